@@ -3,19 +3,28 @@ Flask 應用程式主文件
 定義所有 API 路由和端點
 """
 
-from flask import Flask, jsonify, send_from_directory, send_file
+from flask import Flask, jsonify, request, send_from_directory, send_file
 from flask_caching import Cache
+import hmac
 import logging
 import os
 
 # 導入配置和服務
-from src.core.core_app_config import create_app
+from src.core.core_app_config import create_app, setup_upload_queue
 from src.core.core_redis_manager import redis_manager
+from src.core.core_db_manager import db
+from src.core.core_disease_catalog import disease_catalog
+from src.core.core_user_status_cache import user_status_cache
+from src.core.core_log_shipper import log_shipper
+from src.core.core_helpers import get_user_id_from_session
+from src.core.core_user_manager import UserManager
 from src.services.service_auth import AuthService
 from src.services.service_user import UserService
 from src.services.service_yolo_api import DetectionAPIService
 from src.services.service_integrated_api import IntegratedDetectionAPIService
 from src.services.service_image_manager import init_image_manager
+from modules.image_buffer import get_pipeline_counters
+from modules.model_registry import model_registry
 
 # 設定日誌
 logging.basicConfig(
@@ -38,12 +47,14 @@ else:
 
 use_cloudinary = getattr(AppConfig, 'USE_CLOUDINARY', False)
 cloudinary_folder = getattr(AppConfig, 'CLOUDINARY_FOLDER', 'leaf_disease_ai')
+upload_queue = setup_upload_queue(cloudinary_storage, AppConfig)
 image_manager = init_image_manager(
     upload_folder,
     temp_file_ttl_hours=24,
     cloudinary_storage=cloudinary_storage,
     use_cloudinary=use_cloudinary and cloudinary_storage is not None,
-    cloudinary_folder=cloudinary_folder
+    cloudinary_folder=cloudinary_folder,
+    upload_queue=upload_queue
 )
 
 # 應用啟動時清理過期暫存文件
@@ -62,7 +73,15 @@ yolo_api_service = DetectionAPIService(detection_service, upload_folder)
 # 初始化整合檢測服務
 if integrated_service:
     try:
-        integrated_api_service = IntegratedDetectionAPIService(integrated_service, image_manager)
+        integrated_api_service = IntegratedDetectionAPIService(
+            integrated_service,
+            image_manager,
+            batch_max_images=AppConfig.BATCH_PREDICT_MAX_IMAGES,
+            batch_max_image_bytes=AppConfig.BATCH_PREDICT_MAX_IMAGE_BYTES,
+            batch_max_bytes=AppConfig.BATCH_PREDICT_MAX_BYTES,
+            batch_chunk_size=AppConfig.BATCH_PREDICT_CHUNK_SIZE,
+            batch_max_concurrent=AppConfig.BATCH_PREDICT_MAX_CONCURRENT
+        )
         logger.info("✅ 整合檢測 API 服務初始化成功")
     except Exception as e:
         logger.error(f"❌ 整合檢測 API 服務初始化失敗: {str(e)}")
@@ -79,7 +98,7 @@ else:
 def api_health():
     """
     服務健康檢查端點
-    用於診斷服務狀態
+    用於診斷服務狀態（不需登入，只返回存活與服務載入狀態；內部指標見 /api/metrics）
     """
     health_status = {
         "status": "ok",
@@ -103,6 +122,94 @@ def api_health():
     return jsonify(health_status), 200 if health_status["status"] == "ok" else 503
 
 
+def _metrics_access_error():
+    """
+    檢查 /api/metrics 的存取權限
+    
+    內部呼叫者（監控系統）以 Authorization: Bearer <METRICS_TOKEN> 存取；
+    其餘請求需為具有 system_maintenance 權限的登入使用者（管理員、開發者）
+    
+    Returns:
+        未授權時返回 (回應, 狀態碼)，否則返回 None
+    """
+    token = getattr(AppConfig, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if token and authorization.startswith('Bearer '):
+        if hmac.compare_digest(authorization[len('Bearer '):].strip().encode('utf-8'), token.encode('utf-8')):
+            return None
+    user_id = get_user_id_from_session()
+    if not user_id:
+        return jsonify({"error": "請先登入"}), 401
+    if not UserManager.has_permission(user_id, 'system_maintenance'):
+        return jsonify({"error": "權限不足"}), 403
+    return None
+
+
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """
+    服務內部指標端點（僅限管理員或內部呼叫者）
+    包含推論、快取、資料庫連接池、Redis、背景佇列等指標；推論伺服器啟用時需要一次統計往返
+    """
+    access_error = _metrics_access_error()
+    if access_error is not None:
+        return access_error
+    
+    # 圖片管線指標（各階段解碼/編碼/I/O 次數）
+    metrics = {"image_pipeline": get_pipeline_counters()}
+    
+    # 推論指標（微批次排程器：佇列深度、批次大小直方圖、各階段延遲；推論結果快取：命中率、淘汰次數；預測記錄寫入器：佇列深度、寫入延遲、溢寫）
+    if integrated_service is not None:
+        batching_metrics = integrated_service.get_batching_metrics()
+        if batching_metrics is not None:
+            metrics["micro_batching"] = batching_metrics
+        inference_cache_metrics = integrated_service.get_inference_cache_metrics()
+        if inference_cache_metrics is not None:
+            metrics["inference_cache"] = inference_cache_metrics
+        # 近似重複索引指標（索引大小、查詢延遲 p50/p99、比中率、資料庫載入統計）
+        near_duplicate_metrics = integrated_service.get_near_duplicate_metrics()
+        if near_duplicate_metrics is not None:
+            metrics["near_duplicate"] = near_duplicate_metrics
+        # 超解析度策略指標（各原因的決策次數、執行 / 跳過次數、節省的估計耗時）
+        sr_policy_metrics = integrated_service.get_sr_policy_metrics()
+        if sr_policy_metrics is not None:
+            metrics["sr_policy"] = sr_policy_metrics
+        metrics["write_behind"] = integrated_service.get_persistence_metrics()
+        metrics["cnn_backend"] = integrated_service.get_cnn_backend_info()
+        metrics["quantization"] = integrated_service.get_quantization_info()
+        # 推論伺服器指標（各推論程序存活、處理數、重啟次數、CPU 綁定；待處理佇列深度；往返延遲）
+        inference_server_metrics = integrated_service.get_inference_server_metrics()
+        if inference_server_metrics is not None:
+            metrics["inference_server"] = inference_server_metrics
+    
+    # Redis 客戶端指標（斷路器狀態、命令數與往返次數、連線失敗次數）
+    metrics["redis"] = redis_manager.get_metrics()
+    
+    # 資料庫連接池指標（使用中 / 閒置連接數、取用等待時間 p50/p99、逾時與回收次數）
+    metrics["database_pool"] = db.get_pool_metrics()
+    
+    # 預備語句指標（各熱門語句的呼叫次數、累計 / 平均 / 最長耗時、PREPARE 次數，依累計耗時排序）
+    metrics["database_statements"] = db.get_statement_metrics()
+    
+    # 模型註冊表指標（各模型權重大小、載入耗時、是否由 gunicorn 主程序預載入；程序 RSS / 共用 / 私有記憶體）
+    metrics["model_registry"] = model_registry.get_metrics()
+    
+    # 病害知識庫目錄指標（筆數、載入耗時、距上次成功檢查秒數、命中率）
+    metrics["disease_catalog"] = disease_catalog.get_metrics()
+    
+    # 使用者狀態快取指標（get_user_id_from_session 命中率）
+    metrics["user_status_cache"] = user_status_cache.get_metrics()
+    
+    # 日誌批次寫入指標（緩衝區深度、各日誌表寫入/覆蓋/失敗筆數、寫入延遲）
+    metrics["log_shipper"] = log_shipper.get_metrics()
+    
+    # Cloudinary 背景上傳佇列指標（佇列深度、去重、重試、失敗次數、上傳延遲）
+    if upload_queue is not None:
+        metrics["upload_queue"] = upload_queue.get_metrics()
+    
+    return jsonify({"metrics": metrics}), 200
+
+
 # ==================== 認證相關路由 ====================
 
 @app.route("/register", methods=["POST"])
@@ -492,7 +599,14 @@ def predict():
     tags:
       - 檢測
     summary: 上傳圖片進行病害檢測
-    description: 上傳葉片圖片，使用 AI 模型進行病害檢測
+    description: |
+      上傳葉片圖片，使用 AI 模型進行病害檢測。
+      除了 JSON（base64）外，也接受 multipart/form-data（image 檔案欄位、source 表單欄位）
+      或 application/octet-stream（請求主體為圖片位元組，source 放在查詢字串），避免 base64 的額外負擔
+    consumes:
+      - application/json
+      - multipart/form-data
+      - application/octet-stream
     security:
       - session: []
     parameters:
@@ -550,6 +664,8 @@ def predict():
               description: 處理時間（毫秒）
       400:
         description: 請求錯誤（無圖片資料或格式錯誤）
+      413:
+        description: 圖片超過上傳大小限制
       401:
         description: 未登入
       500:
@@ -570,7 +686,14 @@ def api_predict():
     tags:
       - 檢測
     summary: 上傳圖片進行整合檢測（CNN 分類 + YOLO 檢測）
-    description: 使用 CNN 分類圖片類型，然後根據結果決定是否執行 YOLO 檢測
+    description: |
+      使用 CNN 分類圖片類型，然後根據結果決定是否執行 YOLO 檢測。
+      除了 JSON（base64）外，也接受 multipart/form-data（image 檔案欄位、source 表單欄位）
+      或 application/octet-stream（請求主體為圖片位元組，source 放在查詢字串）
+    consumes:
+      - application/json
+      - multipart/form-data
+      - application/octet-stream
     security:
       - session: []
     parameters:
@@ -626,6 +749,61 @@ def api_predict():
     return integrated_api_service.predict()
 
 
+@app.route("/api/predict/batch", methods=["POST"])
+def api_predict_batch():
+    """
+    批次整合檢測 API（CNN + YOLO）
+    ---
+    tags:
+      - 檢測
+    summary: 一次上傳多張圖片進行整合檢測，逐張串流返回結果
+    description: |
+      接受 multipart/form-data（多個 images 檔案欄位，或一個 archive zip 檔案欄位，source 為表單欄位）
+      或 application/zip（請求主體為 zip，source 放在查詢字串）。
+      圖片依序每 BATCH_PREDICT_CHUNK_SIZE 張以單次 CNN/YOLO 批次推論，每張完成後立即以 NDJSON（application/x-ndjson）送出一行：
+      type 為 result（index、filename、result 同 /api/predict 回應）或 error（index、filename、error），
+      最後一行 type 為 summary（total、succeeded、failed、persisted、processing_time_ms）。
+      所有預測記錄在單一交易中寫入。
+    consumes:
+      - multipart/form-data
+      - application/zip
+    produces:
+      - application/x-ndjson
+    security:
+      - session: []
+    parameters:
+      - in: formData
+        name: images
+        type: file
+        description: 圖片檔案（可重複）
+      - in: formData
+        name: archive
+        type: file
+        description: 含圖片的 zip 壓縮檔（與 images 擇一）
+      - in: formData
+        name: source
+        type: string
+        enum: [upload, camera, gallery]
+        default: upload
+    responses:
+      200:
+        description: NDJSON 串流（每張圖片一行，最後一行為摘要）
+      400:
+        description: 請求錯誤（無圖片資料或格式錯誤）
+      401:
+        description: 未登入
+      413:
+        description: 圖片數量或大小超過限制
+      429:
+        description: 批次檢測已達並發上限（依 Retry-After 重試）
+      500:
+        description: 系統錯誤
+    """
+    if not integrated_api_service:
+        return jsonify({"error": "整合檢測服務未載入"}), 500
+    return integrated_api_service.predict_batch()
+
+
 @app.route("/api/predict-crop", methods=["POST"])
 def api_predict_crop():
     """
@@ -634,7 +812,15 @@ def api_predict_crop():
     tags:
       - 檢測
     summary: 使用裁切後的圖片重新執行檢測
-    description: 當 CNN 分類為 whole_plant 時，使用者裁切圖片後重新檢測
+    description: |
+      當 CNN 分類為 whole_plant 時，使用者裁切圖片後重新檢測。
+      除了 JSON（base64）外，也接受 multipart/form-data（cropped_image 檔案欄位，
+      prediction_id、crop_count 與 JSON 字串形式的 crop_coordinates 為表單欄位）
+      或 application/octet-stream（請求主體為圖片位元組，其他參數放在查詢字串）
+    consumes:
+      - application/json
+      - multipart/form-data
+      - application/octet-stream
     security:
       - session: []
     parameters:
@@ -677,9 +863,42 @@ def history():
     tags:
       - 檢測
     summary: 獲取使用者的檢測歷史記錄
-    description: 獲取當前使用者的所有病害檢測歷史記錄（最多 100 筆）
+    description: 獲取當前使用者的病害檢測歷史記錄（每頁最多 100 筆）；依時間由新到舊排序時以 pagination.next_cursor 翻頁
     security:
       - session: []
+    parameters:
+      - in: query
+        name: per_page
+        type: integer
+        default: 20
+        description: 每頁記錄數（最多 100）
+      - in: query
+        name: cursor
+        type: string
+        description: 上一頁回傳的 pagination.next_cursor（游標分頁，深頁查詢成本固定）
+      - in: query
+        name: page
+        type: integer
+        default: 1
+        description: 頁碼（未提供 cursor 時使用 OFFSET 分頁）
+      - in: query
+        name: order_by
+        type: string
+        enum: [created_at, confidence, disease_name, severity]
+        default: created_at
+      - in: query
+        name: order_dir
+        type: string
+        enum: [ASC, DESC]
+        default: DESC
+      - in: query
+        name: disease
+        type: string
+        description: 病害名稱過濾（部分匹配）
+      - in: query
+        name: min_confidence
+        type: number
+        description: 最小置信度過濾
     responses:
       200:
         description: 歷史記錄列表
@@ -830,6 +1049,28 @@ def get_image_from_db(record_id):
     return yolo_api_service.get_image_from_db(record_id)
 
 
+def _serve_tracked_upload(prediction_id, kind, user_id):
+    """
+    由背景上傳佇列回應圖片（上傳中：直接返回位元組；已完成：重定向到 Cloudinary URL）
+    未追蹤、已失敗或不屬於該使用者時返回 None，由呼叫者改查資料庫
+    """
+    from flask import Response, redirect
+    
+    queue = image_manager.upload_queue
+    if queue is None:
+        return None
+    status = queue.lookup((prediction_id, kind))
+    if not status or status['owner'] != user_id:
+        return None
+    if status['state'] == 'done' and status['url']:
+        return redirect(status['url'], code=302)
+    if status['state'] == 'pending' and status['image_bytes']:
+        response = Response(status['image_bytes'], mimetype='image/jpeg')
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    return None
+
+
 @app.route("/image/prediction/<prediction_id>")
 def get_prediction_image(prediction_id):
     """
@@ -866,6 +1107,11 @@ def get_prediction_image(prediction_id):
     if not user_id:
         return jsonify({"error": "請先登入"}), 401
     
+    # 背景上傳尚未完成時直接回應待上傳的位元組（或重定向到剛完成的 URL）
+    pending_response = _serve_tracked_upload(prediction_id, 'origin', user_id)
+    if pending_response is not None:
+        return pending_response
+    
     try:
         # 查詢記錄並驗證權限（只查詢圖片路徑）
         record = db.execute_query(
@@ -884,7 +1130,8 @@ def get_prediction_image(prediction_id):
         image_path = record[0]
         
         # 如果 image_path 是 Cloudinary URL，重定向到該 URL
-        if image_path and (image_path.startswith('http://') or image_path.startswith('https://')):
+        if image_path and (image_path.startswith('http://') or image_path.startswith('https://')
+                           or image_path.startswith('/local-cloudinary/')):
             logger.debug(f"✅ 重定向到 Cloudinary URL: {image_path}")
             return redirect(image_path, code=302)
         
@@ -909,6 +1156,89 @@ def get_prediction_image(prediction_id):
         return jsonify({"error": "系統錯誤"}), 500
 
 
+@app.route("/image/prediction/<prediction_id>/annotated")
+def get_prediction_annotated_image(prediction_id):
+    """
+    獲取預測記錄的帶框圖片
+    ---
+    tags:
+      - 檢測
+    summary: 獲取 prediction_log 的帶框圖片
+    description: 背景上傳完成前直接返回圖片，完成後重定向到 Cloudinary URL（predict_img_url）
+    parameters:
+      - in: path
+        name: prediction_id
+        required: true
+        type: string
+        format: uuid
+        description: 預測記錄 ID (UUID)
+    responses:
+      200:
+        description: 圖片文件（JPEG 格式）
+      302:
+        description: 重定向到 Cloudinary URL
+      404:
+        description: 記錄不存在或帶框圖片尚未生成
+      401:
+        description: 未登入或無權限
+    """
+    from flask import redirect
+    from src.core.core_helpers import get_user_id_from_session
+    from src.core.core_db_manager import db
+    
+    user_id = get_user_id_from_session()
+    if not user_id:
+        return jsonify({"error": "請先登入"}), 401
+    
+    pending_response = _serve_tracked_upload(prediction_id, 'annotated', user_id)
+    if pending_response is not None:
+        return pending_response
+    
+    try:
+        record = db.execute_query(
+            """
+            SELECT predict_img_url
+            FROM prediction_log
+            WHERE id = %s AND user_id = %s
+            """,
+            (prediction_id, user_id),
+            fetch_one=True
+        )
+        if record and record[0] and (record[0].startswith('http://') or record[0].startswith('https://')
+                                      or record[0].startswith('/local-cloudinary/')):
+            return redirect(record[0], code=302)
+        return jsonify({"error": "圖片未找到"}), 404
+    except Exception as e:
+        logger.error(f"❌ 獲取帶框圖片失敗: {str(e)}")
+        return jsonify({"error": "系統錯誤"}), 500
+
+
+@app.route("/local-cloudinary/<path:public_id>")
+def get_local_cloudinary_image(public_id):
+    """
+    本地 Cloudinary 替代儲存的圖片（僅在 CLOUDINARY_LOCAL_STANDIN=true 時可用）
+    ---
+    tags:
+      - 檢測
+    summary: 獲取本地替代儲存中的圖片
+    parameters:
+      - in: path
+        name: public_id
+        required: true
+        type: string
+        description: 資料夾與公開 ID（例如 leaf_disease_ai/origin/xxx.jpg）
+    responses:
+      200:
+        description: 圖片文件
+      404:
+        description: 未啟用本地替代儲存或文件不存在
+    """
+    root_dir = getattr(cloudinary_storage, 'root_dir', None)
+    if not root_dir:
+        return jsonify({"error": "本地替代儲存未啟用"}), 404
+    return send_from_directory(root_dir, public_id)
+
+
 # ==================== 系統路由 ====================
 
 @app.route("/", methods=["GET"])
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+離線批次評分腳本
+對目錄（遞迴）或檔案清單中的圖片執行與整合檢測相同的流程（超解析度 → CNN 分類 → 分流 → YOLO 檢測），
+結果寫入 CSV 或 JSON Lines；不啟動 Flask，也不連接資料庫、Redis 或 Cloudinary
+
+- 讀取與解碼由讀取執行緒池並行處理（PIL 解碼與 resize 期間釋放 GIL），與推論重疊執行
+- CNN 與 YOLO 每批各以單次呼叫完成（modules/cnn_*、modules/yolo_*、modules/sr_*）
+- 每批結果寫入並 fsync 後才記錄到 checkpoint 檔，中斷後以 --resume 從未完成的圖片繼續
+  （最後一批可能在輸出檔中重複一次，不會遺漏）
+
+使用方式：
+    cd backend
+    python batch_score.py /data/field_images --output scores.csv
+    python batch_score.py --file-list paths.txt --output scores.jsonl --batch-size 16 --readers 8
+    python batch_score.py /data/field_images --output scores.csv --resume
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(backend_dir)
+for path in (project_root, backend_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(project_root, '.env'))
+
+
+from modules.cnn_backend import checkpoint_sha256, load_cnn_backend
+from modules.cnn_preprocess import preprocess_arrays_batch
+from modules.cnn_predict import cnn_predict
+from modules.cnn_postprocess import postprocess_cnn_batch_result
+from modules.cnn_utils import CNN_CLASSES, should_run_yolo, get_final_status
+from modules.yolo_detect import yolo_detect_arrays_batch
+from modules.yolo_postprocess import postprocess_yolo_result
+from modules.sr_policy import SR_POLICY_MODES, SRPolicy
+from modules.model_registry import get_cnn_model, get_yolo_model, get_sr_model
+from modules.image_buffer import ImageBuffer, decode_image_bytes
+
+# 根據環境選擇配置（與 app.py 相同）
+if os.getenv('FLASK_ENV', os.getenv('ENVIRONMENT', 'development')).lower() == 'production':
+    from config.production import ProductionConfig as AppConfig
+else:
+    from config.development import DevelopmentConfig as AppConfig
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 視為圖片的副檔名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# 與 ImageService.TARGET_SIZE 相同：線上檢測在推論前將圖片拉伸到此尺寸
+TARGET_SIZE = (640, 640)
+
+# 輸出欄位（CSV 欄位順序；JSON Lines 使用相同鍵）
+OUTPUT_FIELDS = (
+    'path', 'status', 'error', 'file_sha256', 'width', 'height',
+    'cnn_best_class', 'cnn_best_score', 'cnn_mean_score', 'cnn_all_scores',
+    'workflow_step', 'final_status', 'yolo_detected', 'disease', 'confidence', 'detections', 'sr_applied', 'sr_reason'
+)
+
+# 各階段計時（read 為讀取執行緒的累計時間，其餘為主執行緒時間）
+STAGES = ('read', 'read_wait', 'sr', 'cnn', 'yolo', 'write')
+
+
+# ==================== 輸入 ====================
+
+def iter_image_paths(inputs: List[str], file_list: Optional[str]) -> Iterator[str]:
+    """依序產生圖片路徑：目錄遞迴走訪（排序），檔案直接使用，--file-list 每行一個路徑"""
+    if file_list:
+        with open(file_list, 'r', encoding='utf-8') as f:
+            for line in f:
+                path = line.strip()
+                if path and not path.startswith('#'):
+                    yield os.path.abspath(path)
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'):
+                        yield os.path.abspath(os.path.join(root, name))
+        else:
+            yield os.path.abspath(item)
+
+
+def read_image(path: str, resize: bool) -> Tuple[str, Optional[ImageBuffer], Optional[str], Optional[str], float]:
+    """
+    讀取並解碼一張圖片（在讀取執行緒中執行）
+
+    Returns:
+        (路徑, 圖片緩衝或 None, 原始檔案 SHA256, 錯誤訊息, 耗時秒數)
+    """
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        image = decode_image_bytes(data, stage='batch_score')
+        if resize:
+            image = image.resize(TARGET_SIZE)
+        return path, image, digest, None, time.perf_counter() - start
+    except Exception as e:
+        return path, None, None, str(e), time.perf_counter() - start
+
+
+def iter_batches(
+    paths: Iterator[str],
+    executor: ThreadPoolExecutor,
+    batch_size: int,
+    prefetch: int,
+    resize: bool,
+    timings: Dict[str, float]
+) -> Iterator[List[tuple]]:
+    """
+    以讀取執行緒池預先讀取最多 prefetch 張圖片，依輸入順序組成批次
+    主執行緒等待讀取結果的時間記錄在 read_wait（讀取跟不上推論時此值偏高）
+    """
+    pending = deque()
+    batch = []
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < prefetch:
+            path = next(paths, None)
+            if path is None:
+                exhausted = True
+                break
+            pending.append(executor.submit(read_image, path, resize))
+        if not pending:
+            break
+        wait_start = time.perf_counter()
+        item = pending.popleft().result()
+        timings['read_wait'] += time.perf_counter() - wait_start
+        timings['read'] += item[4]
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ==================== 推論 ====================
+
+class ScoringPipeline:
+    """與 IntegratedDetectionService 階段 0-2 相同的批次推論（僅模型，無快取與持久化）"""
+
+    def __init__(
+        self,
+        cnn_model_path: str,
+        yolo_model_path: str,
+        cnn_backend: str = 'eager',
+        cnn_num_threads: int = 0,
+        cnn_export_dir: Optional[str] = None,
+        enable_sr: bool = False,
+        sr_model_path: Optional[str] = None,
+        sr_model_type: str = 'edsr',
+        sr_scale: int = 2,
+        sr_tile_size: int = 0,
+        sr_tile_overlap: int = 16,
+        sr_tile_batch_size: int = 4,
+        sr_policy: str = 'always',
+        device: Optional[str] = None
+    ):
+        """
+        載入模型
+
+        Args:
+            cnn_model_path: CNN 模型路徑
+            yolo_model_path: YOLO 模型路徑
+            cnn_backend: CNN 推論後端 ('eager', 'torchscript', 'onnx')
+            cnn_num_threads: ONNX Runtime intra-op 執行緒數（0 表示預設）
+            cnn_export_dir: 檢查點目錄不可寫入時的匯出檔目錄
+            enable_sr: 是否執行超解析度預處理
+            sr_model_path: 超解析度模型路徑（None 時使用預設架構）
+            sr_model_type: 超解析度模型類型
+            sr_scale: 超解析度放大倍數
+            sr_tile_size: 分塊超解析度的 tile 邊長（0 表示整張處理）
+            sr_tile_overlap: 相鄰 tile 重疊像素數
+            sr_tile_batch_size: 每次前向傳播的 tile 數
+            sr_policy: 超解析度策略（'always', 'never', 'adaptive'，adaptive 的門檻使用設定檔）
+            device: 設備（None 自動選擇）
+        """
+        import torch
+
+        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        cnn_model = get_cnn_model(cnn_model_path, len(CNN_CLASSES), self.device)
+        self.cnn_backend, self.cnn_backend_info = load_cnn_backend(
+            cnn_model,
+            cnn_model_path,
+            backend=cnn_backend,
+            device=self.device,
+            checkpoint_hash=checkpoint_sha256(cnn_model_path),
+            num_threads=cnn_num_threads,
+            fallback_export_dir=cnn_export_dir
+        )
+        self.yolo_model = get_yolo_model(yolo_model_path)
+
+        self.sr_model = None
+        self.sr_policy = SRPolicy(
+            mode=sr_policy,
+            scale=sr_scale,
+            min_side=AppConfig.SR_POLICY_MIN_SIDE,
+            blur_threshold=AppConfig.SR_POLICY_BLUR_THRESHOLD,
+            min_jpeg_quality=AppConfig.SR_POLICY_MIN_JPEG_QUALITY,
+            tile_size=sr_tile_size
+        )
+        self.sr_kwargs = {
+            'tile_overlap': sr_tile_overlap,
+            'tile_batch_size': sr_tile_batch_size
+        }
+        if enable_sr:
+            try:
+                self.sr_model = get_sr_model(sr_model_path, sr_model_type, sr_scale, self.device)
+            except Exception as e:
+                logger.warning(f"⚠️  超解析度模型載入失敗，不執行超解析度: {str(e)}")
+        logger.info(f"✅ 模型載入完成 (CNN 後端: {self.cnn_backend.name}, 超解析度: {'啟用' if self.sr_model is not None else '停用'}, 設備: {self.device})")
+
+    def score(self, images: List[ImageBuffer], timings: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        對一批圖片執行超解析度（逐張）、CNN 批次分類與 YOLO 批次檢測
+
+        Returns:
+            每張圖片的結果欄位（順序與輸入一致）
+        """
+        # 階段 0: 超解析度（輸出尺寸不一，逐張處理，由策略決定；失敗時使用原始像素）
+        start = time.perf_counter()
+        cnn_inputs = []
+        sr_decisions = []
+        for image in images:
+            enhanced = image.pixels
+            decision = None
+            if self.sr_model is not None:
+                decision = self.sr_policy.decide(image.pixels, image.metadata)
+                try:
+                    enhanced, _ = self.sr_policy.run(image.pixels, decision, self.sr_model, device=self.device, **self.sr_kwargs)
+                except Exception as e:
+                    logger.warning(f"⚠️  超解析度失敗，使用原始圖片: {str(e)}")
+                    self.sr_policy.mark_failed(decision)
+                self.sr_policy.record(decision)
+            cnn_inputs.append(enhanced)
+            sr_decisions.append(decision)
+        timings['sr'] += time.perf_counter() - start
+
+        # 階段 1: CNN 批次分類（單次前向傳播）
+        start = time.perf_counter()
+        input_tensor = preprocess_arrays_batch(cnn_inputs, device=self.device)
+        cnn_results = postprocess_cnn_batch_result(cnn_predict(self.cnn_backend, input_tensor), CNN_CLASSES)
+        timings['cnn'] += time.perf_counter() - start
+
+        rows = []
+        yolo_indices = []
+        for index, cnn_result in enumerate(cnn_results):
+            best_class = cnn_result['best_class']
+            final_status = get_final_status(best_class)
+            workflow_step = 'cnn_only'
+            if should_run_yolo(best_class):
+                workflow_step = 'cnn_yolo'
+                yolo_indices.append(index)
+            elif best_class == 'whole_plant':
+                final_status = 'need_crop'
+            elif best_class == 'others':
+                final_status = 'not_plant'
+            rows.append({
+                'status': 'ok',
+                'width': images[index].metadata.get('original_size', images[index].size)[0],
+                'height': images[index].metadata.get('original_size', images[index].size)[1],
+                'cnn_best_class': best_class,
+                'cnn_best_score': cnn_result['best_score'],
+                'cnn_mean_score': cnn_result['mean_score'],
+                'cnn_all_scores': cnn_result['all_scores'],
+                'workflow_step': workflow_step,
+                'final_status': final_status,
+                'yolo_detected': False,
+                'disease': best_class,
+                'confidence': cnn_result['best_score'],
+                'detections': None,
+                'sr_applied': bool(sr_decisions[index] and sr_decisions[index]['applied']),
+                'sr_reason': sr_decisions[index]['reason'] if sr_decisions[index] else None
+            })
+
+        # 階段 2: YOLO 批次檢測（原始像素，只對需要的圖片）
+        if yolo_indices:
+            start = time.perf_counter()
+            try:
+                batch_results = yolo_detect_arrays_batch(self.yolo_model, [images[index].pixels for index in yolo_indices])
+                for index, per_image_results in zip(yolo_indices, batch_results):
+                    processed = postprocess_yolo_result(per_image_results)
+                    detections = processed['detections'] if processed['detected'] else [{'class': 'Healthy', 'confidence': 1.0, 'bbox': []}]
+                    rows[index].update({
+                        'yolo_detected': processed['detected'],
+                        'detections': detections,
+                        'disease': detections[0]['class'],
+                        'confidence': detections[0]['confidence']
+                    })
+            except Exception as e:
+                logger.error(f"❌ YOLO 批次檢測失敗: {str(e)}", exc_info=True)
+                for index in yolo_indices:
+                    rows[index].update({'status': 'degraded', 'error': f"YOLO 檢測失敗: {str(e)}"})
+            timings['yolo'] += time.perf_counter() - start
+        return rows
+
+
+# ==================== 輸出與 checkpoint ====================
+
+class ResultWriter:
+    """CSV / JSON Lines 結果寫入器（巢狀欄位在 CSV 中以 JSON 字串表示）"""
+
+    def __init__(self, path: str, output_format: str, append: bool):
+        self.format = output_format
+        new_file = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        self.csv_writer = None
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+            if new_file:
+                self.csv_writer.writeheader()
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            if self.csv_writer is not None:
+                self.csv_writer.writerow({
+                    key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                    for key, value in row.items()
+                })
+            else:
+                self.file.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class Checkpoint:
+    """已完成圖片的路徑清單（每行一個，結果寫入輸出檔後才追加）"""
+
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        self.done: Set[str] = set()
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def mark(self, paths: List[str]):
+        self.file.write(''.join(f"{path}\n" for path in paths))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.done.update(paths)
+
+    def close(self):
+        self.file.close()
+
+
+# ==================== 主程式 ====================
+
+def print_report(total: int, skipped: int, failed: int, wall: float, timings: Dict[str, float], readers: int):
+    print("\n" + "=" * 60)
+    print("📊 批次評分結果")
+    print("=" * 60)
+    print(f"   評分 {total} 張（失敗 {failed} 張），略過已完成 {skipped} 張，總耗時 {wall:.1f}s")
+    print(f"   吞吐量: {total / wall if wall > 0 else 0.0:.2f} img/s")
+    print("   各階段耗時：")
+    for stage in STAGES:
+        seconds = timings[stage]
+        if stage == 'read':
+            # 讀取在多個執行緒並行，累計時間可能超過總耗時
+            print(f"     {stage:<10} {seconds:8.2f}s（{readers} 個讀取執行緒累計，每張 {seconds / total * 1000 if total else 0.0:.1f}ms）")
+        else:
+            share = seconds / wall * 100 if wall > 0 else 0.0
+            print(f"     {stage:<10} {seconds:8.2f}s（{share:5.1f}%，每張 {seconds / total * 1000 if total else 0.0:.1f}ms）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='離線批次評分（不需要 Flask、資料庫與 Cloudinary）')
+    parser.add_argument('inputs', nargs='*', help='圖片目錄（遞迴）或圖片檔案')
+    parser.add_argument('--file-list', default=None, help='圖片路徑清單檔（每行一個路徑）')
+    parser.add_argument('--output', required=True, help='輸出檔（.csv 或 .jsonl）')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None, help='輸出格式（預設依副檔名）')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint 檔（預設為 <output>.checkpoint）')
+    parser.add_argument('--resume', action='store_true', help='略過 checkpoint 中已完成的圖片，結果附加到輸出檔')
+    parser.add_argument('--batch-size', type=int, default=AppConfig.BATCH_MAX_SIZE, help='每批圖片數')
+    parser.add_argument('--readers', type=int, default=min(8, os.cpu_count() or 1), help='讀取執行緒數')
+    parser.add_argument('--prefetch', type=int, default=0, help='預先讀取的圖片數（0 表示 4 批）')
+    parser.add_argument('--no-resize', action='store_true', help=f'不拉伸到 {TARGET_SIZE[0]}x{TARGET_SIZE[1]}（線上檢測會拉伸）')
+    parser.add_argument('--cnn-backend', default=AppConfig.CNN_BACKEND, help='CNN 推論後端')
+    parser.add_argument('--enable-sr', action='store_true', default=AppConfig.ENABLE_SR, help='執行超解析度預處理')
+    parser.add_argument('--no-sr', dest='enable_sr', action='store_false', help='不執行超解析度預處理')
+    parser.add_argument('--sr-policy', choices=SR_POLICY_MODES, default=AppConfig.SR_POLICY,
+                        help='超解析度策略（adaptive 依圖片品質逐張決定）')
+    parser.add_argument('--device', default=None, help="設備（'cpu'、'cuda'，預設自動選擇）")
+    parser.add_argument('--progress-every', type=int, default=20, help='每隔幾批輸出一次進度')
+    args = parser.parse_args()
+
+    if not args.inputs and not args.file_list:
+        parser.error('請指定圖片目錄、圖片檔案或 --file-list')
+    output_format = args.format or ('jsonl' if args.output.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    if not args.resume and os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        parser.error(f'輸出檔已存在: {args.output}（使用 --resume 繼續，或先刪除）')
+
+    sr_relative = AppConfig.SR_MODEL_PATH_RELATIVE
+    sr_model_path = os.path.join(project_root, sr_relative) if sr_relative else None
+    if sr_model_path and not os.path.exists(sr_model_path):
+        sr_model_path = None
+    pipeline = ScoringPipeline(
+        cnn_model_path=os.path.join(project_root, AppConfig.CNN_MODEL_PATH_RELATIVE),
+        yolo_model_path=os.path.join(project_root, AppConfig.YOLO_MODEL_PATH_RELATIVE),
+        cnn_backend=args.cnn_backend,
+        cnn_num_threads=AppConfig.CNN_NUM_THREADS,
+        cnn_export_dir=os.path.join(project_root, AppConfig.CNN_EXPORT_DIR_RELATIVE),
+        enable_sr=args.enable_sr,
+        sr_model_path=sr_model_path,
+        sr_model_type=AppConfig.SR_MODEL_TYPE,
+        sr_scale=AppConfig.SR_SCALE,
+        sr_tile_size=AppConfig.SR_TILE_SIZE,
+        sr_tile_overlap=AppConfig.SR_TILE_OVERLAP,
+        sr_tile_batch_size=AppConfig.SR_TILE_BATCH_SIZE,
+        sr_policy=args.sr_policy,
+        device=args.device
+    )
+
+    checkpoint = Checkpoint(checkpoint_path, args.resume)
+    writer = ResultWriter(args.output, output_format, append=args.resume)
+    skipped = 0
+
+    def pending_paths() -> Iterator[str]:
+        nonlocal skipped
+        for path in iter_image_paths(args.inputs, args.file_list):
+            if path in checkpoint.done:
+                skipped += 1
+                continue
+            yield path
+
+    batch_size = max(1, args.batch_size)
+    prefetch = args.prefetch or batch_size * 4
+    timings = {stage: 0.0 for stage in STAGES}
+    total = 0
+    failed = 0
+    print("=" * 60)
+    print(f"🗂️  離線批次評分 → {args.output} ({output_format})")
+    print(f"   每批 {batch_size} 張，讀取執行緒 {args.readers}，預先讀取 {prefetch} 張" + ("，續跑" if args.resume else ""))
+    print("=" * 60)
+
+    wall_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.readers), thread_name_prefix='batch-reader') as executor:
+            for batch_index, batch in enumerate(iter_batches(pending_paths(), executor, batch_size, prefetch, not args.no_resize, timings)):
+                rows = [None] * len(batch)
+                decoded = []
+                for position, (path, image, digest, error, _) in enumerate(batch):
+                    if image is None:
+                        rows[position] = {'path': path, 'status': 'error', 'error': error}
+                    else:
+                        decoded.append(position)
+                if decoded:
+                    try:
+                        scored = pipeline.score([batch[position][1] for position in decoded], timings)
+                    except Exception as e:
+                        logger.error(f"❌ 批次推論失敗: {str(e)}", exc_info=True)
+                        scored = [{'status': 'error', 'error': f"推論失敗: {str(e)}"} for _ in decoded]
+                    for position, row in zip(decoded, scored):
+                        row.update({'path': batch[position][0], 'file_sha256': batch[position][2]})
+                        rows[position] = row
+                failed += sum(1 for row in rows if row['status'] == 'error')
+                total += len(rows)
+
+                start = time.perf_counter()
+                writer.write_rows(rows)
+                checkpoint.mark([row['path'] for row in rows])
+                timings['write'] += time.perf_counter() - start
+
+                if (batch_index + 1) % max(1, args.progress_every) == 0:
+                    elapsed = time.perf_counter() - wall_start
+                    print(f"   ⏳ 已評分 {total} 張，{total / elapsed:.2f} img/s")
+    except KeyboardInterrupt:
+        print("\n🛑 已中斷，使用 --resume 可從未完成的圖片繼續")
+    finally:
+        writer.close()
+        checkpoint.close()
+
+    print_report(total, skipped, failed, time.perf_counter() - wall_start, timings, max(1, args.readers))
+    if pipeline.sr_model is not None:
+        sr_metrics = pipeline.sr_policy.get_metrics()
+        print(f"   超解析度策略 {sr_metrics['mode']}: 執行 {sr_metrics['applied']} 張"
+              f"（縮小輸入 {sr_metrics['applied_reduced']} 張），跳過 {sr_metrics['skipped']} 張，原因 {sr_metrics['reasons']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+帶框圖片生成效能測試腳本
+比較「重新執行 YOLO predict() + plot()」與「以既有檢測結果繪製檢測框」兩種方式的耗時
+"""
+
+import io
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def time_it(fn, iterations: int) -> list:
+    """執行 fn 多次並返回每次耗時（毫秒）"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='帶框圖片生成效能測試')
+    parser.add_argument('image', help='測試圖片路徑（建議使用含病害的葉片圖片）')
+    parser.add_argument('--iterations', type=int, default=30, help='重複次數')
+    parser.add_argument('--min-confidence', type=float, default=0.75, help='帶框圖片的最小置信度')
+    args = parser.parse_args()
+
+    from PIL import Image
+    from modules.yolo_load import load_yolo_model
+    from modules.yolo_detect import yolo_detect
+    from modules.yolo_postprocess import (
+        postprocess_yolo_result,
+        filter_detections_by_confidence,
+        draw_boxes_on_image_from_bytes,
+    )
+
+    print("=" * 60)
+    print("📦 載入 YOLO 模型")
+    print("=" * 60)
+    model = load_yolo_model(str(project_root / DevelopmentConfig.YOLO_MODEL_PATH_RELATIVE))
+
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+
+    # 整合檢測流程中已經存在的第一次推論結果
+    detections = postprocess_yolo_result(yolo_detect(model, args.image))['detections']
+    print(f"   檢測框數量: {len(detections)}")
+
+    def before():
+        results = model.predict(source=args.image, save=False, conf=args.min_confidence)
+        array = results[0].plot(labels=False, boxes=True, line_width=2)
+        buffer = io.BytesIO()
+        Image.fromarray(array).save(buffer, format='JPEG', quality=95)
+        return buffer.getvalue()
+
+    def after():
+        kept = filter_detections_by_confidence(detections, args.min_confidence)
+        return draw_boxes_on_image_from_bytes(image_bytes, kept, line_width=2)
+
+    # 預熱
+    before()
+    after()
+
+    print("\n" + "=" * 60)
+    print("📊 測試結果")
+    print("=" * 60)
+    for title, fn in (("重新推論 + plot()", before), ("既有檢測框繪製", after)):
+        timings = time_it(fn, args.iterations)
+        print(f"   {title}: median={statistics.median(timings):.1f}ms, "
+              f"mean={statistics.mean(timings):.1f}ms, max={max(timings):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
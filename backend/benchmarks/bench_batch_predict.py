@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+批次檢測吞吐量測試腳本
+對執行中的服務比較：
+  sequential  逐張呼叫 /api/predict（multipart，每張各自查詢 session、記錄日誌、提交預測記錄）
+  batch       單次呼叫 /api/predict/batch（NDJSON 串流，CNN/YOLO 批次推論，預測記錄單一交易寫入）
+的每秒圖片數，以及批次模式收到第一筆結果的時間
+
+每輪都會在圖片中加入隨機像素，避免使用者回應快取與推論結果快取命中
+
+使用方式（先啟動後端）：
+    python benchmarks/bench_batch_predict.py --email user@example.com --password ****** --count 32
+"""
+
+import io
+import sys
+import time
+import json
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+import numpy as np
+import requests
+from PIL import Image
+
+from config.development import DevelopmentConfig
+
+
+def load_sources(image_dir: str, count: int, size: int) -> list:
+    """載入測試圖片（RGB 陣列）；未提供目錄時生成隨機圖片"""
+    if image_dir:
+        paths = [
+            p for p in sorted(Path(image_dir).iterdir())
+            if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        ]
+        if not paths:
+            raise FileNotFoundError(f"目錄中沒有圖片: {image_dir}")
+        arrays = [np.asarray(Image.open(path).convert('RGB')) for path in paths]
+    else:
+        arrays = [np.random.randint(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(min(count, 16))]
+    return [arrays[i % len(arrays)] for i in range(count)]
+
+
+def encode_unique(sources: list) -> list:
+    """在每張圖片左上角寫入隨機像素後編碼為 JPEG（每輪內容都不同）"""
+    encoded = []
+    for pixels in sources:
+        pixels = pixels.copy()
+        pixels[0:4, 0:4] = np.random.randint(0, 255, (4, 4, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=92)
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+def login(base_url: str, email: str, password: str) -> requests.Session:
+    session = requests.Session()
+    response = session.post(f"{base_url}/login", json={'email': email, 'password': password}, timeout=30)
+    if response.status_code != 200:
+        raise RuntimeError(f"登入失敗: {response.status_code} {response.text[:200]}")
+    return session
+
+
+def run_sequential(session: requests.Session, base_url: str, images: list) -> dict:
+    start = time.perf_counter()
+    latencies = []
+    failed = 0
+    for index, data in enumerate(images):
+        request_start = time.perf_counter()
+        response = session.post(
+            f"{base_url}/api/predict",
+            files={'image': (f"leaf_{index}.jpg", data, 'image/jpeg')},
+            data={'source': 'upload'},
+            timeout=300
+        )
+        latencies.append((time.perf_counter() - request_start) * 1000)
+        if response.status_code != 200:
+            failed += 1
+    wall = time.perf_counter() - start
+    return {
+        'images_per_second': (len(images) - failed) / wall,
+        'wall_s': wall,
+        'first_result_ms': latencies[0] if latencies else 0.0,
+        'p50_ms': statistics.median(latencies) if latencies else 0.0,
+        'failed': failed
+    }
+
+
+def run_batch(session: requests.Session, base_url: str, images: list) -> dict:
+    start = time.perf_counter()
+    response = session.post(
+        f"{base_url}/api/predict/batch",
+        files=[('images', (f"leaf_{index}.jpg", data, 'image/jpeg')) for index, data in enumerate(images)],
+        data={'source': 'upload'},
+        stream=True,
+        timeout=600
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"批次檢測失敗: {response.status_code} {response.text[:200]}")
+
+    first_result_ms = None
+    succeeded = 0
+    failed = 0
+    summary = None
+    for line in response.iter_lines():
+        if not line:
+            continue
+        item = json.loads(line)
+        if item['type'] == 'summary':
+            summary = item
+            continue
+        if first_result_ms is None:
+            first_result_ms = (time.perf_counter() - start) * 1000
+        if item['type'] == 'result':
+            succeeded += 1
+        else:
+            failed += 1
+    wall = time.perf_counter() - start
+    return {
+        'images_per_second': succeeded / wall,
+        'wall_s': wall,
+        'first_result_ms': first_result_ms or 0.0,
+        'failed': failed,
+        'persisted': summary.get('persisted') if summary else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次檢測吞吐量測試')
+    parser.add_argument('--base-url', default='http://localhost:5000', help='後端位址')
+    parser.add_argument('--email', required=True, help='測試帳號 Email')
+    parser.add_argument('--password', required=True, help='測試帳號密碼')
+    parser.add_argument('--images', default=None, help='測試圖片目錄（預設生成隨機圖片）')
+    parser.add_argument('--size', type=int, default=640, help='隨機圖片邊長')
+    parser.add_argument('--count', type=int, default=DevelopmentConfig.BATCH_PREDICT_MAX_IMAGES, help='每輪圖片數')
+    parser.add_argument('--rounds', type=int, default=3, help='測試輪數')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    sources = load_sources(args.images, args.count, args.size)
+    session = login(base_url, args.email, args.password)
+
+    print("=" * 60)
+    print(f"📦 批次檢測測試（每輪 {args.count} 張，{args.rounds} 輪，分批 {DevelopmentConfig.BATCH_PREDICT_CHUNK_SIZE} 張）")
+    print("=" * 60)
+
+    # 預熱（載入模型執行緒池、連線）
+    run_sequential(session, base_url, encode_unique(sources[:1]))
+
+    results = {'sequential': [], 'batch': []}
+    for round_index in range(args.rounds):
+        results['sequential'].append(run_sequential(session, base_url, encode_unique(sources)))
+        results['batch'].append(run_batch(session, base_url, encode_unique(sources)))
+        seq, batch = results['sequential'][-1], results['batch'][-1]
+        print(f"   第 {round_index + 1} 輪: sequential {seq['images_per_second']:.2f} img/s, "
+              f"batch {batch['images_per_second']:.2f} img/s")
+
+    print("\n" + "=" * 60)
+    print("📊 結果（中位數）")
+    print("=" * 60)
+    for mode in ('sequential', 'batch'):
+        rounds = results[mode]
+        print(f"   {mode:<10} {statistics.median(r['images_per_second'] for r in rounds):.2f} img/s，"
+              f"總耗時 {statistics.median(r['wall_s'] for r in rounds):.2f}s，"
+              f"第一筆結果 {statistics.median(r['first_result_ms'] for r in rounds):.0f}ms，"
+              f"失敗 {sum(r['failed'] for r in rounds)} 張")
+    speedup = (statistics.median(r['images_per_second'] for r in results['batch'])
+               / statistics.median(r['images_per_second'] for r in results['sequential']))
+    print(f"   batch 相對 sequential: {speedup:.2f}x")
+    not_persisted = sum(1 for r in results['batch'] if r['persisted'] is False)
+    if not_persisted:
+        print(f"   ⚠️  {not_persisted} 輪批次的預測記錄未能以單一交易寫入（已溢寫）")
+
+
+if __name__ == "__main__":
+    main()
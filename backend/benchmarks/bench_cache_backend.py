@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+程序內快取效能測試腳本
+模擬 gunicorn gthread worker 中多個執行緒同時存取快取（讀多寫少、熱點鍵集中），測量：
+  memory   MemoryCacheBackend 本身的吞吐量、延遲、命中率與淘汰次數（鍵空間大於容量）
+  near     RedisManager 在 Redis 可用時，近端快取開啟 / 關閉的吞吐量與 Redis 往返次數
+  down     Redis 無回應時，RedisManager 以程序內快取替代的命中率（加入前所有讀取都未命中）
+
+near / down 使用 bench_redis_client.py 的腳本內 RESP 伺服器，不需要安裝 Redis
+"""
+
+import sys
+import time
+import random
+import argparse
+import threading
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.core.core_cache_backend import MemoryCacheBackend
+from src.core.core_redis_manager import RedisManager
+from bench_redis_client import FakeRedisServer
+
+
+def make_keys(prefix: str, key_space: int, operations: int, skew: float, seed: int) -> list:
+    """依冪次分佈產生存取序列（少數熱點鍵佔大部分存取，接近結果快取的實際分佈）"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** skew for rank in range(key_space)]
+    return [f"{prefix}:{i}" for i in rng.choices(range(key_space), weights=weights, k=operations)]
+
+
+def run_threads(cache, keys: list, threads: int, write_ratio: float, value: dict, expire: int) -> dict:
+    """
+    以 threads 個執行緒分攤 keys 的存取：讀取未命中時寫入（cache-aside），另有 write_ratio 比例的直接寫入
+
+    Returns:
+        吞吐量、延遲與本次的命中率
+    """
+    chunks = [keys[i::threads] for i in range(threads)]
+    latencies = [[] for _ in range(threads)]
+    hits = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        rng = random.Random(index)
+        local_latencies = latencies[index]
+        barrier.wait()
+        for key in chunks[index]:
+            start = time.perf_counter()
+            if rng.random() < write_ratio:
+                cache.set(key, value, expire=expire)
+            elif cache.get(key) is not None:
+                hits[index] += 1
+            else:
+                cache.set(key, value, expire=expire)
+            local_latencies.append((time.perf_counter() - start) * 1000)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed_s = time.perf_counter() - start
+    merged = sorted(latency for chunk in latencies for latency in chunk)
+    return {
+        'ops_per_s': len(keys) / elapsed_s,
+        'p50_ms': statistics.median(merged),
+        'p99_ms': merged[min(len(merged) - 1, int(len(merged) * 0.99))],
+        'hit_rate': sum(hits) / len(keys)
+    }
+
+
+def print_result(name: str, result: dict, extra: str = ""):
+    print(f"   {name:<22} {result['ops_per_s']:>10,.0f} ops/s，p50={result['p50_ms'] * 1000:.1f}µs，"
+          f"p99={result['p99_ms'] * 1000:.1f}µs，命中率 {result['hit_rate'] * 100:.1f}%{extra}")
+
+
+def bench_memory(args, value: dict):
+    print(f"\n📊 memory：MemoryCacheBackend（容量 {args.max_entries} 筆 / {args.max_bytes // 1024 // 1024}MB，"
+          f"鍵空間 {args.key_space}，寫入 {args.write_ratio * 100:.0f}%）")
+    keys = make_keys('user_stats', args.key_space, args.operations, args.skew, args.seed)
+    for threads in args.threads:
+        cache = MemoryCacheBackend(max_entries=args.max_entries, max_bytes=args.max_bytes)
+        result = run_threads(cache, keys, threads, args.write_ratio, value, expire=300)
+        metrics = cache.get_metrics()
+        print_result(f"{threads} 執行緒", result,
+                     f"，淘汰 {metrics['evictions']} 次，{metrics['entries']} 筆 / {metrics['bytes'] / 1024:.0f}KB")
+
+
+def bench_near(args, value: dict):
+    server = FakeRedisServer(latency_ms=args.latency_ms)
+    operations = args.operations // 10
+    keys = make_keys('user_stats', args.key_space, operations, args.skew, args.seed)
+    threads = max(args.threads)
+    print(f"\n📊 near：RedisManager（往返延遲 {args.latency_ms}ms，{threads} 執行緒，{operations} 次）")
+    for near_ttl in (0, args.near_ttl):
+        manager = RedisManager(host='127.0.0.1', port=server.port, max_connections=threads, near_cache_ttl=near_ttl)
+        server.store.clear()
+        result = run_threads(manager, keys, threads, args.write_ratio, value, expire=300)
+        metrics = manager.get_metrics()
+        print_result(f"近端快取 {near_ttl}s" if near_ttl else "近端快取關閉", result,
+                     f"，Redis 往返 {metrics['round_trips']} 次，近端命中 {metrics['near_hits']} 次")
+    server.shutdown()
+
+
+def bench_down(args, value: dict):
+    server = FakeRedisServer(hang=True)
+    threads = max(args.threads)
+    keys = make_keys('login_attempts', args.key_space, args.operations // 10, args.skew, args.seed)
+    manager = RedisManager(host='127.0.0.1', port=server.port, socket_timeout=0.2, connect_timeout=0.2,
+                           max_connections=threads, reset_timeout=3600)
+    print(f"\n📊 down：Redis 無回應（斷路器開啟，{threads} 執行緒，{len(keys)} 次）")
+    result = run_threads(manager, keys, threads, args.write_ratio, value, expire=300)
+    metrics = manager.get_metrics()
+    print_result("程序內快取替代", result,
+                 f"，替代讀取 {metrics['fallback_reads']} 次 / 寫入 {metrics['fallback_writes']} 次")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='程序內快取效能測試（MemoryCacheBackend / 近端快取 / Redis 停機替代）')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='並行執行緒數')
+    parser.add_argument('--operations', type=int, default=200000, help='memory 情境的操作數（near / down 為其 1/10）')
+    parser.add_argument('--key-space', type=int, default=20000, help='鍵總數')
+    parser.add_argument('--skew', type=float, default=1.1, help='冪次分佈指數（越大熱點越集中）')
+    parser.add_argument('--write-ratio', type=float, default=0.05, help='直接寫入的比例')
+    parser.add_argument('--value-size', type=int, default=1024, help='值的大小（位元組）')
+    parser.add_argument('--max-entries', type=int, default=5000, help='memory 情境的容量（筆）')
+    parser.add_argument('--max-bytes', type=int, default=32 * 1024 * 1024, help='memory 情境的容量（位元組）')
+    parser.add_argument('--latency-ms', type=float, default=0.5, help='near 情境的 Redis 往返延遲（毫秒）')
+    parser.add_argument('--near-ttl', type=int, default=5, help='near 情境的近端快取秒數')
+    parser.add_argument('--scenarios', nargs='+', choices=('memory', 'near', 'down'), default=['memory', 'near', 'down'])
+    parser.add_argument('--seed', type=int, default=0, help='隨機種子')
+    args = parser.parse_args()
+
+    value = {'total_detections': 42, 'diseases': {'leaf_blight': 12}, 'padding': 'x' * args.value_size}
+    print("=" * 60)
+    print(f"🧠 程序內快取測試（gunicorn --threads 模擬，Python {sys.version.split()[0]}）")
+    print("=" * 60)
+    if 'memory' in args.scenarios:
+        bench_memory(args, value)
+    if 'near' in args.scenarios:
+        bench_near(args, value)
+    if 'down' in args.scenarios:
+        bench_down(args, value)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+快取失效效能測試腳本
+在 --keys 個鍵（預設 100 萬）的 Redis 中比較三種失效方式：
+  keys      KEYS pattern + DEL（舊的 clear_pattern）：單一命令走訪整個鍵空間，期間 Redis 無法處理其他請求
+  scan      RedisManager.clear_pattern()：SCAN 分批走訪 + UNLINK，不阻塞 Redis，但總耗時仍與鍵空間成正比
+  tags      RedisManager.invalidate_tags()：只走訪標籤集合，成本與群組內的鍵數成正比
+
+每種方式分別清除一個小群組（一個使用者，--group-size 個鍵）與一個大群組（一個模型版本，--model-keys 個鍵），
+測量失效耗時，以及同時由另一條連線每毫秒送出 PING 觀察到的 Redis 停頓（最大 PING 延遲）
+
+需要本機 redis-server（停頓時間無法以腳本內的模擬伺服器測量）；
+測試使用 --db 指定的資料庫，非空時拒絕執行（--force 會先清空），結束後清空
+"""
+
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+import redis
+
+from src.core.core_redis_manager import RedisManager
+
+MODEL_TAG = 'model:benchmark'
+
+
+class StallProbe:
+    """另一條連線每 interval 秒送出 PING，記錄延遲（失效期間的最大值即 Redis 停頓時間）"""
+
+    def __init__(self, host: str, port: int, db: int, interval: float = 0.001):
+        self.client = redis.Redis(host=host, port=port, db=db)
+        self.interval = interval
+        self.latencies = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.latencies = []
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            self.client.ping()
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(self.interval)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies) or [0.0]
+        return {
+            'max_ms': ordered[-1],
+            'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            'over_10ms': sum(latency > 10 for latency in ordered)
+        }
+
+
+def populate_model(manager: RedisManager, args, value):
+    """寫入模型推論結果（帶 model 標籤）"""
+    for offset in range(0, args.model_keys, 1000):
+        manager.mset(
+            {f"inference:benchmark:{i}": value for i in range(offset, min(args.model_keys, offset + 1000))},
+            expire=args.ttl, tags=[MODEL_TAG]
+        )
+
+
+def populate(manager: RedisManager, args, value):
+    """寫入 --keys 個鍵：使用者歷史快取（每人 --group-size 個，帶 user 標籤）與模型推論結果"""
+    users = max(1, (args.keys - args.model_keys) // args.group_size)
+    start = time.perf_counter()
+    for user_id in range(users):
+        manager.mset(
+            {f"history_count:{user_id}:{i}": value for i in range(args.group_size)},
+            expire=args.ttl, tags=[f"user:{user_id}"]
+        )
+    populate_model(manager, args, value)
+    print(f"   寫入 {manager.client.dbsize():,} 個鍵（含標籤集合），{users:,} 個使用者，"
+          f"耗時 {time.perf_counter() - start:.1f}s")
+    return users
+
+
+def legacy_clear_pattern(client: redis.Redis, pattern: str) -> int:
+    """舊的 clear_pattern：KEYS + DEL"""
+    keys = client.keys(pattern)
+    return client.delete(*keys) if keys else 0
+
+
+def measure(name: str, probe: StallProbe, fn) -> dict:
+    with probe:
+        time.sleep(0.02)
+        start = time.perf_counter()
+        deleted = fn()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        time.sleep(0.02)
+    stall = probe.summary()
+    print(f"   {name:<30} 刪除 {deleted:>8,} 個鍵，耗時 {elapsed_ms:>9.1f}ms，"
+          f"Redis 停頓 max={stall['max_ms']:.1f}ms / p99={stall['p99_ms']:.2f}ms（>10ms 的 PING {stall['over_10ms']} 次）")
+    return {'elapsed_ms': elapsed_ms, 'deleted': deleted, **stall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='快取失效效能測試（KEYS vs SCAN/UNLINK vs 標籤）')
+    parser.add_argument('--host', default='localhost', help='redis-server 主機')
+    parser.add_argument('--port', type=int, default=6379, help='redis-server 埠號')
+    parser.add_argument('--db', type=int, default=15, help='測試使用的資料庫編號')
+    parser.add_argument('--force', action='store_true', help='資料庫非空時先清空')
+    parser.add_argument('--keys', type=int, default=1000000, help='鍵總數')
+    parser.add_argument('--group-size', type=int, default=100, help='每個使用者的鍵數（小群組）')
+    parser.add_argument('--model-keys', type=int, default=200000, help='模型版本的鍵數（大群組）')
+    parser.add_argument('--value-size', type=int, default=64, help='值的大小（位元組）')
+    parser.add_argument('--ttl', type=int, default=3600, help='鍵的過期時間（秒）')
+    parser.add_argument('--scan-count', type=int, default=1000, help='SCAN / SSCAN 每次走訪的鍵數')
+    args = parser.parse_args()
+
+    manager = RedisManager(host=args.host, port=args.port, db=args.db, scan_count=args.scan_count, near_cache_ttl=0)
+    if not manager.ping():
+        raise SystemExit(f"❌ 無法連接 {args.host}:{args.port}")
+    client = manager.client
+    if client.dbsize():
+        if not args.force:
+            raise SystemExit(f"❌ 資料庫 {args.db} 非空，請改用其他 --db 或加上 --force")
+        client.flushdb()
+
+    try:
+        version = client.info('server').get('redis_version')
+    except redis.ResponseError:
+        # 部分託管服務以 ACL 禁用 INFO
+        version = 'unknown'
+    print("=" * 60)
+    print(f"🧹 快取失效測試：{args.host}:{args.port}/{args.db}，{args.keys:,} 個鍵，Redis {version}")
+    print("=" * 60)
+    try:
+        value = {'total': 42, 'padding': 'x' * args.value_size}
+        users = populate(manager, args, value)
+        probe = StallProbe(args.host, args.port, args.db)
+
+        print(f"\n📊 小群組：清除一個使用者的 {args.group_size} 個鍵")
+        measure('KEYS + DEL', probe, lambda: legacy_clear_pattern(client, 'history_count:0:*'))
+        measure('SCAN + UNLINK（clear_pattern）', probe, lambda: manager.clear_pattern('history_count:1:*'))
+        measure('標籤（invalidate_tags）', probe, lambda: manager.invalidate_tags([f"user:{min(2, users - 1)}"]))
+
+        print(f"\n📊 大群組：清除一個模型版本的 {args.model_keys:,} 個鍵")
+        measure('KEYS + DEL', probe, lambda: legacy_clear_pattern(client, 'inference:benchmark:*'))
+        populate_model(manager, args, value)
+        measure('SCAN + UNLINK（clear_pattern）', probe, lambda: manager.clear_pattern('inference:benchmark:*'))
+        populate_model(manager, args, value)
+        measure('標籤（invalidate_tags）', probe, lambda: manager.invalidate_tags([MODEL_TAG]))
+
+        metrics = manager.get_metrics()
+        print(f"\n   RedisManager: SCAN/SSCAN {metrics['scan_calls']:,} 次，UNLINK {metrics['keys_unlinked']:,} 個鍵")
+    finally:
+        client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+CNN 推論後端測試腳本
+對 eager / TorchScript / ONNX Runtime 三種後端：
+  - 數值一致性：與 eager 比較 top-1 類別與 softmax 分數（--image-dir 提供真實圖片，否則使用隨機輸入）
+  - 延遲：batch size 1 / 4 / 16 的單次前向傳播 p50 / p99
+
+匯出檔快取在檢查點旁（檔名含檢查點 hash），第一次執行會包含匯出時間
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def collect_inputs(image_dir: str, count: int, device: str):
+    """預處理測試圖片為批次張量；未提供目錄時使用固定種子的隨機輸入"""
+    import torch
+    from modules.cnn_backend import CNN_INPUT_SHAPE
+
+    if image_dir:
+        from modules.cnn_preprocess import preprocess_images_batch
+
+        paths = [
+            str(p) for p in sorted(Path(image_dir).iterdir())
+            if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        ]
+        if not paths:
+            raise FileNotFoundError(f"目錄中沒有圖片: {image_dir}")
+        paths = [paths[i % len(paths)] for i in range(count)]
+        return preprocess_images_batch(paths, device=device)
+
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(count, *CNN_INPUT_SHAPE, generator=generator).to(device)
+
+
+def measure(backend, inputs, repeats: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        backend(inputs)
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend(inputs)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies),
+        'p99': latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CNN 推論後端測試')
+    parser.add_argument('--backends', nargs='+', default=['eager', 'torchscript', 'onnx'], help='測試的後端')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16], help='batch size')
+    parser.add_argument('--image-dir', type=str, default=None, help='一致性檢查用的圖片目錄（預設使用隨機輸入）')
+    parser.add_argument('--parity-samples', type=int, default=64, help='一致性檢查的樣本數')
+    parser.add_argument('--atol', type=float, default=DevelopmentConfig.CNN_PARITY_ATOL, help='softmax 分數容許誤差')
+    parser.add_argument('--repeats', type=int, default=50, help='每個 batch size 重複次數')
+    parser.add_argument('--warmup', type=int, default=5, help='暖機次數')
+    parser.add_argument('--threads', type=int, default=0, help='torch / ONNX Runtime 執行緒數（0 表示預設）')
+    parser.add_argument('--device', type=str, default='cpu', help='設備')
+    args = parser.parse_args()
+
+    import torch
+    from modules.cnn_load import load_cnn_model
+    from modules.cnn_utils import CNN_CLASSES
+    from modules.cnn_backend import EagerBackend, load_cnn_backend, check_cnn_parity, checkpoint_sha256, available_cnn_backends
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    model_path = os.path.join(project_root, DevelopmentConfig.CNN_MODEL_PATH_RELATIVE)
+    model = load_cnn_model(model_path, len(CNN_CLASSES), args.device)
+    checkpoint_hash = checkpoint_sha256(model_path)
+    export_dir = os.path.join(project_root, DevelopmentConfig.CNN_EXPORT_DIR_RELATIVE)
+    parity_inputs = collect_inputs(args.image_dir, args.parity_samples, args.device)
+
+    print("=" * 60)
+    print(f"📦 檢查點: {model_path} ({checkpoint_hash[:16]})")
+    print(f"   可用後端: {', '.join(available_cnn_backends())}, torch 執行緒: {torch.get_num_threads()}")
+    print("=" * 60)
+
+    reference = EagerBackend(model)
+    backends = {}
+    for name in args.backends:
+        start = time.perf_counter()
+        backend, info = load_cnn_backend(
+            model, model_path,
+            backend=name,
+            device=args.device,
+            checkpoint_hash=checkpoint_hash,
+            num_threads=args.threads,
+            verify=False,
+            fallback_export_dir=export_dir
+        )
+        if backend.name != name:
+            print(f"   ⚠️  {name}: 無法載入（{info.get('error', '未知原因')}），略過")
+            continue
+        parity = check_cnn_parity(reference, backend, inputs=parity_inputs, atol=args.atol)
+        status = "✅" if parity['passed'] else "❌"
+        print(f"   {status} {name}: 載入 {time.perf_counter() - start:.2f}s, "
+              f"top-1 不一致 {parity['top1_mismatches']}/{parity['samples']}, 最大誤差 {parity['max_abs_diff']:.2e}"
+              + (f", 匯出檔 {os.path.basename(info['export_path'])}" if info['export_path'] else ""))
+        backends[name] = backend
+
+    for batch_size in args.batch_sizes:
+        inputs = collect_inputs(None, batch_size, args.device)
+        print("\n" + "=" * 60)
+        print(f"📊 batch size {batch_size}（{args.repeats} 次）")
+        print("=" * 60)
+        baseline = None
+        for name, backend in backends.items():
+            result = measure(backend, inputs, args.repeats, args.warmup)
+            baseline = baseline or result['p50']
+            print(f"   {name:<12} p50={result['p50']:.2f}ms, p99={result['p99']:.2f}ms, "
+                  f"{result['p50'] / batch_size:.2f}ms/img, 相對第一個後端 {baseline / result['p50']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
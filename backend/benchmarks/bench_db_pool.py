@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+資料庫連接池壓力測試腳本
+以多於連線上限的執行緒（gunicorn --threads 與背景寫入執行緒同時取用）執行 SELECT pg_sleep(--query-ms)，比較：
+  legacy   舊的 SimpleConnectionPool + 每次查詢前 getconn/putconn 測試：非執行緒安全，上限檢查與計數之間有競爭，
+           實際連線數可能超過上限（也可能在用盡時直接拋出 PoolError）；閒置連線多於 minconn 時歸還即關閉，每次查詢重新連線
+  pool     ConnectionPool：連線數不超過上限，用盡時等待（最多 --acquire-timeout 秒），記錄等待時間 p50/p99
+同時以另一條連線每 10ms 查詢 pg_stat_activity，記錄伺服器端的最大連線數
+
+另外驗證：
+  timeout   statement_timeout_ms 讓過長的語句被伺服器取消，連線仍可重用
+  recycle   超過 max_lifetime 的連線在取出時重建（後端 PID 改變）
+  terminate pg_terminate_backend 中斷所有閒置連線後，下次取出時檢查並重建，不拋出錯誤
+
+需要 .env 中的資料庫設定（只執行 SELECT，不寫入任何資料表）
+"""
+
+import sys
+import time
+import argparse
+import threading
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import pool
+
+from config.development import DevelopmentConfig
+from src.core.core_db_pool import ConnectionPool, set_statement_timeout
+
+
+def connect_kwargs() -> dict:
+    return {
+        'host': DevelopmentConfig.DB_HOST,
+        'port': int(DevelopmentConfig.DB_PORT),
+        'database': DevelopmentConfig.DB_NAME,
+        'user': DevelopmentConfig.DB_USER,
+        'password': DevelopmentConfig.DB_PASSWORD
+    }
+
+
+class LegacyPool:
+    """舊的 DatabaseManager 存取方式：SimpleConnectionPool，每次查詢前先取出 / 歸還一次確認可用"""
+
+    def __init__(self, maxconn: int):
+        self.pool = pool.SimpleConnectionPool(minconn=2, maxconn=maxconn, **connect_kwargs())
+
+    def getconn(self):
+        test_conn = self.pool.getconn()
+        self.pool.putconn(test_conn)
+        return self.pool.getconn()
+
+    def putconn(self, conn):
+        self.pool.putconn(conn)
+
+    def closeall(self):
+        self.pool.closeall()
+
+
+class BackendSampler:
+    """另一條連線定期查詢 pg_stat_activity，記錄本資料庫的最大用戶端連線數（不含取樣連線本身）"""
+
+    def __init__(self, interval: float = 0.01):
+        self.conn = psycopg2.connect(**connect_kwargs())
+        self.conn.autocommit = True
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        with self.conn.cursor() as cursor:
+            while not self._stop.is_set():
+                cursor.execute(
+                    "SELECT count(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()"
+                )
+                self.peak = max(self.peak, cursor.fetchone()[0])
+                time.sleep(self.interval)
+
+    def close(self):
+        self.conn.close()
+
+
+def run_stress(name: str, db_pool, args, sampler: BackendSampler) -> dict:
+    """threads 個執行緒各執行 --iterations 次查詢，返回成功 / 失敗次數與延遲"""
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads + 1)
+    sql = "SELECT pg_sleep(%s)"
+
+    def worker():
+        barrier.wait()
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            try:
+                conn = db_pool.getconn()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(sql, (args.query_ms / 1000,))
+                        cursor.fetchone()
+                    conn.commit()
+                finally:
+                    db_pool.putconn(conn)
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in workers:
+        thread.start()
+    with sampler:
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed_s = time.perf_counter() - start
+
+    latencies.sort()
+    total = args.threads * args.iterations
+    result = {
+        'ok': len(latencies),
+        'errors': errors,
+        'qps': len(latencies) / elapsed_s,
+        'p50_ms': statistics.median(latencies) if latencies else 0.0,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0,
+        'peak_backends': sampler.peak
+    }
+    error_text = '、'.join(f"{k} {v}" for k, v in errors.items()) or '無'
+    print(f"   {name:<20} 成功 {result['ok']:>5}/{total}，{result['qps']:>7.1f} qps，"
+          f"p50={result['p50_ms']:.1f}ms，p99={result['p99_ms']:.1f}ms，"
+          f"伺服器連線數最多 {result['peak_backends']}，錯誤: {error_text}")
+    return result
+
+
+def bench_stress(args):
+    print(f"\n📊 stress：{args.threads} 執行緒 × {args.iterations} 次 pg_sleep({args.query_ms}ms)，連線上限 {args.maxconn}")
+    sampler = BackendSampler()
+    legacy = LegacyPool(args.maxconn)
+    run_stress('SimpleConnectionPool', legacy, args, sampler)
+    legacy.closeall()
+
+    db_pool = ConnectionPool(minconn=2, maxconn=args.maxconn, acquire_timeout=args.acquire_timeout, **connect_kwargs())
+    run_stress('ConnectionPool', db_pool, args, sampler)
+    metrics = db_pool.get_metrics()
+    print(f"   取用等待 p50={metrics['wait_ms']['p50']:.1f}ms / p99={metrics['wait_ms']['p99']:.1f}ms / "
+          f"max={metrics['wait_ms']['max']:.1f}ms，等待 {metrics['waits']} 次，逾時 {metrics['timeouts']} 次，"
+          f"建立 {metrics['created']} 條連線")
+    db_pool.closeall()
+    sampler.close()
+
+
+def backend_pid(db_pool: ConnectionPool) -> int:
+    conn = db_pool.getconn()
+    try:
+        return conn.get_backend_pid()
+    finally:
+        db_pool.putconn(conn)
+
+
+def bench_timeout(args):
+    print(f"\n📊 timeout：預設語句逾時 {args.statement_timeout_ms}ms，單次交易調整為 {args.statement_timeout_ms * 4}ms")
+    db_pool = ConnectionPool(minconn=1, maxconn=1, statement_timeout_ms=args.statement_timeout_ms, **connect_kwargs())
+    sleep_s = args.statement_timeout_ms * 2 / 1000
+
+    conn = db_pool.getconn()
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", (sleep_s,))
+        print("   ❌ 語句未被取消")
+    except psycopg2.extensions.QueryCanceledError:
+        print(f"   ✅ pg_sleep({sleep_s:.2f}s) 在 {(time.perf_counter() - start) * 1000:.0f}ms 後被取消")
+    finally:
+        db_pool.putconn(conn)
+
+    conn = db_pool.getconn()
+    try:
+        set_statement_timeout(conn, args.statement_timeout_ms * 4)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", (sleep_s,))
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            restored = cursor.fetchone()[0]
+        print(f"   ✅ SET LOCAL 放寬後完成，交易結束後恢復為 {restored}")
+    finally:
+        db_pool.putconn(conn)
+    db_pool.closeall()
+
+
+def bench_recycle(args):
+    print(f"\n📊 recycle：max_lifetime={args.max_lifetime}s")
+    db_pool = ConnectionPool(minconn=1, maxconn=1, max_lifetime=args.max_lifetime, **connect_kwargs())
+    before = backend_pid(db_pool)
+    time.sleep(args.max_lifetime + 0.1)
+    after = backend_pid(db_pool)
+    metrics = db_pool.get_metrics()
+    status = '✅' if before != after else '❌'
+    print(f"   {status} 後端 PID {before} → {after}，回收 {metrics['recycled_lifetime']} 條連線")
+    db_pool.closeall()
+
+
+def bench_terminate(args):
+    print(f"\n📊 terminate：pg_terminate_backend 中斷全部 {args.maxconn} 條閒置連線")
+    db_pool = ConnectionPool(minconn=args.maxconn, maxconn=args.maxconn, validate_idle_seconds=0, **connect_kwargs())
+    with db_pool._lock:
+        pids = [pooled.conn.get_backend_pid() for pooled in db_pool._idle]
+    admin = psycopg2.connect(**connect_kwargs())
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute("SELECT count(pg_terminate_backend(pid)) FROM unnest(%s::int[]) AS pid", (pids,))
+    admin.close()
+    time.sleep(0.2)
+
+    failures = 0
+    for _ in range(args.maxconn * 2):
+        try:
+            conn = db_pool.getconn()
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            db_pool.putconn(conn)
+        except psycopg2.Error:
+            failures += 1
+    metrics = db_pool.get_metrics()
+    status = '✅' if failures == 0 else '❌'
+    print(f"   {status} 查詢失敗 {failures} 次，檢查 {metrics['validations']} 次，"
+          f"替換失效連線 {metrics['validation_failures']} 條")
+    db_pool.closeall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='資料庫連接池壓力測試（SimpleConnectionPool vs ConnectionPool）')
+    parser.add_argument('--threads', type=int, default=32, help='並行執行緒數（應大於 --maxconn）')
+    parser.add_argument('--iterations', type=int, default=20, help='每個執行緒的查詢次數')
+    parser.add_argument('--query-ms', type=float, default=20, help='每次查詢的 pg_sleep 毫秒數')
+    parser.add_argument('--maxconn', type=int, default=10, help='連線上限')
+    parser.add_argument('--acquire-timeout', type=float, default=5.0, help='ConnectionPool 等待可用連線的秒數')
+    parser.add_argument('--statement-timeout-ms', type=int, default=200, help='timeout 情境的語句逾時毫秒數')
+    parser.add_argument('--max-lifetime', type=float, default=1.0, help='recycle 情境的連線最長使用秒數')
+    parser.add_argument('--scenarios', nargs='+', choices=('stress', 'timeout', 'recycle', 'terminate'),
+                        default=['stress', 'timeout', 'recycle', 'terminate'])
+    args = parser.parse_args()
+
+    DevelopmentConfig.validate_db_config()
+    print("=" * 60)
+    print(f"🐘 資料庫連接池測試：{DevelopmentConfig.DB_HOST}:{DevelopmentConfig.DB_PORT}/{DevelopmentConfig.DB_NAME}")
+    print("=" * 60)
+    if 'stress' in args.scenarios:
+        bench_stress(args)
+    if 'timeout' in args.scenarios:
+        bench_timeout(args)
+    if 'recycle' in args.scenarios:
+        bench_recycle(args)
+    if 'terminate' in args.scenarios:
+        bench_terminate(args)
+
+
+if __name__ == "__main__":
+    main()
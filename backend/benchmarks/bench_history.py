@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+檢測歷史查詢測試腳本
+為指定使用者寫入大量 detection_records（預設 100k 筆），比較深頁查詢的延遲：
+  - 舊路徑：OFFSET 分頁 + 每次 COUNT(*) + 每筆記錄查詢一次 disease_library（N+1）
+  - 新路徑：游標（keyset）分頁 + 快取總數 + 病害知識庫目錄（記憶體內查詢）
+
+需要 .env 中的資料庫設定與既有使用者（--user-id）；測試資料以 notes 標記，結束時刪除
+"""
+
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+import statistics
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from psycopg2.extras import execute_values
+
+from config.development import DevelopmentConfig
+
+BENCH_NOTE = 'bench_history'
+
+
+def seed_records(db, user_id: int, count: int, batch_size: int = 5000) -> int:
+    """寫入測試記錄（每 3 筆共用同一時間戳，驗證游標以 id 區分同時間記錄）"""
+    diseases = [row[0] for row in (db.execute_query(
+        "SELECT disease_name FROM disease_library WHERE is_active = TRUE ORDER BY id"
+    ) or [])] or ['Tomato_early_blight', 'Potato__Late_blight', 'others']
+    run_id = uuid.uuid4().hex
+    base_time = datetime.now()
+
+    inserted = 0
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            while inserted < count:
+                rows = []
+                for i in range(inserted, min(inserted + batch_size, count)):
+                    image_hash = hashlib.sha256(f"{run_id}:{i}".encode('utf-8')).hexdigest()
+                    rows.append((
+                        user_id, diseases[i % len(diseases)], 'Unknown', 0.9,
+                        f"https://example.com/{image_hash}.jpg", image_hash, 'upload', 'completed',
+                        BENCH_NOTE, base_time - timedelta(seconds=i // 3)
+                    ))
+                execute_values(cursor, """
+                    INSERT INTO detection_records (
+                        user_id, disease_name, severity, confidence, image_path, image_hash,
+                        image_source, status, notes, created_at
+                    ) VALUES %s
+                """, rows, page_size=1000)
+                inserted += len(rows)
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE detection_records")
+        conn.commit()
+    return inserted
+
+
+def cleanup(db, user_id: int):
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM detection_records WHERE user_id = %s AND notes = %s", (user_id, BENCH_NOTE))
+            deleted = cursor.rowcount
+        conn.commit()
+    return deleted
+
+
+def old_page(db, queries, user_id: int, page: int, per_page: int):
+    """舊路徑：OFFSET + COUNT(*) + 每筆記錄一次 disease_library 查詢"""
+    records, total = queries.get_user_detections(user_id=user_id, limit=per_page, offset=(page - 1) * per_page)
+    for record in records:
+        if record.get('disease_name') not in ('others', 'whole_plant'):
+            db.execute_query(
+                "SELECT * FROM disease_library WHERE LOWER(disease_name) = LOWER(%s) AND is_active = TRUE LIMIT 1",
+                (record.get('disease_name'),),
+                dict_cursor=True,
+                fetch_one=True
+            )
+    return records
+
+
+def new_page(queries, user_id: int, cursor: str, per_page: int):
+    """新路徑：游標分頁 + 快取總數 + 病害知識庫目錄"""
+    records, _ = queries.get_user_detections_page(user_id=user_id, limit=per_page, cursor=cursor)
+    queries.count_user_detections(user_id)
+    queries.get_disease_info_batch([record.get('disease_name') for record in records])
+    return records
+
+
+def cursor_for_page(db, queries, user_id: int, page: int, per_page: int):
+    """取得第 page 頁的游標（上一頁最後一筆記錄）"""
+    if page == 1:
+        return None
+    row = db.execute_query(
+        """
+        SELECT id, created_at FROM detection_records
+        WHERE user_id = %s
+        ORDER BY created_at DESC, id DESC
+        OFFSET %s LIMIT 1
+        """,
+        (user_id, (page - 1) * per_page - 1),
+        dict_cursor=True,
+        fetch_one=True
+    )
+    return queries.encode_history_cursor(row)
+
+
+def measure(fn, repeats: int) -> dict:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies),
+        'p99': latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='檢測歷史查詢測試')
+    parser.add_argument('--user-id', type=int, required=True, help='資料庫中已存在的使用者 ID')
+    parser.add_argument('--records', type=int, default=100000, help='寫入的測試記錄數')
+    parser.add_argument('--per-page', type=int, default=20, help='每頁記錄數')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 4000], help='測試頁碼')
+    parser.add_argument('--repeats', type=int, default=30, help='每頁重複次數')
+    parser.add_argument('--keep', action='store_true', help='保留測試資料')
+    args = parser.parse_args()
+
+    from src.core.core_db_manager import db
+    from src.core.core_user_manager import DetectionQueries
+
+    print("=" * 60)
+    print(f"🌱 寫入 {args.records} 筆測試記錄 (user_id={args.user_id}, db={DevelopmentConfig.DB_NAME})")
+    print("=" * 60)
+    start = time.perf_counter()
+    seed_records(db, args.user_id, args.records)
+    print(f"   完成，耗時 {time.perf_counter() - start:.1f}s")
+
+    try:
+        for page in args.pages:
+            if (page - 1) * args.per_page >= args.records:
+                continue
+            cursor = cursor_for_page(db, DetectionQueries, args.user_id, page, args.per_page)
+
+            # 驗證兩種分頁返回相同的記錄
+            old_ids = [r['id'] for r in old_page(db, DetectionQueries, args.user_id, page, args.per_page)]
+            new_ids = [r['id'] for r in new_page(DetectionQueries, args.user_id, cursor, args.per_page)]
+            match = "✅" if old_ids == new_ids else "❌"
+
+            old = measure(lambda: old_page(db, DetectionQueries, args.user_id, page, args.per_page), args.repeats)
+            new = measure(lambda: new_page(DetectionQueries, args.user_id, cursor, args.per_page), args.repeats)
+
+            print("\n" + "=" * 60)
+            print(f"📊 第 {page} 頁（OFFSET {(page - 1) * args.per_page}） {match} 記錄一致")
+            print("=" * 60)
+            print(f"   OFFSET + COUNT + N+1: p50={old['p50']:.2f}ms, p99={old['p99']:.2f}ms")
+            print(f"   游標 + 快取總數 + 批次: p50={new['p50']:.2f}ms, p99={new['p99']:.2f}ms")
+            print(f"   p50 加速: {old['p50'] / new['p50']:.1f}x")
+    finally:
+        if not args.keep:
+            DetectionQueries.invalidate_history_count(args.user_id)
+            print(f"\n🧹 已刪除 {cleanup(db, args.user_id)} 筆測試資料")
+
+
+if __name__ == "__main__":
+    main()
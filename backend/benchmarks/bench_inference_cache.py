@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+推論結果快取效能測試腳本
+比較完整推論（未命中）、程序內 LRU 命中與 Redis 命中三種路徑的延遲，並輸出快取指標
+"""
+
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def make_images(count: int, size: int) -> list:
+    """生成隨機圖片緩衝並計算 hash"""
+    import numpy as np
+    from modules.image_buffer import ImageBuffer
+
+    images = []
+    for _ in range(count):
+        image = ImageBuffer(np.random.randint(0, 255, (size, size, 3), dtype=np.uint8), source_format='JPEG')
+        image.ensure_hash()
+        images.append(image)
+    return images
+
+
+def time_pass(fn, images: list) -> list:
+    """對每張圖片執行 fn 並返回耗時（毫秒）"""
+    timings = []
+    for image in images:
+        start = time.perf_counter()
+        fn(image)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def print_pass(title: str, timings: list):
+    print(f"   {title}: median={statistics.median(timings):.2f}ms, "
+          f"mean={statistics.mean(timings):.2f}ms, max={max(timings):.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推論結果快取效能測試')
+    parser.add_argument('--images', type=int, default=32, help='測試圖片數')
+    parser.add_argument('--size', type=int, default=640, help='隨機圖片邊長')
+    parser.add_argument('--max-entries', type=int, default=DevelopmentConfig.INFERENCE_CACHE_MAX_ENTRIES, help='LRU 最大筆數')
+    args = parser.parse_args()
+
+    from src.services.service_integrated import IntegratedDetectionService
+    from src.services.service_inference_cache import InferenceCache
+
+    print("=" * 60)
+    print("📦 載入模型")
+    print("=" * 60)
+    service = IntegratedDetectionService(
+        cnn_model_path=str(project_root / DevelopmentConfig.CNN_MODEL_PATH_RELATIVE),
+        yolo_model_path=str(project_root / DevelopmentConfig.YOLO_MODEL_PATH_RELATIVE),
+        enable_sr=False,
+        inference_cache_max_entries=args.max_entries
+    )
+    cache = service.inference_cache
+    images = make_images(args.images, args.size)
+    service._run_inference(images[0])  # 預熱
+
+    def miss(image):
+        cache.put(image.image_hash, service._run_inference(image))
+
+    def hit(image):
+        assert cache.get(image.image_hash) is not None
+
+    print("\n" + "=" * 60)
+    print("📊 測試結果")
+    print("=" * 60)
+    print_pass("未命中（完整推論 + 寫入）", time_pass(miss, images))
+    print_pass("程序內 LRU 命中", time_pass(hit, images))
+
+    # 新的快取實例（相同指紋）模擬另一個 worker：程序內為空，只能從 Redis 命中
+    other_worker = InferenceCache(fingerprint=cache.fingerprint, max_entries=args.max_entries)
+    redis_timings = time_pass(lambda image: other_worker.get(image.image_hash), images)
+    if other_worker.get_metrics()['redis_hits']:
+        print_pass("Redis 命中", redis_timings)
+    else:
+        print("   ⚠️  Redis 不可用，跳過 Redis 命中測試")
+
+    # 模型指紋變更後所有舊結果失效
+    cache.set_fingerprint('benchmark-new-model')
+    invalidated = sum(1 for image in images if cache.get(image.image_hash) is None)
+    print(f"   指紋變更後未命中: {invalidated}/{len(images)}")
+
+    print("\n📈 快取指標:")
+    for key, value in cache.get_metrics().items():
+        print(f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+推論伺服器尾端延遲測試腳本
+比較在並發負載下：
+  in_process  請求執行緒直接在本程序推論（與 gunicorn worker 內推論相同，多個執行緒共用 GIL 與 torch 執行緒池）
+  server      經由共享記憶體送到推論伺服器的推論程序池（每個程序綁定獨立的 CPU 與執行緒數）
+的吞吐量與 p50 / p95 / p99 延遲
+
+--crash-test 會在 server 負載進行中終止一個推論程序，驗證其進行中的請求以錯誤返回、程序自動重新啟動
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import tempfile
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def collect_images(image_dir: str, count: int, size: int) -> list:
+    """收集測試圖片並解碼為 RGB 陣列；未提供目錄時生成隨機圖片"""
+    import numpy as np
+    from modules.image_buffer import load_image_buffer
+
+    if image_dir:
+        paths = [
+            str(p) for p in sorted(Path(image_dir).iterdir())
+            if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        ]
+        if not paths:
+            raise FileNotFoundError(f"目錄中沒有圖片: {image_dir}")
+        arrays = [load_image_buffer(path).pixels for path in paths]
+    else:
+        arrays = [np.random.randint(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(min(count, 16))]
+    return [arrays[i % len(arrays)] for i in range(count)]
+
+
+def run_load(infer_fn, images: list, concurrency: int) -> dict:
+    """以固定並發數送出所有請求並統計延遲（失敗的請求不計入延遲）"""
+    latencies = []
+    failures = []
+
+    def one(pixels):
+        start = time.perf_counter()
+        try:
+            infer_fn(pixels)
+        except Exception as e:
+            failures.append(str(e))
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, images))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        'throughput': len(latencies) / wall,
+        'p50': statistics.median(latencies) if latencies else 0.0,
+        'p95': latencies[max(int(len(latencies) * 0.95) - 1, 0)] if latencies else 0.0,
+        'p99': latencies[max(int(len(latencies) * 0.99) - 1, 0)] if latencies else 0.0,
+        'failed': len(failures),
+        'errors': sorted(set(failures))[:3]
+    }
+
+
+def print_result(title: str, result: dict):
+    print(f"   {title}: {result['throughput']:.2f} img/s, "
+          f"p50={result['p50']:.1f}ms, p95={result['p95']:.1f}ms, p99={result['p99']:.1f}ms"
+          + (f", 失敗 {result['failed']} 筆" if result['failed'] else ""))
+    for error in result['errors']:
+        print(f"      ❌ {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推論伺服器尾端延遲測試')
+    parser.add_argument('--images', default=None, help='測試圖片目錄（預設生成隨機圖片）')
+    parser.add_argument('--size', type=int, default=640, help='隨機圖片邊長')
+    parser.add_argument('--requests', type=int, default=128, help='每個並發數的總請求數')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16], help='並發數列表')
+    parser.add_argument('--workers', type=int, default=DevelopmentConfig.INFERENCE_WORKERS, help='推論程序數')
+    parser.add_argument('--threads-per-worker', type=int, default=DevelopmentConfig.INFERENCE_THREADS_PER_WORKER, help='每個推論程序的執行緒數（0 自動）')
+    parser.add_argument('--no-pin', action='store_true', help='不綁定 CPU')
+    parser.add_argument('--enable-sr', action='store_true', help='啟用超解析度（預設關閉以專注於 CNN/YOLO）')
+    parser.add_argument('--skip-in-process', action='store_true', help='只測試推論伺服器')
+    parser.add_argument('--crash-test', action='store_true', help='在 server 負載中終止一個推論程序')
+    args = parser.parse_args()
+
+    from src.services.service_inference_pool import InferenceClient, InferenceServer
+
+    engine_kwargs = {
+        'cnn_model_path': str(project_root / DevelopmentConfig.CNN_MODEL_PATH_RELATIVE),
+        'yolo_model_path': str(project_root / DevelopmentConfig.YOLO_MODEL_PATH_RELATIVE),
+        'cnn_backend': DevelopmentConfig.CNN_BACKEND,
+        'enable_sr': args.enable_sr,
+        'sr_scale': DevelopmentConfig.SR_SCALE
+    }
+    images = collect_images(args.images, args.requests, args.size)
+
+    print("=" * 60)
+    print(f"🚀 推論伺服器測試（{args.workers} 個推論程序，圖片 {images[0].shape}）")
+    print("=" * 60)
+
+    results = {}
+    if not args.skip_in_process:
+        from src.services.service_integrated import IntegratedDetectionService
+
+        print("📦 載入程序內模型...")
+        service = IntegratedDetectionService(
+            **engine_kwargs,
+            enable_inference_cache=False,
+            enable_write_behind=False
+        )
+        service.infer_pixels(images[0])  # 預熱
+        for concurrency in args.concurrency:
+            results[('in_process', concurrency)] = run_load(service.infer_pixels, images, concurrency)
+        del service
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='bench_inference_'), 'inference.sock')
+    authkey = os.urandom(16)
+    print("📦 啟動推論伺服器...")
+    start = time.perf_counter()
+    server = InferenceServer(
+        socket_path,
+        authkey,
+        engine_kwargs,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        pin_cpus=not args.no_pin
+    )
+    server.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = InferenceClient(socket_path, authkey, slot_bytes=max(image.nbytes for image in images))
+    client.connect(timeout=60)
+    print(f"   推論伺服器就緒: {time.perf_counter() - start:.1f}s")
+    for plan in server.get_metrics()['workers']:
+        print(f"   推論程序 {plan['worker_id']}: pid={plan['pid']}, threads={plan['threads']}, cpus={plan['cpus']}")
+
+    client.infer(images[0])  # 預熱
+    for concurrency in args.concurrency:
+        results[('server', concurrency)] = run_load(client.infer, images, concurrency)
+
+    for concurrency in args.concurrency:
+        print("\n" + "=" * 60)
+        print(f"📊 並發數: {concurrency}")
+        print("=" * 60)
+        for mode in ('in_process', 'server'):
+            if (mode, concurrency) in results:
+                print_result(mode, results[(mode, concurrency)])
+        if ('in_process', concurrency) in results:
+            base, remote = results[('in_process', concurrency)], results[('server', concurrency)]
+            print(f"   p99 變化: {remote['p99'] - base['p99']:+.1f}ms，吞吐量 {remote['throughput'] / base['throughput']:.2f}x")
+
+    client_metrics = client.get_metrics()
+    print("\n" + "=" * 60)
+    print("📈 推論伺服器指標")
+    print("=" * 60)
+    print(f"   共享記憶體傳送 {client_metrics['shm_transfers']} 次，直接傳送 {client_metrics['inline_transfers']} 次，"
+          f"等待槽位 {client_metrics['slot_waits']} 次")
+    server_metrics = server.get_metrics()
+    print(f"   推論延遲: {server_metrics['inference_latency']}，排隊: {server_metrics['queue_wait']}")
+
+    if args.crash_test:
+        print("\n" + "=" * 60)
+        print("💥 崩潰測試：負載中終止推論程序 0")
+        print("=" * 60)
+        victim = server.get_metrics()['workers'][0]['pid']
+        threading.Timer(0.5, lambda: os.kill(victim, signal.SIGKILL)).start()
+        print_result("server", run_load(client.infer, images, max(args.concurrency)))
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            worker = server.get_metrics()['workers'][0]
+            if worker['ready'] and worker['pid'] != victim:
+                break
+            time.sleep(0.5)
+        worker = server.get_metrics()['workers'][0]
+        print(f"   推論程序 0: pid {victim} -> {worker['pid']}，重啟 {worker['restarts']} 次，就緒={worker['ready']}")
+        print_result("重啟後", run_load(client.infer, images, max(args.concurrency)))
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
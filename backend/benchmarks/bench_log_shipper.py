@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+日誌批次寫入（log shipper）測試腳本
+比較每個請求記錄 api_logs 的額外延遲：
+  - 不記錄日誌（基準）
+  - 同步寫入（請求執行緒逐筆 INSERT，即 ENABLE_LOG_SHIPPER=false）
+  - 環形緩衝區 + 背景批次寫入
+並以極小緩衝區與緩慢的資料庫驗證過載時的覆蓋計數與結束時的寫入
+
+使用本地 PostgreSQL（需 .env 中的資料庫設定），或使用 --stub 以記憶體內的模擬資料庫執行（可模擬語句與提交延遲）
+"""
+
+import sys
+import time
+import argparse
+import statistics
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+BENCH_ENDPOINT = '/bench/log_shipper'
+
+
+class StubCursor:
+    """模擬遊標：計算寫入的資料列，每個語句模擬固定延遲"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = 0
+
+    def mogrify(self, template, args):
+        self._rows += 1
+        return repr(args).encode('utf-8')
+
+    def execute(self, sql, params=None):
+        time.sleep(self.connection.database.statement_ms / 1000.0)
+        self.connection.staged += self._rows or 1
+        self._rows = 0
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StubConnection:
+    """模擬連接：提交時才計入寫入筆數"""
+
+    encoding = 'UTF8'
+
+    def __init__(self, database):
+        self.database = database
+        self.staged = 0
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        time.sleep(self.database.commit_ms / 1000.0)
+        with self.database.lock:
+            self.database.rows += self.staged
+            self.database.commits += 1
+        self.staged = 0
+
+    def rollback(self):
+        self.staged = 0
+
+
+class StubDatabase:
+    """提供與 DatabaseManager 相同 get_connection() 介面的模擬資料庫"""
+
+    def __init__(self, statement_ms: float, commit_ms: float):
+        self.statement_ms = statement_ms
+        self.commit_ms = commit_ms
+        self.rows = 0
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def get_connection(self):
+        yield StubConnection(self)
+
+
+def api_log_row(index: int) -> tuple:
+    """建立一筆與 log_api_request 相同格式的 api_logs 資料"""
+    return (
+        None, BENCH_ENDPOINT, 'POST', 200, 120 + index % 50,
+        '127.0.0.1', 'bench-log-shipper/1.0', None, None, None
+    )
+
+
+def run_requests(log_fn, count: int, concurrency: int) -> list:
+    """模擬請求執行緒：每個請求結束時記錄一次 API 日誌，返回每次記錄的延遲（微秒）"""
+    latencies = []
+
+    def one(index):
+        start = time.perf_counter()
+        log_fn(index)
+        latencies.append((time.perf_counter() - start) * 1_000_000)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(count)))
+    return latencies
+
+
+def print_latency(title: str, latencies: list, wall: float):
+    latencies = sorted(latencies)
+    print(f"   {title}: p50={statistics.median(latencies):.1f}µs, "
+          f"p99={latencies[max(int(len(latencies) * 0.99) - 1, 0)]:.1f}µs, "
+          f"max={latencies[-1]:.1f}µs, 總耗時 {wall:.2f}s")
+
+
+def count_rows(database) -> int:
+    if isinstance(database, StubDatabase):
+        return database.rows
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM api_logs WHERE endpoint = %s", (BENCH_ENDPOINT,))
+            return cursor.fetchone()[0]
+
+
+def cleanup(database):
+    if isinstance(database, StubDatabase):
+        return
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM api_logs WHERE endpoint = %s", (BENCH_ENDPOINT,))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日誌批次寫入測試')
+    parser.add_argument('--stub', action='store_true', help='使用記憶體內模擬資料庫')
+    parser.add_argument('--requests', type=int, default=5000, help='請求數')
+    parser.add_argument('--concurrency', type=int, default=4, help='並發數')
+    parser.add_argument('--statement-ms', type=float, default=0.5, help='模擬資料庫每個語句延遲（毫秒）')
+    parser.add_argument('--commit-ms', type=float, default=1.0, help='模擬資料庫提交延遲（毫秒）')
+    parser.add_argument('--buffer-size', type=int, default=10000, help='緩衝區上限筆數')
+    parser.add_argument('--batch-size', type=int, default=500, help='單一 INSERT 最大列數')
+    parser.add_argument('--flush-ms', type=int, default=1000, help='背景寫入最長等待時間（毫秒）')
+    args = parser.parse_args()
+
+    from src.core.core_log_shipper import LogShipper
+
+    if args.stub:
+        database = StubDatabase(args.statement_ms, args.commit_ms)
+        target = f"模擬資料庫（語句 {args.statement_ms}ms，提交 {args.commit_ms}ms）"
+    else:
+        from src.core.core_db_manager import db as database
+        target = f"PostgreSQL（db={DevelopmentConfig.DB_NAME}）"
+        cleanup(database)
+
+    print("=" * 60)
+    print(f"📊 每個請求的日誌記錄延遲（{args.requests} 筆，並發 {args.concurrency}，{target}）")
+    print("=" * 60)
+
+    try:
+        # 1. 不記錄日誌
+        wall_start = time.perf_counter()
+        latencies = run_requests(api_log_row, args.requests, args.concurrency)
+        print_latency("不記錄日誌", latencies, time.perf_counter() - wall_start)
+
+        # 2. 同步寫入
+        sync_shipper = LogShipper(db_manager=database, enabled=False)
+        before = count_rows(database)
+        wall_start = time.perf_counter()
+        latencies = run_requests(lambda i: sync_shipper.ship('api_logs', api_log_row(i)), args.requests, args.concurrency)
+        print_latency("同步逐筆寫入", latencies, time.perf_counter() - wall_start)
+        print(f"      已寫入 {count_rows(database) - before} 筆")
+        sync_shipper.shutdown()
+
+        # 3. 環形緩衝區 + 背景批次寫入
+        shipper = LogShipper(
+            db_manager=database,
+            buffer_size=args.buffer_size,
+            batch_size=args.batch_size,
+            flush_interval_ms=args.flush_ms
+        )
+        before = count_rows(database)
+        wall_start = time.perf_counter()
+        latencies = run_requests(lambda i: shipper.ship('api_logs', api_log_row(i)), args.requests, args.concurrency)
+        request_wall = time.perf_counter() - wall_start
+        shipper.flush()
+        print_latency("環形緩衝區", latencies, request_wall)
+        metrics = shipper.get_metrics()
+        shipper.shutdown()
+        print(f"      全部寫入 {time.perf_counter() - wall_start:.2f}s, 已寫入 {count_rows(database) - before} 筆, "
+              f"批次 {metrics['flushes']} 次（avg={metrics['flush_latency']['avg_ms']}ms, "
+              f"max={metrics['flush_latency']['max_ms']}ms）, 覆蓋 {metrics['dropped']}, 失敗 {metrics['failed']}")
+
+        # 4. 過載：緩衝區遠小於請求數、背景寫入間隔很長，覆蓋最舊的資料而不阻塞請求
+        overload_size = max(1, args.requests // 10)
+        shipper = LogShipper(
+            db_manager=database,
+            buffer_size=overload_size,
+            batch_size=overload_size + 1,
+            flush_interval_ms=60000
+        )
+        before = count_rows(database)
+        wall_start = time.perf_counter()
+        latencies = run_requests(lambda i: shipper.ship('api_logs', api_log_row(i)), args.requests, args.concurrency)
+        print("\n" + "=" * 60)
+        print(f"📊 過載（緩衝區 {overload_size} 筆，背景寫入暫停）")
+        print("=" * 60)
+        print_latency("環形緩衝區", latencies, time.perf_counter() - wall_start)
+        dropped = shipper.get_metrics()['dropped']
+        shipper.shutdown()
+        written = count_rows(database) - before
+        status = "✅" if dropped + written == args.requests and written == overload_size else "❌"
+        print(f"   {status} 覆蓋 {dropped} 筆, 結束時寫入 {written} 筆（合計 {dropped + written}/{args.requests}）")
+    finally:
+        cleanup(database)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+微批次推論負載測試腳本
+比較「每次呼叫處理一張圖片」與「動態微批次」兩種路徑在並發負載下的吞吐量與延遲
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def collect_images(image_dir: str, count: int) -> list:
+    """收集測試圖片並解碼為 ImageBuffer；未提供目錄時生成隨機圖片"""
+    from modules.image_buffer import load_image_buffer
+
+    if image_dir:
+        paths = [
+            str(p) for p in sorted(Path(image_dir).iterdir())
+            if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        ]
+        if not paths:
+            raise FileNotFoundError(f"目錄中沒有圖片: {image_dir}")
+        buffers = [load_image_buffer(path) for path in paths]
+        return [buffers[i % len(buffers)] for i in range(count)]
+
+    import numpy as np
+    from PIL import Image
+
+    temp_dir = tempfile.mkdtemp(prefix='bench_batching_')
+    paths = []
+    for i in range(min(count, 16)):
+        array = np.random.randint(0, 255, (640, 640, 3), dtype=np.uint8)
+        path = os.path.join(temp_dir, f"random_{i}.jpg")
+        Image.fromarray(array).save(path, quality=85)
+        paths.append(path)
+    buffers = [load_image_buffer(path) for path in paths]
+    return [buffers[i % len(buffers)] for i in range(count)]
+
+
+def run_load(infer_fn, images: list, concurrency: int) -> dict:
+    """以固定並發數送出所有請求並統計延遲"""
+    latencies = []
+
+    def one(image):
+        start = time.perf_counter()
+        infer_fn(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, images))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        'throughput': len(images) / wall,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'p99': latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def print_result(title: str, result: dict):
+    print(f"   {title}: {result['throughput']:.2f} img/s, "
+          f"p50={result['p50']:.1f}ms, p95={result['p95']:.1f}ms, p99={result['p99']:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='微批次推論負載測試')
+    parser.add_argument('--images', default=None, help='測試圖片目錄（預設生成隨機圖片）')
+    parser.add_argument('--requests', type=int, default=128, help='總請求數')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16], help='並發數列表')
+    parser.add_argument('--window-ms', type=int, default=DevelopmentConfig.BATCH_WINDOW_MS, help='批次時間窗口')
+    parser.add_argument('--max-batch', type=int, default=DevelopmentConfig.BATCH_MAX_SIZE, help='最大批次大小')
+    args = parser.parse_args()
+
+    from src.services.service_integrated import IntegratedDetectionService
+    from src.services.service_batching import MicroBatchScheduler
+
+    print("=" * 60)
+    print("📦 載入模型")
+    print("=" * 60)
+    service = IntegratedDetectionService(
+        cnn_model_path=str(project_root / DevelopmentConfig.CNN_MODEL_PATH_RELATIVE),
+        yolo_model_path=str(project_root / DevelopmentConfig.YOLO_MODEL_PATH_RELATIVE),
+        enable_sr=False
+    )
+    images = collect_images(args.images, args.requests)
+
+    # 預熱
+    service._run_inference(images[0])
+    service._run_inference_batch(images[:args.max_batch])
+
+    for concurrency in args.concurrency:
+        print("\n" + "=" * 60)
+        print(f"📊 並發數: {concurrency}")
+        print("=" * 60)
+
+        baseline = run_load(service._run_inference, images, concurrency)
+        print_result("單張路徑", baseline)
+
+        scheduler = MicroBatchScheduler(
+            batch_fn=service._run_inference_batch,
+            window_ms=args.window_ms,
+            max_batch_size=args.max_batch,
+            name='benchmark'
+        )
+        service.batch_scheduler = scheduler
+        batched = run_load(scheduler.submit_and_wait, images, concurrency)
+        metrics = scheduler.get_metrics()
+        scheduler.shutdown()
+        service.batch_scheduler = None
+
+        print_result("微批次路徑", batched)
+        print(f"   批次大小直方圖: {metrics['batch_size_histogram']}")
+        for stage, stats in metrics['stage_latency'].items():
+            print(f"   {stage}: avg={stats['avg_ms']}ms, max={stats['max_ms']}ms")
+        print(f"   吞吐量提升: {batched['throughput'] / baseline['throughput']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+近似重複索引效能測試腳本
+以 100 萬個 64 位元雜湊建立 HammingIndex（多索引雜湊），測量：
+  - 建立耗時與記憶體（RSS 增量）
+  - 查詢延遲 p50 / p99（一半查詢為既有雜湊翻轉 0..d 個位元，一半為隨機雜湊）
+  - 與 NumPy 暴力掃描（XOR + popcount）比較結果是否一致，以及暴力掃描的延遲
+
+--clusters N 以 N 個中心點附近的雜湊取代均勻隨機雜湊（模擬大量相似葉片照片，桶大小不均時的最差情況）
+--images DIR 額外測量真實圖片重新以不同 JPEG 品質存檔、縮放後的 pHash 漢明距離，用於選擇 NEAR_DUPLICATE_MAX_DISTANCE
+
+不需要資料庫或模型
+"""
+
+import io
+import sys
+import time
+import random
+import argparse
+import resource
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+import numpy as np
+
+from config.development import DevelopmentConfig
+from modules.perceptual_hash import HammingIndex, hamming_distance, phash
+
+
+def rss_mb() -> float:
+    """目前程序的 RSS（MB）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for position in rng.sample(range(64), count):
+        value ^= 1 << position
+    return value
+
+
+def generate_hashes(count: int, clusters: int, rng: random.Random) -> list:
+    """生成測試雜湊：均勻隨機，或在 clusters 個中心點附近翻轉 0-12 個位元"""
+    if not clusters:
+        return [rng.getrandbits(64) for _ in range(count)]
+    centers = [rng.getrandbits(64) for _ in range(clusters)]
+    return [flip_bits(centers[rng.randrange(clusters)], rng.randint(0, 12), rng) for _ in range(count)]
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def brute_force(hashes: np.ndarray, query: int, max_distance: int) -> set:
+    """NumPy 暴力掃描：返回距離 <= max_distance 的所有雜湊"""
+    xor = hashes ^ np.uint64(query)
+    if hasattr(np, 'bitwise_count'):
+        distances = np.bitwise_count(xor)
+    else:
+        distances = _POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+    return set(hashes[distances <= max_distance].tolist())
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def bench_index(index: HammingIndex, hashes: list, queries: list, max_distance: int, verify: int) -> dict:
+    print(f"\n📊 max_distance={max_distance}")
+    latencies = []
+    candidates = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        matches, checked = index.search(query, max_distance)
+        latencies.append((time.perf_counter() - start) * 1000)
+        candidates.append(checked)
+        found += bool(matches)
+
+    # 與暴力掃描比較（只比較前 verify 筆查詢，暴力掃描較慢）
+    array = np.array(hashes, dtype=np.uint64)
+    brute_latencies = []
+    mismatches = 0
+    for query in queries[:verify]:
+        start = time.perf_counter()
+        expected = brute_force(array, query, max_distance)
+        brute_latencies.append((time.perf_counter() - start) * 1000)
+        matches, _ = index.search(query, max_distance)
+        if {value for _, value, _ in matches} != expected:
+            mismatches += 1
+
+    result = {
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': percentile(latencies, 0.99),
+        'avg_candidates': statistics.mean(candidates),
+        'found': found,
+        'brute_p50_ms': statistics.median(brute_latencies) if brute_latencies else 0.0,
+        'mismatches': mismatches
+    }
+    print(f"   索引查詢: p50={result['p50_ms']:.3f}ms, p99={result['p99_ms']:.3f}ms, "
+          f"平均驗證候選 {result['avg_candidates']:.0f} 個，找到 {found}/{len(queries)}")
+    print(f"   暴力掃描: p50={result['brute_p50_ms']:.2f}ms（{verify} 筆查詢），"
+          f"結果不一致 {mismatches} 筆" + (" ❌" if mismatches else " ✅"))
+    return result
+
+
+def bench_images(image_dir: str):
+    """真實圖片經重新存檔 / 縮放後的 pHash 距離（同一張圖片應在門檻內）與不同圖片間的距離"""
+    from PIL import Image
+
+    paths = [p for p in sorted(Path(image_dir).iterdir()) if p.suffix.lower() in ('.jpg', '.jpeg', '.png')]
+    if not paths:
+        raise FileNotFoundError(f"目錄中沒有圖片: {image_dir}")
+
+    def reencode(img, quality):
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+        buffer.seek(0)
+        return Image.open(buffer).convert('RGB')
+
+    variants = {
+        'jpeg_q90': lambda img: reencode(img, 90),
+        'jpeg_q60': lambda img: reencode(img, 60),
+        'jpeg_q30': lambda img: reencode(img, 30),
+        'half_size': lambda img: img.resize((img.width // 2, img.height // 2), Image.Resampling.LANCZOS)
+    }
+    distances = {name: [] for name in variants}
+    originals = []
+    for path in paths:
+        # 與 Web 流程相同：先拉伸到 640x640 再計算
+        img = Image.open(path).convert('RGB')
+        base = phash(np.asarray(img.resize((640, 640), Image.Resampling.LANCZOS)))
+        originals.append(base)
+        for name, transform in variants.items():
+            variant = transform(img).resize((640, 640), Image.Resampling.LANCZOS)
+            distances[name].append(hamming_distance(base, phash(np.asarray(variant))))
+
+    print("\n" + "=" * 60)
+    print(f"🖼️  真實圖片 pHash 距離（{len(paths)} 張）")
+    print("=" * 60)
+    for name, values in distances.items():
+        print(f"   {name:<10} 中位數 {statistics.median(values):.0f}，最大 {max(values)}")
+    pairs = [hamming_distance(a, b) for i, a in enumerate(originals) for b in originals[i + 1:]]
+    if pairs:
+        print(f"   不同圖片   最小 {min(pairs)}，中位數 {statistics.median(pairs):.0f}"
+              f"（門檻 {DevelopmentConfig.NEAR_DUPLICATE_MAX_DISTANCE} 內 {sum(d <= DevelopmentConfig.NEAR_DUPLICATE_MAX_DISTANCE for d in pairs)} 對）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='近似重複索引效能測試')
+    parser.add_argument('--entries', type=int, default=1000000, help='索引雜湊數')
+    parser.add_argument('--queries', type=int, default=2000, help='查詢數')
+    parser.add_argument('--verify', type=int, default=100, help='與暴力掃描比較的查詢數')
+    parser.add_argument('--max-distance', type=int, nargs='+',
+                        default=sorted({DevelopmentConfig.NEAR_DUPLICATE_MAX_DISTANCE, 7, 10}), help='漢明距離門檻')
+    parser.add_argument('--clusters', type=int, default=0, help='叢集中心數（0 表示均勻隨機雜湊）')
+    parser.add_argument('--images', default=None, help='真實圖片目錄（測量重新存檔後的 pHash 距離）')
+    parser.add_argument('--seed', type=int, default=0, help='隨機種子')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    distribution = f"{args.clusters} 個叢集" if args.clusters else "均勻隨機"
+    print("=" * 60)
+    print(f"🔎 近似重複索引測試（{args.entries} 個雜湊，{distribution}）")
+    print("=" * 60)
+
+    hashes = generate_hashes(args.entries, args.clusters, rng)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    index = HammingIndex(max_entries=args.entries)
+    for position, value in enumerate(hashes):
+        index.add(value, position)
+    build_s = time.perf_counter() - start
+    print(f"   建立: {build_s:.1f}s（{args.entries / build_s:,.0f} 筆/s），"
+          f"唯一雜湊 {len(index)} 個，RSS 增加 {rss_mb() - rss_before:.0f}MB")
+
+    for max_distance in args.max_distance:
+        # 一半查詢為既有雜湊翻轉 0..d 個位元（應找到），一半為隨機雜湊（通常找不到）
+        queries = []
+        for _ in range(args.queries // 2):
+            queries.append(flip_bits(rng.choice(hashes), rng.randint(0, max_distance), rng))
+            queries.append(rng.getrandbits(64))
+        bench_index(index, hashes, queries, max_distance, args.verify)
+
+    if args.images:
+        bench_images(args.images)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+預備語句效能測試腳本
+以相同的參數比較熱門 SQL 以文字送出（每次解析與規劃）與經 statements 登錄表 PREPARE 後以 EXECUTE 執行的延遲：
+  active   使用者啟用狀態查詢（user_status_cache 未命中時，db.execute_query vs db.execute_prepared）
+  history  檢測歷史第一頁與總數（--user-id 的記錄，execute_query vs execute_prepared）
+  insert   一批 --batch-size 筆 prediction_log 寫入（execute_values 多列 VALUES vs unnest 預備語句），每次都回滾
+
+需要 .env 中的資料庫設定與既有使用者（--user-id）；不會留下任何資料
+"""
+
+import sys
+import time
+import uuid
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from psycopg2.extras import execute_values
+
+from src.core.core_db_manager import db
+from src.core.core_db_statements import statements
+from src.core.core_user_manager import DetectionQueries
+from src.core.core_user_status_cache import ACTIVE_USER_STATEMENT
+from src.core.core_write_behind import PREDICTION_LOG_COLUMNS, PREDICTION_LOG_INSERT_STATEMENT
+
+
+def measure(name: str, fn, iterations: int) -> float:
+    """執行 iterations 次（先暖身 5 次，讓每條連線都已 PREPARE），返回 p50 毫秒"""
+    for _ in range(5):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    print(f"   {name:<28} p50={p50:.3f}ms，p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:.3f}ms")
+    return p50
+
+
+def compare(title: str, text_fn, prepared_fn, iterations: int):
+    print(f"\n📊 {title}")
+    text_p50 = measure('文字 SQL', text_fn, iterations)
+    prepared_p50 = measure('預備語句', prepared_fn, iterations)
+    print(f"   p50 降低 {(1 - prepared_p50 / text_p50) * 100:.1f}%")
+
+
+def bench_active(args):
+    sql = "SELECT id FROM users WHERE id = %s AND is_active = TRUE"
+    compare(
+        '使用者啟用狀態查詢',
+        lambda: db.execute_query(sql, (args.user_id,), fetch_one=True),
+        lambda: db.execute_prepared(ACTIVE_USER_STATEMENT, (args.user_id,), fetch_one=True),
+        args.iterations
+    )
+
+
+def bench_history(args):
+    where_conditions, params = DetectionQueries._history_filters(args.user_id)
+    page_sql = f"""
+            SELECT {DetectionQueries.HISTORY_COLUMNS}
+            FROM detection_records
+            WHERE {" AND ".join(where_conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """
+    count_sql = f"""
+            SELECT COUNT(*) as total
+            FROM detection_records
+            WHERE {" AND ".join(where_conditions)}
+        """
+    page_statement = DetectionQueries._history_statement('page', page_sql)
+    count_statement = DetectionQueries._history_statement('count', count_sql)
+    page_params = tuple(params + [args.page_size + 1])
+    compare(
+        f"檢測歷史第一頁（{args.page_size} 筆）",
+        lambda: db.execute_query(page_sql, page_params, dict_cursor=True),
+        lambda: db.execute_prepared(page_statement, page_params, dict_cursor=True),
+        args.iterations
+    )
+    compare(
+        '檢測歷史總數',
+        lambda: db.execute_query(count_sql, tuple(params), fetch_one=True),
+        lambda: db.execute_prepared(count_statement, tuple(params), fetch_one=True),
+        args.iterations
+    )
+
+
+def make_rows(args) -> list:
+    rows = []
+    for _ in range(args.batch_size):
+        prediction_id = str(uuid.uuid4())
+        values = dict.fromkeys(PREDICTION_LOG_COLUMNS)
+        values.update({
+            'id': prediction_id,
+            'user_id': args.user_id,
+            'image_path': f"/image/prediction/{prediction_id}",
+            'image_hash': uuid.uuid4().hex + uuid.uuid4().hex,
+            'image_source': 'upload',
+            'cnn_best_class': 'Tomato_early_blight',
+            'cnn_best_score': 0.93,
+            'cnn_all_scores': '{"Tomato_early_blight": 0.93}',
+            'final_status': 'completed'
+        })
+        rows.append(tuple(values[column] for column in PREDICTION_LOG_COLUMNS) + (time.time(),))
+    return rows
+
+
+def bench_insert(args):
+    rows = make_rows(args)
+    columns = [list(column) for column in zip(*rows)]
+    text_sql = f"""
+            INSERT INTO prediction_log ({', '.join(PREDICTION_LOG_COLUMNS)}, created_at)
+            VALUES %s
+            ON CONFLICT (id) DO NOTHING
+            """
+    template = '(' + ', '.join(['%s'] * len(PREDICTION_LOG_COLUMNS)) + ', to_timestamp(%s))'
+
+    def text_insert():
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, text_sql, rows, template=template, page_size=len(rows))
+            conn.rollback()
+
+    def prepared_insert():
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                statements.execute(cursor, PREDICTION_LOG_INSERT_STATEMENT, columns)
+            conn.rollback()
+
+    compare(f"prediction_log 批次寫入（{args.batch_size} 筆，回滾）", text_insert, prepared_insert, args.iterations // 10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='預備語句效能測試（文字 SQL vs PREPARE / EXECUTE）')
+    parser.add_argument('--user-id', type=int, default=1, help='既有使用者 ID')
+    parser.add_argument('--iterations', type=int, default=2000, help='每種方式的執行次數（insert 為其 1/10）')
+    parser.add_argument('--page-size', type=int, default=20, help='history 情境每頁筆數')
+    parser.add_argument('--batch-size', type=int, default=64, help='insert 情境每批筆數')
+    parser.add_argument('--scenarios', nargs='+', choices=('active', 'history', 'insert'),
+                        default=['active', 'history', 'insert'])
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🧾 預備語句測試（使用者 {args.user_id}，連線數上限 {db.pool.maxconn}）")
+    print("=" * 60)
+    if 'active' in args.scenarios:
+        bench_active(args)
+    if 'history' in args.scenarios:
+        bench_history(args)
+    if 'insert' in args.scenarios:
+        bench_insert(args)
+
+    print("\n📊 語句統計（db.get_statement_metrics()）")
+    for name, stats in db.get_statement_metrics()['statements'].items():
+        print(f"   {name:<28} {stats['calls']:>6} 次，平均 {stats['avg_ms']:.3f}ms，PREPARE {stats['prepares']} 次")
+    db.close_all()
+
+
+if __name__ == "__main__":
+    main()
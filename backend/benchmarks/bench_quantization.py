@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+INT8 量化測試腳本
+比較 CNN（MobileNetV3）與超解析度模型（EDSR）fp32 與 INT8（dynamic / static）的：
+  - 延遲：CNN batch 1 / 8，SR 單張 patch
+  - 記憶體：序列化模型大小、載入後程序 RSS 增量
+  - 準確率：重播 val_predictions_rerun.csv（需 --image-root 指向本機驗證集），SR 以「SR → fp32 CNN」的分類準確率衡量
+
+未提供 --image-root 時只測延遲與記憶體（static 量化以隨機圖片校正，結果僅供參考）
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def rss_mb() -> float:
+    """目前程序的常駐記憶體（MB，讀取 /proc/self/status；其他平台返回 0）"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def serialized_mb(model, example_input) -> float:
+    """以 TorchScript 序列化後的大小（MB）"""
+    import torch
+
+    buffer = io.BytesIO()
+    with torch.no_grad():
+        torch.jit.save(torch.jit.trace(model, example_input), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def measure(fn, repeats: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {'p50': statistics.median(latencies), 'p99': latencies[max(int(len(latencies) * 0.99) - 1, 0)]}
+
+
+def random_arrays(count: int, size: int = 256) -> list:
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def print_latency(name: str, latency: dict, baseline: dict = None):
+    line = f"   {name:<12} p50={latency['p50']:.2f}ms, p99={latency['p99']:.2f}ms"
+    if baseline:
+        line += f", p50 加速 {baseline['p50'] / latency['p50']:.2f}x"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8 量化測試')
+    parser.add_argument('--models', nargs='+', default=['cnn', 'sr'], help="測試的模型（'cnn'、'sr'）")
+    parser.add_argument('--modes', nargs='+', default=['dynamic', 'static'], help='量化模式')
+    parser.add_argument('--image-root', type=str, default=DevelopmentConfig.QUANT_VAL_IMAGE_ROOT, help='本機驗證集目錄')
+    parser.add_argument('--samples', type=int, default=DevelopmentConfig.QUANT_GATE_MAX_SAMPLES, help='準確率評估的最大圖片數')
+    parser.add_argument('--sr-samples', type=int, default=50, help='SR 準確率評估的最大圖片數（SR 較慢）')
+    parser.add_argument('--calibration', type=int, default=DevelopmentConfig.QUANT_CALIBRATION_SIZE, help='static 校正圖片數')
+    parser.add_argument('--max-drop', type=float, default=DevelopmentConfig.QUANT_MAX_ACCURACY_DROP, help='準確率閘門門檻')
+    parser.add_argument('--sr-patch', type=int, default=128, help='SR 延遲測試的輸入 patch 邊長')
+    parser.add_argument('--repeats', type=int, default=30, help='延遲測試重複次數')
+    parser.add_argument('--threads', type=int, default=0, help='torch 執行緒數（0 表示預設）')
+    args = parser.parse_args()
+
+    import torch
+    from modules.cnn_load import load_cnn_model, quantize_cnn_model
+    from modules.cnn_utils import CNN_CLASSES
+    from modules.sr_load import SuperResolutionModelLoader
+    from modules.image_buffer import load_image_buffer
+    from modules.quantization import select_quantization_engine, load_validation_samples, split_samples, compare_accuracy
+    from src.services.service_quantization import cnn_classify_fn, sr_then_cnn_classify_fn
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    engine = select_quantization_engine(DevelopmentConfig.QUANT_ENGINE)
+
+    samples = load_validation_samples(
+        os.path.join(project_root, DevelopmentConfig.QUANT_VAL_CSV_RELATIVE), args.image_root, CNN_CLASSES
+    )
+    calibration, evaluation = split_samples(samples, args.calibration, args.samples)
+    load_arrays = lambda batch: [load_image_buffer(s['path'], stage='quantization').pixels for s in batch]
+    calibration_arrays = load_arrays(calibration) if calibration else random_arrays(args.calibration)
+
+    print("=" * 60)
+    print(f"📦 量化引擎: {engine}, torch 執行緒: {torch.get_num_threads()}")
+    if samples:
+        print(f"   驗證清單: {len(samples)} 張（校正 {len(calibration)}，評估 {len(evaluation)}），門檻 {args.max_drop}")
+    else:
+        print("   ⚠️  找不到驗證圖片（--image-root），略過準確率評估，static 以隨機圖片校正")
+    print("=" * 60)
+
+    cnn_path = os.path.join(project_root, DevelopmentConfig.CNN_MODEL_PATH_RELATIVE)
+    rss_before = rss_mb()
+    cnn_model = load_cnn_model(cnn_path, len(CNN_CLASSES), 'cpu')
+    cnn_rss = rss_mb() - rss_before
+    cnn_reference = cnn_classify_fn(cnn_model)
+
+    if 'cnn' in args.models:
+        quantized_models = {}
+        print("\n" + "=" * 60)
+        print("📊 CNN 記憶體與準確率")
+        print("=" * 60)
+        example = torch.randn(1, 3, 224, 224)
+        print(f"   {'fp32':<12} 模型 {serialized_mb(cnn_model, example):.1f}MB, RSS +{cnn_rss:.1f}MB")
+        for mode in args.modes:
+            rss_before = rss_mb()
+            quantized, example = quantize_cnn_model(cnn_model, mode, calibration_arrays, engine)
+            rss_delta = rss_mb() - rss_before
+            quantized_models[mode] = quantized
+            print(f"   {'int8-' + mode:<12} 模型 {serialized_mb(quantized, example):.1f}MB, RSS +{rss_delta:.1f}MB")
+            if evaluation:
+                report = compare_accuracy(cnn_reference, cnn_classify_fn(quantized), evaluation,
+                                          args.max_drop, load_fn=load_arrays)
+                status = "✅ 通過" if report['passed'] else "❌ 拒絕"
+                print(f"      準確率 {report['reference_accuracy']:.4f} → {report['candidate_accuracy']:.4f}"
+                      f"（下降 {report['drop']:+.4f}，不一致 {report['disagreements']}/{report['samples']}） {status}")
+
+        for batch_size in (1, 8):
+            inputs = torch.randn(batch_size, 3, 224, 224)
+            print("\n" + "=" * 60)
+            print(f"📊 CNN batch size {batch_size}（{args.repeats} 次）")
+            print("=" * 60)
+            with torch.no_grad():
+                baseline = measure(lambda: cnn_model(inputs), args.repeats)
+                print_latency('fp32', baseline)
+                for mode, quantized in quantized_models.items():
+                    print_latency(f"int8-{mode}", measure(lambda: quantized(inputs), args.repeats), baseline)
+
+    sr_relative = DevelopmentConfig.SR_MODEL_PATH_RELATIVE
+    if 'sr' in args.models and sr_relative:
+        sr_path = os.path.join(project_root, sr_relative)
+        rss_before = rss_mb()
+        loader = SuperResolutionModelLoader(model_path=sr_path, device='cpu')
+        sr_model = loader.load_model(model_type=DevelopmentConfig.SR_MODEL_TYPE, scale=DevelopmentConfig.SR_SCALE)
+        sr_rss = rss_mb() - rss_before
+        patch = torch.rand(1, 3, args.sr_patch, args.sr_patch)
+        sr_kwargs = {'scale': DevelopmentConfig.SR_SCALE, 'tile_size': DevelopmentConfig.SR_TILE_SIZE or None,
+                     'tile_overlap': DevelopmentConfig.SR_TILE_OVERLAP, 'tile_batch_size': DevelopmentConfig.SR_TILE_BATCH_SIZE}
+        sr_evaluation = evaluation[:args.sr_samples]
+
+        print("\n" + "=" * 60)
+        print(f"📊 超解析度 {os.path.basename(sr_path)}（{args.sr_patch}x{args.sr_patch} patch, {DevelopmentConfig.SR_SCALE}x）")
+        print("=" * 60)
+        with torch.no_grad():
+            baseline = measure(lambda: sr_model(patch), max(5, args.repeats // 3))
+        print_latency('fp32', baseline)
+        print(f"      模型 {serialized_mb(sr_model, patch):.1f}MB, RSS +{sr_rss:.1f}MB")
+        for mode in args.modes:
+            rss_before = rss_mb()
+            quantized, example = loader.quantize(mode, calibration_arrays, engine)
+            rss_delta = rss_mb() - rss_before
+            with torch.no_grad():
+                latency = measure(lambda: quantized(patch), max(5, args.repeats // 3))
+            print_latency(f"int8-{mode}", latency, baseline)
+            print(f"      模型 {serialized_mb(quantized, example):.1f}MB, RSS +{rss_delta:.1f}MB")
+            if sr_evaluation:
+                report = compare_accuracy(
+                    sr_then_cnn_classify_fn(sr_model, cnn_reference, **sr_kwargs),
+                    sr_then_cnn_classify_fn(quantized, cnn_reference, **sr_kwargs),
+                    sr_evaluation, args.max_drop, batch_size=4, load_fn=load_arrays
+                )
+                status = "✅ 通過" if report['passed'] else "❌ 拒絕"
+                print(f"      SR → CNN 準確率 {report['reference_accuracy']:.4f} → {report['candidate_accuracy']:.4f}"
+                      f"（下降 {report['drop']:+.4f}，{report['samples']} 張） {status}")
+    elif 'sr' in args.models:
+        print("\n   ℹ️  未設定 SR_MODEL_PATH_RELATIVE，略過超解析度模型")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Redis 客戶端效能測試腳本
+比較舊的存取方式（每次操作前先 PING、多個鍵逐一 GET / SET）與 RedisManager
+（連線池 + 單次往返、mget / mset 管線化）在多執行緒下的吞吐量與延遲：
+  single   每次讀取一個鍵
+  multi    每次讀寫 --keys 個鍵（批次推論快取）
+  down     Redis 無回應時每次操作的耗時（舊方式每次都等待 socket 逾時，RedisManager 在斷路器開啟後直接返回）
+
+預設在腳本內啟動簡易 RESP 伺服器（--latency-ms 模擬網路往返延遲），不需要安裝 Redis；
+也可以用 --host / --port 指向本機 redis-server（down 情境仍使用腳本內的無回應伺服器）
+"""
+
+import sys
+import time
+import argparse
+import threading
+import statistics
+import socketserver
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+import redis
+
+from src.core.core_redis_manager import RedisManager
+
+
+class FakeRedisHandler(socketserver.BaseRequestHandler):
+    """最小的 RESP 伺服器：支援測試用到的命令，其他命令回覆錯誤"""
+
+    def handle(self):
+        server = self.server
+        buffer = b''
+        self.protocol = 2
+        while True:
+            try:
+                chunk = self.request.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            if server.hang:
+                # 模擬無回應的 Redis：接受連線但不回覆
+                continue
+            if server.latency:
+                # 每次收到資料延遲一次（管線化的多個命令只付一次往返）
+                time.sleep(server.latency)
+            buffer += chunk
+            replies = []
+            while True:
+                command, buffer = self._parse(buffer)
+                if command is None:
+                    break
+                replies.append(self._execute(command))
+            if replies:
+                self.request.sendall(b''.join(replies))
+
+    @staticmethod
+    def _parse(buffer: bytes):
+        """解析一個 RESP 陣列命令，資料不完整時返回 (None, buffer)"""
+        if not buffer.startswith(b'*'):
+            return None, buffer
+        end = buffer.find(b'\r\n')
+        if end < 0:
+            return None, buffer
+        count = int(buffer[1:end])
+        position = end + 2
+        args = []
+        for _ in range(count):
+            end = buffer.find(b'\r\n', position)
+            if end < 0:
+                return None, buffer
+            length = int(buffer[position + 1:end])
+            start = end + 2
+            if len(buffer) < start + length + 2:
+                return None, buffer
+            args.append(buffer[start:start + length])
+            position = start + length + 2
+        return args, buffer[position:]
+
+    def _execute(self, args: list) -> bytes:
+        store = self.server.store
+        name = args[0].upper()
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name == b'HELLO':
+            # 新版 redis-py 以 HELLO 3 交握；RESP3 除了空值（_）以外，這裡用到的回覆格式與 RESP2 相同
+            self.protocol = int(args[1]) if len(args) > 1 else 2
+            return b'%%2\r\n+server\r\n+fake\r\n+proto\r\n:%d\r\n' % self.protocol
+        if name == b'GET':
+            return self._bulk(store.get(args[1]))
+        if name == b'MGET':
+            return b'*%d\r\n' % (len(args) - 1) + b''.join(self._bulk(store.get(key)) for key in args[1:])
+        if name == b'SET':
+            store[args[1]] = args[2]
+            return b'+OK\r\n'
+        if name == b'SETEX':
+            store[args[1]] = args[3]
+            return b'+OK\r\n'
+        if name == b'DEL':
+            return b':%d\r\n' % sum(store.pop(key, None) is not None for key in args[1:])
+        if name == b'EXISTS':
+            return b':%d\r\n' % sum(key in store for key in args[1:])
+        if name == b'EXPIRE':
+            return b':%d\r\n' % (args[1] in store)
+        if name == b'INCRBY':
+            value = int(store.get(args[1], b'0')) + int(args[2])
+            store[args[1]] = str(value).encode()
+            return b':%d\r\n' % value
+        return b'-ERR unknown command\r\n'
+
+    def _bulk(self, value) -> bytes:
+        if value is None:
+            return b'_\r\n' if self.protocol == 3 else b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency_ms: float = 0.0, hang: bool = False):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.latency = latency_ms / 1000
+        self.hang = hang
+        self.store = {}
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class LegacyClient:
+    """舊的存取方式：每次操作前先 PING 確認可用，多個鍵逐一存取"""
+
+    def __init__(self, host: str, port: int, socket_timeout: float):
+        self.client = redis.Redis(
+            host=host, port=port, decode_responses=True,
+            socket_connect_timeout=socket_timeout, socket_timeout=socket_timeout
+        )
+
+    def is_available(self) -> bool:
+        try:
+            self.client.ping()
+            return True
+        except Exception:
+            return False
+
+    def get(self, key: str):
+        if not self.is_available():
+            return None
+        try:
+            return self.client.get(key)
+        except Exception:
+            return None
+
+    def set(self, key: str, value: str, expire: int) -> bool:
+        if not self.is_available():
+            return False
+        try:
+            return bool(self.client.set(key, value, ex=expire))
+        except Exception:
+            return False
+
+    def mget(self, keys: list) -> list:
+        return [self.get(key) for key in keys]
+
+    def mset(self, mapping: dict, expire: int) -> bool:
+        return all(self.set(key, value, expire) for key, value in mapping.items())
+
+
+def run_workload(name: str, operation, threads: int, operations: int) -> dict:
+    """以 threads 個執行緒執行 operations 次 operation(i)，返回吞吐量與延遲"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(i):
+        start = time.perf_counter()
+        operation(i)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(operations)))
+    elapsed_s = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        'ops_per_s': operations / elapsed_s,
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    }
+    print(f"   {name:<28} {result['ops_per_s']:>9,.0f} ops/s，p50={result['p50_ms']:.2f}ms，p99={result['p99_ms']:.2f}ms")
+    return result
+
+
+def bench_reachable(legacy: LegacyClient, manager: RedisManager, args):
+    keys = [f"bench:key:{i}" for i in range(args.key_space)]
+    value = 'x' * args.value_size
+    manager.mset({key: value for key in keys}, expire=600)
+
+    def batch(i):
+        start = (i * args.keys) % (len(keys) - args.keys)
+        return keys[start:start + args.keys]
+
+    print(f"\n📊 single：每次讀取 1 個鍵（{args.threads} 執行緒，{args.operations} 次）")
+    legacy_single = run_workload('舊方式（PING + GET）', lambda i: legacy.get(keys[i % len(keys)]), args.threads, args.operations)
+    new_single = run_workload('RedisManager.get', lambda i: manager.get(keys[i % len(keys)]), args.threads, args.operations)
+
+    print(f"\n📊 multi：每次讀 {args.keys} 個鍵 + 寫 {args.keys} 個鍵")
+    legacy_multi = run_workload(
+        '舊方式（逐一 GET / SET）',
+        lambda i: (legacy.mget(batch(i)), legacy.mset({key: value for key in batch(i)}, 600)),
+        args.threads, args.operations // args.keys
+    )
+    new_multi = run_workload(
+        'RedisManager.mget / mset',
+        lambda i: (manager.mget(batch(i)), manager.mset({key: value for key in batch(i)}, expire=600)),
+        args.threads, args.operations // args.keys
+    )
+    print(f"\n   吞吐量提升: single {new_single['ops_per_s'] / legacy_single['ops_per_s']:.2f}x，"
+          f"multi {new_multi['ops_per_s'] / legacy_multi['ops_per_s']:.2f}x")
+
+
+def bench_down(args):
+    """Redis 無回應：舊方式每次操作等待 socket 逾時，RedisManager 在斷路器開啟後直接返回"""
+    server = FakeRedisServer(hang=True)
+    timeout = args.down_timeout
+    legacy = LegacyClient('127.0.0.1', server.port, timeout)
+    manager = RedisManager(
+        host='127.0.0.1', port=server.port, socket_timeout=timeout, connect_timeout=timeout,
+        max_connections=args.threads, reset_timeout=args.down_seconds * 2
+    )
+    operations = args.down_operations
+    print(f"\n📊 down：Redis 無回應（socket 逾時 {timeout}s，{args.threads} 執行緒，{operations} 次 GET）")
+    legacy_result = run_workload('舊方式（PING + GET）', lambda i: legacy.get('bench:key'), args.threads, operations)
+    new_result = run_workload('RedisManager.get', lambda i: manager.get('bench:key'), args.threads, operations)
+    breaker = manager.get_metrics()['breaker']
+    print(f"   斷路器: {breaker['state']}，略過 {breaker['short_circuited']} 次；"
+          f"p50 延遲 {legacy_result['p50_ms']:.0f}ms → {new_result['p50_ms']:.3f}ms")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Redis 客戶端效能測試（舊方式 vs RedisManager）')
+    parser.add_argument('--host', default=None, help='使用現有的 redis-server（預設啟動腳本內的 RESP 伺服器）')
+    parser.add_argument('--port', type=int, default=6379, help='redis-server 埠號')
+    parser.add_argument('--latency-ms', type=float, default=0.5, help='腳本內伺服器模擬的往返延遲（毫秒）')
+    parser.add_argument('--threads', type=int, default=16, help='並行執行緒數')
+    parser.add_argument('--operations', type=int, default=5000, help='single 情境的操作數（multi 為其 1/--keys）')
+    parser.add_argument('--keys', type=int, default=10, help='multi 情境每次讀寫的鍵數')
+    parser.add_argument('--key-space', type=int, default=1000, help='測試鍵總數')
+    parser.add_argument('--value-size', type=int, default=512, help='值的大小（位元組）')
+    parser.add_argument('--down-timeout', type=float, default=0.2, help='down 情境的 socket 逾時（秒）')
+    parser.add_argument('--down-operations', type=int, default=64, help='down 情境的操作數')
+    parser.add_argument('--skip-down', action='store_true', help='不測試 down 情境')
+    args = parser.parse_args()
+    # down 情境的斷路器在整個測試期間保持開啟
+    args.down_seconds = args.down_timeout * args.down_operations
+
+    server = None
+    if args.host:
+        host, port = args.host, args.port
+        target = f"redis-server {host}:{port}"
+    else:
+        server = FakeRedisServer(latency_ms=args.latency_ms)
+        host, port = '127.0.0.1', server.port
+        target = f"腳本內 RESP 伺服器（往返延遲 {args.latency_ms}ms）"
+
+    print("=" * 60)
+    print(f"🚀 Redis 客戶端測試：{target}")
+    print("=" * 60)
+
+    legacy = LegacyClient(host, port, socket_timeout=2.0)
+    manager = RedisManager(host=host, port=port, max_connections=args.threads)
+    if not manager.ping():
+        raise SystemExit(f"❌ 無法連接 {host}:{port}")
+    bench_reachable(legacy, manager, args)
+    metrics = manager.get_metrics()
+    print(f"   RedisManager: {metrics['commands']} 個命令 / {metrics['round_trips']} 次往返")
+
+    if not args.skip_down:
+        bench_down(args)
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
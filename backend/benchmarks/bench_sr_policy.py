@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+超解析度策略離線評估腳本
+以與線上檢測相同的流程（解碼 → 拉伸到 640x640 → 超解析度策略 → CNN）比較三種策略：
+  always    每張圖片以 640x640 執行超解析度（加入策略前的行為）
+  never     不執行超解析度
+  adaptive  依原始解析度、模糊程度、JPEG 品質逐張決定（門檻使用設定檔或命令列參數）
+的 CNN top-1 準確率、每張圖片的超解析度 + CNN 延遲、adaptive 的決策分布，以及各策略與 always 的預測不一致數
+
+準確率使用已標註的驗證清單（QUANT_VAL_CSV_RELATIVE，需 --image-root 指向本機驗證集）；
+未提供時可用 --images 指定未標註的圖片目錄，只比較延遲與預測一致性
+
+--degrade mixed 將部分圖片改為低解析度、模糊或低品質 JPEG（重新編碼後解碼，與使用者上傳相同），
+用於檢查 adaptive 在需要超解析度的圖片上是否仍會執行
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from PIL import Image, ImageFilter
+
+from config.development import DevelopmentConfig
+from modules.image_buffer import decode_image_bytes
+from modules.sr_policy import SR_POLICY_MODES, SRPolicy
+
+# 與 ImageService.TARGET_SIZE 相同
+TARGET_SIZE = (640, 640)
+
+DEGRADATIONS = ('none', 'low_resolution', 'blur', 'jpeg_q30')
+
+
+def degrade(data: bytes, kind: str) -> bytes:
+    """將原始圖片位元組轉為指定劣化後重新編碼（none 時原樣返回）"""
+    if kind == 'none':
+        return data
+    img = Image.open(io.BytesIO(data)).convert('RGB')
+    quality = 92
+    if kind == 'low_resolution':
+        img.thumbnail((160, 160), Image.Resampling.LANCZOS)
+    elif kind == 'blur':
+        img = img.filter(ImageFilter.GaussianBlur(radius=3))
+    elif kind == 'jpeg_q30':
+        quality = 30
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def load_inputs(samples: list, degradation: str, resize: bool, seed: int) -> list:
+    """讀取圖片並套用劣化，返回 [(ImageBuffer, 標籤或 None, 劣化種類)]"""
+    rng = random.Random(seed)
+    inputs = []
+    for sample in samples:
+        with open(sample['path'], 'rb') as f:
+            data = f.read()
+        kind = rng.choice(DEGRADATIONS) if degradation == 'mixed' else degradation
+        image = decode_image_bytes(degrade(data, kind), stage='sr_policy')
+        if resize:
+            image = image.resize(TARGET_SIZE)
+        inputs.append((image, sample.get('label'), kind))
+    return inputs
+
+
+def evaluate(mode: str, inputs: list, sr_model, cnn_classify, args) -> dict:
+    """以指定策略對所有圖片執行超解析度 + CNN（batch 1，與單張上傳相同）"""
+    policy = SRPolicy(
+        mode=mode,
+        scale=DevelopmentConfig.SR_SCALE,
+        min_side=args.min_side,
+        blur_threshold=args.blur_threshold,
+        min_jpeg_quality=args.min_jpeg_quality,
+        tile_size=DevelopmentConfig.SR_TILE_SIZE
+    )
+    predictions = []
+    sr_latencies = []
+    total_latencies = []
+    by_degradation = {}
+    for image, label, kind in inputs:
+        start = time.perf_counter()
+        decision = policy.decide(image.pixels, image.metadata)
+        cnn_input, _ = policy.run(
+            image.pixels, decision, sr_model, device='cpu',
+            tile_overlap=DevelopmentConfig.SR_TILE_OVERLAP, tile_batch_size=DevelopmentConfig.SR_TILE_BATCH_SIZE
+        )
+        sr_latencies.append((time.perf_counter() - start) * 1000)
+        prediction = cnn_classify([cnn_input])[0]
+        total_latencies.append((time.perf_counter() - start) * 1000)
+        policy.record(decision)
+        predictions.append(prediction)
+        if label is not None:
+            correct, count = by_degradation.get(kind, (0, 0))
+            by_degradation[kind] = (correct + (prediction == label), count + 1)
+
+    labeled = [(p, label) for p, (_, label, _) in zip(predictions, inputs) if label is not None]
+    return {
+        'predictions': predictions,
+        'accuracy': sum(p == label for p, label in labeled) / len(labeled) if labeled else None,
+        'by_degradation': {kind: correct / count for kind, (correct, count) in by_degradation.items()},
+        'sr_p50_ms': statistics.median(sr_latencies),
+        'sr_mean_ms': statistics.mean(sr_latencies),
+        'total_p50_ms': statistics.median(total_latencies),
+        'total_mean_ms': statistics.mean(total_latencies),
+        'metrics': policy.get_metrics()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='超解析度策略離線評估（always / never / adaptive）')
+    parser.add_argument('--image-root', default=DevelopmentConfig.QUANT_VAL_IMAGE_ROOT, help='本機驗證集目錄（計算準確率）')
+    parser.add_argument('--images', default=None, help='未標註的圖片目錄（沒有驗證集時只比較延遲與一致性）')
+    parser.add_argument('--samples', type=int, default=200, help='最多評估的圖片數（SR 較慢）')
+    parser.add_argument('--modes', nargs='+', choices=SR_POLICY_MODES, default=list(SR_POLICY_MODES), help='評估的策略')
+    parser.add_argument('--degrade', choices=('mixed',) + DEGRADATIONS, default='none', help='圖片劣化方式')
+    parser.add_argument('--no-resize', action='store_true', help=f'不拉伸到 {TARGET_SIZE[0]}x{TARGET_SIZE[1]}')
+    parser.add_argument('--min-side', type=int, default=DevelopmentConfig.SR_POLICY_MIN_SIDE, help='adaptive：低解析度門檻')
+    parser.add_argument('--blur-threshold', type=float, default=DevelopmentConfig.SR_POLICY_BLUR_THRESHOLD, help='adaptive：模糊門檻')
+    parser.add_argument('--min-jpeg-quality', type=int, default=DevelopmentConfig.SR_POLICY_MIN_JPEG_QUALITY, help='adaptive：JPEG 品質門檻')
+    parser.add_argument('--threads', type=int, default=0, help='torch 執行緒數（0 表示預設）')
+    parser.add_argument('--seed', type=int, default=0, help='隨機種子（mixed 劣化）')
+    args = parser.parse_args()
+
+    import torch
+    from modules.cnn_utils import CNN_CLASSES
+    from modules.cnn_preprocess import preprocess_arrays_batch
+    from modules.model_registry import get_cnn_model, get_sr_model
+    from modules.quantization import load_validation_samples
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    samples = load_validation_samples(
+        os.path.join(project_root, DevelopmentConfig.QUANT_VAL_CSV_RELATIVE), args.image_root, CNN_CLASSES
+    )
+    if not samples and args.images:
+        samples = [
+            {'path': str(p), 'label': None} for p in sorted(Path(args.images).iterdir())
+            if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        ]
+    if not samples:
+        raise SystemExit("❌ 找不到圖片：請以 --image-root 指定本機驗證集，或以 --images 指定圖片目錄")
+    random.Random(args.seed).shuffle(samples)
+    samples = samples[:args.samples]
+
+    cnn_model = get_cnn_model(os.path.join(project_root, DevelopmentConfig.CNN_MODEL_PATH_RELATIVE), len(CNN_CLASSES), 'cpu')
+    sr_relative = DevelopmentConfig.SR_MODEL_PATH_RELATIVE
+    sr_model_path = os.path.join(project_root, sr_relative) if sr_relative else None
+    if sr_model_path and not os.path.exists(sr_model_path):
+        print(f"⚠️  超解析度模型不存在，使用預設架構（無預訓練權重）: {sr_model_path}")
+        sr_model_path = None
+    sr_model = get_sr_model(sr_model_path, DevelopmentConfig.SR_MODEL_TYPE, DevelopmentConfig.SR_SCALE, 'cpu')
+
+    def cnn_classify(arrays):
+        with torch.no_grad():
+            return cnn_model(preprocess_arrays_batch(arrays, device='cpu')).argmax(dim=1).tolist()
+
+    inputs = load_inputs(samples, args.degrade, not args.no_resize, args.seed)
+    labeled = sum(label is not None for _, label, _ in inputs)
+    print("=" * 60)
+    print(f"🔬 超解析度策略評估（{len(inputs)} 張，已標註 {labeled} 張，劣化 {args.degrade}，"
+          f"SR {DevelopmentConfig.SR_SCALE}x，torch 執行緒 {torch.get_num_threads()}）")
+    print("=" * 60)
+
+    # 預熱（模型第一次前向傳播較慢）
+    warmup = inputs[0][0].pixels
+    cnn_classify([warmup])
+    warmup_policy = SRPolicy(scale=DevelopmentConfig.SR_SCALE)
+    warmup_policy.run(warmup, warmup_policy.decide(warmup), sr_model)
+
+    results = {}
+    for mode in args.modes:
+        results[mode] = result = evaluate(mode, inputs, sr_model, cnn_classify, args)
+        accuracy = f"{result['accuracy']:.4f}" if result['accuracy'] is not None else "N/A"
+        print(f"\n📊 {mode}")
+        print(f"   準確率: {accuracy}" + (f"，各劣化: {', '.join(f'{k}={v:.3f}' for k, v in sorted(result['by_degradation'].items()))}"
+                                         if len(result['by_degradation']) > 1 else ""))
+        print(f"   SR: p50={result['sr_p50_ms']:.1f}ms, mean={result['sr_mean_ms']:.1f}ms；"
+              f"SR + CNN: p50={result['total_p50_ms']:.1f}ms, mean={result['total_mean_ms']:.1f}ms")
+        metrics = result['metrics']
+        if mode == 'adaptive':
+            print(f"   決策: {metrics['reasons']}（跳過 {metrics['skip_rate'] * 100:.1f}%，"
+                  f"品質估計平均 {metrics['avg_assess_ms']:.2f}ms）")
+
+    if 'always' in results:
+        baseline = results['always']
+        print("\n" + "=" * 60)
+        print("📊 相對 always")
+        print("=" * 60)
+        for mode, result in results.items():
+            if mode == 'always':
+                continue
+            disagreements = sum(a != b for a, b in zip(baseline['predictions'], result['predictions']))
+            line = (f"   {mode:<9} SR + CNN mean {result['total_mean_ms']:.1f}ms"
+                    f"（{baseline['total_mean_ms'] / result['total_mean_ms']:.2f}x），"
+                    f"預測不一致 {disagreements}/{len(inputs)}")
+            if result['accuracy'] is not None:
+                line += f"，準確率變化 {result['accuracy'] - baseline['accuracy']:+.4f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
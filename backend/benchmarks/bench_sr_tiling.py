@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+分塊超解析度效能測試腳本
+比較整張處理與不同 tile 大小在各放大倍數下的延遲與峰值記憶體（RSS）
+每組設定在獨立子程序中執行，避免峰值 RSS 互相影響
+"""
+
+import sys
+import time
+import argparse
+import resource
+import statistics
+import multiprocessing
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def peak_rss_mb() -> float:
+    """返回目前程序的峰值 RSS（MB，Linux 上 ru_maxrss 單位為 KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_case(scale: int, tile_size, args, result_queue):
+    """在子程序中載入模型並測量單一設定"""
+    import numpy as np
+    from modules.sr_load import SuperResolutionModelLoader
+    from modules.sr_preprocess import enhance_image_array_with_sr
+    from modules.image_buffer import load_image_buffer
+
+    model_path = project_root / 'model' / 'SR' / 'model_pytorch' / f'EDSR_x{scale}.pt'
+    loader = SuperResolutionModelLoader(str(model_path) if model_path.exists() else None, args.device)
+    model = loader.load_model(DevelopmentConfig.SR_MODEL_TYPE, scale)
+
+    if args.image:
+        pixels = load_image_buffer(args.image).pixels
+    else:
+        pixels = np.random.randint(0, 255, (args.size, args.size, 3), dtype=np.uint8)
+
+    rss_before = peak_rss_mb()
+
+    def once():
+        return enhance_image_array_with_sr(
+            pixels, model, device=args.device, scale=scale,
+            tile_size=tile_size, tile_overlap=args.overlap, tile_batch_size=args.tile_batch
+        )
+
+    once()  # 預熱
+    timings = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        output = once()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    result_queue.put({
+        'median_ms': statistics.median(timings),
+        'max_ms': max(timings),
+        'model_rss_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_shape': tuple(output.shape),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分塊超解析度效能測試')
+    parser.add_argument('--image', default=None, help='測試圖片路徑（預設生成隨機圖片）')
+    parser.add_argument('--size', type=int, default=640, help='隨機圖片邊長')
+    parser.add_argument('--scales', type=int, nargs='+', default=[2, 3, 4], help='放大倍數列表')
+    parser.add_argument('--tiles', type=int, nargs='+', default=[0, 96, 128, 192], help='tile 邊長列表（0 表示整張處理）')
+    parser.add_argument('--overlap', type=int, default=DevelopmentConfig.SR_TILE_OVERLAP, help='tile 重疊像素數')
+    parser.add_argument('--tile-batch', type=int, default=DevelopmentConfig.SR_TILE_BATCH_SIZE, help='每批 tile 數')
+    parser.add_argument('--iterations', type=int, default=3, help='重複次數')
+    parser.add_argument('--device', default='cpu', help='設備類型')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+
+    for scale in args.scales:
+        print("\n" + "=" * 60)
+        print(f"📊 放大倍數: {scale}x")
+        print("=" * 60)
+        for tile_size in args.tiles:
+            result_queue = context.Queue()
+            process = context.Process(target=run_case, args=(scale, tile_size or None, args, result_queue))
+            process.start()
+            process.join()
+            title = f"tile={tile_size}" if tile_size else "整張處理"
+            if process.exitcode != 0 or result_queue.empty():
+                print(f"   ❌ {title}: 執行失敗 (exit={process.exitcode})")
+                continue
+            result = result_queue.get()
+            print(f"   {title}: median={result['median_ms']:.1f}ms, max={result['max_ms']:.1f}ms, "
+                  f"峰值 RSS={result['peak_rss_mb']:.0f}MB (模型載入後 {result['model_rss_mb']:.0f}MB), "
+                  f"輸出={result['output_shape']}")
+
+
+if __name__ == "__main__":
+    main()
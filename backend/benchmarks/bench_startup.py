@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+啟動記憶體與就緒時間測試腳本
+以不同設定啟動 gunicorn（與 start.sh 相同的 worker / 執行緒數），比較：
+  - 就緒時間：從啟動到所有 worker 都能回應 /api/health
+  - 容器記憶體：主程序 + 所有 worker 的 RSS 總和與 PSS 總和（PSS 將共用頁面平均分攤，接近容器實際用量）
+  - 各 worker 的共用 / 私有記憶體與模型註冊表內容
+
+測試的設定：
+  before   ENABLE_MODEL_REGISTRY=false, MODEL_PRELOAD=false（每個服務各自載入模型，YOLO 每個 worker 兩份）
+  registry ENABLE_MODEL_REGISTRY=true,  MODEL_PRELOAD=false（每個 worker 每個檢查點一份）
+  preload  ENABLE_MODEL_REGISTRY=true,  MODEL_PRELOAD=true （主程序載入一次，worker 以 copy-on-write 共用）
+
+需要與正式啟動相同的環境（.env、資料庫、模型檔案）；僅支援 Linux（讀取 /proc）
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+SCENARIOS = {
+    'before': {'ENABLE_MODEL_REGISTRY': 'false', 'MODEL_PRELOAD': 'false'},
+    'registry': {'ENABLE_MODEL_REGISTRY': 'true', 'MODEL_PRELOAD': 'false'},
+    'preload': {'ENABLE_MODEL_REGISTRY': 'true', 'MODEL_PRELOAD': 'true'},
+}
+
+
+def child_pids(pid: int) -> list:
+    """pid 的所有子孫程序"""
+    result = []
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+            children = [int(c) for c in f.read().split()]
+    except OSError:
+        return result
+    for child in children:
+        result.append(child)
+        result.extend(child_pids(child))
+    return result
+
+
+def process_memory(pid: int) -> dict:
+    """讀取 /proc/<pid>/smaps_rollup（MB）"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    values[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        pass
+    return {'rss': values.get('Rss', 0.0), 'pss': values.get('Pss', 0.0)}
+
+
+def fetch_health(port: int):
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=2) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except Exception:
+        return None
+
+
+def run_scenario(name: str, args) -> dict:
+    env = dict(os.environ, **SCENARIOS[name])
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--config', str(project_root / 'backend' / 'gunicorn.conf.py'),
+        '--bind', f'127.0.0.1:{args.port}',
+        '--workers', str(args.workers),
+        '--threads', str(args.threads),
+        '--timeout', '300',
+        '--chdir', str(project_root / 'backend'),
+    ]
+    log = open(os.devnull, 'w') if not args.verbose else None
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=log, stderr=log)
+
+    ready_pids = set()
+    health = {}
+    try:
+        deadline = time.time() + args.timeout
+        while len(ready_pids) < args.workers:
+            if server.poll() is not None:
+                raise RuntimeError(f"gunicorn 已結束（exit {server.returncode}），請加 --verbose 查看日誌")
+            if time.time() > deadline:
+                raise TimeoutError(f"{args.timeout}s 內只有 {len(ready_pids)}/{args.workers} 個 worker 就緒")
+            payload = fetch_health(args.port)
+            registry = (payload or {}).get('metrics', {}).get('model_registry')
+            if registry:
+                ready_pids.add(registry['pid'])
+                health[registry['pid']] = registry
+            else:
+                time.sleep(0.2)
+        ready_seconds = time.perf_counter() - start
+
+        time.sleep(args.settle)
+        pids = [server.pid] + child_pids(server.pid)
+        memory = {pid: process_memory(pid) for pid in pids}
+        return {
+            'ready_seconds': ready_seconds,
+            'rss_mb': sum(m['rss'] for m in memory.values()),
+            'pss_mb': sum(m['pss'] for m in memory.values()),
+            'master': memory.get(server.pid, {}),
+            'workers': health
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if log:
+            log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='啟動記憶體與就緒時間測試')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS), help='測試的設定')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 數（與 start.sh 相同）')
+    parser.add_argument('--threads', type=int, default=2, help='每個 worker 的執行緒數')
+    parser.add_argument('--port', type=int, default=5099, help='測試用埠號')
+    parser.add_argument('--timeout', type=float, default=600, help='等待就緒的最長秒數')
+    parser.add_argument('--settle', type=float, default=2.0, help='就緒後等待幾秒再量測記憶體')
+    parser.add_argument('--verbose', action='store_true', help='顯示 gunicorn 日誌')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🚀 gunicorn 啟動測試（{args.workers} workers x {args.threads} threads）")
+    print(f"   YOLO: {DevelopmentConfig.YOLO_MODEL_PATH_RELATIVE}")
+    print(f"   CNN: {DevelopmentConfig.CNN_MODEL_PATH_RELATIVE}")
+    print(f"   超解析度: {'啟用' if DevelopmentConfig.ENABLE_SR else '禁用'} ({DevelopmentConfig.SR_MODEL_PATH_RELATIVE or '預設架構'})")
+    print("=" * 60)
+
+    results = {}
+    for name in args.scenarios:
+        print(f"\n📊 {name}: {SCENARIOS[name]}")
+        try:
+            result = run_scenario(name, args)
+        except Exception as e:
+            print(f"   ❌ {str(e)}")
+            continue
+        results[name] = result
+        print(f"   就緒時間: {result['ready_seconds']:.1f}s")
+        print(f"   RSS 總和: {result['rss_mb']:.0f}MB，PSS 總和: {result['pss_mb']:.0f}MB（主程序 RSS {result['master'].get('rss', 0):.0f}MB）")
+        for pid, registry in sorted(result['workers'].items()):
+            memory = registry.get('process_memory', {})
+            models = ', '.join(
+                f"{m['name']} {m['weight_mb']}MB{'（共用）' if m['preloaded'] else ''}" for m in registry['models']
+            ) or '（註冊表未啟用）'
+            print(f"   worker {pid}: RSS {memory.get('rss_mb', 0)}MB（共用 {memory.get('shared_mb', 0)}MB，"
+                  f"私有 {memory.get('private_mb', 0)}MB），載入 {registry['loads']} 次，{models}")
+
+    if 'before' in results and len(results) > 1:
+        print("\n" + "=" * 60)
+        print("📈 相對 before")
+        print("=" * 60)
+        base = results['before']
+        for name, result in results.items():
+            if name == 'before':
+                continue
+            print(f"   {name:<10} PSS {result['pss_mb'] - base['pss_mb']:+.0f}MB "
+                  f"({(result['pss_mb'] / base['pss_mb'] - 1) * 100:+.1f}%)，"
+                  f"就緒時間 {result['ready_seconds'] - base['ready_seconds']:+.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+圖片上傳解析效能測試腳本
+比較檢測端點三種上傳格式的請求解析時間與峰值記憶體（tracemalloc）：
+  json       {"image": "<base64>"}（舊版格式）
+  multipart  multipart/form-data，image 檔案欄位（UploadRequest 串流寫入 HashingBuffer）
+  binary     application/octet-stream，請求主體即圖片
+
+只測量 read_image_upload()（讀取請求主體、解析、base64 解碼、計算 SHA256），不解碼圖片；
+測試用最小 Flask 應用不連接資料庫，MAX_CONTENT_LENGTH 放寬到 16MB 以便測量 5MB 的 JSON 請求
+（預設 5MB 上限下，5MB 圖片的 JSON 請求因 base64 膨脹會被拒絕）
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import statistics
+import tracemalloc
+from pathlib import Path
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from flask import Flask, jsonify
+
+from config.development import DevelopmentConfig
+from modules.upload_stream import UploadRequest, read_image_upload
+
+
+def decode_base64(data: str) -> bytes:
+    if "," in data:
+        _, data = data.split(",", 1)
+    return base64.b64decode(data)
+
+
+def build_app() -> Flask:
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+
+    @app.route('/parse', methods=['POST'])
+    def parse():
+        upload = read_image_upload('image', decode_base64)
+        return jsonify({'size': upload.size, 'sha256': upload.sha256, 'transport': upload.transport})
+
+    return app
+
+
+def build_request(transport: str, payload: bytes) -> dict:
+    """建立測試用請求參數（在量測範圍外完成）"""
+    if transport == 'json':
+        body = json.dumps({'image': base64.b64encode(payload).decode('ascii'), 'source': 'upload'}).encode('utf-8')
+        return {'data': body, 'content_type': 'application/json'}
+    if transport == 'binary':
+        return {'data': payload, 'content_type': 'application/octet-stream', 'query_string': {'source': 'upload'}}
+    boundary = 'benchboundary7MA4YWxkTrZu0gW'
+    body = b''.join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="source"\r\n\r\nupload\r\n'.encode(),
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="image.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode(),
+        payload,
+        f'\r\n--{boundary}--\r\n'.encode()
+    ])
+    return {'data': body, 'content_type': f'multipart/form-data; boundary={boundary}'}
+
+
+def measure(client, transport: str, payload: bytes, repeat: int) -> dict:
+    kwargs = build_request(transport, payload)
+    body_bytes = len(kwargs['data'])
+    times = []
+    peaks = []
+    for _ in range(repeat):
+        # 量測範圍包含測試客戶端把請求主體放入 wsgi.input（對應伺服器收到的請求主體）
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.post('/parse', **kwargs)
+        times.append((time.perf_counter() - start) * 1000)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak / 1024 / 1024)
+        if response.status_code != 200:
+            raise RuntimeError(f"{transport} 解析失敗: {response.status_code} {response.get_data(as_text=True)[:200]}")
+        if response.get_json()['size'] != len(payload):
+            raise RuntimeError(f"{transport} 解析結果大小不符")
+    return {
+        'body_mb': body_bytes / 1024 / 1024,
+        'parse_ms': statistics.median(times),
+        'peak_mb': statistics.median(peaks)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='圖片上傳解析效能測試')
+    parser.add_argument('--sizes-mb', type=float, nargs='+', default=[1, 3, 5], help='圖片大小（MB）')
+    parser.add_argument('--repeat', type=int, default=10, help='每個組合重複次數')
+    args = parser.parse_args()
+
+    limit_mb = DevelopmentConfig.MAX_CONTENT_LENGTH / 1024 / 1024
+    print("=" * 60)
+    print("📥 圖片上傳解析測試（read_image_upload）")
+    print(f"   正式環境 MAX_CONTENT_LENGTH: {limit_mb:.1f}MB")
+    print("=" * 60)
+
+    client = build_app().test_client()
+    for size_mb in args.sizes_mb:
+        # 以 JPEG 檔頭 + 隨機位元組模擬圖片（解析階段不解碼）
+        payload = b'\xff\xd8\xff\xe0' + os.urandom(int(size_mb * 1024 * 1024) - 4)
+        print(f"\n📊 圖片 {size_mb:g}MB")
+        results = {}
+        for transport in ('json', 'multipart', 'binary'):
+            result = measure(client, transport, payload, args.repeat)
+            results[transport] = result
+            over_limit = " ⚠️  超過正式環境上限" if result['body_mb'] > limit_mb else ""
+            print(f"   {transport:<10} 請求 {result['body_mb']:.2f}MB，解析 {result['parse_ms']:.1f}ms，"
+                  f"峰值記憶體 {result['peak_mb']:.1f}MB{over_limit}")
+        base = results['json']
+        for transport in ('multipart', 'binary'):
+            result = results[transport]
+            print(f"   {transport} 相對 json: 解析 {base['parse_ms'] / result['parse_ms']:.1f}x 快，"
+                  f"峰值記憶體 {result['peak_mb'] - base['peak_mb']:+.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Cloudinary 背景上傳佇列測試腳本
+比較「請求中同步上傳」與「放入背景佇列」兩種方式的請求延遲，並統計重試、去重與最終完成時間
+
+使用本地替代儲存（LocalCloudinaryStorage），以 --latency-ms / --failure-rate 模擬網路延遲與失敗，
+不需要 Cloudinary 帳號與網路；--redis 時才使用 Redis 去重
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def make_images(count: int, unique: int, size_kb: int) -> list:
+    """生成 count 張圖片位元組，其中只有 unique 種不同內容（模擬重複上傳）"""
+    contents = [os.urandom(size_kb * 1024) for _ in range(max(1, unique))]
+    return [contents[i % len(contents)] for i in range(count)]
+
+
+def print_latency(title: str, latencies: list):
+    latencies = sorted(latencies)
+    print(f"   {title}: p50={statistics.median(latencies):.2f}ms, "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}ms, max={latencies[-1]:.2f}ms")
+
+
+def run_sync(storage, images: list, concurrency: int, max_retries: int) -> tuple:
+    """請求執行緒直接上傳（含重試），返回（延遲列表, 失敗數）"""
+    latencies = []
+    failures = []
+
+    def one(item):
+        index, image_bytes = item
+        start = time.perf_counter()
+        for attempt in range(max_retries + 1):
+            try:
+                storage.upload_image(image_bytes, public_id=f"sync/{index}", folder='benchmark')
+                break
+            except Exception:
+                if attempt == max_retries:
+                    failures.append(index)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, enumerate(images)))
+    return latencies, len(failures)
+
+
+def run_queued(upload_queue, images: list, concurrency: int) -> tuple:
+    """請求執行緒只放入佇列，返回（延遲列表, 已完成回呼數, 全部完成耗時）"""
+    import hashlib
+
+    latencies = []
+    completed = []
+    lock = threading.Lock()
+
+    def on_success(url):
+        with lock:
+            completed.append(url)
+
+    def one(item):
+        index, image_bytes = item
+        start = time.perf_counter()
+        upload_queue.enqueue(
+            image_bytes,
+            public_id=f"queued/{hashlib.sha256(image_bytes).hexdigest()}",
+            folder='benchmark',
+            ref=(f"prediction-{index}", 'origin'),
+            owner=1,
+            on_success=on_success
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, enumerate(images)))
+    upload_queue.wait_idle(timeout=300)
+    return latencies, len(completed), time.perf_counter() - wall_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cloudinary 背景上傳佇列測試')
+    parser.add_argument('--requests', type=int, default=200, help='請求數')
+    parser.add_argument('--unique', type=int, default=150, help='不同圖片內容數（其餘為重複上傳）')
+    parser.add_argument('--size-kb', type=int, default=150, help='每張圖片大小（KB）')
+    parser.add_argument('--concurrency', type=int, default=8, help='請求並發數')
+    parser.add_argument('--latency-ms', type=float, default=250.0, help='模擬每次上傳延遲（毫秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='模擬上傳失敗機率')
+    parser.add_argument('--workers', type=int, default=DevelopmentConfig.UPLOAD_QUEUE_WORKERS, help='上傳工作執行緒數')
+    parser.add_argument('--max-queue', type=int, default=DevelopmentConfig.UPLOAD_QUEUE_MAX_SIZE, help='佇列上限')
+    parser.add_argument('--max-retries', type=int, default=DevelopmentConfig.UPLOAD_MAX_RETRIES, help='重試次數')
+    parser.add_argument('--backoff-ms', type=int, default=DevelopmentConfig.UPLOAD_RETRY_BACKOFF_MS, help='第一次重試等待時間')
+    parser.add_argument('--redis', action='store_true', help='使用 Redis 去重（預設只用程序內去重）')
+    args = parser.parse_args()
+
+    from src.services.service_cloudinary import LocalCloudinaryStorage
+    from src.services.service_upload_queue import UploadQueue
+
+    storage = LocalCloudinaryStorage(
+        tempfile.mkdtemp(prefix='bench_upload_queue_'),
+        latency_ms=args.latency_ms,
+        failure_rate=args.failure_rate
+    )
+    images = make_images(args.requests, args.unique, args.size_kb)
+
+    print("=" * 60)
+    print(f"📊 請求延遲（{args.requests} 筆 / {args.unique} 種內容，並發 {args.concurrency}，"
+          f"上傳延遲 {args.latency_ms}ms，失敗率 {args.failure_rate:.0%}）")
+    print("=" * 60)
+
+    wall_start = time.perf_counter()
+    latencies, failures = run_sync(storage, images, args.concurrency, args.max_retries)
+    print_latency("同步上傳", latencies)
+    print(f"      總耗時 {time.perf_counter() - wall_start:.2f}s, 上傳次數 {args.requests}, 失敗 {failures}")
+
+    upload_queue = UploadQueue(
+        storage,
+        workers=args.workers,
+        max_queue_size=args.max_queue,
+        max_retries=args.max_retries,
+        backoff_base=args.backoff_ms / 1000.0,
+        use_redis=args.redis
+    )
+    latencies, completed, wall = run_queued(upload_queue, images, args.concurrency)
+    metrics = upload_queue.get_metrics()
+    upload_queue.shutdown()
+
+    print_latency("背景佇列", latencies)
+    print(f"      全部上傳完成 {wall:.2f}s, 實際上傳 {metrics['enqueued']} 次, 去重 {metrics['deduplicated']} 次, "
+          f"重試 {metrics['retries']} 次, 失敗 {metrics['failed']}, 佇列滿時同步上傳 {metrics['inline_uploads']} 次")
+    print(f"      上傳延遲（自放入佇列起）: avg={metrics['upload_latency']['avg_ms']}ms, "
+          f"max={metrics['upload_latency']['max_ms']}ms")
+    status = "✅" if completed == args.requests else "⚠️ "
+    print(f"   {status} URL 回呼 {completed}/{args.requests}")
+
+
+if __name__ == "__main__":
+    main()
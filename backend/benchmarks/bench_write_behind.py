@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+預測記錄背景寫入（write-behind）效能測試腳本
+比較同步寫入與背景批次寫入時請求執行緒的延遲
+
+使用本地 PostgreSQL（需 .env 中的資料庫設定與既有使用者 --user-id），結束時刪除測試資料；
+批次寫入、溢寫與重放的正確性由 tests/unit/test_core/test_core_write_behind.py 驗證
+"""
+
+import sys
+import time
+import uuid
+import json
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 載入環境變數
+from dotenv import load_dotenv
+load_dotenv()
+
+from config.development import DevelopmentConfig
+
+
+def make_prediction(user_id: int) -> tuple:
+    """建立一筆與整合檢測相同格式的 prediction_log / detection_records 資料"""
+    prediction_id = str(uuid.uuid4())
+    image_hash = uuid.uuid4().hex + uuid.uuid4().hex
+    prediction_log = {
+        'id': prediction_id,
+        'user_id': user_id,
+        'image_path': f"/image/prediction/{prediction_id}",
+        'image_hash': image_hash,
+        'image_size': 120000,
+        'image_source': 'upload',
+        'image_compressed': False,
+        'cnn_mean_score': 0.2,
+        'cnn_best_class': 'tomato',
+        'cnn_best_score': 0.97,
+        'cnn_all_scores': json.dumps({'tomato': 0.97}),
+        'yolo_result': json.dumps([{'class': 'Tomato_early_blight', 'confidence': 0.9, 'bbox': [[1, 2, 3, 4]]}]),
+        'yolo_detected': True,
+        'final_status': 'yolo_detected',
+        'workflow_step': 'cnn_yolo'
+    }
+    detection_record = {
+        'user_id': user_id,
+        'disease_name': 'Tomato_early_blight',
+        'severity': 'Unknown',
+        'confidence': 0.9,
+        'image_path': prediction_log['image_path'],
+        'image_hash': image_hash,
+        'image_size': 120000,
+        'image_source': 'upload',
+        'raw_model_output': json.dumps({'benchmark': True}),
+        'status': 'completed',
+        'processing_time_ms': 100,
+        'image_compressed': False,
+        'prediction_log_id': prediction_id
+    }
+    return prediction_log, detection_record
+
+
+def run_requests(writer, count: int, concurrency: int, user_id: int) -> tuple:
+    """模擬請求執行緒：提交預測並補上兩次 Cloudinary URL 更新，返回（延遲列表, prediction IDs）"""
+    latencies = []
+    ids = []
+
+    def one(_):
+        prediction_log, detection_record = make_prediction(user_id)
+        start = time.perf_counter()
+        writer.submit_prediction(prediction_log, detection_record)
+        url = f"https://example.com/{prediction_log['id']}.jpg"
+        writer.patch_urls(prediction_log['id'], user_id,
+                          prediction_log={'image_path': url, 'original_image_url': url},
+                          detection_record={'original_image_url': url})
+        writer.patch_urls(prediction_log['id'], user_id,
+                          prediction_log={'predict_img_url': url},
+                          detection_record={'annotated_image_url': url})
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(prediction_log['id'])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(count)))
+    return latencies, ids
+
+
+def print_latency(title: str, latencies: list):
+    latencies = sorted(latencies)
+    print(f"   {title}: p50={statistics.median(latencies):.2f}ms, "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}ms, max={latencies[-1]:.2f}ms")
+
+
+def cleanup(database, ids: list):
+    """刪除真實資料庫中的測試資料"""
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM detection_records WHERE prediction_log_id = ANY(%s::uuid[])", (ids,))
+            cursor.execute("DELETE FROM prediction_log WHERE id = ANY(%s::uuid[])", (ids,))
+        conn.commit()
+
+
+def count_persisted(database, ids: list) -> int:
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM prediction_log WHERE id = ANY(%s::uuid[])", (ids,))
+            return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='預測記錄背景寫入測試')
+    parser.add_argument('--user-id', type=int, default=1, help='真實資料庫中已存在的使用者 ID')
+    parser.add_argument('--requests', type=int, default=500, help='請求數')
+    parser.add_argument('--concurrency', type=int, default=8, help='並發數')
+    parser.add_argument('--batch-size', type=int, default=DevelopmentConfig.WRITE_BEHIND_BATCH_SIZE, help='批次大小')
+    parser.add_argument('--flush-ms', type=int, default=DevelopmentConfig.WRITE_BEHIND_FLUSH_MS, help='最長等待時間')
+    args = parser.parse_args()
+
+    from src.core.core_db_manager import db as database
+    from src.core.core_write_behind import WriteBehindWriter
+
+    spill_dir = tempfile.mkdtemp(prefix='bench_write_behind_')
+    all_ids = []
+
+    print("=" * 60)
+    print(f"📊 請求延遲（{args.requests} 筆，並發 {args.concurrency}）")
+    print("=" * 60)
+    for title, enabled in (("同步寫入", False), ("背景批次寫入", True)):
+        writer = WriteBehindWriter(
+            db_manager=database, enabled=enabled,
+            batch_size=args.batch_size, flush_interval_ms=args.flush_ms, spill_dir=spill_dir
+        )
+        wall_start = time.perf_counter()
+        latencies, ids = run_requests(writer, args.requests, args.concurrency, args.user_id)
+        writer.flush(timeout=60)
+        wall = time.perf_counter() - wall_start
+        writer.shutdown()
+        all_ids += ids
+
+        metrics = writer.get_metrics()
+        print_latency(title, latencies)
+        print(f"      總耗時 {wall:.2f}s, 交易數 {metrics['flushes']}, "
+              f"平均寫入 {metrics['flush_latency']['avg_ms']}ms, 已寫入 {count_persisted(database, ids)}/{len(ids)}")
+
+    cleanup(database, all_ids)
+    print("\n🧹 已刪除測試資料")
+
+
+if __name__ == "__main__":
+    main()
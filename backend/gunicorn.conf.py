@@ -0,0 +1,132 @@
+"""
+Gunicorn 設定
+綁定位址、worker 數等參數由 start.sh 的命令列指定；本檔提供模型預載入與推論伺服器生命週期的 hook
+
+MODEL_PRELOAD=true 時，主程序在 fork worker 之前把 YOLO / CNN / 超解析度模型載入模型註冊表（modules/model_registry.py），
+worker 建立服務時直接取得已載入的物件，權重以 copy-on-write 在所有 worker 間共用，不會每個 worker 各載入一份
+
+只預載入模型而不使用 gunicorn --preload 載入整個應用：應用在導入時會建立資料庫連接池、Redis 連線與背景寫入執行緒，
+這些資源不能跨 fork 共用，必須在各 worker 中建立
+
+INFERENCE_MODE=server 時，推論伺服器（inference_server.py）是 gunicorn 主程序的子程序：on_starting 啟動，
+意外結束時由主程序的監控執行緒重新啟動，on_exit 時送出 SIGTERM 並等待結束，不會在 gunicorn 結束後殘留
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(backend_dir)
+for path in (project_root, backend_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def _app_config():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+    env = os.getenv('FLASK_ENV', os.getenv('ENVIRONMENT', 'development')).lower()
+    if env == 'production':
+        from config.production import ProductionConfig as AppConfig
+    else:
+        from config.development import DevelopmentConfig as AppConfig
+    return AppConfig
+
+
+class InferenceServerSupervisor:
+    """在 gunicorn 主程序中管理推論伺服器子程序：啟動、意外結束時重新啟動、gunicorn 結束時停止"""
+
+    # 連續重新啟動的等待秒數（執行超過 STABLE_SECONDS 後重設）
+    RESTART_BACKOFF = (1, 2, 5, 10, 30)
+    STABLE_SECONDS = 60.0
+
+    def __init__(self, log, stop_timeout: float = 30.0):
+        self.log = log
+        self.stop_timeout = stop_timeout
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._spawn()
+        threading.Thread(target=self._monitor, name='inference-server-supervisor', daemon=True).start()
+
+    def _spawn(self):
+        # 推論伺服器在主程序消失（例如被 SIGKILL）時自行結束，不會成為孤兒程序
+        env = dict(os.environ, INFERENCE_SERVER_PARENT_PID=str(os.getpid()))
+        with self._lock:
+            self.process = subprocess.Popen([sys.executable, os.path.join(backend_dir, 'inference_server.py')], env=env)
+            self.started_at = time.time()
+        self.log.info(f"🧠 推論伺服器已啟動 (pid={self.process.pid})")
+
+    def _monitor(self):
+        failures = 0
+        while not self._stopping.is_set():
+            exit_code = self.process.wait()
+            if self._stopping.is_set():
+                break
+            failures = 0 if time.time() - self.started_at >= self.STABLE_SECONDS else failures + 1
+            delay = self.RESTART_BACKOFF[min(failures, len(self.RESTART_BACKOFF) - 1)]
+            self.log.error(f"❌ 推論伺服器意外結束 (pid={self.process.pid}, exit={exit_code})，{delay}s 後重新啟動")
+            if self._stopping.wait(delay):
+                break
+            self.restarts += 1
+            self._spawn()
+
+    def stop(self):
+        """送出 SIGTERM 並等待推論伺服器結束（逾時則 SIGKILL）"""
+        self._stopping.set()
+        with self._lock:
+            process = self.process
+        if process is None or process.poll() is not None:
+            return
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=self.stop_timeout)
+        except subprocess.TimeoutExpired:
+            self.log.warning(f"⚠️  推論伺服器未在 {self.stop_timeout}s 內結束，強制終止 (pid={process.pid})")
+            process.kill()
+            process.wait()
+        self.log.info(f"🛑 推論伺服器已停止 (pid={process.pid}, exit={process.returncode})")
+
+
+inference_supervisor = None
+
+
+def on_starting(server):
+    """主程序啟動時（fork worker 之前）啟動推論伺服器或預載入模型"""
+    global inference_supervisor
+
+    app_config = _app_config()
+    if getattr(app_config, 'INFERENCE_MODE', 'in_process') == 'server':
+        server.log.info("ℹ️  INFERENCE_MODE=server，模型由推論伺服器載入，web worker 不載入模型")
+        inference_supervisor = InferenceServerSupervisor(server.log)
+        inference_supervisor.start()
+        return
+    if not getattr(app_config, 'MODEL_PRELOAD', True):
+        server.log.info("ℹ️  MODEL_PRELOAD=false，模型由各 worker 自行載入")
+        return
+
+    from modules.model_registry import model_registry, preload_models
+
+    if not model_registry.enabled:
+        server.log.info("ℹ️  ENABLE_MODEL_REGISTRY=false，略過模型預載入")
+        return
+
+    start = time.perf_counter()
+    metrics = preload_models(project_root, app_config)
+    server.log.info(f"✅ 主程序已預載入 {len(metrics['models'])} 個模型（{time.perf_counter() - start:.1f}s，"
+                    f"權重 {metrics['weight_mb']}MB），worker 將共用這些權重")
+
+
+def on_exit(server):
+    """gunicorn 主程序結束時停止推論伺服器"""
+    if inference_supervisor is not None:
+        inference_supervisor.stop()
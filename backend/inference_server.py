@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+推論伺服器啟動腳本
+INFERENCE_MODE=server 時由 gunicorn 主程序（gunicorn.conf.py 的 on_starting）以子程序啟動並監控：
+載入模型到推論程序池，並在 INFERENCE_SERVER_SOCKET_RELATIVE 監聽 web worker 的連線
+gunicorn 結束時收到 SIGTERM；主程序異常消失時（INFERENCE_SERVER_PARENT_PID 不再是父程序）自行結束
+
+本機測試：
+    cd backend && INFERENCE_MODE=server python inference_server.py
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(backend_dir)
+for path in (project_root, backend_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from src.services.service_inference_pool import InferenceServer
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    # 推論程序以 spawn 啟動，會重新導入本檔案（__mp_main__）：應用程式配置在此才導入，
+    # 推論程序只導入 service_inference_pool 與推論引擎需要的模組
+    from src.core.core_app_config import AppConfig, get_base_dir, build_integrated_service_kwargs, get_inference_server_address
+
+    base_dir = get_base_dir()
+    engine_kwargs = build_integrated_service_kwargs(base_dir, AppConfig)
+    if engine_kwargs is None:
+        logger.error("❌ 模型文件不存在，推論伺服器無法啟動")
+        sys.exit(1)
+
+    socket_path, authkey = get_inference_server_address(base_dir, AppConfig)
+    server = InferenceServer(
+        socket_path,
+        authkey,
+        engine_kwargs,
+        workers=AppConfig.INFERENCE_WORKERS,
+        threads_per_worker=AppConfig.INFERENCE_THREADS_PER_WORKER,
+        pin_cpus=AppConfig.INFERENCE_PIN_CPUS,
+        task_timeout=AppConfig.INFERENCE_TASK_TIMEOUT,
+        max_pending=AppConfig.INFERENCE_MAX_PENDING
+    )
+
+    def handle_signal(signum, frame):
+        logger.info(f"🛑 收到信號 {signum}，關閉推論伺服器")
+        server.shutdown()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    parent_pid = os.getenv('INFERENCE_SERVER_PARENT_PID')
+    if parent_pid:
+        def watch_parent():
+            while os.getppid() == int(parent_pid):
+                time.sleep(1.0)
+            logger.warning(f"⚠️  gunicorn 主程序 {parent_pid} 已結束，關閉推論伺服器")
+            server.shutdown()
+            os._exit(0)
+
+        threading.Thread(target=watch_parent, name='parent-watch', daemon=True).start()
+
+    server.start()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
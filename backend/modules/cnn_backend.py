@@ -0,0 +1,291 @@
+"""
+CNN 推論後端模組
+提供 eager PyTorch、TorchScript、ONNX Runtime 三種可替換的推論後端
+
+TorchScript / ONNX 匯出檔快取在檢查點旁（檔名包含檢查點 SHA256 前綴），檢查點更新後自動重新匯出；
+載入後以數值一致性檢查（top-1 類別與 softmax 分數）與 eager 模型比對，不一致時退回 eager
+"""
+
+import os
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+# 嘗試導入 onnxruntime（可選依賴）
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNXRUNTIME_AVAILABLE = False
+
+CNN_BACKENDS = ('eager', 'torchscript', 'onnx')
+
+# 模型輸入尺寸（與 get_cnn_transform 一致）
+CNN_INPUT_SHAPE = (3, 224, 224)
+
+ONNX_OPSET_VERSION = 17
+
+
+def checkpoint_sha256(model_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """計算檢查點內容的 SHA256（分塊讀取）"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_export_path(model_path: str, backend: str, checkpoint_hash: str, export_dir: Optional[str] = None) -> str:
+    """
+    獲取匯出檔路徑：{檢查點檔名}.{hash 前 16 碼}.{torchscript.pt|onnx}
+
+    Args:
+        model_path: 檢查點路徑
+        backend: 'torchscript' 或 'onnx'
+        checkpoint_hash: 檢查點 SHA256
+        export_dir: 匯出目錄（預設為檢查點所在目錄）
+    """
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    suffix = 'torchscript.pt' if backend == 'torchscript' else 'onnx'
+    directory = export_dir or os.path.dirname(os.path.abspath(model_path))
+    return os.path.join(directory, f"{stem}.{checkpoint_hash[:16]}.{suffix}")
+
+
+class EagerBackend:
+    """eager PyTorch 後端（原始 nn.Module）"""
+
+    name = 'eager'
+
+    def __init__(self, model: nn.Module):
+        self.model = model
+        self.export_path = None
+
+    def __call__(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(input_tensor)
+
+
+class TorchScriptBackend:
+    """TorchScript 後端（trace 後 freeze + optimize_for_inference）"""
+
+    name = 'torchscript'
+
+    def __init__(self, export_path: str, device: str):
+        self.export_path = export_path
+        module = torch.jit.load(export_path, map_location=device)
+        module.eval()
+        try:
+            module = torch.jit.optimize_for_inference(torch.jit.freeze(module))
+        except Exception as e:
+            logger.warning(f"⚠️  TorchScript 圖最佳化失敗，使用未最佳化的模組: {str(e)}")
+        self.module = module
+
+    @staticmethod
+    def export(model: nn.Module, export_path: str, device: str):
+        example = torch.randn(1, *CNN_INPUT_SHAPE, device=device)
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+        _atomic_save(export_path, lambda tmp_path: traced.save(tmp_path))
+
+    def __call__(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(input_tensor)
+
+
+class OnnxRuntimeBackend:
+    """ONNX Runtime 後端（動態 batch 維度，啟用全部圖最佳化）"""
+
+    name = 'onnx'
+
+    def __init__(self, export_path: str, device: str, num_threads: int = 0):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise ImportError("onnxruntime 未安裝，請執行: pip install onnxruntime")
+        self.export_path = export_path
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        providers = ['CPUExecutionProvider']
+        if device == 'cuda' and 'CUDAExecutionProvider' in ort.get_available_providers():
+            providers.insert(0, 'CUDAExecutionProvider')
+        self.session = ort.InferenceSession(export_path, sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def export(model: nn.Module, export_path: str, device: str):
+        example = torch.randn(1, *CNN_INPUT_SHAPE, device=device)
+
+        def write(tmp_path):
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    example,
+                    tmp_path,
+                    input_names=['input'],
+                    output_names=['logits'],
+                    dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+                    opset_version=ONNX_OPSET_VERSION,
+                    do_constant_folding=True
+                )
+
+        _atomic_save(export_path, write)
+
+    def __call__(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        array = input_tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+        logits = self.session.run(None, {self.input_name: array})[0]
+        return torch.from_numpy(logits).to(input_tensor.device)
+
+
+def _atomic_save(export_path: str, write_fn):
+    """寫入暫存檔後再改名（多個 worker 同時匯出時不會讀到寫到一半的檔案）"""
+    tmp_path = f"{export_path}.{os.getpid()}.tmp"
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, export_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _writable_export_dir(model_path: str, fallback_dir: Optional[str]) -> str:
+    """檢查點所在目錄不可寫入時（例如唯讀映像）改用 fallback_dir"""
+    directory = os.path.dirname(os.path.abspath(model_path))
+    if os.access(directory, os.W_OK) or not fallback_dir:
+        return directory
+    os.makedirs(fallback_dir, exist_ok=True)
+    return fallback_dir
+
+
+def check_cnn_parity(
+    reference: Any,
+    candidate: Any,
+    inputs: Optional[torch.Tensor] = None,
+    atol: float = 1e-3,
+    device: str = 'cpu'
+) -> Dict[str, Any]:
+    """
+    數值一致性檢查：比較兩個後端的 top-1 類別與 softmax 分數
+
+    Args:
+        reference: 參考後端（通常為 eager）
+        candidate: 待檢查後端
+        inputs: 預處理後的輸入批次（None 時使用固定種子的隨機輸入）
+        atol: softmax 分數的最大允許絕對誤差
+        device: 隨機輸入所在設備
+
+    Returns:
+        {'passed', 'top1_match', 'top1_mismatches', 'max_abs_diff', 'samples', 'atol'}；
+        參考分數中前兩名差距小於 atol 的樣本不計入 top-1 比對（誤差內本來就可能互換）
+    """
+    if inputs is None:
+        generator = torch.Generator().manual_seed(0)
+        inputs = torch.randn(8, *CNN_INPUT_SHAPE, generator=generator).to(device)
+
+    with torch.no_grad():
+        ref_probs = F.softmax(reference(inputs).float(), dim=1).cpu()
+        cand_probs = F.softmax(candidate(inputs).float(), dim=1).cpu()
+
+    max_abs_diff = float((ref_probs - cand_probs).abs().max())
+    top2 = ref_probs.topk(min(2, ref_probs.shape[1]), dim=1).values
+    decisive = (top2[:, 0] - top2[:, -1]) >= atol
+    mismatched = (ref_probs.argmax(dim=1) != cand_probs.argmax(dim=1)) & decisive
+    top1_mismatches = int(mismatched.sum())
+
+    return {
+        'passed': top1_mismatches == 0 and max_abs_diff <= atol,
+        'top1_match': top1_mismatches == 0,
+        'top1_mismatches': top1_mismatches,
+        'max_abs_diff': max_abs_diff,
+        'samples': int(inputs.shape[0]),
+        'atol': atol
+    }
+
+
+def load_cnn_backend(
+    model: nn.Module,
+    model_path: str,
+    backend: str = 'eager',
+    device: str = 'cpu',
+    checkpoint_hash: Optional[str] = None,
+    num_threads: int = 0,
+    verify: bool = True,
+    atol: float = 1e-3,
+    fallback_export_dir: Optional[str] = None
+):
+    """
+    建立 CNN 推論後端；匯出檔不存在時先匯出，載入或一致性檢查失敗時退回 eager
+
+    Args:
+        model: 已載入權重的 eager 模型（eval 模式）
+        model_path: 檢查點路徑（匯出檔放在同一目錄）
+        backend: 'eager'、'torchscript' 或 'onnx'
+        device: 設備
+        checkpoint_hash: 檢查點 SHA256（None 時自動計算）
+        num_threads: ONNX Runtime intra-op 執行緒數（0 表示預設）
+        verify: 是否與 eager 模型做一致性檢查
+        atol: 一致性檢查的 softmax 分數容許誤差
+        fallback_export_dir: 檢查點目錄不可寫入時的匯出目錄
+
+    Returns:
+        (後端物件, 後端資訊字典)；後端物件可直接傳給 cnn_predict
+    """
+    eager = EagerBackend(model)
+    info: Dict[str, Any] = {'requested': backend, 'backend': 'eager', 'export_path': None, 'parity': None}
+    if backend == 'eager':
+        return eager, info
+    if backend not in CNN_BACKENDS:
+        logger.warning(f"⚠️  未知的 CNN 後端 '{backend}'，使用 eager（可選: {', '.join(CNN_BACKENDS)}）")
+        info['error'] = f"unknown backend: {backend}"
+        return eager, info
+
+    try:
+        checkpoint_hash = checkpoint_hash or checkpoint_sha256(model_path)
+        export_dir = _writable_export_dir(model_path, fallback_export_dir)
+        export_path = get_export_path(model_path, backend, checkpoint_hash, export_dir)
+
+        backend_cls = TorchScriptBackend if backend == 'torchscript' else OnnxRuntimeBackend
+        if backend == 'onnx' and not ONNXRUNTIME_AVAILABLE:
+            raise ImportError("onnxruntime 未安裝，請執行: pip install onnxruntime")
+        if not os.path.exists(export_path):
+            logger.info(f"📦 匯出 CNN 模型為 {backend}: {export_path}")
+            backend_cls.export(model, export_path, device)
+        else:
+            logger.info(f"📦 使用已快取的 CNN {backend} 匯出檔: {export_path}")
+
+        if backend == 'torchscript':
+            candidate = TorchScriptBackend(export_path, device)
+        else:
+            candidate = OnnxRuntimeBackend(export_path, device, num_threads=num_threads)
+        info['export_path'] = export_path
+
+        if verify:
+            parity = check_cnn_parity(eager, candidate, atol=atol, device=device)
+            info['parity'] = parity
+            if not parity['passed']:
+                logger.warning(
+                    f"⚠️  CNN {backend} 後端與 eager 結果不一致（top-1 不一致 {parity['top1_mismatches']} 筆，"
+                    f"最大誤差 {parity['max_abs_diff']:.2e} > {atol:.0e}），使用 eager"
+                )
+                return eager, info
+
+        info['backend'] = backend
+        logger.info(f"✅ CNN 推論後端: {backend}")
+        return candidate, info
+
+    except Exception as e:
+        logger.warning(f"⚠️  CNN {backend} 後端載入失敗，使用 eager: {str(e)}")
+        info['error'] = str(e)
+        return eager, info
+
+
+def available_cnn_backends() -> List[str]:
+    """目前環境可用的後端列表"""
+    return [name for name in CNN_BACKENDS if name != 'onnx' or ONNXRUNTIME_AVAILABLE]
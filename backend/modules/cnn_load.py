@@ -90,3 +90,35 @@ def load_cnn_model(model_path: str, num_classes: int = 5, device: Optional[str]
         import traceback
         logger.error(f"錯誤堆疊:\n{traceback.format_exc()}")
         raise
+
+
+def quantize_cnn_model(model: nn.Module, mode: str, calibration_arrays=None, engine: Optional[str] = None):
+    """
+    對已載入的 CNN 模型做 INT8 訓練後量化（CPU 推論用，不修改原始模型）
+    
+    Args:
+        model: load_cnn_model 返回的 fp32 模型
+        mode: 'dynamic'（只量化分類頭 nn.Linear）或 'static'（FX 量化所有卷積層，需要校正圖片）
+        calibration_arrays: static 模式的校正圖片（RGB uint8 陣列列表）
+        engine: 量化引擎（None 時自動選擇）
+    
+    Returns:
+        (量化模型, 範例輸入)；範例輸入用於以 TorchScript 保存量化模型
+    """
+    from modules.quantization import select_quantization_engine, quantize_dynamic_model, quantize_static_model
+    from modules.cnn_preprocess import preprocess_arrays_batch
+    
+    engine = select_quantization_engine(engine)
+    example_input = torch.randn(1, 3, 224, 224)
+    
+    if mode == 'dynamic':
+        return quantize_dynamic_model(model), example_input
+    if mode == 'static':
+        if not calibration_arrays:
+            raise ValueError("CNN static 量化需要校正圖片")
+        batches = (
+            preprocess_arrays_batch(calibration_arrays[i:i + 16], device='cpu')
+            for i in range(0, len(calibration_arrays), 16)
+        )
+        return quantize_static_model(model, batches, example_input, engine), example_input
+    raise ValueError(f"未知的量化模式: {mode}")
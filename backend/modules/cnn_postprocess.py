@@ -14,6 +14,37 @@ from modules.cnn_utils import CNN_CLASSES
 logger = logging.getLogger(__name__)
 
 
+def _build_cnn_result(probabilities: np.ndarray, classes: List[str]) -> Dict[str, Any]:
+    """
+    由單張圖片的機率向量構建結果字典
+    
+    Args:
+        probabilities: 單張圖片的機率陣列（已 softmax）
+        classes: 類別列表
+    
+    Returns:
+        與 postprocess_cnn_result() 相同格式的結果字典
+    """
+    mean_score = float(probabilities.mean())
+    best_class_idx = int(probabilities.argmax())
+    best_class = classes[best_class_idx]
+    best_score = float(probabilities[best_class_idx])
+    
+    # 構建所有類別分數字典
+    all_scores = {
+        class_name: float(probabilities[i])
+        for i, class_name in enumerate(classes)
+    }
+    
+    return {
+        'mean_score': mean_score,
+        'best_class': best_class,
+        'best_score': best_score,
+        'all_scores': all_scores,
+        'probabilities': probabilities.tolist()  # 用於調試
+    }
+
+
 def postprocess_cnn_result(output: torch.Tensor, classes: List[str] = None) -> Dict[str, Any]:
     """
     後處理 CNN 推論結果
@@ -40,30 +71,35 @@ def postprocess_cnn_result(output: torch.Tensor, classes: List[str] = None) -> D
         probabilities = probabilities.cpu().numpy()[0]  # 移除 batch 維度
         logger.info(f"probabilities: {probabilities}")
         
-        # 計算結果
-        mean_score = float(probabilities.mean())
-        best_class_idx = int(probabilities.argmax())
-        best_class = classes[best_class_idx]
-        best_score = float(probabilities[best_class_idx])
-        
-        # 構建所有類別分數字典
-        all_scores = {
-            class_name: float(probabilities[i])
-            for i, class_name in enumerate(classes)
-        }
+        result = _build_cnn_result(probabilities, classes)
         
-        result = {
-            'mean_score': mean_score,
-            'best_class': best_class,
-            'best_score': best_score,
-            'all_scores': all_scores,
-            'probabilities': probabilities.tolist()  # 用於調試
-        }
-        
-        logger.debug(f"CNN 預測結果: {best_class} ({best_score:.4f}), 平均分數: {mean_score:.4f}")
+        logger.debug(f"CNN 預測結果: {result['best_class']} ({result['best_score']:.4f}), 平均分數: {result['mean_score']:.4f}")
         
         return result
         
     except Exception as e:
         logger.error(f"❌ CNN 後處理失敗: {str(e)}")
         raise
+
+
+def postprocess_cnn_batch_result(output: torch.Tensor, classes: List[str] = None) -> List[Dict[str, Any]]:
+    """
+    後處理批次 CNN 推論結果
+    
+    Args:
+        output: 模型原始輸出，形狀為 (N, num_classes)
+        classes: 類別列表（如果為 None，使用預設 CNN_CLASSES）
+    
+    Returns:
+        結果字典列表，順序與輸入批次一致，每個元素格式同 postprocess_cnn_result()
+    """
+    try:
+        if classes is None:
+            classes = CNN_CLASSES
+        
+        probabilities = F.softmax(output, dim=1).cpu().numpy()
+        return [_build_cnn_result(row, classes) for row in probabilities]
+        
+    except Exception as e:
+        logger.error(f"❌ CNN 批次後處理失敗: {str(e)}")
+        raise
@@ -17,7 +17,7 @@ def cnn_predict(model: nn.Module, input_tensor: torch.Tensor) -> torch.Tensor:
     執行 CNN 推論
     
     Args:
-        model: 已載入的 CNN 模型
+        model: 已載入的 CNN 模型，或 modules.cnn_backend 的推論後端（可呼叫物件，返回 logits 張量）
         input_tensor: 預處理後的圖片張量（已包含 batch 維度）
     
     Returns:
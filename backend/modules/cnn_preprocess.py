@@ -3,13 +3,14 @@ CNN 圖片預處理模組
 負責圖片的前處理轉換
 """
 
-import os
-from io import BytesIO
+import numpy as np
 from PIL import Image
 from torchvision import transforms
 import torch
 import logging
-from typing import Optional
+from typing import Optional, List
+
+from modules.image_buffer import decode_image_bytes, load_image_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -31,12 +32,12 @@ def get_cnn_transform():
     ])
 
 
-def preprocess_image(image_path: str, transform: Optional[transforms.Compose] = None, device: Optional[str] = None) -> torch.Tensor:
+def preprocess_image_from_array(image_array: np.ndarray, transform: Optional[transforms.Compose] = None, device: Optional[str] = None) -> torch.Tensor:
     """
-    從圖片路徑預處理圖片
+    從已解碼的 RGB 陣列預處理圖片（不觸發解碼）
     
     Args:
-        image_path: 圖片檔案路徑
+        image_array: RGB uint8 陣列 (H, W, 3)
         transform: 預處理轉換（如果為 None，使用預設轉換）
         device: 設備 ('cuda', 'cpu', 或 None 自動選擇)
     
@@ -44,9 +45,6 @@ def preprocess_image(image_path: str, transform: Optional[transforms.Compose] =
         預處理後的圖片張量（已添加 batch 維度並移到指定設備）
     """
     try:
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"圖片檔案不存在: {image_path}")
-        
         # 使用預設轉換或提供的轉換
         if transform is None:
             transform = get_cnn_transform()
@@ -55,13 +53,32 @@ def preprocess_image(image_path: str, transform: Optional[transforms.Compose] =
         if device is None:
             device = 'cuda' if torch.cuda.is_available() else 'cpu'
         
-        # 載入並預處理圖片
-        image = Image.open(image_path).convert('RGB')
-        input_tensor = transform(image).unsqueeze(0)  # 添加 batch 維度
+        input_tensor = transform(Image.fromarray(image_array)).unsqueeze(0)  # 添加 batch 維度
         input_tensor = input_tensor.to(device)
         
         return input_tensor
         
+    except Exception as e:
+        logger.error(f"❌ CNN 圖片預處理失敗（從陣列）: {str(e)}")
+        raise
+
+
+def preprocess_image(image_path: str, transform: Optional[transforms.Compose] = None, device: Optional[str] = None) -> torch.Tensor:
+    """
+    從圖片路徑預處理圖片（轉接層：讀檔解碼後交給 preprocess_image_from_array）
+    
+    Args:
+        image_path: 圖片檔案路徑
+        transform: 預處理轉換（如果為 None，使用預設轉換）
+        device: 設備 ('cuda', 'cpu', 或 None 自動選擇)
+    
+    Returns:
+        預處理後的圖片張量（已添加 batch 維度並移到指定設備）
+    """
+    try:
+        image = load_image_buffer(image_path, stage='cnn')
+        return preprocess_image_from_array(image.pixels, transform, device)
+        
     except Exception as e:
         logger.error(f"❌ CNN 圖片預處理失敗: {str(e)}")
         raise
@@ -69,7 +86,7 @@ def preprocess_image(image_path: str, transform: Optional[transforms.Compose] =
 
 def preprocess_image_from_bytes(image_bytes: bytes, transform: Optional[transforms.Compose] = None, device: Optional[str] = None) -> torch.Tensor:
     """
-    從圖片位元組預處理圖片
+    從圖片位元組預處理圖片（轉接層：解碼後交給 preprocess_image_from_array）
     
     Args:
         image_bytes: 圖片位元組資料
@@ -80,21 +97,55 @@ def preprocess_image_from_bytes(image_bytes: bytes, transform: Optional[transfor
         預處理後的圖片張量（已添加 batch 維度並移到指定設備）
     """
     try:
-        # 使用預設轉換或提供的轉換
+        image = decode_image_bytes(image_bytes, stage='cnn')
+        return preprocess_image_from_array(image.pixels, transform, device)
+        
+    except Exception as e:
+        logger.error(f"❌ CNN 圖片預處理失敗（從位元組）: {str(e)}")
+        raise
+
+
+def preprocess_arrays_batch(image_arrays: List[np.ndarray], transform: Optional[transforms.Compose] = None, device: Optional[str] = None) -> torch.Tensor:
+    """
+    將多個已解碼的 RGB 陣列預處理並堆疊為單一批次張量（用於批次推論）
+    
+    Args:
+        image_arrays: RGB uint8 陣列列表
+        transform: 預處理轉換（如果為 None，使用預設轉換）
+        device: 設備 ('cuda', 'cpu', 或 None 自動選擇)
+    
+    Returns:
+        形狀為 (N, 3, 224, 224) 的批次張量（已移到指定設備）
+    """
+    try:
+        if not image_arrays:
+            raise ValueError("圖片列表為空")
+        
         if transform is None:
             transform = get_cnn_transform()
         
-        # 自動選擇設備
         if device is None:
             device = 'cuda' if torch.cuda.is_available() else 'cpu'
         
-        # 從位元組載入圖片
-        image = Image.open(BytesIO(image_bytes)).convert('RGB')
-        input_tensor = transform(image).unsqueeze(0)  # 添加 batch 維度
-        input_tensor = input_tensor.to(device)
-        
-        return input_tensor
+        tensors = [transform(Image.fromarray(image_array)) for image_array in image_arrays]
+        return torch.stack(tensors, dim=0).to(device)
         
     except Exception as e:
-        logger.error(f"❌ CNN 圖片預處理失敗（從位元組）: {str(e)}")
+        logger.error(f"❌ CNN 批次圖片預處理失敗: {str(e)}")
         raise
+
+
+def preprocess_images_batch(image_paths: List[str], transform: Optional[transforms.Compose] = None, device: Optional[str] = None) -> torch.Tensor:
+    """
+    將多張圖片預處理並堆疊為單一批次張量（轉接層：讀檔解碼後交給 preprocess_arrays_batch）
+    
+    Args:
+        image_paths: 圖片檔案路徑列表
+        transform: 預處理轉換（如果為 None，使用預設轉換）
+        device: 設備 ('cuda', 'cpu', 或 None 自動選擇)
+    
+    Returns:
+        形狀為 (N, 3, 224, 224) 的批次張量（已移到指定設備）
+    """
+    arrays = [load_image_buffer(image_path, stage='cnn').pixels for image_path in image_paths]
+    return preprocess_arrays_batch(arrays, transform, device)
@@ -0,0 +1,281 @@
+"""
+記憶體內圖片緩衝模組
+上傳圖片只解碼一次為 NumPy 陣列（RGB, uint8），並攜帶中繼資料流經驗證、hash、超解析度、CNN、YOLO 與標註
+同時提供各階段解碼/編碼/I/O 計數器，用於確認每張圖片只被解碼一次
+"""
+
+import io
+import os
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from modules.perceptual_hash import phash
+
+logger = logging.getLogger(__name__)
+
+# 計數器類型
+COUNTER_KINDS = ('decode', 'encode', 'io_read', 'io_write')
+
+_counters_lock = threading.Lock()
+_pipeline_counters: Dict[str, Dict[str, int]] = {}
+
+
+def record_pipeline_event(stage: str, kind: str, image: Optional['ImageBuffer'] = None):
+    """
+    記錄一次圖片管線事件（全域累計，若提供 image 也記錄到該圖片自身）
+
+    Args:
+        stage: 階段名稱（例如 'upload', 'annotate', 'cnn'）
+        kind: 事件類型（'decode', 'encode', 'io_read', 'io_write'）
+        image: 事件所屬的圖片緩衝（可選）
+    """
+    if kind not in COUNTER_KINDS:
+        raise ValueError(f"未知的計數器類型: {kind}")
+    with _counters_lock:
+        stage_counters = _pipeline_counters.setdefault(stage, {k: 0 for k in COUNTER_KINDS})
+        stage_counters[kind] += 1
+    if image is not None:
+        image.counters[kind] = image.counters.get(kind, 0) + 1
+
+
+def get_pipeline_counters() -> Dict[str, Dict[str, int]]:
+    """
+    獲取各階段的解碼/編碼/I/O 累計次數
+
+    Returns:
+        {stage: {'decode': n, 'encode': n, 'io_read': n, 'io_write': n}}
+    """
+    with _counters_lock:
+        return {stage: dict(counts) for stage, counts in _pipeline_counters.items()}
+
+
+def reset_pipeline_counters():
+    """重置所有管線計數器（用於測試與基準測試）"""
+    with _counters_lock:
+        _pipeline_counters.clear()
+
+
+class ImageBuffer:
+    """
+    已解碼的圖片緩衝
+
+    pixels 為 RGB uint8 陣列 (H, W, 3)；encoded 為對應的編碼位元組（上傳、hash、儲存用），
+    只在需要時編碼一次並快取。
+    """
+
+    def __init__(
+        self,
+        pixels: np.ndarray,
+        source_format: Optional[str] = None,
+        encoded: Optional[bytes] = None,
+        image_hash: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        perceptual_hash: Optional[int] = None
+    ):
+        """
+        初始化圖片緩衝
+
+        Args:
+            pixels: RGB uint8 陣列 (H, W, 3)
+            source_format: 原始編碼格式（例如 'JPEG', 'PNG'）
+            encoded: 與 pixels 對應的編碼位元組（可選）
+            image_hash: encoded 的 SHA256 hash（可選）
+            metadata: 其他中繼資料（原始尺寸、原始大小等）
+            perceptual_hash: pixels 的 64 位元感知雜湊（可選）
+        """
+        self.pixels = pixels
+        self.source_format = source_format
+        self.encoded = encoded
+        self.image_hash = image_hash
+        self.metadata = metadata or {}
+        self.perceptual_hash = perceptual_hash
+        self.counters: Dict[str, int] = {}
+
+    @property
+    def width(self) -> int:
+        return int(self.pixels.shape[1])
+
+    @property
+    def height(self) -> int:
+        return int(self.pixels.shape[0])
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height)，與 PIL 的 size 一致"""
+        return self.width, self.height
+
+    def to_pil(self) -> Image.Image:
+        """返回共用像素資料的 PIL 圖片（不解碼）"""
+        return Image.fromarray(self.pixels)
+
+    def to_bgr(self) -> np.ndarray:
+        """返回 BGR 連續陣列（供 OpenCV / Ultralytics 使用）"""
+        return np.ascontiguousarray(self.pixels[:, :, ::-1])
+
+    def resize(self, target_size: Tuple[int, int]) -> 'ImageBuffer':
+        """
+        以 LANCZOS 直接拉伸到目標尺寸（不保持比例），不觸發解碼
+
+        Args:
+            target_size: 目標尺寸 (width, height)
+
+        Returns:
+            新的 ImageBuffer（encoded 與 hash 需重新產生）
+        """
+        resized = self.to_pil().resize(target_size, Image.Resampling.LANCZOS)
+        metadata = dict(self.metadata)
+        metadata['resized_from'] = self.size
+        buffer = ImageBuffer(np.asarray(resized), source_format='JPEG', metadata=metadata)
+        buffer.counters = self.counters
+        return buffer
+
+    def encode(self, format: str = 'JPEG', quality: int = 85, stage: str = 'encode') -> bytes:
+        """
+        將像素編碼為位元組並快取為 encoded（重複呼叫不會重新編碼）
+
+        Args:
+            format: 圖片格式
+            quality: JPEG 品質
+            stage: 計數器階段名稱
+
+        Returns:
+            編碼後的位元組
+        """
+        if self.encoded is None:
+            self.encoded = encode_array(self.pixels, format=format, quality=quality, stage=stage, image=self)
+        return self.encoded
+
+    def ensure_hash(self) -> str:
+        """計算（並快取）encoded 的 SHA256 hash"""
+        if self.image_hash is None:
+            self.image_hash = hashlib.sha256(self.encode()).hexdigest()
+        return self.image_hash
+
+    def ensure_phash(self) -> int:
+        """計算（並快取）pixels 的 64 位元感知雜湊（近似重複比對用，不需要編碼）"""
+        if self.perceptual_hash is None:
+            self.perceptual_hash = phash(self.pixels)
+        return self.perceptual_hash
+
+
+def encode_array(
+    pixels: np.ndarray,
+    format: str = 'JPEG',
+    quality: int = 85,
+    stage: str = 'encode',
+    image: Optional[ImageBuffer] = None
+) -> bytes:
+    """
+    將 RGB 陣列編碼為圖片位元組
+
+    Args:
+        pixels: RGB uint8 陣列
+        format: 圖片格式
+        quality: JPEG 品質
+        stage: 計數器階段名稱
+        image: 所屬圖片緩衝（用於計數）
+
+    Returns:
+        編碼後的位元組
+    """
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format=format, quality=quality)
+    record_pipeline_event(stage, 'encode', image)
+    return output.getvalue()
+
+
+# IJG 標準亮度量化表（quality 50，自然順序）
+_STD_LUMINANCE_TABLE = (
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+)
+
+
+def estimate_jpeg_quality(quantization: Optional[Dict[int, Any]]) -> Optional[int]:
+    """
+    由 JPEG 亮度量化表估計壓縮品質（IJG 1-100 量表，反推 libjpeg 的縮放比例）
+    以表格總和比較，與量化表的排列順序（自然或 zigzag）無關
+
+    Args:
+        quantization: PIL JpegImageFile.quantization（{表格編號: 64 個係數}）
+
+    Returns:
+        估計品質（1-100），非 JPEG 或無量化表時返回 None
+    """
+    if not quantization or 0 not in quantization:
+        return None
+    table = list(quantization[0])
+    if len(table) != 64:
+        return None
+    scale = sum(table) * 100.0 / sum(_STD_LUMINANCE_TABLE)
+    quality = (200.0 - scale) / 2.0 if scale <= 100.0 else 5000.0 / scale
+    return int(round(min(100.0, max(1.0, quality))))
+
+
+def decode_image_bytes(image_bytes: bytes, stage: str = 'upload') -> ImageBuffer:
+    """
+    將圖片位元組解碼為 ImageBuffer（整條管線唯一的解碼點）
+    完整解碼即可驗證圖片是否損壞，不需要額外的 verify()
+
+    Args:
+        image_bytes: 圖片位元組
+        stage: 計數器階段名稱
+
+    Returns:
+        ImageBuffer，encoded 為原始位元組
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            source_format = img.format
+            original_mode = img.mode
+            jpeg_quality = estimate_jpeg_quality(getattr(img, 'quantization', None)) if source_format == 'JPEG' else None
+            pixels = np.asarray(img.convert('RGB'))
+    except Exception as e:
+        logger.error(f"❌ 圖片解碼失敗: {str(e)}")
+        raise ValueError(f"圖片格式錯誤: {str(e)}")
+
+    buffer = ImageBuffer(
+        pixels,
+        source_format=source_format,
+        encoded=image_bytes,
+        metadata={
+            'original_size': (int(pixels.shape[1]), int(pixels.shape[0])),
+            'original_mode': original_mode,
+            'original_bytes': len(image_bytes),
+            'jpeg_quality': jpeg_quality
+        }
+    )
+    record_pipeline_event(stage, 'decode', buffer)
+    return buffer
+
+
+def load_image_buffer(image_path: str, stage: str = 'file') -> ImageBuffer:
+    """
+    從檔案讀取並解碼圖片（路徑版函數的轉接層使用）
+
+    Args:
+        image_path: 圖片檔案路徑
+        stage: 計數器階段名稱
+
+    Returns:
+        ImageBuffer
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"圖片檔案不存在: {image_path}")
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    buffer = decode_image_bytes(image_bytes, stage=stage)
+    record_pipeline_event(stage, 'io_read', buffer)
+    buffer.metadata['source_path'] = image_path
+    return buffer
@@ -0,0 +1,306 @@
+"""
+模型註冊表模組
+程序內共用的模型實例：同一個檢查點（路徑 + 載入參數）只載入一次，所有服務取得同一個物件
+
+- YOLO / CNN / 超解析度模型都經由 get_yolo_model / get_cnn_model / get_sr_model 取得
+- gunicorn 主程序可在 fork 前呼叫 preload_models（見 backend/gunicorn.conf.py），
+  worker 繼承已載入的權重，以 copy-on-write 共用同一份實體記憶體
+- 本模組不導入資料庫、Redis 等服務，可安全地在 gunicorn 主程序中使用
+"""
+
+import os
+import gc
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def read_process_memory() -> Dict[str, float]:
+    """
+    目前程序的記憶體用量（MB）
+
+    Returns:
+        {'rss_mb', 'pss_mb', 'shared_mb', 'private_mb'}；
+        讀取 /proc/self/smaps_rollup（fork 後與其他 worker 共用的頁面計入 shared），
+        不支援時退回 /proc/self/statm，其他平台返回空字典
+    """
+    try:
+        values = {}
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    values[parts[0][:-1]] = int(parts[1]) / 1024
+        return {
+            'rss_mb': round(values.get('Rss', 0.0), 1),
+            'pss_mb': round(values.get('Pss', 0.0), 1),
+            'shared_mb': round(values.get('Shared_Clean', 0.0) + values.get('Shared_Dirty', 0.0), 1),
+            'private_mb': round(values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0), 1)
+        }
+    except OSError:
+        pass
+    try:
+        page_mb = os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+        with open('/proc/self/statm', 'r') as f:
+            _, resident, shared = (int(value) for value in f.read().split()[:3])
+        return {
+            'rss_mb': round(resident * page_mb, 1),
+            'shared_mb': round(shared * page_mb, 1),
+            'private_mb': round((resident - shared) * page_mb, 1)
+        }
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def _weight_bytes(model: Any) -> int:
+    """模型參數與 buffer 佔用的位元組數（共用同一儲存空間的張量只計一次；YOLO 物件取其內部 nn.Module）"""
+    import torch.nn as nn
+
+    module = model if isinstance(model, nn.Module) else getattr(model, 'model', None)
+    if not isinstance(module, nn.Module):
+        return 0
+    seen = set()
+    total = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() in seen:
+            continue
+        seen.add(storage.data_ptr())
+        total += storage.nbytes()
+    return total
+
+
+class _Entry:
+    """已載入的模型與其載入資訊"""
+
+    __slots__ = ('model', 'name', 'kind', 'path', 'load_seconds', 'rss_delta_mb', 'weight_mb', 'loaded_pid', 'hits')
+
+    def __init__(self, model: Any, name: str, kind: str, path: Optional[str],
+                 load_seconds: float, rss_delta_mb: float, weight_mb: float):
+        self.model = model
+        self.name = name
+        self.kind = kind
+        self.path = path
+        self.load_seconds = load_seconds
+        self.rss_delta_mb = rss_delta_mb
+        self.weight_mb = weight_mb
+        self.loaded_pid = os.getpid()
+        self.hits = 0
+
+
+class ModelRegistry:
+    """
+    程序內模型註冊表
+
+    以（模型種類, 檢查點實際路徑, 影響載入結果的參數）為鍵；第一次請求時呼叫 loader 載入，
+    之後返回同一個物件。載入在鎖內依序執行，避免多個執行緒同時載入同一個檢查點
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        初始化模型註冊表
+
+        Args:
+            enabled: 是否共用模型；False 時每次請求都重新載入（僅用於比較記憶體用量）
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple, _Entry] = {}
+        self._counters = {'loads': 0, 'hits': 0, 'failed_loads': 0}
+        self._preload_seconds: Optional[float] = None
+
+        if hasattr(os, 'register_at_fork'):
+            # gunicorn fork 後：模型物件沿用主程序已載入的（copy-on-write），只重建鎖
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, path: Optional[str], **params) -> Tuple:
+        """建立註冊表鍵（路徑正規化為實際路徑，未提供路徑時為 'default'）"""
+        resolved = os.path.realpath(path) if path else 'default'
+        return (kind, resolved) + tuple(sorted(params.items()))
+
+    def get_or_load(
+        self,
+        kind: str,
+        path: Optional[str],
+        loader: Callable[[], Any],
+        **params
+    ) -> Any:
+        """
+        取得已載入的模型，尚未載入時呼叫 loader
+
+        Args:
+            kind: 模型種類（'yolo'、'cnn'、'sr'）
+            path: 檢查點路徑（None 表示沒有檢查點，例如預設架構）
+            loader: 無參數的載入函數
+            **params: 影響載入結果的參數（類別數、設備、放大倍數等）
+
+        Returns:
+            模型物件（所有呼叫者共用，不可就地修改）
+        """
+        key = self.make_key(kind, path, **params)
+        with self._lock:
+            entry = self._entries.get(key) if self.enabled else None
+            if entry is not None:
+                entry.hits += 1
+                self._counters['hits'] += 1
+                return entry.model
+
+            rss_before = read_process_memory().get('rss_mb', 0.0)
+            start = time.perf_counter()
+            try:
+                model = loader()
+            except Exception:
+                self._counters['failed_loads'] += 1
+                raise
+            load_seconds = time.perf_counter() - start
+            rss_delta = read_process_memory().get('rss_mb', 0.0) - rss_before
+
+            name = f"{kind}:{os.path.basename(path) if path else 'default'}"
+            entry = _Entry(model, name, kind, path, load_seconds, round(rss_delta, 1),
+                           round(_weight_bytes(model) / (1024 * 1024), 1))
+            self._counters['loads'] += 1
+            if self.enabled:
+                self._entries[key] = entry
+            logger.info(f"📦 模型已載入: {name}（{load_seconds:.2f}s，權重 {entry.weight_mb}MB，RSS +{entry.rss_delta_mb}MB）")
+            return model
+
+    def mark_preloaded(self, seconds: float):
+        """記錄 fork 前預載入的耗時，並將已載入的物件移出 GC 追蹤，避免 worker 中的 GC 觸發寫入複製"""
+        self._preload_seconds = round(seconds, 2)
+        if hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取註冊表指標
+
+        Returns:
+            各模型的載入耗時、權重大小、載入時的 RSS 增量、是否由主程序預載入（fork 後共用），以及程序記憶體用量
+        """
+        pid = os.getpid()
+        with self._lock:
+            models = [
+                {
+                    'name': entry.name,
+                    'kind': entry.kind,
+                    'path': entry.path,
+                    'load_seconds': round(entry.load_seconds, 2),
+                    'weight_mb': entry.weight_mb,
+                    'rss_delta_mb': entry.rss_delta_mb,
+                    'preloaded': entry.loaded_pid != pid,
+                    'hits': entry.hits
+                }
+                for entry in self._entries.values()
+            ]
+            counters = dict(self._counters)
+        return {
+            'enabled': self.enabled,
+            'pid': pid,
+            'preload_seconds': self._preload_seconds,
+            'models': models,
+            'weight_mb': round(sum(model['weight_mb'] for model in models), 1),
+            'process_memory': read_process_memory(),
+            **counters
+        }
+
+
+def _registry_from_env() -> ModelRegistry:
+    return ModelRegistry(enabled=os.getenv('ENABLE_MODEL_REGISTRY', 'true').lower() == 'true')
+
+
+# 全局模型註冊表實例
+model_registry = _registry_from_env()
+
+
+def _resolve_device(device: Optional[str]) -> str:
+    import torch
+
+    return device or ('cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def get_yolo_model(model_path: str):
+    """取得共用的 YOLO 模型"""
+    from modules.yolo_load import load_yolo_model
+
+    return model_registry.get_or_load('yolo', model_path, lambda: load_yolo_model(model_path))
+
+
+def get_cnn_model(model_path: str, num_classes: int, device: Optional[str] = None):
+    """取得共用的 CNN 模型（eval 模式）"""
+    from modules.cnn_load import load_cnn_model
+
+    device = _resolve_device(device)
+    return model_registry.get_or_load(
+        'cnn', model_path,
+        lambda: load_cnn_model(model_path, num_classes, device),
+        num_classes=num_classes, device=device
+    )
+
+
+def get_sr_model(model_path: Optional[str], model_type: str = 'edsr', scale: int = 2, device: Optional[str] = None):
+    """取得共用的超解析度模型（model_path 為 None 時為預設架構）"""
+    from modules.sr_load import SuperResolutionModelLoader
+
+    device = _resolve_device(device)
+    return model_registry.get_or_load(
+        'sr', model_path,
+        lambda: SuperResolutionModelLoader(model_path=model_path, device=device).load_model(model_type=model_type, scale=scale),
+        model_type=model_type.lower(), scale=scale, device=device
+    )
+
+
+def preload_models(base_dir: str, config) -> Dict[str, Any]:
+    """
+    依應用配置預先載入所有模型（gunicorn 主程序在 fork 前呼叫）
+
+    路徑與參數的解析方式與 load_model / load_integrated_models 一致，worker 中的服務因此命中同一組鍵；
+    單一模型載入失敗只記錄警告，由 worker 啟動時照常處理
+
+    Args:
+        base_dir: 專案根目錄
+        config: 應用配置類
+
+    Returns:
+        註冊表指標
+    """
+    from modules.cnn_utils import CNN_CLASSES
+
+    start = time.perf_counter()
+    yolo_paths = {
+        os.path.join(base_dir, getattr(config, 'MODEL_PATH_RELATIVE', 'model/yolov11/YOLOv11_v1_20251212/weights/best.pt')),
+        os.path.join(base_dir, getattr(config, 'YOLO_MODEL_PATH_RELATIVE', 'model/yolov11/YOLOv11_v1_20251212/weights/best.pt'))
+    }
+    jobs = [(f"YOLO {path}", lambda path=path: get_yolo_model(path)) for path in sorted(yolo_paths)]
+
+    cnn_path = os.path.join(base_dir, getattr(config, 'CNN_MODEL_PATH_RELATIVE', 'model/CNN/CNN_v1.1_20251210/best_mobilenetv3_large.pth'))
+    jobs.append((f"CNN {cnn_path}", lambda: get_cnn_model(cnn_path, len(CNN_CLASSES))))
+
+    if getattr(config, 'ENABLE_SR', True):
+        sr_relative = getattr(config, 'SR_MODEL_PATH_RELATIVE', None)
+        sr_path = os.path.join(base_dir, sr_relative) if sr_relative else None
+        if sr_path and not os.path.exists(sr_path):
+            sr_path = None
+        jobs.append((
+            f"超解析度 {sr_path or '預設架構'}",
+            lambda: get_sr_model(sr_path, getattr(config, 'SR_MODEL_TYPE', 'edsr'), getattr(config, 'SR_SCALE', 2))
+        ))
+
+    for label, job in jobs:
+        try:
+            job()
+        except Exception as e:
+            logger.warning(f"⚠️  預載入模型失敗（worker 啟動時會再嘗試）: {label}: {str(e)}")
+
+    model_registry.mark_preloaded(time.perf_counter() - start)
+    metrics = model_registry.get_metrics()
+    logger.info(f"✅ 模型預載入完成: {len(metrics['models'])} 個模型，權重 {metrics['weight_mb']}MB，"
+                f"耗時 {metrics['preload_seconds']}s")
+    return metrics
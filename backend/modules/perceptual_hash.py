@@ -0,0 +1,218 @@
+"""
+感知雜湊（pHash）與近似重複索引模組
+SHA256 只能找到位元組完全相同的圖片；同一片葉子重新拍攝、或被手機以不同 JPEG 品質重新存檔後，
+SHA256 完全不同，但 pHash 只差幾個位元，可以用漢明距離找到先前的結果
+
+- phash(): 灰階、面積平均縮小到 32x32、二維 DCT，取左上 8x8 低頻係數與中位數比較得到 64 位元
+- HammingIndex: 多索引雜湊（multi-index hashing），64 位元切成 4 段 16 位元，每段一張雜湊表；
+  漢明距離 <= d 的兩個雜湊至少有一段距離 <= d // 4（鴿籠原理），
+  查詢只需探測每段距離 <= d // 4 的鍵，再對候選逐一驗證完整距離
+
+只依賴 NumPy，不需要資料庫（離線批次評分與基準測試可直接使用）
+"""
+
+import threading
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+HASH_BITS = 64
+_HASH_MASK = (1 << HASH_BITS) - 1
+
+# 灰階轉換權重（ITU-R 601，與 PIL convert('L') 相同）
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# pHash 參數：32x32 DCT，取 8x8 低頻係數
+_DCT_SIZE = 32
+_LOW_FREQ_SIZE = 8
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """正交 DCT-II 轉換矩陣"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0, :] = np.sqrt(1.0 / size)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _to_gray(pixels: np.ndarray) -> np.ndarray:
+    """RGB / 灰階 uint8 陣列轉為 float32 灰階"""
+    if pixels.ndim == 2:
+        return pixels.astype(np.float32)
+    return pixels[:, :, :3].astype(np.float32) @ _LUMA_WEIGHTS
+
+
+def _area_resize(gray: np.ndarray, size: int) -> np.ndarray:
+    """
+    以面積平均縮小到 size x size（640x640 -> 32x32 為 20x20 區塊平均）
+    小於目標尺寸的邊先以最近鄰放大，確保每個區塊至少一個像素
+    """
+    height, width = gray.shape
+    if height < size:
+        gray = np.repeat(gray, -(-size // height), axis=0)
+    if width < size:
+        gray = np.repeat(gray, -(-size // width), axis=1)
+    height, width = gray.shape
+    row_edges = np.linspace(0, height, size + 1).astype(np.int64)
+    col_edges = np.linspace(0, width, size + 1).astype(np.int64)
+    sums = np.add.reduceat(np.add.reduceat(gray, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+
+
+def phash(pixels: np.ndarray) -> int:
+    """
+    計算圖片的 64 位元感知雜湊（DCT pHash）
+
+    Args:
+        pixels: RGB 或灰階 uint8 陣列
+
+    Returns:
+        64 位元無號整數
+    """
+    small = _area_resize(_to_gray(pixels), _DCT_SIZE)
+    low = (_DCT @ small @ _DCT.T)[:_LOW_FREQ_SIZE, :_LOW_FREQ_SIZE]
+    bits = (low > np.median(low)).reshape(-1)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """兩個 64 位元雜湊的漢明距離"""
+    return (a ^ b).bit_count()
+
+
+def to_signed64(value: int) -> int:
+    """無號 64 位元雜湊轉為 PostgreSQL BIGINT（有號）"""
+    return value - (1 << HASH_BITS) if value >= (1 << (HASH_BITS - 1)) else value
+
+
+def from_signed64(value: int) -> int:
+    """PostgreSQL BIGINT 轉回無號 64 位元雜湊"""
+    return value & _HASH_MASK
+
+
+class HammingIndex:
+    """
+    64 位元雜湊的近似重複索引（多索引雜湊，執行緒安全）
+
+    每個雜湊只保存一份（重複加入時更新對應值並視為最新），
+    超過 max_entries 時淘汰最早加入的雜湊。
+    """
+
+    def __init__(self, max_entries: int = 500000, chunks: int = 4):
+        """
+        初始化索引
+
+        Args:
+            max_entries: 最多保存的雜湊數（0 表示不限制）
+            chunks: 64 位元切成的段數（必須整除 64）
+        """
+        if HASH_BITS % chunks:
+            raise ValueError(f"段數必須整除 {HASH_BITS}: {chunks}")
+        self.max_entries = max_entries
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        self._lock = threading.Lock()
+        # 插入順序即淘汰順序（dict 保持插入順序）
+        self._values: Dict[int, Any] = {}
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(chunks)]
+        self._flip_masks: Dict[int, List[int]] = {}
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _chunk_keys(self, value: int) -> List[int]:
+        return [(value >> (i * self.chunk_bits)) & self._chunk_mask for i in range(self.chunks)]
+
+    def _masks(self, radius: int) -> List[int]:
+        """單段內距離 <= radius 的所有翻轉遮罩（含 0）"""
+        masks = self._flip_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for flips in range(1, radius + 1):
+                for positions in combinations(range(self.chunk_bits), flips):
+                    mask = 0
+                    for position in positions:
+                        mask |= 1 << position
+                    masks.append(mask)
+            self._flip_masks[radius] = masks
+        return masks
+
+    def add(self, value: int, payload: Any):
+        """
+        加入雜湊（已存在時更新 payload 並移到最新）
+
+        Args:
+            value: 64 位元無號雜湊
+            payload: 對應的值（例如圖片 SHA256）
+        """
+        value &= _HASH_MASK
+        with self._lock:
+            if value in self._values:
+                del self._values[value]
+                self._values[value] = payload
+                return
+            self._values[value] = payload
+            for table, key in zip(self._tables, self._chunk_keys(value)):
+                table.setdefault(key, []).append(value)
+            if self.max_entries and len(self._values) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        """淘汰最早加入的雜湊（呼叫者需持有鎖）"""
+        oldest = next(iter(self._values))
+        del self._values[oldest]
+        for table, key in zip(self._tables, self._chunk_keys(oldest)):
+            bucket = table[key]
+            bucket.remove(oldest)
+            if not bucket:
+                del table[key]
+        self.evictions += 1
+
+    def search(self, value: int, max_distance: int, limit: int = 0) -> Tuple[List[Tuple[int, int, Any]], int]:
+        """
+        查詢漢明距離 <= max_distance 的雜湊
+
+        Args:
+            value: 查詢雜湊
+            max_distance: 最大漢明距離
+            limit: 最多返回筆數（0 表示全部）
+
+        Returns:
+            ([(距離, 雜湊, payload)]（依距離由近到遠）, 驗證的候選數)
+        """
+        value &= _HASH_MASK
+        masks = self._masks(max_distance // self.chunks)
+        matches = []
+        checked = set()
+        with self._lock:
+            for table, key in zip(self._tables, self._chunk_keys(value)):
+                for mask in masks:
+                    bucket = table.get(key ^ mask)
+                    if not bucket:
+                        continue
+                    for candidate in bucket:
+                        if candidate in checked:
+                            continue
+                        checked.add(candidate)
+                        distance = (candidate ^ value).bit_count()
+                        if distance <= max_distance:
+                            matches.append((distance, candidate, self._values[candidate]))
+        matches.sort(key=lambda match: match[0])
+        return (matches[:limit] if limit else matches), len(checked)
+
+    def nearest(self, value: int, max_distance: int) -> Optional[Tuple[int, int, Any]]:
+        """返回最近的一筆 (距離, 雜湊, payload)，沒有時返回 None"""
+        matches, _ = self.search(value, max_distance, limit=1)
+        return matches[0] if matches else None
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            for table in self._tables:
+                table.clear()
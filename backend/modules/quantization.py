@@ -0,0 +1,278 @@
+"""
+INT8 量化模組
+提供 CPU 推論用的訓練後量化（dynamic / static）、量化模型的 TorchScript 保存與載入，
+以及以已標註驗證清單（val_predictions_rerun.csv）重播的準確率比對工具
+
+- dynamic：只量化 nn.Linear（權重 int8、激活值執行時量化），不需要校正資料
+- static：FX graph mode 量化所有支援的層（Conv / Linear / 激活），以樣本圖片校正激活值範圍
+"""
+
+import os
+import csv
+import copy
+import json
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('none', 'dynamic', 'static')
+
+
+def select_quantization_engine(preferred: Optional[str] = None) -> str:
+    """
+    選擇量化運算後端並設為目前程序的引擎（x86 / fbgemm 用於 x86 CPU，qnnpack 用於 ARM）
+
+    Args:
+        preferred: 指定引擎（None 或不支援時自動選擇）
+
+    Returns:
+        實際使用的引擎名稱
+    """
+    supported = list(torch.backends.quantized.supported_engines)
+    candidates = ([preferred] if preferred else []) + ['x86', 'fbgemm', 'qnnpack']
+    engine = next((name for name in candidates if name in supported), None)
+    if engine is None:
+        raise RuntimeError(f"此環境不支援 INT8 量化引擎（可用: {supported}）")
+    torch.backends.quantized.engine = engine
+    return engine
+
+
+def quantize_dynamic_model(model: nn.Module) -> nn.Module:
+    """
+    動態量化：nn.Linear 權重轉為 int8（不修改原始模型）
+
+    Args:
+        model: eval 模式的 fp32 模型（CPU）
+
+    Returns:
+        量化後的模型；沒有可量化的層時返回的模型與原模型行為相同
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    if not any(isinstance(module, nn.Linear) for module in model.modules()):
+        logger.warning("⚠️  模型中沒有 nn.Linear，dynamic 量化不會有效果（卷積模型請使用 static）")
+    return quantize_dynamic(copy.deepcopy(model).cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_model(
+    model: nn.Module,
+    calibration_batches: Iterable[torch.Tensor],
+    example_input: torch.Tensor,
+    engine: str
+) -> nn.Module:
+    """
+    靜態訓練後量化（FX graph mode）：插入觀察器、以校正資料收集激活值範圍後轉換為 int8
+
+    Args:
+        model: eval 模式的 fp32 模型（CPU）
+        calibration_batches: 校正用的輸入批次（已預處理、位於 CPU）
+        example_input: 供 FX 追蹤的範例輸入
+        engine: 量化引擎（select_quantization_engine 的返回值）
+
+    Returns:
+        量化後的模型（輸入與輸出仍為 fp32 張量）
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    float_model = copy.deepcopy(model).cpu().eval()
+    prepared = prepare_fx(float_model, get_default_qconfig_mapping(engine), example_inputs=(example_input,))
+    batches = 0
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+            batches += 1
+    if batches == 0:
+        raise ValueError("static 量化需要至少一個校正批次")
+    return convert_fx(prepared)
+
+
+def save_quantized_model(model: nn.Module, example_input: torch.Tensor, path: str):
+    """以 TorchScript 保存量化模型（先寫暫存檔再改名），下次啟動時不需重新校正"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_input)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        traced.save(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_quantized_model(path: str) -> torch.jit.ScriptModule:
+    """載入 save_quantized_model 保存的量化模型（CPU）"""
+    module = torch.jit.load(path, map_location='cpu')
+    module.eval()
+    return module
+
+
+def quantized_artifact_paths(model_path: str, artifact_key: str, directory: Optional[str] = None) -> Tuple[str, str]:
+    """
+    獲取量化模型與準確率報告路徑：{檢查點檔名}.int8-{key 前 16 碼}.pt / .gate.json
+
+    Args:
+        model_path: fp32 檢查點路徑
+        artifact_key: 由 build_artifact_key 產生的鍵（包含檢查點 hash、量化模式、引擎等）
+        directory: 保存目錄（預設為檢查點所在目錄）
+    """
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    directory = directory or os.path.dirname(os.path.abspath(model_path))
+    base = os.path.join(directory, f"{stem}.int8-{artifact_key[:16]}")
+    return f"{base}.pt", f"{base}.gate.json"
+
+
+def build_artifact_key(components: Dict[str, Any]) -> str:
+    """將影響量化結果的項目（檢查點 hash、模式、引擎、校正樣本數、torch 版本）合併為單一鍵"""
+    payload = json.dumps({**components, 'torch': torch.__version__}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_gate_report(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️  讀取量化準確率報告失敗: {str(e)}")
+        return None
+
+
+def save_gate_report(path: str, report: Dict[str, Any]):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ------------------------------------------------------------
+# 驗證清單重播
+# ------------------------------------------------------------
+
+def load_validation_samples(
+    csv_path: str,
+    image_root: Optional[str],
+    classes: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    讀取已標註的驗證清單並對應到本機圖片
+
+    清單中的 filepath 為訓練環境的絕對路徑（.../val/<類別>/<檔名>），
+    依序嘗試 image_root/<val 之後的相對路徑>、image_root/<類別>/<檔名>；找不到的圖片略過
+
+    Args:
+        csv_path: 驗證清單（欄位 filepath, true_label, pred_label, ...）
+        image_root: 本機驗證集目錄（對應清單中的 val/）
+        classes: 類別列表（決定標籤索引）
+
+    Returns:
+        [{'path', 'label', 'recorded_pred'}]，label / recorded_pred 為類別索引
+    """
+    if not image_root or not os.path.isdir(image_root):
+        return []
+    class_index = {name: i for i, name in enumerate(classes)}
+    samples = []
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            label = class_index.get(row.get('true_label'))
+            if label is None:
+                continue
+            filepath = row['filepath'].replace('\\', '/')
+            relative = filepath.split('/val/', 1)[1] if '/val/' in filepath else os.path.basename(filepath)
+            for candidate in (
+                os.path.join(image_root, relative),
+                os.path.join(image_root, row['true_label'], os.path.basename(filepath))
+            ):
+                if os.path.exists(candidate):
+                    samples.append({
+                        'path': candidate,
+                        'label': label,
+                        'recorded_pred': class_index.get(row.get('pred_label'))
+                    })
+                    break
+    return samples
+
+
+def split_samples(
+    samples: List[Dict[str, Any]],
+    calibration_size: int,
+    max_gate_samples: int = 0
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    將驗證樣本分為校正集與評估集（互不重疊，依固定間隔抽樣以涵蓋所有類別）
+
+    Args:
+        samples: load_validation_samples 的返回值（依類別排序）
+        calibration_size: 校正集大小
+        max_gate_samples: 評估集上限（0 表示不限）
+
+    Returns:
+        (校正集, 評估集)
+    """
+    if not samples:
+        return [], []
+    calibration_size = min(calibration_size, len(samples) // 2)
+    step = max(1, len(samples) // calibration_size) if calibration_size else 0
+    calibration_ids = set(range(0, len(samples), step)[:calibration_size]) if step else set()
+    calibration = [samples[i] for i in sorted(calibration_ids)]
+    evaluation = [sample for i, sample in enumerate(samples) if i not in calibration_ids]
+    if max_gate_samples and len(evaluation) > max_gate_samples:
+        stride = len(evaluation) / max_gate_samples
+        evaluation = [evaluation[int(i * stride)] for i in range(max_gate_samples)]
+    return calibration, evaluation
+
+
+def compare_accuracy(
+    reference_fn: Callable[[Any], List[int]],
+    candidate_fn: Callable[[Any], List[int]],
+    samples: List[Dict[str, Any]],
+    max_drop: float,
+    batch_size: int = 16,
+    load_fn: Optional[Callable[[List[Dict[str, Any]]], Any]] = None
+) -> Dict[str, Any]:
+    """
+    在相同樣本上比較 fp32 與量化模型的 top-1 準確率
+
+    Args:
+        reference_fn: fp32 路徑，輸入 load_fn 的結果、返回預測類別索引
+        candidate_fn: 量化路徑
+        samples: 評估樣本
+        max_drop: 允許的最大準確率下降（絕對值，例如 0.01 = 1 個百分點）
+        batch_size: 每次評估的樣本數
+        load_fn: 將一批樣本轉換為模型輸入（例如讀檔解碼），兩條路徑共用同一份結果；None 時直接傳入樣本
+
+    Returns:
+        {'passed', 'reference_accuracy', 'candidate_accuracy', 'drop', 'max_drop', 'samples', 'disagreements'}
+    """
+    if not samples:
+        return {'passed': False, 'reason': 'no validation images', 'samples': 0, 'max_drop': max_drop}
+
+    reference_correct = candidate_correct = disagreements = 0
+    for start in range(0, len(samples), batch_size):
+        batch = samples[start:start + batch_size]
+        inputs = load_fn(batch) if load_fn else batch
+        reference_preds = reference_fn(inputs)
+        candidate_preds = candidate_fn(inputs)
+        for sample, ref, cand in zip(batch, reference_preds, candidate_preds):
+            reference_correct += int(ref == sample['label'])
+            candidate_correct += int(cand == sample['label'])
+            disagreements += int(ref != cand)
+
+    reference_accuracy = reference_correct / len(samples)
+    candidate_accuracy = candidate_correct / len(samples)
+    drop = reference_accuracy - candidate_accuracy
+    return {
+        'passed': drop <= max_drop,
+        'reference_accuracy': round(reference_accuracy, 4),
+        'candidate_accuracy': round(candidate_accuracy, 4),
+        'drop': round(drop, 4),
+        'max_drop': max_drop,
+        'samples': len(samples),
+        'disagreements': disagreements
+    }
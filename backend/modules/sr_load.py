@@ -127,6 +127,46 @@ class SuperResolutionModelLoader:
     def is_loaded(self) -> bool:
         """檢查模型是否已加載"""
         return self.model is not None
+    
+    def quantize(self, mode: str, calibration_arrays=None, engine: Optional[str] = None, patch_size: int = 96):
+        """
+        對已加載的模型做 INT8 訓練後量化（CPU 推論用，不修改 self.model）
+        
+        EDSR 幾乎全為卷積層，dynamic 模式（只量化 nn.Linear）只對 RCAN 的通道注意力有效果，
+        建議使用 static 模式（以校正圖片的中央 patch 收集激活值範圍）
+        
+        Args:
+            mode: 'dynamic' 或 'static'
+            calibration_arrays: static 模式的校正圖片（RGB uint8 陣列列表）
+            engine: 量化引擎（None 時自動選擇）
+            patch_size: 校正 patch 邊長（與分塊推論的 tile 大小同級即可）
+        
+        Returns:
+            (量化模型, 範例輸入)；範例輸入用於以 TorchScript 保存量化模型
+        """
+        from modules.quantization import select_quantization_engine, quantize_dynamic_model, quantize_static_model
+        
+        if self.model is None:
+            raise RuntimeError("超解析度模型尚未加載")
+        engine = select_quantization_engine(engine)
+        example_input = torch.rand(1, 3, patch_size, patch_size)
+        
+        if mode == 'dynamic':
+            return quantize_dynamic_model(self.model), example_input
+        if mode == 'static':
+            if not calibration_arrays:
+                raise ValueError("超解析度 static 量化需要校正圖片")
+            
+            def patches():
+                for array in calibration_arrays:
+                    height, width = array.shape[:2]
+                    top = max(0, (height - patch_size) // 2)
+                    left = max(0, (width - patch_size) // 2)
+                    patch = array[top:top + patch_size, left:left + patch_size, :3]
+                    yield torch.from_numpy(patch.copy()).permute(2, 0, 1).float().unsqueeze(0) / 255.0
+            
+            return quantize_static_model(self.model, patches(), example_input, engine), example_input
+        raise ValueError(f"未知的量化模式: {mode}")
 
 
 def load_sr_model(model_path: Optional[str] = None, model_type: str = 'edsr', scale: int = 2, device: Optional[str] = None):
@@ -0,0 +1,329 @@
+"""
+自適應超解析度策略模組
+上傳圖片已被 ImageService.resize_image 拉伸到 640x640，遠大於 CNN 的 224x224 輸入，
+對每張圖片都以 640x640 執行 EDSR（輸出 1280x1280 後又被 CNN 縮小到 224）大多是純成本。
+
+本模組以快速的圖片品質估計決定每張圖片是否執行超解析度、以多大的輸入執行：
+- 原始解析度：metadata['original_size']（拉伸前的尺寸），短邊小於 CNN 輸入時細節本來就不足
+- 模糊程度：CNN 實際看到的 224x224 灰階圖的 Laplacian 變異數（越小越模糊）
+- JPEG 品質：解碼時由量化表估計的壓縮品質（metadata['jpeg_quality']）
+
+超解析度模型的放大倍數由檢查點固定，「以多大倍數放大」以選擇超解析度的輸入尺寸實現：
+輸入先縮小到 224 // scale（輸出剛好是 CNN 輸入尺寸），或原始解析度（不超過目前像素尺寸），
+不再需要時整張跳過。
+
+模式：
+- always:   每張圖片以目前像素尺寸執行（與加入本模組前相同）
+- never:    永不執行
+- adaptive: 依上述估計逐張決定
+"""
+
+import time
+import threading
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from modules.sr_preprocess import enhance_image_array_with_sr
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SR_POLICY_MODES = ('always', 'never', 'adaptive')
+
+# CNN 輸入邊長（cnn_preprocess 以 transforms.Resize((224, 224)) 拉伸）
+CNN_INPUT_SIZE = 224
+
+
+def laplacian_variance(pixels: np.ndarray, size: int = CNN_INPUT_SIZE) -> float:
+    """
+    估計清晰度：拉伸到 size x size 灰階（與 CNN 看到的尺寸相同）後，4 鄰域 Laplacian 的變異數
+
+    Args:
+        pixels: RGB 或灰階 uint8 陣列
+        size: 估計時的邊長
+
+    Returns:
+        Laplacian 變異數（越小越模糊；一般清晰照片 > 100）
+    """
+    gray = Image.fromarray(pixels).convert('L').resize((size, size), Image.Resampling.BILINEAR)
+    g = np.asarray(gray, dtype=np.float32)
+    laplacian = g[:-2, 1:-1] + g[2:, 1:-1] + g[1:-1, :-2] + g[1:-1, 2:] - 4.0 * g[1:-1, 1:-1]
+    return float(laplacian.var())
+
+
+class SRPolicy:
+    """
+    逐張決定超解析度的執行方式，並統計決策與節省的延遲（執行緒安全）
+
+    decide() 只估計品質、不執行模型；run() 依決策執行超解析度並回填實際耗時與節省的估計值。
+    節省的延遲以「以目前像素尺寸整張執行」的估計耗時為基準：
+    依已執行過的超解析度換算每百萬像素耗時（EWMA），尚未執行過任何超解析度時為 None。
+    """
+
+    # 每百萬像素耗時 EWMA 的平滑係數
+    EWMA_ALPHA = 0.2
+
+    def __init__(
+        self,
+        mode: str = 'always',
+        scale: int = 2,
+        min_side: int = CNN_INPUT_SIZE,
+        blur_threshold: float = 100.0,
+        min_jpeg_quality: int = 50,
+        tile_size: int = 0
+    ):
+        """
+        初始化超解析度策略
+
+        Args:
+            mode: 策略模式（'always', 'never', 'adaptive'）
+            scale: 超解析度模型的放大倍數
+            min_side: 原始短邊小於此值時視為低解析度
+            blur_threshold: Laplacian 變異數小於此值時視為模糊
+            min_jpeg_quality: 估計 JPEG 品質低於此值時視為壓縮失真
+            tile_size: 分塊超解析度的 tile 邊長（0 表示整張處理；輸入不大於 tile 時也整張處理）
+        """
+        if mode not in SR_POLICY_MODES:
+            raise ValueError(f"不支援的超解析度策略: {mode}（可用: {', '.join(SR_POLICY_MODES)}）")
+        self.mode = mode
+        self.scale = max(1, scale)
+        self.min_side = min_side
+        self.blur_threshold = blur_threshold
+        self.min_jpeg_quality = min_jpeg_quality
+        self.tile_size = tile_size
+        # 縮小輸入：超解析度輸出剛好是 CNN 輸入尺寸
+        self.reduced_size = max(1, -(-CNN_INPUT_SIZE // self.scale))
+
+        self._lock = threading.Lock()
+        self._ms_per_megapixel: Optional[float] = None
+        self._reasons: Dict[str, int] = {}
+        self._counters = {
+            'decisions': 0,
+            'applied': 0,
+            'applied_full': 0,
+            'applied_reduced': 0,
+            'skipped': 0,
+            'failed': 0,
+            'sr_ms_total': 0.0,
+            'saved_ms_total': 0.0,
+            'assess_ms_total': 0.0
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        """策略設定（計入模型指紋：不同策略的推論結果不共用快取）"""
+        if self.mode != 'adaptive':
+            return {'mode': self.mode}
+        return {
+            'mode': self.mode,
+            'min_side': self.min_side,
+            'blur_threshold': self.blur_threshold,
+            'min_jpeg_quality': self.min_jpeg_quality
+        }
+
+    def assess(self, pixels: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        估計圖片品質
+
+        Args:
+            pixels: RGB uint8 陣列 (H, W, 3)
+            metadata: ImageBuffer.metadata（original_size、jpeg_quality）
+
+        Returns:
+            {'original_side', 'jpeg_quality', 'sharpness', 'assess_ms'}
+        """
+        start = time.perf_counter()
+        metadata = metadata or {}
+        original_size = metadata.get('original_size') or (pixels.shape[1], pixels.shape[0])
+        return {
+            'original_side': int(min(original_size)),
+            'jpeg_quality': metadata.get('jpeg_quality'),
+            'sharpness': round(laplacian_variance(pixels), 1),
+            'assess_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    def decide(self, pixels: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        決定是否執行超解析度與輸入尺寸
+
+        Args:
+            pixels: RGB uint8 陣列 (H, W, 3)
+            metadata: ImageBuffer.metadata
+
+        Returns:
+            決策字典：mode, applied, reason, input_size（None 表示目前像素尺寸）, output_size,
+            tile_size, quality（adaptive 模式）, sr_ms, saved_ms（run() 回填）
+        """
+        current_side = int(min(pixels.shape[:2]))
+        decision = {
+            'mode': self.mode,
+            'applied': self.mode != 'never',
+            'reason': self.mode,
+            'input_size': None,
+            'output_size': None,
+            'tile_size': 0,
+            'sr_ms': 0,
+            'saved_ms': None
+        }
+        if self.mode == 'adaptive':
+            quality = self.assess(pixels, metadata)
+            decision['quality'] = quality
+            jpeg_quality = quality['jpeg_quality']
+            if quality['original_side'] < self.min_side:
+                # 原始解析度不足：以原始解析度（至少縮小輸入尺寸）放大，拉伸後的多餘像素不含新資訊
+                decision['reason'] = 'low_resolution'
+                decision['input_size'] = min(current_side, max(quality['original_side'], self.reduced_size))
+            elif quality['sharpness'] < self.blur_threshold:
+                decision['reason'] = 'blurry'
+                decision['input_size'] = min(current_side, self.reduced_size)
+            elif jpeg_quality is not None and jpeg_quality < self.min_jpeg_quality:
+                decision['reason'] = 'low_jpeg_quality'
+                decision['input_size'] = min(current_side, self.reduced_size)
+            else:
+                decision['applied'] = False
+                decision['reason'] = 'sufficient_detail'
+            if decision['input_size'] == current_side:
+                decision['input_size'] = None
+
+        if decision['applied']:
+            input_side = decision['input_size'] or current_side
+            decision['output_size'] = input_side * self.scale
+            decision['tile_size'] = self.tile_size if self.tile_size and input_side > self.tile_size else 0
+        else:
+            decision['saved_ms'] = self._estimate_full_ms(pixels)
+        return decision
+
+    def _estimate_full_ms(self, pixels: np.ndarray) -> Optional[float]:
+        """以目前像素尺寸整張執行的估計耗時（毫秒）"""
+        rate = self._ms_per_megapixel
+        if rate is None:
+            return None
+        return round(rate * pixels.shape[0] * pixels.shape[1] / 1e6, 1)
+
+    def run(
+        self,
+        pixels: np.ndarray,
+        decision: Dict[str, Any],
+        model,
+        device: str = 'cpu',
+        tile_overlap: int = 16,
+        tile_batch_size: int = 4
+    ) -> Tuple[np.ndarray, int]:
+        """
+        依決策執行超解析度（決策為不執行時直接返回原始像素）
+
+        Args:
+            pixels: RGB uint8 陣列 (H, W, 3)
+            decision: decide() 的結果（回填 sr_ms、saved_ms）
+            model: 超解析度模型
+            device: 設備類型
+            tile_overlap: 相鄰 tile 重疊像素數
+            tile_batch_size: 每次前向傳播的 tile 數
+
+        Returns:
+            (供 CNN 使用的 RGB 陣列, 耗時毫秒)
+        """
+        if not decision['applied']:
+            return pixels, 0
+
+        start = time.perf_counter()
+        sr_input = pixels
+        if decision['input_size']:
+            side = decision['input_size']
+            # CNN 以拉伸方式縮放到正方形，這裡同樣拉伸，不保持比例
+            sr_input = np.asarray(Image.fromarray(pixels).resize((side, side), Image.Resampling.BICUBIC))
+        enhanced = enhance_image_array_with_sr(
+            sr_input,
+            model=model,
+            device=device,
+            scale=self.scale,
+            tile_size=decision['tile_size'] or None,
+            tile_overlap=tile_overlap,
+            tile_batch_size=tile_batch_size
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        # 超解析度耗時約與輸入像素數成正比：以每百萬像素耗時估計整張執行的耗時
+        megapixels = sr_input.shape[0] * sr_input.shape[1] / 1e6
+        with self._lock:
+            rate = elapsed_ms / megapixels
+            if self._ms_per_megapixel is None:
+                self._ms_per_megapixel = rate
+            else:
+                self._ms_per_megapixel += self.EWMA_ALPHA * (rate - self._ms_per_megapixel)
+
+        decision['sr_ms'] = int(elapsed_ms)
+        if decision['input_size']:
+            full_ms = self._estimate_full_ms(pixels)
+            decision['saved_ms'] = round(max(0.0, full_ms - elapsed_ms), 1) if full_ms is not None else None
+        else:
+            decision['saved_ms'] = 0.0
+        return enhanced, int(elapsed_ms)
+
+    def mark_failed(self, decision: Dict[str, Any]):
+        """超解析度執行失敗（呼叫者已改用原始像素）"""
+        decision['applied'] = False
+        decision['reason'] = 'failed'
+        decision['sr_ms'] = 0
+        decision['saved_ms'] = None
+
+    def record(self, decision: Optional[Dict[str, Any]]):
+        """
+        記錄一次決策（推論完成後呼叫；推論伺服器模式下由 web worker 以返回的決策記錄）
+
+        Args:
+            decision: decide() / run() 回填後的決策字典
+        """
+        if not decision:
+            return
+        with self._lock:
+            counters = self._counters
+            counters['decisions'] += 1
+            reason = decision.get('reason', 'unknown')
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+            if reason == 'failed':
+                counters['failed'] += 1
+            elif decision.get('applied'):
+                counters['applied'] += 1
+                counters['applied_reduced' if decision.get('input_size') else 'applied_full'] += 1
+            else:
+                counters['skipped'] += 1
+            counters['sr_ms_total'] += decision.get('sr_ms') or 0
+            counters['saved_ms_total'] += decision.get('saved_ms') or 0.0
+            counters['assess_ms_total'] += (decision.get('quality') or {}).get('assess_ms', 0.0)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取策略指標
+
+        Returns:
+            設定、各原因的決策次數、執行 / 跳過次數、累計超解析度耗時與節省的估計耗時
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            reasons = dict(self._reasons)
+            rate = self._ms_per_megapixel
+        decisions = counters['decisions']
+        return {
+            **self.describe(),
+            'scale': self.scale,
+            'reduced_input_size': self.reduced_size,
+            'decisions': decisions,
+            'reasons': reasons,
+            'applied': counters['applied'],
+            'applied_full': counters['applied_full'],
+            'applied_reduced': counters['applied_reduced'],
+            'skipped': counters['skipped'],
+            'failed': counters['failed'],
+            'skip_rate': round(counters['skipped'] / decisions, 4) if decisions else 0.0,
+            'sr_ms_total': round(counters['sr_ms_total'], 1),
+            'saved_ms_total': round(counters['saved_ms_total'], 1),
+            'avg_assess_ms': round(counters['assess_ms_total'] / decisions, 3) if decisions else 0.0,
+            'ms_per_megapixel': round(rate, 1) if rate is not None else None
+        }
@@ -13,10 +13,10 @@ import cv2
 import numpy as np
 import torch
 import logging
-from typing import Optional, Tuple, Union
-from PIL import Image
+from typing import List, Optional, Tuple, Union
 
 from modules.sr_utils import prepare_image_for_sr, postprocess_sr_output
+from modules.image_buffer import load_image_buffer, record_pipeline_event
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +27,10 @@ def enhance_image_with_sr(
     device: str = 'cpu',
     scale: int = 2,
     output_path: Optional[str] = None,
-    save_intermediate: bool = False
+    save_intermediate: bool = False,
+    tile_size: Optional[int] = None,
+    tile_overlap: int = 16,
+    tile_batch_size: int = 4
 ) -> Union[str, np.ndarray]:
     """
     使用超解析度模型增強圖片
@@ -39,45 +42,25 @@ def enhance_image_with_sr(
         scale: 放大倍數
         output_path: 輸出圖片路徑（可選，如果為 None 則返回 numpy 數組）
         save_intermediate: 是否保存中間結果
+        tile_size: tile 邊長（None 表示整張處理）
+        tile_overlap: 相鄰 tile 重疊的像素數
+        tile_batch_size: 每次前向傳播的 tile 數
     
     Returns:
         如果 output_path 為 None，返回增強後的圖片數組；否則返回輸出路徑
     """
     try:
-        # 讀取圖片
+        # 讀取並解碼圖片（路徑版轉接層）
         logger.info(f"📖 讀取圖片: {image_path}")
-        image = cv2.imread(image_path)
+        image = load_image_buffer(image_path, stage='sr')
+        logger.info(f"   原始尺寸: {image.width}x{image.height}")
         
-        if image is None:
-            raise ValueError(f"無法讀取圖片: {image_path}")
-        
-        original_shape = image.shape[:2]  # (H, W)
-        logger.info(f"   原始尺寸: {original_shape[1]}x{original_shape[0]}")
-        
-        # 轉換為 RGB（OpenCV 使用 BGR）
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # 轉換為 PIL Image 以便更好地處理
-        pil_image = Image.fromarray(image_rgb)
-        
-        # 轉換為張量並正規化到 [0, 1]
-        image_tensor = torch.from_numpy(np.array(pil_image)).float() / 255.0
-        image_tensor = image_tensor.permute(2, 0, 1)  # (H, W, C) -> (C, H, W)
-        
-        # 準備輸入
-        input_tensor = prepare_image_for_sr(image_tensor, device=device)
-        
-        # 執行超解析度
+        # 執行超解析度（記憶體內）
         logger.info(f"🔍 執行超解析度處理 (scale={scale}x)...")
-        model.eval()
-        with torch.no_grad():
-            enhanced_tensor = model(input_tensor)
-            enhanced_tensor = postprocess_sr_output(enhanced_tensor)
-        
-        # 轉換回 numpy 數組
-        enhanced_tensor = enhanced_tensor.squeeze(0)  # 移除 batch 維度
-        enhanced_tensor = enhanced_tensor.permute(1, 2, 0)  # (C, H, W) -> (H, W, C)
-        enhanced_array = (enhanced_tensor.cpu().numpy() * 255.0).astype(np.uint8)
+        enhanced_array = enhance_image_array_with_sr(
+            image.pixels, model, device=device, scale=scale,
+            tile_size=tile_size, tile_overlap=tile_overlap, tile_batch_size=tile_batch_size
+        )
         
         enhanced_shape = enhanced_array.shape[:2]
         logger.info(f"   增強後尺寸: {enhanced_shape[1]}x{enhanced_shape[0]}")
@@ -87,6 +70,8 @@ def enhance_image_with_sr(
             # 轉換回 BGR 以便 OpenCV 保存
             enhanced_bgr = cv2.cvtColor(enhanced_array, cv2.COLOR_RGB2BGR)
             cv2.imwrite(output_path, enhanced_bgr)
+            record_pipeline_event('sr', 'encode')
+            record_pipeline_event('sr', 'io_write')
             logger.info(f"✅ 超解析度圖片已保存: {output_path}")
             return output_path
         else:
@@ -97,39 +82,150 @@ def enhance_image_with_sr(
         raise
 
 
+def _ensure_rgb(image_array: np.ndarray) -> np.ndarray:
+    """將灰度圖或 RGBA 圖統一為 (H, W, 3)"""
+    if len(image_array.shape) == 2:
+        image_array = np.stack([image_array] * 3, axis=-1)
+    if image_array.shape[2] == 4:  # RGBA
+        image_array = image_array[:, :, :3]
+    return image_array
+
+
+def _tile_starts(length: int, tile: int, stride: int) -> List[int]:
+    """計算單一軸向的 tile 起點，最後一塊貼齊邊界"""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def _blend_window(height: int, width: int, overlap: int) -> np.ndarray:
+    """
+    產生 tile 融合權重（重疊區線性漸變，中心為 1）
+    權重恆大於 0，圖片邊界處即使沒有相鄰 tile，除以權重總和後仍正確
+    """
+    def ramp(length: int) -> np.ndarray:
+        index = np.arange(length, dtype=np.float32)
+        edge = np.minimum(index + 1, length - index)
+        return np.minimum(edge / (overlap + 1), 1.0) if overlap > 0 else np.ones(length, dtype=np.float32)
+
+    return np.outer(ramp(height), ramp(width)).astype(np.float32)
+
+
+def enhance_image_array_tiled(
+    image_array: np.ndarray,
+    model: torch.nn.Module,
+    device: str = 'cpu',
+    scale: int = 2,
+    tile_size: int = 128,
+    tile_overlap: int = 16,
+    tile_batch_size: int = 4
+) -> np.ndarray:
+    """
+    以重疊 tile 分塊執行超解析度（記憶體內處理）
+    每批最多 tile_batch_size 個 tile 一起前向傳播，重疊區以線性權重融合避免接縫；
+    峰值記憶體由 tile 大小與批次大小決定，而非整張圖片的特徵圖
+    
+    Args:
+        image_array: 輸入圖片數組 (H, W, C) 或 (H, W) 灰度圖，uint8
+        model: 超解析度模型
+        device: 設備類型
+        scale: 放大倍數
+        tile_size: tile 邊長（低解析度像素）
+        tile_overlap: 相鄰 tile 重疊的像素數（低解析度像素）
+        tile_batch_size: 每次前向傳播的 tile 數
+    
+    Returns:
+        增強後的圖片數組 (H*scale, W*scale, 3)，uint8
+    """
+    try:
+        image_array = _ensure_rgb(image_array)
+        height, width = image_array.shape[:2]
+        
+        tile_h = min(tile_size, height)
+        tile_w = min(tile_size, width)
+        overlap = max(0, min(tile_overlap, tile_h // 2, tile_w // 2))
+        ys = _tile_starts(height, tile_h, max(1, tile_h - overlap))
+        xs = _tile_starts(width, tile_w, max(1, tile_w - overlap))
+        coords = [(y, x) for y in ys for x in xs]
+        logger.debug(f"   tile 分塊: {len(coords)} 塊 ({tile_w}x{tile_h}, overlap={overlap}, batch={tile_batch_size})")
+        
+        # 輸出累加緩衝（float32）與權重總和
+        out_tile_h, out_tile_w = tile_h * scale, tile_w * scale
+        accumulator = np.zeros((height * scale, width * scale, 3), dtype=np.float32)
+        weight_sum = np.zeros((height * scale, width * scale, 1), dtype=np.float32)
+        window = _blend_window(out_tile_h, out_tile_w, overlap * scale)[:, :, None]
+        
+        source = torch.from_numpy(np.ascontiguousarray(image_array)).permute(2, 0, 1).float() / 255.0
+        
+        model.eval()
+        with torch.no_grad():
+            for start in range(0, len(coords), max(1, tile_batch_size)):
+                chunk = coords[start:start + max(1, tile_batch_size)]
+                batch = torch.stack([
+                    source[:, y:y + tile_h, x:x + tile_w] for y, x in chunk
+                ]).to(device)
+                
+                output = postprocess_sr_output(model(batch))
+                output = output.cpu().numpy().transpose(0, 2, 3, 1)  # (B, C, H, W) -> (B, H, W, C)
+                
+                for (y, x), tile_output in zip(chunk, output):
+                    out_y, out_x = y * scale, x * scale
+                    accumulator[out_y:out_y + out_tile_h, out_x:out_x + out_tile_w] += tile_output * window
+                    weight_sum[out_y:out_y + out_tile_h, out_x:out_x + out_tile_w] += window
+                del batch, output
+        
+        accumulator /= weight_sum
+        return (accumulator * 255.0).astype(np.uint8)
+        
+    except Exception as e:
+        logger.error(f"❌ 分塊超解析度處理失敗: {str(e)}")
+        raise
+
+
 def enhance_image_array_with_sr(
     image_array: np.ndarray,
     model: torch.nn.Module,
     device: str = 'cpu',
-    scale: int = 2
+    scale: int = 2,
+    tile_size: Optional[int] = None,
+    tile_overlap: int = 16,
+    tile_batch_size: int = 4
 ) -> np.ndarray:
     """
-    使用超解析度模型增強圖片數組（內存中處理）
+    使用超解析度模型增強圖片數組（記憶體內處理，返回陣列，不寫入檔案）
     
     Args:
         image_array: 輸入圖片數組 (H, W, C) 或 (H, W) 灰度圖
         model: 超解析度模型
         device: 設備類型
         scale: 放大倍數
+        tile_size: tile 邊長（None 或 0 表示整張處理；圖片不大於 tile 時也整張處理）
+        tile_overlap: 相鄰 tile 重疊的像素數
+        tile_batch_size: 每次前向傳播的 tile 數
     
     Returns:
         增強後的圖片數組
     """
     try:
-        # 處理灰度圖
-        if len(image_array.shape) == 2:
-            image_array = np.stack([image_array] * 3, axis=-1)
-        
-        # 確保是 RGB
-        if image_array.shape[2] == 4:  # RGBA
-            image_array = image_array[:, :, :3]
+        image_array = _ensure_rgb(image_array)
         
         original_shape = image_array.shape[:2]
         logger.debug(f"   原始尺寸: {original_shape[1]}x{original_shape[0]}")
         
+        # 分塊模式
+        if tile_size and max(original_shape) > tile_size:
+            enhanced_array = enhance_image_array_tiled(
+                image_array, model, device=device, scale=scale,
+                tile_size=tile_size, tile_overlap=tile_overlap, tile_batch_size=tile_batch_size
+            )
+            logger.debug(f"   增強後尺寸: {enhanced_array.shape[1]}x{enhanced_array.shape[0]}")
+            return enhanced_array
+        
         # 轉換為張量並正規化
-        image_tensor = torch.from_numpy(image_array).float()
-        if image_tensor.max() > 1.0:
+        image_tensor = torch.from_numpy(np.ascontiguousarray(image_array)).float()
+        if image_array.dtype == np.uint8 or image_tensor.max() > 1.0:
             image_tensor = image_tensor / 255.0
         
         image_tensor = image_tensor.permute(2, 0, 1)  # (H, W, C) -> (C, H, W)
@@ -163,10 +259,14 @@ def preprocess_with_sr(
     model: torch.nn.Module,
     device: str = 'cpu',
     scale: int = 2,
-    temp_dir: Optional[str] = None
+    temp_dir: Optional[str] = None,
+    tile_size: Optional[int] = None,
+    tile_overlap: int = 16,
+    tile_batch_size: int = 4
 ) -> str:
     """
     預處理圖片：使用超解析度增強後保存到臨時文件
+    （僅供需要檔案的舊流程使用；線上流程請使用 enhance_image_array_with_sr 直接取得陣列）
     
     Args:
         image_path: 原始圖片路徑
@@ -174,6 +274,9 @@ def preprocess_with_sr(
         device: 設備類型
         scale: 放大倍數
         temp_dir: 臨時目錄（如果為 None 則使用原圖目錄）
+        tile_size: tile 邊長（None 表示整張處理）
+        tile_overlap: 相鄰 tile 重疊的像素數
+        tile_batch_size: 每次前向傳播的 tile 數
     
     Returns:
         增強後的圖片路徑
@@ -198,7 +301,10 @@ def preprocess_with_sr(
             model=model,
             device=device,
             scale=scale,
-            output_path=output_path
+            output_path=output_path,
+            tile_size=tile_size,
+            tile_overlap=tile_overlap,
+            tile_batch_size=tile_batch_size
         )
         
         return enhanced_path
@@ -0,0 +1,290 @@
+"""
+圖片上傳解析
+檢測端點支援三種請求格式：
+- multipart/form-data：圖片欄位由 UploadRequest 直接串流寫入有上限的緩衝區（取代 werkzeug 預設的暫存檔），
+  寫入時同步計算 SHA256，其他參數放在表單欄位
+- application/octet-stream（或 image/*）：請求主體即圖片，分塊讀入同一種緩衝區，其他參數放在查詢字串
+- application/json：base64 圖片（舊版前端相容格式）
+
+批次端點另外接受多個 multipart 圖片欄位，或一個 zip 壓縮檔（multipart 檔案欄位或 application/zip 請求主體）
+"""
+
+import io
+import json
+import os
+import hashlib
+import logging
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Request, request
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 未設定 MAX_CONTENT_LENGTH 時的上傳上限
+DEFAULT_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+# 分塊讀取請求主體的大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# zip 壓縮檔中視為圖片的副檔名
+ZIP_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# 視為 zip 壓縮檔的 Content-Type
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+class UploadTooLarge(ValueError):
+    """上傳內容超過上限（API 返回 413）"""
+
+
+class HashingBuffer(io.BytesIO):
+    """寫入時同步計算 SHA256 的記憶體緩衝區，超過上限時立即中止"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self._hash = hashlib.sha256()
+        self._size = 0
+
+    def write(self, data) -> int:
+        self._size += len(data)
+        if self.max_bytes is not None and self._size > self.max_bytes:
+            raise UploadTooLarge(f"圖片大小超過限制 ({self.max_bytes / 1024 / 1024:.0f}MB)")
+        self._hash.update(data)
+        return super().write(data)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class UploadRequest(Request):
+    """multipart 檔案欄位寫入 HashingBuffer 而非暫存檔（app.request_class）"""
+
+    _upload_limit: Optional[int] = None
+
+    def set_upload_limit(self, max_bytes: int):
+        """
+        以本請求專用的上限取代 MAX_CONTENT_LENGTH（批次端點使用，須在讀取請求主體前呼叫）
+
+        Args:
+            max_bytes: 請求主體上限（位元組）
+        """
+        self._upload_limit = max_bytes
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        if self._upload_limit is not None:
+            return self._upload_limit
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingBuffer(self.max_content_length or DEFAULT_UPLOAD_MAX_BYTES)
+
+
+class UploadedImage:
+    """解析後的上傳圖片"""
+
+    __slots__ = ('data', 'sha256', 'transport', 'fields')
+
+    def __init__(self, data: bytes, sha256: str, transport: str, fields: Dict[str, Any]):
+        """
+        Args:
+            data: 原始圖片位元組
+            sha256: 原始位元組的 SHA256（與處理後圖片的 image_hash 不同）
+            transport: 'multipart'、'binary' 或 'json'
+            fields: 其他請求參數（表單欄位、查詢字串或 JSON 物件）
+        """
+        self.data = data
+        self.sha256 = sha256
+        self.transport = transport
+        self.fields = fields
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def get_json_field(self, name: str, default: Any = None) -> Any:
+        """讀取結構化參數（multipart / 查詢字串中以 JSON 字串傳送，例如 crop_coordinates）"""
+        value = self.fields.get(name, default)
+        if isinstance(value, str) and value[:1] in ('{', '['):
+            try:
+                return json.loads(value)
+            except ValueError:
+                raise ValueError(f"{name} 不是有效的 JSON")
+        return value
+
+
+def read_image_upload(
+    image_field: str,
+    base64_decoder: Callable[[str], bytes],
+    missing_error: str = "無圖片資料"
+) -> UploadedImage:
+    """
+    從目前的請求讀取圖片（依 Content-Type 選擇解析方式）
+
+    Args:
+        image_field: 圖片欄位名稱（multipart 欄位與 JSON 鍵，例如 'image'、'cropped_image'）
+        base64_decoder: JSON 格式使用的 base64 解碼函數
+        missing_error: 缺少圖片時的錯誤訊息
+
+    Returns:
+        UploadedImage
+
+    Raises:
+        UploadTooLarge: 超過 MAX_CONTENT_LENGTH
+        ValueError: 缺少圖片或請求格式錯誤
+    """
+    max_bytes = request.max_content_length or DEFAULT_UPLOAD_MAX_BYTES
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise UploadTooLarge(f"圖片大小超過限制 ({max_bytes / 1024 / 1024:.0f}MB)")
+
+    mimetype = request.mimetype
+    if mimetype == 'multipart/form-data':
+        file = request.files.get(image_field)
+        if file is None:
+            raise ValueError(missing_error)
+        stream = file.stream
+        if isinstance(stream, HashingBuffer):
+            data, digest = stream.getvalue(), stream.hexdigest()
+        else:
+            data = file.read()
+            digest = hashlib.sha256(data).hexdigest()
+        return UploadedImage(data, digest, 'multipart', request.form.to_dict())
+
+    if mimetype == 'application/octet-stream' or mimetype.startswith('image/'):
+        buffer = HashingBuffer(max_bytes)
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            buffer.write(chunk)
+        if buffer.size == 0:
+            raise ValueError(missing_error)
+        return UploadedImage(buffer.getvalue(), buffer.hexdigest(), 'binary', request.args.to_dict())
+
+    payload = request.get_json(silent=True)
+    if not payload:
+        raise ValueError("請求資料格式錯誤（缺少 JSON 資料）")
+    encoded = payload.get(image_field)
+    if not encoded:
+        raise ValueError(missing_error)
+    data = base64_decoder(encoded)
+    return UploadedImage(data, hashlib.sha256(data).hexdigest(), 'json', payload)
+
+
+def _read_zip_images(
+    archive: bytes,
+    max_images: int,
+    max_image_bytes: int,
+    max_total_bytes: int
+) -> List[UploadedImage]:
+    """
+    解壓 zip 中的圖片（依檔名排序；略過目錄、隱藏檔與非圖片檔）
+    以實際讀出的位元組檢查上限，不信任壓縮檔記錄的檔案大小（防止壓縮炸彈）
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(archive))
+    except zipfile.BadZipFile:
+        raise ValueError("zip 壓縮檔格式錯誤")
+
+    images = []
+    total = 0
+    with zf:
+        for info in sorted(zf.infolist(), key=lambda item: item.filename):
+            name = os.path.basename(info.filename)
+            if (info.is_dir() or not name or name.startswith('.')
+                    or info.filename.startswith('__MACOSX/')
+                    or not name.lower().endswith(ZIP_IMAGE_EXTENSIONS)):
+                continue
+            if len(images) >= max_images:
+                raise UploadTooLarge(f"圖片數量超過限制 ({max_images} 張)")
+            with zf.open(info) as member:
+                data = member.read(max_image_bytes + 1)
+            if len(data) > max_image_bytes:
+                raise UploadTooLarge(f"{name} 超過單張圖片大小限制 ({max_image_bytes / 1024 / 1024:.0f}MB)")
+            total += len(data)
+            if total > max_total_bytes:
+                raise UploadTooLarge(f"解壓後圖片總大小超過限制 ({max_total_bytes / 1024 / 1024:.0f}MB)")
+            images.append(UploadedImage(data, hashlib.sha256(data).hexdigest(), 'zip', {'filename': info.filename}))
+    return images
+
+
+def read_image_batch_upload(
+    image_field: str,
+    archive_field: str,
+    max_images: int,
+    max_image_bytes: int,
+    max_total_bytes: int
+) -> Tuple[List[UploadedImage], Dict[str, Any]]:
+    """
+    從目前的請求讀取多張圖片（批次端點）
+    - multipart/form-data：多個同名 image_field 檔案欄位，或一個 archive_field zip 檔案欄位
+    - application/zip：請求主體即 zip 壓縮檔，其他參數放在查詢字串
+
+    Args:
+        image_field: 圖片檔案欄位名稱（例如 'images'）
+        archive_field: zip 檔案欄位名稱（例如 'archive'）
+        max_images: 最多圖片數
+        max_image_bytes: 單張圖片上限（位元組）
+        max_total_bytes: 請求主體與 zip 解壓後總大小上限（位元組）
+
+    Returns:
+        (圖片列表（fields 只含 filename）, 其他請求參數)
+
+    Raises:
+        UploadTooLarge: 超過任一上限
+        ValueError: 缺少圖片或請求格式錯誤
+    """
+    if isinstance(request, UploadRequest):
+        request.set_upload_limit(max_total_bytes)
+    if request.content_length is not None and request.content_length > max_total_bytes:
+        raise UploadTooLarge(f"請求大小超過限制 ({max_total_bytes / 1024 / 1024:.0f}MB)")
+
+    mimetype = request.mimetype
+    if mimetype in ZIP_MIMETYPES:
+        buffer = HashingBuffer(max_total_bytes)
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            buffer.write(chunk)
+        images = _read_zip_images(buffer.getvalue(), max_images, max_image_bytes, max_total_bytes)
+        fields = request.args.to_dict()
+    elif mimetype == 'multipart/form-data':
+        fields = request.form.to_dict()
+        archive = request.files.get(archive_field)
+        if archive is not None:
+            images = _read_zip_images(archive.read(), max_images, max_image_bytes, max_total_bytes)
+        else:
+            files = request.files.getlist(image_field)
+            if len(files) > max_images:
+                raise UploadTooLarge(f"圖片數量超過限制 ({max_images} 張)")
+            images = []
+            for index, file in enumerate(files):
+                stream = file.stream
+                if isinstance(stream, HashingBuffer):
+                    data, digest = stream.getvalue(), stream.hexdigest()
+                else:
+                    data = file.read()
+                    digest = hashlib.sha256(data).hexdigest()
+                name = file.filename or f"{image_field}[{index}]"
+                if len(data) > max_image_bytes:
+                    raise UploadTooLarge(f"{name} 超過單張圖片大小限制 ({max_image_bytes / 1024 / 1024:.0f}MB)")
+                if data:
+                    images.append(UploadedImage(data, digest, 'multipart', {'filename': name}))
+    else:
+        raise ValueError(f"批次檢測只接受 multipart/form-data 或 application/zip（收到 {mimetype or '未指定'}）")
+
+    if not images:
+        raise ValueError("無圖片資料")
+    return images, fields
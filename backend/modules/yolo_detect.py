@@ -5,14 +5,41 @@ YOLO 檢測模組
 
 import os
 import logging
+import numpy as np
 from typing import List, Any
 
+from modules.image_buffer import load_image_buffer
+
 logger = logging.getLogger(__name__)
 
 
+def _to_bgr(image_array: np.ndarray) -> np.ndarray:
+    """Ultralytics 將 numpy 輸入視為 BGR（OpenCV 慣例），RGB 陣列需先轉換"""
+    return np.ascontiguousarray(image_array[:, :, ::-1])
+
+
+def yolo_detect_array(model, image_array: np.ndarray) -> List[Any]:
+    """
+    對已解碼的 RGB 陣列執行 YOLO 檢測（不觸發檔案讀取與解碼）
+    
+    Args:
+        model: 已載入的 YOLO 模型
+        image_array: RGB uint8 陣列 (H, W, 3)
+    
+    Returns:
+        YOLO 檢測結果列表
+    """
+    try:
+        return model(_to_bgr(image_array))
+        
+    except Exception as e:
+        logger.error(f"❌ YOLO 檢測失敗: {str(e)}")
+        raise
+
+
 def yolo_detect(model, image_path: str) -> List[Any]:
     """
-    執行 YOLO 檢測
+    執行 YOLO 檢測（轉接層：讀檔解碼後交給 yolo_detect_array）
     
     Args:
         model: 已載入的 YOLO 模型
@@ -25,11 +52,49 @@ def yolo_detect(model, image_path: str) -> List[Any]:
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"圖片檔案不存在: {image_path}")
         
-        # 執行 YOLO 檢測
-        results = model(image_path)
-        
-        return results
+        image = load_image_buffer(image_path, stage='yolo')
+        return yolo_detect_array(model, image.pixels)
         
     except Exception as e:
         logger.error(f"❌ YOLO 檢測失敗: {str(e)}")
         raise
+
+
+def yolo_detect_arrays_batch(model, image_arrays: List[np.ndarray]) -> List[List[Any]]:
+    """
+    以單次模型呼叫對多個已解碼的 RGB 陣列執行 YOLO 檢測
+    
+    Args:
+        model: 已載入的 YOLO 模型
+        image_arrays: RGB uint8 陣列列表
+    
+    Returns:
+        每張圖片各自的結果列表（每個元素可直接傳給 postprocess_yolo_result），順序與輸入一致
+    """
+    try:
+        if not image_arrays:
+            return []
+        
+        # Ultralytics 接受陣列列表，並為每張圖片返回一個 Results
+        results = model([_to_bgr(image_array) for image_array in image_arrays])
+        
+        return [[result] for result in results]
+        
+    except Exception as e:
+        logger.error(f"❌ YOLO 批次檢測失敗: {str(e)}")
+        raise
+
+
+def yolo_detect_batch(model, image_paths: List[str]) -> List[List[Any]]:
+    """
+    以單次模型呼叫對多張圖片執行 YOLO 檢測（轉接層：讀檔解碼後交給 yolo_detect_arrays_batch）
+    
+    Args:
+        model: 已載入的 YOLO 模型
+        image_paths: 圖片檔案路徑列表
+    
+    Returns:
+        每張圖片各自的結果列表（每個元素可直接傳給 postprocess_yolo_result），順序與輸入一致
+    """
+    arrays = [load_image_buffer(image_path, stage='yolo').pixels for image_path in image_paths]
+    return yolo_detect_arrays_batch(model, arrays)
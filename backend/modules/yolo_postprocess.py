@@ -9,6 +9,8 @@ from typing import Dict, Any, List, Optional
 from PIL import Image, ImageDraw
 import numpy as np
 
+from modules.image_buffer import decode_image_bytes, load_image_buffer, record_pipeline_event
+
 logger = logging.getLogger(__name__)
 
 
@@ -99,18 +101,48 @@ def parse_severity(disease_name: str) -> str:
     return "Unknown"
 
 
-def draw_boxes_on_image(
-    image_path: str,
+def filter_detections_by_confidence(
+    detections: List[Dict[str, Any]],
+    min_confidence: float
+) -> List[Dict[str, Any]]:
+    """
+    依置信度過濾檢測結果（取代重新以 conf 參數執行一次 YOLO 推論）
+    
+    Args:
+        detections: 檢測結果列表，每個包含 'confidence' 欄位
+        min_confidence: 最小置信度（含）
+    
+    Returns:
+        置信度不低於 min_confidence 的檢測結果列表
+    """
+    return [
+        detection for detection in detections
+        if float(detection.get('confidence', 0.0)) >= min_confidence
+    ]
+
+
+def _normalize_bbox(bbox: Any) -> List[float]:
+    """
+    將 bbox 統一為 [x1, y1, x2, y2]
+    postprocess_yolo_result() 儲存的是 box.xyxy.tolist()，形狀為 [[x1, y1, x2, y2]]
+    """
+    if bbox and len(bbox) == 1 and isinstance(bbox[0], (list, tuple)):
+        return list(bbox[0])
+    return list(bbox) if bbox else []
+
+
+def draw_boxes_on_array(
+    image_array: np.ndarray,
     detections: List[Dict[str, Any]],
     line_width: int = 2,
     box_color: tuple = (255, 255, 0)  # 黃色框
 ) -> bytes:
     """
-    在圖片上繪製檢測框（只繪製框，不添加文字）
+    在已解碼的 RGB 陣列上繪製檢測框（只繪製框，不添加文字），不觸發解碼
     
     Args:
-        image_path: 原始圖片路徑
-        detections: 檢測結果列表，每個包含 'bbox' 欄位 [x1, y1, x2, y2]
+        image_array: RGB uint8 陣列 (H, W, 3)
+        detections: 檢測結果列表，每個包含 'bbox' 欄位 [x1, y1, x2, y2] 或 [[x1, y1, x2, y2]]
         line_width: 框線寬度（預設 2，不要太粗）
         box_color: 框線顏色 RGB 元組（預設黃色）
     
@@ -118,18 +150,15 @@ def draw_boxes_on_image(
         帶框圖片的位元組資料（JPEG 格式）
     """
     try:
-        # 讀取原始圖片
-        image = Image.open(image_path)
-        # 確保是 RGB 模式
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # 複製一份以免修改原始像素（原始像素仍用於其他階段）
+        image = Image.fromarray(image_array).copy()
         
         # 創建繪圖對象
         draw = ImageDraw.Draw(image)
         
         # 繪製每個檢測框
         for detection in detections:
-            bbox = detection.get('bbox', [])
+            bbox = _normalize_bbox(detection.get('bbox', []))
             if len(bbox) == 4:
                 x1, y1, x2, y2 = bbox
                 # 確保座標是整數
@@ -144,7 +173,7 @@ def draw_boxes_on_image(
         # 將圖片轉換為位元組
         img_bytes = io.BytesIO()
         image.save(img_bytes, format='JPEG', quality=95)
-        img_bytes.seek(0)
+        record_pipeline_event('annotate', 'encode')
         
         return img_bytes.getvalue()
         
@@ -153,6 +182,28 @@ def draw_boxes_on_image(
         raise
 
 
+def draw_boxes_on_image(
+    image_path: str,
+    detections: List[Dict[str, Any]],
+    line_width: int = 2,
+    box_color: tuple = (255, 255, 0)  # 黃色框
+) -> bytes:
+    """
+    在圖片上繪製檢測框（轉接層：讀檔解碼後交給 draw_boxes_on_array）
+    
+    Args:
+        image_path: 原始圖片路徑
+        detections: 檢測結果列表，每個包含 'bbox' 欄位 [x1, y1, x2, y2] 或 [[x1, y1, x2, y2]]
+        line_width: 框線寬度（預設 2，不要太粗）
+        box_color: 框線顏色 RGB 元組（預設黃色）
+    
+    Returns:
+        帶框圖片的位元組資料（JPEG 格式）
+    """
+    image = load_image_buffer(image_path, stage='annotate')
+    return draw_boxes_on_array(image.pixels, detections, line_width, box_color)
+
+
 def draw_boxes_on_image_from_bytes(
     image_bytes: bytes,
     detections: List[Dict[str, Any]],
@@ -160,48 +211,16 @@ def draw_boxes_on_image_from_bytes(
     box_color: tuple = (255, 255, 0)  # 黃色框
 ) -> bytes:
     """
-    在圖片位元組上繪製檢測框（只繪製框，不添加文字）
+    在圖片位元組上繪製檢測框（轉接層：解碼後交給 draw_boxes_on_array）
     
     Args:
         image_bytes: 原始圖片位元組
-        detections: 檢測結果列表，每個包含 'bbox' 欄位 [x1, y1, x2, y2]
+        detections: 檢測結果列表，每個包含 'bbox' 欄位 [x1, y1, x2, y2] 或 [[x1, y1, x2, y2]]
         line_width: 框線寬度（預設 2，不要太粗）
         box_color: 框線顏色 RGB 元組（預設黃色）
     
     Returns:
         帶框圖片的位元組資料（JPEG 格式）
     """
-    try:
-        # 從位元組讀取圖片
-        image = Image.open(io.BytesIO(image_bytes))
-        # 確保是 RGB 模式
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 創建繪圖對象
-        draw = ImageDraw.Draw(image)
-        
-        # 繪製每個檢測框
-        for detection in detections:
-            bbox = detection.get('bbox', [])
-            if len(bbox) == 4:
-                x1, y1, x2, y2 = bbox
-                # 確保座標是整數
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                # 繪製矩形框（只繪製框，不添加文字）
-                draw.rectangle(
-                    [(x1, y1), (x2, y2)],
-                    outline=box_color,
-                    width=line_width
-                )
-        
-        # 將圖片轉換為位元組
-        img_bytes = io.BytesIO()
-        image.save(img_bytes, format='JPEG', quality=95)
-        img_bytes.seek(0)
-        
-        return img_bytes.getvalue()
-        
-    except Exception as e:
-        logger.error(f"❌ 繪製檢測框失敗: {str(e)}")
-        raise
+    image = decode_image_bytes(image_bytes, stage='annotate')
+    return draw_boxes_on_array(image.pixels, detections, line_width, box_color)
@@ -5,15 +5,42 @@ YOLO 工具函數模組
 
 import os
 import json
+import threading
 import logging
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# data/disease_info.json 只在第一次需要時讀取並解析一次
+_json_disease_db: Optional[Dict[str, Any]] = None
+_json_lock = threading.Lock()
+
+
+def _load_json_disease_db() -> Dict[str, Any]:
+    """讀取 data/disease_info.json（向後兼容），結果保留在記憶體中"""
+    global _json_disease_db
+    if _json_disease_db is not None:
+        return _json_disease_db
+    with _json_lock:
+        if _json_disease_db is None:
+            disease_info_file = os.path.join(
+                os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
+                "data", "disease_info.json"
+            )
+            disease_db: Dict[str, Any] = {}
+            if os.path.exists(disease_info_file):
+                try:
+                    with open(disease_info_file, 'r', encoding='utf-8') as f:
+                        disease_db = json.load(f)
+                except Exception as e:
+                    logger.warning(f"⚠️ 讀取 disease_info.json 失敗: {str(e)}")
+            _json_disease_db = disease_db
+    return _json_disease_db
+
 
 def get_disease_info(disease_name: str) -> Optional[Dict[str, Any]]:
     """
-    從資料庫或 JSON 檔案獲取病害詳細資訊
+    從病害知識庫目錄（程序內快取的 disease_library）或 JSON 檔案獲取病害詳細資訊
     
     Args:
         disease_name: 病害名稱
@@ -22,20 +49,11 @@ def get_disease_info(disease_name: str) -> Optional[Dict[str, Any]]:
         病害資訊字典或 None
     """
     try:
-        # 先嘗試從資料庫獲取
+        # 先從病害知識庫目錄獲取（資料庫內容已載入記憶體）
         try:
-            from src.core.core_db_manager import db
+            from src.core.core_disease_catalog import disease_catalog
             
-            result = db.execute_query(
-                """
-                SELECT chinese_name, causes, features, pesticides, management_measures
-                FROM disease_library
-                WHERE disease_name = %s AND is_active = TRUE
-                """,
-                (disease_name,),
-                fetch_one=True,
-                dict_cursor=True
-            )
+            result = disease_catalog.lookup(disease_name)
             
             if result:
                 return {
@@ -48,29 +66,19 @@ def get_disease_info(disease_name: str) -> Optional[Dict[str, Any]]:
                     }
                 }
         except Exception as db_error:
-            error_msg = str(db_error)
-            logger.warning(f"⚠️ 從資料庫獲取病害資訊失敗: {error_msg}")
-            if "relation" in error_msg.lower() and "does not exist" in error_msg.lower():
-                logger.warning("   提示: disease_library 表不存在，將嘗試從 JSON 檔案讀取")
+            logger.warning(f"⚠️ 從病害知識庫目錄獲取病害資訊失敗: {str(db_error)}")
             # 繼續嘗試從 JSON 檔案讀取
         
         # 如果資料庫沒有，嘗試從 JSON 檔案讀取（向後兼容）
-        disease_info_file = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            "data", "disease_info.json"
-        )
-        
-        if os.path.exists(disease_info_file):
-            with open(disease_info_file, 'r', encoding='utf-8') as f:
-                disease_db = json.load(f)
-                if disease_name in disease_db:
-                    info = disease_db[disease_name]
-                    return {
-                        "name": info.get("name", disease_name),
-                        "causes": info.get("causes", ''),
-                        "feature": info.get("feature", ''),
-                        "solution": info.get("solution", {})
-                    }
+        disease_db = _load_json_disease_db()
+        if disease_name in disease_db:
+            info = disease_db[disease_name]
+            return {
+                "name": info.get("name", disease_name),
+                "causes": info.get("causes", ''),
+                "feature": info.get("feature", ''),
+                "solution": info.get("solution", {})
+            }
         
         return None
         
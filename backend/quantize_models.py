@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+INT8 量化準確率閘門（離線執行）
+依 CNN_QUANTIZATION / SR_QUANTIZATION 量化模型並重播驗證清單（QuantizationGate，evaluate=True），
+將準確率報告與通過的量化模型保存在檢查點旁（或 CNN_EXPORT_DIR_RELATIVE）
+
+web worker 與推論程序啟動時只載入這裡保存的結果，不重播驗證清單；
+報告已存在時直接沿用（檢查點、量化模式、引擎或 torch 版本改變時才重新評估）
+
+使用方式：
+    cd backend
+    CNN_QUANTIZATION=static QUANT_VAL_IMAGE_ROOT=/data/val python quantize_models.py
+"""
+
+import os
+import sys
+import logging
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(backend_dir)
+for path in (project_root, backend_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    from src.core.core_app_config import AppConfig, get_base_dir, build_integrated_service_kwargs
+    from src.services.service_inference_pool import build_inference_engine
+
+    engine_kwargs = build_integrated_service_kwargs(get_base_dir(), AppConfig)
+    if engine_kwargs is None:
+        logger.error("❌ 模型文件不存在，無法執行量化準確率閘門")
+        return 1
+    gate = engine_kwargs['quantization_gate']
+    if gate is None:
+        logger.info("ℹ️  CNN_QUANTIZATION 與 SR_QUANTIZATION 皆為 none，不需要量化")
+        return 0
+
+    # 與推論程序相同的引擎（不連接資料庫），只差在閘門允許重播驗證清單
+    gate.evaluate = True
+    engine = build_inference_engine(engine_kwargs)
+
+    failed = False
+    for name, info in engine.get_quantization_info().items():
+        if info.get('requested', 'none') == 'none':
+            continue
+        report = info.get('report') or {}
+        if info['enabled']:
+            logger.info(f"✅ {name}: INT8（{info['requested']}）已通過，準確率 {report['reference_accuracy']:.4f} → "
+                        f"{report['candidate_accuracy']:.4f}: {info.get('artifact_path')}")
+        elif not info.get('reason'):
+            logger.info(f"ℹ️  {name}: 模型未啟用，略過")
+        elif info.get('reason') == 'accuracy gate failed':
+            logger.warning(f"⚠️  {name}: INT8（{info['requested']}）未通過準確率閘門，執行時使用 fp32")
+        else:
+            failed = True
+            logger.error(f"❌ {name}: INT8（{info['requested']}）無法驗證: {info.get('reason')}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,54 @@
 """
 核心模組
 提供應用程式配置、資料庫管理、Redis 快取、使用者管理等核心功能
+
+匯出的名稱在第一次存取時才導入對應的子模組：導入任何 src.core 子模組都會先執行本檔案，
+若在此直接導入 core_db_manager，只需要 core_write_behind、core_db_pool 等子模組的程序
+（例如推論伺服器的推論程序）也會建立資料庫連接池
 """
 
-from .core_app_config import create_app
-from .core_db_manager import db, ActivityLogger, ErrorLogger, AuditLogger, APILogger, PerformanceLogger
-from .core_helpers import get_user_id_from_session, log_api_request
-from .core_redis_manager import redis_manager
-from .core_user_manager import UserManager, DetectionQueries, LogQueries
-
-__all__ = [
-    'create_app',
-    'db',
-    'ActivityLogger',
-    'ErrorLogger',
-    'AuditLogger',
-    'APILogger',
-    'PerformanceLogger',
-    'get_user_id_from_session',
-    'log_api_request',
-    'redis_manager',
-    'UserManager',
-    'DetectionQueries',
-    'LogQueries',
-]
+import importlib
+
+# 匯出名稱 -> 所在子模組
+_EXPORTS = {
+    'create_app': '.core_app_config',
+    'CacheBackend': '.core_cache_backend',
+    'MemoryCacheBackend': '.core_cache_backend',
+    'DiseaseCatalog': '.core_disease_catalog',
+    'disease_catalog': '.core_disease_catalog',
+    'ConnectionPool': '.core_db_pool',
+    'PoolTimeout': '.core_db_pool',
+    'PreparedStatementRegistry': '.core_db_statements',
+    'db': '.core_db_manager',
+    'ActivityLogger': '.core_db_manager',
+    'ErrorLogger': '.core_db_manager',
+    'AuditLogger': '.core_db_manager',
+    'APILogger': '.core_db_manager',
+    'PerformanceLogger': '.core_db_manager',
+    'get_user_id_from_session': '.core_helpers',
+    'log_api_request': '.core_helpers',
+    'LogShipper': '.core_log_shipper',
+    'log_shipper': '.core_log_shipper',
+    'redis_manager': '.core_redis_manager',
+    'UserManager': '.core_user_manager',
+    'DetectionQueries': '.core_user_manager',
+    'LogQueries': '.core_user_manager',
+    'UserStatusCache': '.core_user_status_cache',
+    'user_status_cache': '.core_user_status_cache',
+    'WriteBehindWriter': '.core_write_behind',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -5,7 +5,9 @@
 
 import os
 import sys
+import hashlib
 import logging
+from typing import Any, Dict, Optional, Tuple
 from flask import Flask
 from flask_caching import Cache
 from flask_cors import CORS
@@ -41,7 +43,9 @@ else:
 from src.core.core_redis_manager import redis_manager
 from src.services.service_yolo import DetectionService
 from src.services.service_integrated import IntegratedDetectionService
-from src.services.service_cloudinary import init_cloudinary_storage
+from src.services.service_cloudinary import init_cloudinary_storage, init_local_cloudinary_storage
+from src.services.service_upload_queue import UploadQueue
+from modules.upload_stream import UploadRequest
 
 # 設定日誌
 logging.basicConfig(
@@ -88,6 +92,9 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(AppConfig)
     
+    # multipart 圖片欄位直接寫入記憶體緩衝區並同步計算 hash（不落地為暫存檔）
+    app.request_class = UploadRequest
+    
     # 確保 JSON 響應正確處理 Unicode 字符（中文）
     app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
     app.config['JSON_AS_ASCII'] = False  # 確保中文不被轉義為 \uXXXX 格式
@@ -147,11 +154,14 @@ def create_app():
     upload_folder = setup_upload_folder(BASE_DIR, AppConfig)
     
     # 載入模型（從 config 讀取路徑）
-    detection_service = load_model(BASE_DIR, AppConfig)
+    # 推論伺服器模式下 web worker 不載入任何模型（舊版 YOLO 端點返回服務不可用）
+    detection_service = None
+    if getattr(AppConfig, 'INFERENCE_MODE', 'in_process') != 'server':
+        detection_service = load_model(BASE_DIR, AppConfig)
     integrated_service = load_integrated_models(BASE_DIR, AppConfig)
     
     # 初始化 Cloudinary（如果啟用）
-    cloudinary_storage = setup_cloudinary(AppConfig)
+    cloudinary_storage = setup_cloudinary(AppConfig, BASE_DIR)
     
     return app, cache, upload_folder, detection_service, integrated_service, cloudinary_storage
 
@@ -288,22 +298,90 @@ def load_model(base_dir: str, config) -> DetectionService:
         return None
 
 
-def load_integrated_models(base_dir: str, config) -> IntegratedDetectionService:
+def get_inference_server_address(base_dir: str, config) -> Tuple[str, bytes]:
     """
-    載入整合模型
-    載入 CNN 和 YOLO 模型並創建整合檢測服務
-    支持可選的超解析度預處理
+    獲取推論伺服器的 Unix socket 路徑與連線驗證金鑰（由 SECRET_KEY 衍生，web worker 與推論伺服器使用相同設定）
+    """
+    socket_path = os.path.join(base_dir, getattr(config, 'INFERENCE_SERVER_SOCKET_RELATIVE', 'data/inference.sock'))
+    secret = getattr(config, 'SECRET_KEY', '') or ''
+    authkey = hashlib.sha256(f"inference-server:{secret}".encode('utf-8')).digest()
+    return socket_path, authkey
+
+
+def build_integrated_service_kwargs(base_dir: str, config) -> Optional[Dict[str, Any]]:
+    """
+    從 config 讀取整合檢測服務的參數（web worker 與推論伺服器共用）
+    
+    Returns:
+        IntegratedDetectionService 的參數字典；模型文件不存在時返回 None
     """
     # 從 config 讀取模型相對路徑
     # 注意：預設路徑必須與 Dockerfile 中複製的模型路徑一致
     cnn_model_path_relative = getattr(config, 'CNN_MODEL_PATH_RELATIVE', 'model/CNN/CNN_v1.1_20251210/best_mobilenetv3_large.pth')
     yolo_model_path_relative = getattr(config, 'YOLO_MODEL_PATH_RELATIVE', 'model/yolov11/YOLOv11_v1_20251212/weights/best.pt')
     
+    # CNN 推論後端配置
+    cnn_backend = getattr(config, 'CNN_BACKEND', 'eager')
+    cnn_parity_atol = getattr(config, 'CNN_PARITY_ATOL', 1e-3)
+    cnn_num_threads = getattr(config, 'CNN_NUM_THREADS', 0)
+    cnn_export_dir = os.path.join(base_dir, getattr(config, 'CNN_EXPORT_DIR_RELATIVE', 'data/model_cache'))
+    
+    # INT8 量化配置（可選）
+    cnn_quantization = getattr(config, 'CNN_QUANTIZATION', 'none')
+    sr_quantization = getattr(config, 'SR_QUANTIZATION', 'none')
+    quantization_gate = None
+    if cnn_quantization != 'none' or sr_quantization != 'none':
+        from src.services.service_quantization import QuantizationGate
+        from modules.cnn_utils import CNN_CLASSES
+        quantization_gate = QuantizationGate(
+            val_csv_path=os.path.join(base_dir, getattr(config, 'QUANT_VAL_CSV_RELATIVE', 'model/CNN/CNN_v1.1_20251210/val_predictions_rerun.csv')),
+            image_root=getattr(config, 'QUANT_VAL_IMAGE_ROOT', '') or None,
+            classes=CNN_CLASSES,
+            max_accuracy_drop=getattr(config, 'QUANT_MAX_ACCURACY_DROP', 0.01),
+            calibration_size=getattr(config, 'QUANT_CALIBRATION_SIZE', 64),
+            max_samples=getattr(config, 'QUANT_GATE_MAX_SAMPLES', 500),
+            engine=getattr(config, 'QUANT_ENGINE', None),
+            fallback_dir=cnn_export_dir,
+            # 驗證清單的重播由 quantize_models.py 離線執行，啟動時只載入已驗證的量化模型
+            evaluate=False
+        )
+    
     # 超解析度模型配置（可選）
     sr_model_path_relative = getattr(config, 'SR_MODEL_PATH_RELATIVE', None)
     sr_model_type = getattr(config, 'SR_MODEL_TYPE', 'edsr')
     sr_scale = getattr(config, 'SR_SCALE', 2)
     enable_sr = getattr(config, 'ENABLE_SR', True)
+    sr_tile_size = getattr(config, 'SR_TILE_SIZE', 0)
+    sr_tile_overlap = getattr(config, 'SR_TILE_OVERLAP', 16)
+    sr_tile_batch_size = getattr(config, 'SR_TILE_BATCH_SIZE', 4)
+    sr_policy = getattr(config, 'SR_POLICY', 'always')
+    sr_policy_min_side = getattr(config, 'SR_POLICY_MIN_SIDE', 224)
+    sr_policy_blur_threshold = getattr(config, 'SR_POLICY_BLUR_THRESHOLD', 100.0)
+    sr_policy_min_jpeg_quality = getattr(config, 'SR_POLICY_MIN_JPEG_QUALITY', 50)
+    
+    # 動態微批次配置（可選）
+    enable_batching = getattr(config, 'ENABLE_MICRO_BATCHING', False)
+    batch_window_ms = getattr(config, 'BATCH_WINDOW_MS', 10)
+    batch_max_size = getattr(config, 'BATCH_MAX_SIZE', 8)
+    
+    # 推論結果快取配置（可選）
+    enable_inference_cache = getattr(config, 'ENABLE_INFERENCE_CACHE', True)
+    inference_cache_max_entries = getattr(config, 'INFERENCE_CACHE_MAX_ENTRIES', 512)
+    inference_cache_max_bytes = getattr(config, 'INFERENCE_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+    inference_cache_ttl = getattr(config, 'INFERENCE_CACHE_TTL', 86400)
+    
+    # 近似重複索引配置（可選）
+    enable_near_duplicate = getattr(config, 'ENABLE_NEAR_DUPLICATE', False)
+    near_duplicate_max_distance = getattr(config, 'NEAR_DUPLICATE_MAX_DISTANCE', 4)
+    near_duplicate_max_entries = getattr(config, 'NEAR_DUPLICATE_MAX_ENTRIES', 500000)
+    near_duplicate_refresh_seconds = getattr(config, 'NEAR_DUPLICATE_REFRESH_SECONDS', 30)
+    
+    # 預測記錄背景寫入配置
+    enable_write_behind = getattr(config, 'ENABLE_WRITE_BEHIND', True)
+    write_behind_batch_size = getattr(config, 'WRITE_BEHIND_BATCH_SIZE', 64)
+    write_behind_flush_ms = getattr(config, 'WRITE_BEHIND_FLUSH_MS', 200)
+    write_behind_max_pending = getattr(config, 'WRITE_BEHIND_MAX_PENDING', 2048)
+    write_behind_spill_dir = os.path.join(base_dir, getattr(config, 'WRITE_BEHIND_SPILL_DIR_RELATIVE', 'data/write_behind'))
     
     cnn_model_path = os.path.join(base_dir, cnn_model_path_relative)
     yolo_model_path = os.path.join(base_dir, yolo_model_path_relative)
@@ -331,29 +409,100 @@ def load_integrated_models(base_dir: str, config) -> IntegratedDetectionService:
     logger.info(f"📦 開始載入整合檢測服務...")
     logger.info(f"   CNN 模型路徑: {cnn_model_path}")
     logger.info(f"   YOLO 模型路徑: {yolo_model_path}")
+    logger.info(f"   CNN 推論後端: {cnn_backend}")
+    if quantization_gate is not None:
+        logger.info(f"   INT8 量化: CNN={cnn_quantization}, SR={sr_quantization}（準確率下降上限 {quantization_gate.max_accuracy_drop}）")
     if enable_sr:
         logger.info(f"   超解析度: 啟用 (類型: {sr_model_type}, scale: {sr_scale}x)")
+        if sr_tile_size:
+            logger.info(f"   超解析度分塊: tile={sr_tile_size}, overlap={sr_tile_overlap}, batch={sr_tile_batch_size}")
+        if sr_policy == 'adaptive':
+            logger.info(f"   超解析度策略: adaptive (min_side: {sr_policy_min_side}, blur_threshold: {sr_policy_blur_threshold}, "
+                        f"min_jpeg_quality: {sr_policy_min_jpeg_quality})")
+        elif sr_policy != 'always':
+            logger.info(f"   超解析度策略: {sr_policy}")
         if sr_model_path:
             logger.info(f"   超解析度模型路徑: {sr_model_path}")
         else:
             logger.info(f"   超解析度模型: 使用預設架構（無預訓練權重）")
     else:
         logger.info(f"   超解析度: 禁用")
+    if enable_batching:
+        logger.info(f"   微批次: 啟用 (window: {batch_window_ms}ms, max_batch: {batch_max_size})")
+    if enable_near_duplicate:
+        logger.info(f"   近似重複索引: 啟用 (max_distance: {near_duplicate_max_distance}, max_entries: {near_duplicate_max_entries})")
+    
+    return dict(
+        cnn_model_path=cnn_model_path,
+        yolo_model_path=yolo_model_path,
+        cnn_backend=cnn_backend,
+        cnn_parity_atol=cnn_parity_atol,
+        cnn_num_threads=cnn_num_threads,
+        cnn_export_dir=cnn_export_dir,
+        cnn_quantization=cnn_quantization,
+        sr_quantization=sr_quantization,
+        quantization_gate=quantization_gate,
+        sr_model_path=sr_model_path,
+        sr_model_type=sr_model_type,
+        sr_scale=sr_scale,
+        enable_sr=enable_sr,
+        sr_tile_size=sr_tile_size,
+        sr_tile_overlap=sr_tile_overlap,
+        sr_tile_batch_size=sr_tile_batch_size,
+        sr_policy=sr_policy,
+        sr_policy_min_side=sr_policy_min_side,
+        sr_policy_blur_threshold=sr_policy_blur_threshold,
+        sr_policy_min_jpeg_quality=sr_policy_min_jpeg_quality,
+        enable_batching=enable_batching,
+        batch_window_ms=batch_window_ms,
+        batch_max_size=batch_max_size,
+        enable_inference_cache=enable_inference_cache,
+        inference_cache_max_entries=inference_cache_max_entries,
+        inference_cache_max_bytes=inference_cache_max_bytes,
+        inference_cache_ttl=inference_cache_ttl,
+        enable_near_duplicate=enable_near_duplicate,
+        near_duplicate_max_distance=near_duplicate_max_distance,
+        near_duplicate_max_entries=near_duplicate_max_entries,
+        near_duplicate_refresh_seconds=near_duplicate_refresh_seconds,
+        enable_write_behind=enable_write_behind,
+        write_behind_batch_size=write_behind_batch_size,
+        write_behind_flush_ms=write_behind_flush_ms,
+        write_behind_max_pending=write_behind_max_pending,
+        write_behind_spill_dir=write_behind_spill_dir
+    )
+
+
+def load_integrated_models(base_dir: str, config) -> IntegratedDetectionService:
+    """
+    載入整合模型
+    載入 CNN 和 YOLO 模型並創建整合檢測服務
+    支持可選的超解析度預處理
+    INFERENCE_MODE=server 時不載入模型，改為連線到推論伺服器
+    """
+    service_kwargs = build_integrated_service_kwargs(base_dir, config)
+    if service_kwargs is None:
+        return None
     
     try:
-        integrated_service = IntegratedDetectionService(
-            cnn_model_path=cnn_model_path,
-            yolo_model_path=yolo_model_path,
-            sr_model_path=sr_model_path,
-            sr_model_type=sr_model_type,
-            sr_scale=sr_scale,
-            enable_sr=enable_sr
-        )
+        if getattr(config, 'INFERENCE_MODE', 'in_process') == 'server':
+            from src.services.service_inference_pool import InferenceClient
+            socket_path, authkey = get_inference_server_address(base_dir, config)
+            logger.info(f"🔌 推論伺服器模式: {socket_path}")
+            service_kwargs['inference_client'] = InferenceClient(
+                socket_path,
+                authkey,
+                slots=getattr(config, 'INFERENCE_SHM_SLOTS', 8),
+                slot_bytes=getattr(config, 'INFERENCE_SHM_SLOT_MB', 16) * 1024 * 1024,
+                request_timeout=getattr(config, 'INFERENCE_TASK_TIMEOUT', 120) * 2,  # 包含在推論伺服器排隊的時間
+                connect_timeout=getattr(config, 'INFERENCE_CONNECT_TIMEOUT', 300)
+            )
+        
+        integrated_service = IntegratedDetectionService(**service_kwargs)
         logger.info(f"✅ 整合檢測服務載入成功")
-        logger.info(f"   CNN: {cnn_model_path}")
-        logger.info(f"   YOLO: {yolo_model_path}")
-        if enable_sr:
-            logger.info(f"   超解析度: {sr_model_type} ({sr_scale}x)")
+        logger.info(f"   CNN: {service_kwargs['cnn_model_path']}")
+        logger.info(f"   YOLO: {service_kwargs['yolo_model_path']}")
+        if integrated_service.enable_sr:
+            logger.info(f"   超解析度: {service_kwargs['sr_model_type']} ({integrated_service.sr_scale}x)")
         return integrated_service
     except FileNotFoundError as e:
         logger.error(f"❌ 模型文件未找到: {str(e)}")
@@ -368,10 +517,11 @@ def load_integrated_models(base_dir: str, config) -> IntegratedDetectionService:
         return None
 
 
-def setup_cloudinary(config):
+def setup_cloudinary(config, base_dir: str = None):
     """
     設定 Cloudinary 儲存服務
     從 config 讀取 Cloudinary 配置並初始化儲存服務
+    CLOUDINARY_LOCAL_STANDIN=true 時改用本地替代儲存（資料夾相對於 base_dir）
     """
     use_cloudinary = getattr(config, 'USE_CLOUDINARY', False)
     
@@ -379,6 +529,13 @@ def setup_cloudinary(config):
         logger.info("ℹ️  Cloudinary 未啟用，使用本地文件儲存")
         return None
     
+    if getattr(config, 'CLOUDINARY_LOCAL_STANDIN', False):
+        local_dir = getattr(config, 'CLOUDINARY_LOCAL_DIR_RELATIVE', 'data/local_cloudinary')
+        if base_dir and not os.path.isabs(local_dir):
+            local_dir = os.path.join(base_dir, local_dir)
+        logger.info("ℹ️  使用本地 Cloudinary 替代儲存")
+        return init_local_cloudinary_storage(local_dir)
+    
     try:
         cloud_name = getattr(config, 'CLOUDINARY_CLOUD_NAME', '')
         api_key = getattr(config, 'CLOUDINARY_API_KEY', '')
@@ -404,3 +561,27 @@ def setup_cloudinary(config):
         logger.error("   將使用本地文件儲存")
         return None
 
+
+
+def setup_upload_queue(cloudinary_storage, config):
+    """
+    設定 Cloudinary 背景上傳佇列
+    從 config 讀取工作執行緒數、佇列上限與重試設定；未啟用 Cloudinary 或佇列時返回 None（同步上傳）
+    """
+    if cloudinary_storage is None or not getattr(config, 'ENABLE_UPLOAD_QUEUE', True):
+        logger.info("ℹ️  Cloudinary 背景上傳佇列未啟用，圖片將同步上傳")
+        return None
+    
+    try:
+        upload_queue = UploadQueue(
+            cloudinary_storage,
+            workers=getattr(config, 'UPLOAD_QUEUE_WORKERS', 4),
+            max_queue_size=getattr(config, 'UPLOAD_QUEUE_MAX_SIZE', 256),
+            max_retries=getattr(config, 'UPLOAD_MAX_RETRIES', 3),
+            backoff_base=getattr(config, 'UPLOAD_RETRY_BACKOFF_MS', 500) / 1000.0
+        )
+        return upload_queue
+    except Exception as e:
+        logger.error(f"❌ 背景上傳佇列初始化失敗: {str(e)}")
+        logger.error("   圖片將同步上傳")
+        return None
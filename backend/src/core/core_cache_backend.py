@@ -0,0 +1,299 @@
+# 快取後端介面與程序內 TTL + LRU 實作
+#
+# RedisManager 以 CacheBackend 介面組合程序內快取：Redis 不可用時作為完整的替代快取，
+# Redis 可用時作為指定鍵前綴的近端快取（短 TTL，減少往返）。
+# 值以與 Redis 相同的方式序列化後保存，讀取時返回新的物件，呼叫者修改結果不會影響快取內容。
+
+import abc
+import json
+import time
+import fnmatch
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, Dict, List, Iterable
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def serialize_value(value: Any) -> str:
+    """將快取值轉為字串（dict / list 以 JSON 保存，與 Redis 中的格式相同）"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def deserialize_value(value: Optional[str]) -> Optional[Any]:
+    """還原 serialize_value 的結果（無法解析為 JSON 時返回原字串）"""
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        return value
+
+
+class CacheBackend(abc.ABC):
+    """
+    快取後端介面（RedisManager 的程序內快取可替換為任何實作）
+
+    所有方法都不拋出例外：後端不可用或失敗時返回預設值（None / False / 0）。
+    expire 為 None 表示不過期（記憶體後端仍會依容量淘汰）。
+    tags 將鍵加入標籤群組，invalidate_tags() 一次刪除群組內的所有鍵（例如某個使用者或某個模型版本的快取）。
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        return [self.get(key) for key in keys]
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, expire: Optional[int] = None, tags: Optional[Iterable[str]] = None) -> bool:
+        ...
+
+    def mset(self, mapping: Dict[str, Any], expire: Optional[int] = None, tags: Optional[Iterable[str]] = None) -> bool:
+        return all([self.set(key, value, expire, tags) for key, value in mapping.items()])
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> bool:
+        ...
+
+    def delete_many(self, keys: List[str]) -> int:
+        return sum(bool(self.delete(key)) for key in keys)
+
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @abc.abstractmethod
+    def expire(self, key: str, seconds: int) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def increment(self, key: str, amount: int = 1) -> Optional[int]:
+        ...
+
+    @abc.abstractmethod
+    def clear_pattern(self, pattern: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """刪除標籤群組內的所有鍵，返回刪除的鍵數量"""
+
+    @abc.abstractmethod
+    def clear(self) -> int:
+        """清除所有項目，返回清除的筆數"""
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    程序內 TTL + LRU 快取（執行緒安全）
+
+    同時以筆數與位元組數（鍵 + 序列化後的值）限制容量，超過時淘汰最久未使用的項目；
+    過期項目在讀取時移除，或在淘汰時優先被移出（LRU 端）。
+    標籤索引只包含仍在快取中的鍵（項目被移除時同步移出索引）。
+    gunicorn 的每個 worker 程序各有一份，內容不在程序間共享。
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 32 * 1024 * 1024, name: str = 'memory'):
+        """
+        初始化記憶體快取
+
+        Args:
+            max_entries: 最大筆數
+            max_bytes: 最大位元組數
+            name: 名稱（日誌與指標用）
+        """
+        self.name = name
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (serialized, size, expires_at, tags)
+        self._tags: Dict[str, set] = {}  # tag -> {key}
+        self._bytes = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'expired': 0,
+            'evictions': 0,
+            'rejected': 0
+        }
+
+    @staticmethod
+    def _deadline(expire: Optional[float]) -> Optional[float]:
+        return time.monotonic() + expire if expire else None
+
+    def _lookup(self, key: str, now: float) -> Optional[tuple]:
+        """查詢並更新 LRU 順序，過期時移除（呼叫者需持有鎖）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] is not None and entry[2] <= now:
+            self._remove(key)
+            self._counters['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str) -> bool:
+        """移除項目（呼叫者需持有鎖）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        self._untag(key, entry[3])
+        return True
+
+    def _untag(self, key: str, tags: tuple):
+        """將鍵移出標籤索引（呼叫者需持有鎖）"""
+        for tag in tags:
+            members = self._tags.get(tag)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._tags[tag]
+
+    def _store(self, key: str, serialized: str, expires_at: Optional[float], tags: tuple = ()) -> bool:
+        """寫入並依筆數與位元組數淘汰（呼叫者需持有鎖）"""
+        size = len(key) + len(serialized.encode('utf-8'))
+        self._remove(key)
+        if size > self.max_bytes:
+            self._counters['rejected'] += 1
+            return False
+        self._entries[key] = (serialized, size, expires_at, tags)
+        self._bytes += size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        self._counters['stores'] += 1
+        now = time.monotonic()
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            evicted_key, (_, evicted_size, evicted_expires, evicted_tags) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._untag(evicted_key, evicted_tags)
+            if evicted_expires is not None and evicted_expires <= now:
+                self._counters['expired'] += 1
+            else:
+                self._counters['evictions'] += 1
+        return True
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            self._counters['hits' if entry else 'misses'] += 1
+        return deserialize_value(entry[0]) if entry else None
+
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entries = [self._lookup(key, now) for key in keys]
+            hits = sum(entry is not None for entry in entries)
+            self._counters['hits'] += hits
+            self._counters['misses'] += len(keys) - hits
+        return [deserialize_value(entry[0]) if entry else None for entry in entries]
+
+    def set(self, key: str, value: Any, expire: Optional[int] = None, tags: Optional[Iterable[str]] = None) -> bool:
+        serialized = serialize_value(value)
+        with self._lock:
+            return self._store(key, serialized, self._deadline(expire), tuple(tags or ()))
+
+    def mset(self, mapping: Dict[str, Any], expire: Optional[int] = None, tags: Optional[Iterable[str]] = None) -> bool:
+        serialized = {key: serialize_value(value) for key, value in mapping.items()}
+        expires_at = self._deadline(expire)
+        tags = tuple(tags or ())
+        with self._lock:
+            return all([self._store(key, value, expires_at, tags) for key, value in serialized.items()])
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def delete_many(self, keys: List[str]) -> int:
+        with self._lock:
+            return sum(self._remove(key) for key in keys)
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return self._lookup(key, time.monotonic()) is not None
+
+    def expire(self, key: str, seconds: int) -> bool:
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is None:
+                return False
+            self._entries[key] = (entry[0], entry[1], self._deadline(seconds), entry[3])
+            return True
+
+    def increment(self, key: str, amount: int = 1) -> Optional[int]:
+        """遞增計數器（與 Redis INCRBY 相同：不存在時從 0 開始並保留原有的過期時間）"""
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            try:
+                value = int(entry[0]) + amount if entry else amount
+            except ValueError:
+                return None
+            self._store(key, str(value), entry[2] if entry else None, entry[3] if entry else ())
+            return value
+
+    def clear_pattern(self, pattern: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+            return count
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取快取指標
+
+        Returns:
+            筆數、位元組數、命中率與淘汰 / 過期次數
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+            used_bytes = self._bytes
+            tags = len(self._tags)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'backend': self.name,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'bytes': used_bytes,
+            'max_bytes': self.max_bytes,
+            'tags': tags,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            **counters
+        }
@@ -1,13 +1,17 @@
-# PostgreSQL 資料庫連接管理器(get_connection, get_cursor, execute_query, execute_update, execute_returning, execute_batch, call_function, transaction, close_all)
+# PostgreSQL 資料庫連接管理器(get_connection, get_cursor, execute_query, execute_update, execute_returning, execute_batch, execute_prepared, call_function, transaction, get_pool_metrics, get_statement_metrics, close_all)
 
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
-from psycopg2 import pool
 from contextlib import contextmanager
 import logging
 import os
 from dotenv import load_dotenv
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Union
+
+from src.core.core_db_pool import ConnectionPool, PoolTimeout, set_statement_timeout
+from src.core.core_db_statements import statements
+from src.core.core_log_shipper import log_shipper
 
 load_dotenv()
 
@@ -19,14 +23,25 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _env_number(name: str, default: Union[int, float], cast=int) -> Union[int, float]:
+    """讀取數值環境變數（未設定、空字串或格式錯誤時返回預設值）"""
+    value = os.getenv(name, '')
+    try:
+        return cast(value) if value and value.strip() else default
+    except ValueError:
+        return default
+
+
 class DatabaseManager:
     """
     PostgreSQL 資料庫管理類
-    使用連接池，支援事務管理和錯誤處理
+    使用執行緒安全的連接池（core_db_pool.ConnectionPool），支援事務管理、語句逾時和錯誤處理
+    熱門 SQL 經 statements（core_db_statements）登錄為預備語句，以 execute_prepared() 執行
     """
     
     def __init__(self):
         """初始化資料庫連接池"""
+        self.statements = statements
         try:
             # 從環境變數讀取配置（必須在 .env 中設定）
             db_host = os.getenv('DB_HOST')
@@ -48,16 +63,21 @@ class DatabaseManager:
                     f"請在 .env 檔案中設定這些變數"
                 )
             
-            self.pool = psycopg2.pool.SimpleConnectionPool(
-                minconn=2,
-                maxconn=10,
+            self.pool = ConnectionPool(
+                minconn=_env_number('DB_POOL_MIN', 2),
+                maxconn=_env_number('DB_POOL_MAX', 10),
+                acquire_timeout=_env_number('DB_POOL_TIMEOUT', 5.0, float),
+                max_lifetime=_env_number('DB_POOL_MAX_LIFETIME', 1800.0, float),
+                validate_idle_seconds=_env_number('DB_POOL_VALIDATE_IDLE_SECONDS', 30.0, float),
+                statement_timeout_ms=_env_number('DB_STATEMENT_TIMEOUT_MS', 30000),
                 host=db_host,
                 port=int(db_port),
                 database=db_name,
                 user=db_user,
-                password=db_password
+                password=db_password,
+                connect_timeout=_env_number('DB_CONNECT_TIMEOUT', 5)
             )
-            logger.info("✅ 資料庫連接池建立成功")
+            logger.info(f"✅ 資料庫連接池建立成功 (連線數 {self.pool.minconn}~{self.pool.maxconn})")
         except psycopg2.OperationalError as e:
             error_msg = str(e)
             if "does not exist" in error_msg:
@@ -78,35 +98,40 @@ class DatabaseManager:
             logger.error(f"❌ 資料庫連接失敗: {str(e)}")
             raise
     
-    def _check_pool(self):
-        """檢查連接池是否可用"""
-        if not hasattr(self, 'pool') or self.pool is None:
-            raise RuntimeError("資料庫連接池未初始化，請檢查資料庫配置")
-        try:
-            test_conn = self.pool.getconn()
-            self.pool.putconn(test_conn)
-        except Exception as e:
-            raise RuntimeError(f"資料庫連接池不可用: {str(e)}")
-    
     @contextmanager
-    def get_connection(self):
+    def get_connection(self, statement_timeout_ms: Optional[int] = None):
         """
         上下文管理器 - 自動處理連接獲取和釋放
         
+        連接池在取出時檢查連接（已關閉、超過最長使用時間或閒置過久的連接會被替換），
+        連接用盡時最多等待 DB_POOL_TIMEOUT 秒；歸還時未提交的事務會回滾
+        
+        Args:
+            statement_timeout_ms: 本次事務的語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
+        
         使用方式：
             with db.get_connection() as conn:
                 cursor = conn.cursor()
                 ...
         """
-        # 檢查連接池
-        self._check_pool()
+        if getattr(self, 'pool', None) is None:
+            raise RuntimeError("資料庫連接池未初始化，請檢查資料庫配置")
         
-        conn = self.pool.getconn()
         try:
-            # 檢查連接是否有效
-            if conn.closed:
-                raise psycopg2.InterfaceError("資料庫連接已關閉")
+            conn = self.pool.getconn()
+        except PoolTimeout as e:
+            logger.error(f"❌ 等待資料庫連接逾時: {str(e)}")
+            raise
+        try:
+            if statement_timeout_ms is not None:
+                set_statement_timeout(conn, statement_timeout_ms)
             yield conn
+        except psycopg2.errors.InvalidSqlStatementName:
+            # 伺服器端的預備語句已遺失，由 execute_prepared() 重新準備後重試
+            raise
+        except psycopg2.extensions.QueryCanceledError as e:
+            logger.error(f"❌ SQL 執行逾時: {str(e).strip().splitlines()[0]}")
+            raise
         except psycopg2.OperationalError as e:
             error_msg = str(e)
             logger.error(f"❌ 資料庫操作錯誤: {error_msg}")
@@ -130,19 +155,21 @@ class DatabaseManager:
                 logger.error(f"❌ 歸還連接失敗: {str(e)}")
     
     @contextmanager
-    def get_cursor(self, dict_cursor: bool = False, commit: bool = True):
+    def get_cursor(self, dict_cursor: bool = False, commit: bool = True,
+                   statement_timeout_ms: Optional[int] = None):
         """
         獲取遊標 - 自動處理事務
         
         Args:
             dict_cursor: 是否使用字典遊標（返回 dict 而非 tuple）
             commit: 是否自動提交事務
+            statement_timeout_ms: 本次事務的語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
         
         使用方式：
             with db.get_cursor() as cursor:
                 cursor.execute(sql, params)
         """
-        with self.get_connection() as conn:
+        with self.get_connection(statement_timeout_ms) as conn:
             if dict_cursor:
                 cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
             else:
@@ -161,7 +188,7 @@ class DatabaseManager:
                 cursor.close()
     
     def execute_query(self, sql: str, params: Tuple = None, fetch_one: bool = False, 
-                     dict_cursor: bool = False) -> Any:
+                     dict_cursor: bool = False, statement_timeout_ms: Optional[int] = None) -> Any:
         """
         執行 SELECT 查詢
         
@@ -170,6 +197,7 @@ class DatabaseManager:
             params: 參數元組
             fetch_one: 只返回第一條記錄
             dict_cursor: 使用字典遊標
+            statement_timeout_ms: 語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
         
         Returns:
             查詢結果
@@ -190,7 +218,8 @@ class DatabaseManager:
             logger.warning(f"⚠️ execute_query 通常用於 SELECT 語句，當前 SQL: {sql[:50]}...")
         
         try:
-            with self.get_cursor(dict_cursor=dict_cursor, commit=False) as cursor:
+            with self.get_cursor(dict_cursor=dict_cursor, commit=False,
+                                 statement_timeout_ms=statement_timeout_ms) as cursor:
                 cursor.execute(sql, params or ())
                 
                 if fetch_one:
@@ -224,13 +253,14 @@ class DatabaseManager:
             logger.error(f"   SQL: {sql[:200]}")
             raise
     
-    def execute_update(self, sql: str, params: Tuple = None) -> int:
+    def execute_update(self, sql: str, params: Tuple = None, statement_timeout_ms: Optional[int] = None) -> int:
         """
         執行 INSERT/UPDATE/DELETE 操作
         
         Args:
             sql: SQL 語句
             params: 參數元組
+            statement_timeout_ms: 語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
         
         Returns:
             受影響的行數
@@ -250,7 +280,7 @@ class DatabaseManager:
             logger.warning(f"⚠️ execute_update 通常用於 INSERT/UPDATE/DELETE，當前 SQL: {sql[:50]}...")
         
         try:
-            with self.get_cursor() as cursor:
+            with self.get_cursor(statement_timeout_ms=statement_timeout_ms) as cursor:
                 cursor.execute(sql, params or ())
                 rows_affected = cursor.rowcount
                 logger.info(f"✅ 操作完成 ({rows_affected} 行受影響)")
@@ -285,7 +315,8 @@ class DatabaseManager:
             logger.error(f"   SQL: {sql[:200]}")
             raise
     
-    def execute_returning(self, sql: str, params: Tuple = None, fetch_one: bool = True) -> Any:
+    def execute_returning(self, sql: str, params: Tuple = None, fetch_one: bool = True,
+                          statement_timeout_ms: Optional[int] = None) -> Any:
         """
         執行 INSERT/UPDATE/DELETE RETURNING 操作
         
@@ -293,6 +324,7 @@ class DatabaseManager:
             sql: SQL 語句（包含 RETURNING）
             params: 參數元組
             fetch_one: 只返回第一條記錄
+            statement_timeout_ms: 語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
         
         Returns:
             返回的資料
@@ -312,7 +344,7 @@ class DatabaseManager:
             logger.warning(f"⚠️ execute_returning 需要包含 RETURNING 子句，當前 SQL: {sql[:50]}...")
         
         try:
-            with self.get_cursor() as cursor:
+            with self.get_cursor(statement_timeout_ms=statement_timeout_ms) as cursor:
                 cursor.execute(sql, params or ())
                 
                 if fetch_one:
@@ -356,13 +388,14 @@ class DatabaseManager:
             logger.error(f"   SQL: {sql[:200]}")
             raise
     
-    def execute_batch(self, sql: str, data_list: List[Tuple]) -> int:
+    def execute_batch(self, sql: str, data_list: List[Tuple], statement_timeout_ms: Optional[int] = None) -> int:
         """
         批量插入操作（executemany）
         
         Args:
             sql: SQL 語句
             data_list: 資料列表
+            statement_timeout_ms: 語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
         
         Returns:
             插入的行數
@@ -387,7 +420,7 @@ class DatabaseManager:
             return 0
         
         try:
-            with self.get_cursor() as cursor:
+            with self.get_cursor(statement_timeout_ms=statement_timeout_ms) as cursor:
                 cursor.executemany(sql, data_list)
                 rows_affected = cursor.rowcount
                 logger.info(f"✅ 批量插入完成 ({rows_affected} 行，共 {len(data_list)} 筆資料)")
@@ -410,6 +443,47 @@ class DatabaseManager:
             logger.error(f"   SQL: {sql[:200]}")
             raise
     
+    def execute_prepared(self, name: str, params: Tuple = None, fetch_one: bool = False,
+                         dict_cursor: bool = False, commit: bool = False,
+                         statement_timeout_ms: Optional[int] = None) -> Any:
+        """
+        執行已登錄的預備語句（每條連線第一次使用時 PREPARE，之後只送 EXECUTE）
+        
+        伺服器端的預備語句遺失時（連線被重設）重新 PREPARE 並重試一次
+        
+        Args:
+            name: statements.register() 登錄的語句名稱
+            params: 參數元組
+            fetch_one: 只返回第一條記錄
+            dict_cursor: 使用字典遊標
+            commit: 是否提交事務（INSERT/UPDATE/DELETE）
+            statement_timeout_ms: 語句逾時（毫秒，預設使用 DB_STATEMENT_TIMEOUT_MS）
+        
+        Returns:
+            有結果集時返回查詢結果，否則返回受影響的行數
+        
+        示例：
+            db.statements.register('users_active_check', "SELECT id FROM users WHERE id = %s AND is_active = TRUE")
+            row = db.execute_prepared('users_active_check', (user_id,), fetch_one=True)
+        """
+        for attempt in range(2):
+            try:
+                with self.get_cursor(dict_cursor=dict_cursor, commit=commit,
+                                     statement_timeout_ms=statement_timeout_ms) as cursor:
+                    self.statements.execute(cursor, name, params)
+                    if cursor.description is None:
+                        return cursor.rowcount
+                    return cursor.fetchone() if fetch_one else cursor.fetchall()
+            except psycopg2.errors.InvalidSqlStatementName:
+                if attempt:
+                    raise
+                logger.warning(f"⚠️ 預備語句 {name} 已不存在於伺服器，重新準備")
+            except psycopg2.Error as e:
+                logger.error(f"❌ 預備語句 {name} 執行失敗: {str(e).strip()}")
+                if params:
+                    logger.error(f"   參數: {params}")
+                raise
+    
     def call_function(self, func_name: str, params: Tuple = None, fetch_one: bool = True) -> Any:
         """
         呼叫 PostgreSQL 函數
@@ -474,6 +548,26 @@ class DatabaseManager:
                 logger.error(f"❌ 事務失敗，已回滾: {str(e)}")
                 return False
     
+    def get_pool_metrics(self) -> Dict[str, Any]:
+        """
+        獲取連接池指標（健康檢查用）
+        
+        Returns:
+            連接數（上限、使用中、閒置、等待中）、取用等待時間與建立 / 回收 / 逾時次數
+        """
+        if getattr(self, 'pool', None) is None:
+            return {}
+        return self.pool.get_metrics()
+    
+    def get_statement_metrics(self) -> Dict[str, Any]:
+        """
+        獲取預備語句統計（健康檢查用的輕量查詢分析）
+        
+        Returns:
+            各語句的呼叫次數、累計 / 平均 / 最長耗時、PREPARE 次數與錯誤次數（依累計耗時排序）
+        """
+        return self.statements.get_metrics()
+    
     def close_all(self):
         """關閉所有連接"""
         try:
@@ -490,6 +584,8 @@ db = DatabaseManager()
 
 # ============================================================
 # 日誌記錄模組
+# 活動、錯誤、API、性能日誌經 log_shipper 批次寫入（ENABLE_LOG_SHIPPER=false 時同步寫入）；
+# 審計日誌仍在呼叫者執行緒同步寫入，確保操作返回前已落盤
 # ============================================================
 
 class ActivityLogger:
@@ -499,20 +595,13 @@ class ActivityLogger:
     def log_action(user_id: int, action_type: str, resource_type: str = None,
                    resource_id: int = None, action_details: dict = None, 
                    ip_address: str = None, user_agent: str = None) -> bool:
-        """記錄使用者活動"""
+        """記錄使用者活動（放入 log_shipper 緩衝區，由背景執行緒批次寫入）"""
         try:
             import json
-            sql = """
-                INSERT INTO activity_logs 
-                (user_id, action_type, resource_type, resource_id, action_details, ip_address, user_agent, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-            """
-            db.execute_update(
-                sql,
-                (user_id, action_type, resource_type, resource_id, 
-                 json.dumps(action_details or {}), ip_address, user_agent)
-            )
-            return True
+            return log_shipper.ship('activity_logs', (
+                user_id, action_type, resource_type, resource_id,
+                json.dumps(action_details or {}), ip_address, user_agent
+            ))
         except Exception as e:
             logger.error(f"❌ 記錄活動失敗: {str(e)}")
             return False
@@ -525,22 +614,15 @@ class ErrorLogger:
     def log_error(user_id: int = None, error_type: str = None, error_message: str = None,
                   error_code: str = None, severity: str = 'error', context: dict = None,
                   endpoint: str = None) -> bool:
-        """記錄系統錯誤"""
+        """記錄系統錯誤（堆疊追蹤在呼叫者執行緒取得，寫入由 log_shipper 批次處理）"""
         try:
             import json
             import traceback
             
-            sql = """
-                INSERT INTO error_logs 
-                (user_id, error_type, error_message, error_code, severity, context, error_traceback, endpoint, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """
-            db.execute_update(
-                sql,
-                (user_id, error_type, error_message, error_code, severity,
-                 json.dumps(context or {}), traceback.format_exc(), endpoint)
-            )
-            return True
+            return log_shipper.ship('error_logs', (
+                user_id, error_type, error_message, error_code, severity,
+                json.dumps(context or {}), traceback.format_exc(), endpoint
+            ))
         except Exception as e:
             logger.error(f"❌ 記錄錯誤失敗: {str(e)}")
             return False
@@ -583,19 +665,12 @@ class APILogger:
                    ip_address: str = None, user_agent: str = None,
                    error_message: str = None, request_size: int = None,
                    response_size: int = None) -> bool:
-        """記錄 API 請求"""
+        """記錄 API 請求（放入 log_shipper 緩衝區，由背景執行緒批次寫入）"""
         try:
-            sql = """
-                INSERT INTO api_logs 
-                (user_id, endpoint, method, status_code, execution_time_ms, ip_address, user_agent, error_message, request_body_size, response_body_size, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """
-            db.execute_update(
-                sql,
-                (user_id, endpoint, method, status_code, execution_time_ms,
-                 ip_address, user_agent, error_message, request_size, response_size)
-            )
-            return True
+            return log_shipper.ship('api_logs', (
+                user_id, endpoint, method, status_code, execution_time_ms,
+                ip_address, user_agent, error_message, request_size, response_size
+            ))
         except Exception as e:
             logger.error(f"❌ 記錄 API 日誌失敗: {str(e)}")
             return False
@@ -608,21 +683,14 @@ class PerformanceLogger:
     def log_performance(operation_name: str, execution_time_ms: int, status: str = 'success',
                        memory_used_mb: float = None, cpu_percentage: float = None,
                        details: dict = None) -> bool:
-        """記錄性能指標"""
+        """記錄性能指標（放入 log_shipper 緩衝區，由背景執行緒批次寫入）"""
         try:
             import json
             
-            sql = """
-                INSERT INTO performance_logs 
-                (operation_name, execution_time_ms, memory_used_mb, cpu_percentage, status, details, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """
-            db.execute_update(
-                sql,
-                (operation_name, execution_time_ms, memory_used_mb, cpu_percentage,
-                 status, json.dumps(details or {}))
-            )
-            return True
+            return log_shipper.ship('performance_logs', (
+                operation_name, execution_time_ms, memory_used_mb, cpu_percentage,
+                status, json.dumps(details or {})
+            ))
         except Exception as e:
             logger.error(f"❌ 記錄性能日誌失敗: {str(e)}")
             return False
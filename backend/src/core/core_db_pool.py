@@ -0,0 +1,369 @@
+# PostgreSQL 連接池（執行緒安全）
+#
+# 取代 psycopg2.pool.SimpleConnectionPool（非執行緒安全，gunicorn --threads 下會競爭；連線用盡時立即拋出例外）：
+#   - 連線用盡時依到達順序等待（歸還的連線直接交給最早的等待者），最多 acquire_timeout 秒後拋出 PoolTimeout
+#   - 取出時檢查連線：已關閉、超過 max_lifetime 的連線直接替換；閒置超過 validate_idle_seconds 的連線先送 SELECT 1
+#     （不再於每次查詢前 getconn/putconn 測試整個連接池）
+#   - 歸還時回滾未結束的交易，已損壞或超過 max_lifetime 的連線關閉
+#   - 連線以 options='-c statement_timeout=...' 建立，所有語句都有伺服器端逾時；可用 set_statement_timeout() 針對單一交易調整
+#   - 記錄等待時間（p50/p99/max）、使用中 / 閒置連線數、建立 / 回收 / 逾時次數
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Optional, Any, Dict, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import pool
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(pool.PoolError):
+    """在 acquire_timeout 秒內沒有可用連線"""
+
+
+class _PooledConnection:
+    """連接池中的連線與其建立 / 最後使用時間"""
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class _Waiter:
+    """等待中的取用請求：歸還的連線或釋出的名額直接交給最早的等待者（先進先出，剛歸還連線的執行緒不能插隊）"""
+
+    __slots__ = ('cond', 'pooled', 'may_create')
+
+    def __init__(self, lock):
+        self.cond = threading.Condition(lock)
+        self.pooled: Optional[_PooledConnection] = None
+        self.may_create = False
+
+
+class ConnectionPool:
+    """
+    執行緒安全的 PostgreSQL 連接池
+
+    getconn() / putconn() 與 psycopg2.pool 相同；閒置連線以後進先出取用（保持少數連線常駐，其餘自然超過 max_lifetime 後回收），
+    連線用盡時等待者依到達順序取得連線。
+    """
+
+    # 等待時間統計保留的最近取用數
+    WAIT_WINDOW = 2048
+
+    def __init__(
+        self,
+        minconn: int = 2,
+        maxconn: int = 10,
+        acquire_timeout: float = 5.0,
+        max_lifetime: float = 1800.0,
+        validate_idle_seconds: float = 30.0,
+        statement_timeout_ms: int = 30000,
+        **connect_kwargs
+    ):
+        """
+        初始化連接池並建立 minconn 條連線（連線失敗時拋出 psycopg2.OperationalError）
+
+        Args:
+            minconn: 啟動時建立、閒置時保留的最少連線數
+            maxconn: 最多連線數
+            acquire_timeout: 連線用盡時最多等待秒數
+            max_lifetime: 連線最長使用秒數，超過後在取出或歸還時關閉並重建（0 表示不限制）
+            validate_idle_seconds: 閒置超過此秒數的連線在取出時先送 SELECT 1 確認可用
+            statement_timeout_ms: 預設的語句逾時（毫秒，0 表示不限制）
+            **connect_kwargs: 傳給 psycopg2.connect() 的參數（host、port、database、user、password 等）
+        """
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.validate_idle_seconds = validate_idle_seconds
+        self.statement_timeout_ms = statement_timeout_ms
+        self.connect_kwargs = dict(connect_kwargs)
+        if statement_timeout_ms:
+            options = self.connect_kwargs.get('options', '')
+            self.connect_kwargs['options'] = f"{options} -c statement_timeout={int(statement_timeout_ms)}".strip()
+
+        self.closed = False
+        self._lock = threading.Lock()
+        self._idle: deque = deque()  # _PooledConnection，右端為最近歸還
+        self._waiters: deque = deque()  # _Waiter，左端為最早到達
+        self._in_use: Dict[int, _PooledConnection] = {}  # id(conn) -> _PooledConnection
+        self._size = 0  # 閒置 + 使用中 + 建立中
+        self._wait_times: deque = deque(maxlen=self.WAIT_WINDOW)
+        self._counters = {
+            'acquires': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'connect_errors': 0,
+            'validations': 0,
+            'validation_failures': 0,
+            'recycled_lifetime': 0,
+            'discarded_broken': 0,
+            'rollbacks_on_return': 0
+        }
+
+        for _ in range(self.minconn):
+            with self._lock:
+                self._size += 1
+            pooled = self._connect()
+            with self._lock:
+                self._idle.append(pooled)
+
+    # ------------------------------------------------------------------
+    # 建立與檢查
+    # ------------------------------------------------------------------
+
+    def _release_slot(self):
+        """釋出一個連線名額：有等待者時轉交給最早的等待者建立新連線（呼叫者需持有鎖）"""
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.may_create = True
+            waiter.cond.notify()
+        else:
+            self._size -= 1
+
+    def _connect(self) -> _PooledConnection:
+        """建立新連線（呼叫前已預留名額，失敗時釋出）"""
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except Exception:
+            with self._lock:
+                self._counters['connect_errors'] += 1
+                self._release_slot()
+            raise
+        with self._lock:
+            self._counters['created'] += 1
+        return _PooledConnection(conn)
+
+    def _expired(self, pooled: _PooledConnection, now: float) -> bool:
+        return bool(self.max_lifetime) and now - pooled.created_at >= self.max_lifetime
+
+    def _close(self, pooled: _PooledConnection, reason: str):
+        """關閉連線並釋出名額"""
+        try:
+            if not pooled.conn.closed:
+                pooled.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._counters[reason] += 1
+            self._release_slot()
+
+    def _usable(self, pooled: _PooledConnection, now: float) -> bool:
+        """取出時檢查連線（只有閒置過久的連線才送往返查詢）"""
+        conn = pooled.conn
+        if conn.closed:
+            self._close(pooled, 'discarded_broken')
+            return False
+        if self._expired(pooled, now):
+            self._close(pooled, 'recycled_lifetime')
+            return False
+        if now - pooled.last_used < self.validate_idle_seconds:
+            return True
+        with self._lock:
+            self._counters['validations'] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ 閒置連線已失效，重新建立: {str(e).strip().splitlines()[0]}")
+            self._close(pooled, 'validation_failures')
+            return False
+
+    # ------------------------------------------------------------------
+    # 取出與歸還
+    # ------------------------------------------------------------------
+
+    def _acquire(self, deadline: float, timeout: float) -> Tuple[Optional[_PooledConnection], bool]:
+        """
+        取得閒置連線或建立新連線的名額（呼叫者需持有鎖）
+
+        Returns:
+            (閒置連線或 None（表示取得名額，需建立新連線）, 是否等待過)
+        """
+        if self.closed:
+            raise pool.PoolError("連接池已關閉")
+        # 已有等待者時不插隊
+        if not self._waiters:
+            if self._idle:
+                return self._idle.pop(), False
+            if self._size < self.maxconn:
+                self._size += 1
+                return None, False
+
+        waiter = _Waiter(self._lock)
+        self._waiters.append(waiter)
+        while waiter.pooled is None and not waiter.may_create:
+            remaining = deadline - time.monotonic()
+            if self.closed or remaining <= 0:
+                self._waiters.remove(waiter)
+                if self.closed:
+                    raise pool.PoolError("連接池已關閉")
+                self._counters['timeouts'] += 1
+                raise PoolTimeout(
+                    f"{timeout:.1f}s 內沒有可用的資料庫連線（上限 {self.maxconn}，使用中 {len(self._in_use)}）"
+                )
+            waiter.cond.wait(remaining)
+        return waiter.pooled, True
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        取出一條連線
+
+        Args:
+            timeout: 最多等待秒數（預設為 acquire_timeout）
+
+        Returns:
+            psycopg2 連線
+
+        Raises:
+            PoolTimeout: 等待逾時
+            psycopg2.OperationalError: 建立新連線失敗
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        while True:
+            with self._lock:
+                pooled, did_wait = self._acquire(deadline, timeout)
+            waited = waited or did_wait
+
+            now = time.monotonic()
+            if pooled is None:
+                pooled = self._connect()
+            elif not self._usable(pooled, now):
+                continue
+
+            pooled.last_used = now
+            with self._lock:
+                self._in_use[id(pooled.conn)] = pooled
+                self._counters['acquires'] += 1
+                if waited:
+                    self._counters['waits'] += 1
+                self._wait_times.append((now - start) * 1000)
+            return pooled.conn
+
+    def putconn(self, conn, close: bool = False):
+        """
+        歸還連線（未結束的交易會回滾）
+
+        Args:
+            conn: getconn() 取得的連線
+            close: 是否直接關閉（例如已知連線損壞）
+        """
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            raise pool.PoolError("歸還的連線不屬於此連接池")
+
+        if close or self.closed or conn.closed:
+            self._close(pooled, 'discarded_broken')
+            return
+        try:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._close(pooled, 'discarded_broken')
+                return
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+                with self._lock:
+                    self._counters['rollbacks_on_return'] += 1
+        except Exception:
+            self._close(pooled, 'discarded_broken')
+            return
+
+        now = time.monotonic()
+        # 超過最長使用時間的連線在閒置連線多於 minconn 時直接回收，否則留到下次取出時替換
+        if self._expired(pooled, now) and len(self._idle) >= self.minconn:
+            self._close(pooled, 'recycled_lifetime')
+            return
+        pooled.last_used = now
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.pooled = pooled
+                waiter.cond.notify()
+            else:
+                self._idle.append(pooled)
+
+    def closeall(self):
+        """關閉所有閒置連線並喚醒等待者，之後歸還的連線也會關閉"""
+        with self._lock:
+            self.closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            for waiter in self._waiters:
+                waiter.cond.notify()
+        for pooled in idle:
+            self._close(pooled, 'discarded_broken')
+
+    # ------------------------------------------------------------------
+    # 指標
+    # ------------------------------------------------------------------
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取連接池指標
+
+        Returns:
+            連線數（上限、使用中、閒置、等待中）、取用等待時間（最近 WAIT_WINDOW 次的 p50/p99/max）與各項計數
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            wait_times = sorted(self._wait_times)
+            in_use = len(self._in_use)
+            idle = len(self._idle)
+            size = self._size
+            waiting = len(self._waiters)
+
+        def percentile(p: float) -> float:
+            if not wait_times:
+                return 0.0
+            return round(wait_times[min(len(wait_times) - 1, int(len(wait_times) * p))], 3)
+
+        return {
+            'max_connections': self.maxconn,
+            'min_connections': self.minconn,
+            'size': size,
+            'in_use': in_use,
+            'idle': idle,
+            'waiting': waiting,
+            'acquire_timeout': self.acquire_timeout,
+            'max_lifetime': self.max_lifetime,
+            'statement_timeout_ms': self.statement_timeout_ms,
+            'wait_ms': {
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'max': round(wait_times[-1], 3) if wait_times else 0.0
+            },
+            **counters
+        }
+
+
+def set_statement_timeout(conn, timeout_ms: int):
+    """
+    調整目前交易的語句逾時（SET LOCAL，交易結束後恢復連接池的預設值）
+
+    Args:
+        conn: 連線（需在交易中，psycopg2 預設在第一個語句前自動開始交易）
+        timeout_ms: 逾時毫秒數（0 表示不限制）
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout_ms)),))
@@ -0,0 +1,210 @@
+# 預備語句（prepared statement）登錄表
+#
+# 熱門 SQL（預測記錄寫入、檢測記錄 upsert、使用者啟用狀態、檢測歷史查詢與總數）每小時執行數千次，
+# 以文字送出時 PostgreSQL 每次都要重新解析與規劃。登錄表為每個語句命名，在每條連線上第一次使用時 PREPARE，
+# 之後以 EXECUTE 名稱執行：
+#   - 已準備的語句以連線物件為鍵記錄（弱引用），重新連線或連接池替換連線後自動重新 PREPARE
+#   - 伺服器端語句遺失（DISCARD ALL 等）時 EXECUTE 拋出 InvalidSqlStatementName，登錄表同步移除記錄，
+#     DatabaseManager.execute_prepared() 會重新 PREPARE 並重試一次
+#   - 記錄每個語句的呼叫次數、累計 / 最長耗時、PREPARE 次數與錯誤次數，作為輕量的查詢分析器
+#
+# 本模組不建立資料庫連線，可在模組層級登錄語句（core_db_manager 匯入時即連線）
+
+import re
+import time
+import logging
+import threading
+import weakref
+from typing import Optional, Any, Dict, Iterable, Sequence
+
+import psycopg2
+import psycopg2.errors
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+_NAME_PATTERN = re.compile(r'^[a-z_][a-z0-9_]*$')
+_PLACEHOLDER_PATTERN = re.compile(r'%%|%s')
+
+
+class PreparedStatement:
+    """已登錄的語句：名稱、原始 SQL（%s 佔位符）與送往伺服器的 PREPARE / EXECUTE 文字"""
+
+    __slots__ = ('name', 'sql', 'param_types', 'param_count', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name: str, sql: str, param_types: Optional[Sequence[str]] = None):
+        self.name = name
+        self.sql = sql
+        self.param_types = tuple(param_types) if param_types else None
+
+        # %s 依序改為 $1、$2 ...，%% 還原為 %（EXECUTE 的參數才由 psycopg2 代入）
+        count = 0
+
+        def placeholder(match):
+            nonlocal count
+            if match.group(0) == '%%':
+                return '%'
+            count += 1
+            return f"${count}"
+
+        body = _PLACEHOLDER_PATTERN.sub(placeholder, sql.strip())
+        self.param_count = count
+        if self.param_types is not None and len(self.param_types) != count:
+            raise ValueError(f"語句 {name} 有 {count} 個參數，但宣告了 {len(self.param_types)} 個型別")
+
+        if self.param_types:
+            self.prepare_sql = f"PREPARE {name} ({', '.join(self.param_types)}) AS {body}"
+            # 陣列等參數需明確轉型（EXECUTE 的參數只接受可隱式轉換的型別）
+            args = ', '.join(f"%s::{param_type}" for param_type in self.param_types)
+        else:
+            self.prepare_sql = f"PREPARE {name} AS {body}"
+            args = ', '.join(['%s'] * count)
+        self.execute_sql = f"EXECUTE {name} ({args})" if count else f"EXECUTE {name}"
+
+
+class PreparedStatementRegistry:
+    """
+    預備語句登錄表（執行緒安全）
+
+    每條連線同一時間只由一個執行緒使用（連接池保證），連線的已準備集合不需加鎖；
+    登錄與統計以鎖保護。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements: Dict[str, PreparedStatement] = {}
+        self._prepared: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # 連線 -> 已準備的語句名稱
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def register(self, name: str, sql: str, param_types: Optional[Iterable[str]] = None) -> str:
+        """
+        登錄語句（相同名稱與 SQL 重複登錄時直接返回）
+
+        Args:
+            name: 語句名稱（小寫英數與底線，在伺服器端作為 PREPARE 名稱）
+            sql: 以 %s 為佔位符的 SQL
+            param_types: 參數型別（例如 'integer[]'），省略時由伺服器推斷
+
+        Returns:
+            語句名稱
+
+        Raises:
+            ValueError: 名稱格式錯誤，或同名語句的 SQL 不同
+        """
+        existing = self._statements.get(name)
+        if existing is not None and existing.sql == sql:
+            return name
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"語句名稱只能包含小寫英數與底線: {name}")
+        statement = PreparedStatement(name, sql, param_types)
+        with self._lock:
+            existing = self._statements.get(name)
+            if existing is not None and existing.sql != sql:
+                raise ValueError(f"語句 {name} 已以不同的 SQL 登錄")
+            self._statements[name] = statement
+            self._stats.setdefault(name, {
+                'calls': 0,
+                'errors': 0,
+                'prepares': 0,
+                'invalidated': 0,
+                'rows': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0
+            })
+        return name
+
+    def _prepared_names(self, conn) -> set:
+        with self._lock:
+            names = self._prepared.get(conn)
+            if names is None:
+                names = set()
+                self._prepared[conn] = names
+            return names
+
+    def execute(self, cursor, name: str, params: Optional[Sequence[Any]] = None):
+        """
+        在遊標所屬的連線上執行已登錄的語句（該連線第一次使用時先 PREPARE）
+
+        結果與 cursor.execute() 相同，由呼叫者 fetch；失敗時拋出原本的 psycopg2 例外
+
+        Args:
+            cursor: psycopg2 遊標
+            name: register() 登錄的名稱
+            params: 參數（數量需與 %s 相同）
+
+        Raises:
+            ValueError: 語句未登錄或參數數量不符
+        """
+        statement = self._statements.get(name)
+        if statement is None:
+            raise ValueError(f"語句未登錄: {name}")
+        params = tuple(params or ())
+        if len(params) != statement.param_count:
+            raise ValueError(f"語句 {name} 需要 {statement.param_count} 個參數，收到 {len(params)} 個")
+
+        prepared = self._prepared_names(cursor.connection)
+        start = time.perf_counter()
+        prepared_now = False
+        try:
+            if name not in prepared:
+                cursor.execute(statement.prepare_sql)
+                prepared.add(name)
+                prepared_now = True
+            cursor.execute(statement.execute_sql, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # 伺服器端已沒有此語句（連線被重設），下次使用時重新 PREPARE
+            prepared.discard(name)
+            self._record(name, start, prepared_now, error=True, invalidated=True)
+            raise
+        except Exception:
+            self._record(name, start, prepared_now, error=True)
+            raise
+        self._record(name, start, prepared_now, rows=max(cursor.rowcount, 0))
+
+    def _record(self, name: str, start: float, prepared: bool, rows: int = 0,
+                error: bool = False, invalidated: bool = False):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            stats = self._stats[name]
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['rows'] += rows
+            if prepared:
+                stats['prepares'] += 1
+            if error:
+                stats['errors'] += 1
+            if invalidated:
+                stats['invalidated'] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取各語句的執行統計（依累計耗時排序）
+
+        Returns:
+            已準備語句的連線數，以及每個語句的呼叫次數、累計 / 平均 / 最長耗時、PREPARE 次數、錯誤次數與影響筆數
+        """
+        with self._lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+            connections = len(self._prepared)
+        per_statement = {}
+        for name, values in sorted(stats.items(), key=lambda item: item[1]['total_ms'], reverse=True):
+            calls = values['calls']
+            per_statement[name] = {
+                **values,
+                'total_ms': round(values['total_ms'], 3),
+                'max_ms': round(values['max_ms'], 3),
+                'avg_ms': round(values['total_ms'] / calls, 3) if calls else 0.0
+            }
+        return {
+            'connections': connections,
+            'statements': per_statement
+        }
+
+
+# 全局登錄表（DatabaseManager.statements）
+statements = PreparedStatementRegistry()
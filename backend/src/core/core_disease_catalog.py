@@ -0,0 +1,383 @@
+"""
+病害知識庫目錄
+程序內常駐的 disease_library 快照：啟動後第一次查詢時整表載入一次，
+以 disease_name / chinese_name / english_name（不區分大小寫）建立索引，查詢完全在記憶體中完成
+
+更新方式：
+- 增量：每隔 refresh_interval 秒以 COUNT(*) + SUM(id) + MAX(updated_at) 檢查一次（disease_library 有 updated_at 觸發器），
+  只有 updated_at 變新時才讀取變更的記錄；筆數或 id 總和改變（新增/刪除）時整表重新載入
+- 即時：訂閱 Redis 頻道（預設 disease_catalog:invalidate），收到任何訊息後下一次查詢立即檢查，
+  例如修改資料後執行 `redis-cli PUBLISH disease_catalog:invalidate 1` 或呼叫 publish_invalidation()；
+  訂閱使用專用連線（redis_manager.pubsub()），只有連線中斷後才額外檢查一次
+"""
+
+import os
+import time
+import threading
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from src.core.core_db_manager import db
+from src.core.core_redis_manager import redis_manager
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 目錄載入的欄位（與 DetectionQueries.get_disease_info 相同）
+CATALOG_COLUMNS = """
+    id, disease_name, chinese_name, english_name, causes, features,
+    symptoms, pesticides, management_measures, target_crops,
+    severity_levels, prevention_tips, reference_links,
+    created_at, updated_at, is_active
+"""
+
+
+class _CatalogSnapshot:
+    """不可變的目錄快照（更新時整個替換，讀取端不需要加鎖）"""
+
+    __slots__ = ('rows', 'by_name', 'by_chinese', 'by_english', 'row_count', 'id_sum', 'max_updated_at')
+
+    def __init__(self, rows: Dict[int, Dict[str, Any]]):
+        self.rows = rows
+        self.row_count = len(rows)
+        self.id_sum = sum(rows)
+        self.max_updated_at = max((row['updated_at'] for row in rows.values() if row.get('updated_at')), default=None)
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        self.by_chinese: Dict[str, Dict[str, Any]] = {}
+        self.by_english: Dict[str, Dict[str, Any]] = {}
+        # 依 id 由小到大建立索引，同名時保留 id 最小的一筆
+        for row_id in sorted(rows):
+            row = rows[row_id]
+            if not row.get('is_active'):
+                continue
+            for index, field in ((self.by_name, 'disease_name'), (self.by_chinese, 'chinese_name'),
+                                 (self.by_english, 'english_name')):
+                value = row.get(field)
+                if value:
+                    index.setdefault(value.lower(), row)
+
+    @property
+    def active_count(self) -> int:
+        return len(self.by_name)
+
+
+class DiseaseCatalog:
+    """程序內病害知識庫目錄（全局實例：disease_catalog）"""
+
+    # 首次載入失敗後的重試間隔（秒）
+    LOAD_RETRY_SECONDS = 5.0
+    # 訂閱執行緒每次等待訊息的秒數（同時是送出連線健康檢查 PING 的最短間隔）
+    LISTEN_POLL_SECONDS = 10.0
+
+    def __init__(
+        self,
+        db_manager=None,
+        refresh_interval: float = 60.0,
+        channel: str = 'disease_catalog:invalidate',
+        use_pubsub: bool = True
+    ):
+        """
+        初始化病害知識庫目錄（不會立即連接資料庫，第一次查詢時才載入）
+
+        Args:
+            db_manager: 提供 execute_query() 的資料庫管理器（預設為全局 db）
+            refresh_interval: 增量檢查間隔（秒），0 表示每次查詢都檢查
+            channel: Redis 失效通知頻道
+            use_pubsub: 是否訂閱 Redis 失效通知
+        """
+        self.db = db_manager or db
+        self.refresh_interval = refresh_interval
+        self.channel = channel
+        self.use_pubsub = use_pubsub
+
+        self._snapshot: Optional[_CatalogSnapshot] = None
+        self._refresh_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._last_check = 0.0
+        self._last_success = 0.0
+        self._invalidated = False
+        self._listener_pid: Optional[int] = None
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'full_loads': 0,
+            'incremental_refreshes': 0,
+            'rows_refreshed': 0,
+            'checks': 0,
+            'refresh_errors': 0,
+            'invalidations_received': 0,
+            'listener_disconnects': 0
+        }
+        self._last_load_ms = 0.0
+        self._loaded_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # 查詢
+    # ------------------------------------------------------------------
+
+    def lookup(self, name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        依病害名稱、中文名稱或英文名稱查詢病害資訊（不區分大小寫）
+
+        Args:
+            name: 病害名稱（例如 Potato__Late_blight、馬鈴薯晚疫病）
+
+        Returns:
+            病害資訊字典（副本）或 None
+        """
+        if not name:
+            return None
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return None
+        key = name.lower()
+        row = snapshot.by_name.get(key) or snapshot.by_chinese.get(key) or snapshot.by_english.get(key)
+        with self._metrics_lock:
+            self._counters['hits' if row is not None else 'misses'] += 1
+        return dict(row) if row is not None else None
+
+    def lookup_many(self, names: Iterable[Optional[str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        批次查詢病害資訊
+
+        Args:
+            names: 病害名稱列表（可重複）
+
+        Returns:
+            {小寫名稱: 病害資訊字典}，未找到的名稱不在字典中
+        """
+        found: Dict[str, Dict[str, Any]] = {}
+        for name in {name.lower() for name in names if name}:
+            row = self.lookup(name)
+            if row is not None:
+                found[name] = row
+        return found
+
+    def _current_snapshot(self) -> Optional[_CatalogSnapshot]:
+        """返回目前快照；首次使用時載入，到期或收到失效通知時做增量檢查"""
+        self._ensure_listener()
+        snapshot = self._snapshot
+        now = time.time()
+        due = self._invalidated or now - self._last_check >= self.refresh_interval
+        if snapshot is None:
+            # 首次載入失敗後短時間內不重試，避免資料庫中斷時每個請求都等待連接逾時
+            if self._last_check and now - self._last_check < self.LOAD_RETRY_SECONDS:
+                return None
+            # 首次載入：其他執行緒等待同一次載入完成
+            with self._refresh_lock:
+                if self._snapshot is None:
+                    self._refresh()
+            return self._snapshot
+        if due and self._refresh_lock.acquire(blocking=False):
+            # 只由一個執行緒檢查，其他執行緒繼續使用目前快照
+            try:
+                self._refresh()
+            finally:
+                self._refresh_lock.release()
+        return self._snapshot
+
+    # ------------------------------------------------------------------
+    # 載入與更新
+    # ------------------------------------------------------------------
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        立即檢查並更新目錄
+
+        Args:
+            force: True 時整表重新載入
+
+        Returns:
+            是否成功
+        """
+        with self._refresh_lock:
+            return self._refresh(force=force)
+
+    def _refresh(self, force: bool = False) -> bool:
+        """增量檢查並更新（呼叫者需持有 _refresh_lock）"""
+        self._last_check = time.time()
+        self._invalidated = False
+        snapshot = self._snapshot
+        try:
+            if snapshot is None or force:
+                self._full_load()
+                return True
+
+            with self._metrics_lock:
+                self._counters['checks'] += 1
+            state = self.db.execute_query(
+                "SELECT COUNT(*), COALESCE(SUM(id), 0), MAX(updated_at) FROM disease_library",
+                fetch_one=True
+            )
+            row_count, id_sum, max_updated_at = (state[0], state[1], state[2]) if state else (0, 0, None)
+
+            if row_count != snapshot.row_count or id_sum != snapshot.id_sum:
+                # 有新增或刪除的記錄：整表重新載入（表很小）
+                self._full_load()
+            elif max_updated_at is not None and (snapshot.max_updated_at is None
+                                                 or max_updated_at > snapshot.max_updated_at):
+                self._incremental_load(snapshot)
+            self._last_success = time.time()
+            return True
+        except Exception as e:
+            with self._metrics_lock:
+                self._counters['refresh_errors'] += 1
+            # 保留舊快照繼續服務；首次載入失敗時下一次查詢會再試
+            logger.warning(f"⚠️  病害知識庫目錄更新失敗: {str(e)}")
+            return False
+
+    def _full_load(self):
+        start = time.perf_counter()
+        result = self.db.execute_query(
+            f"SELECT {CATALOG_COLUMNS} FROM disease_library",
+            dict_cursor=True
+        ) or []
+        rows = {row['id']: dict(row) for row in result}
+        self._snapshot = _CatalogSnapshot(rows)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        now = time.time()
+        self._loaded_at = now
+        self._last_success = now
+        with self._metrics_lock:
+            self._counters['full_loads'] += 1
+            self._last_load_ms = elapsed_ms
+        logger.info(f"✅ 病害知識庫目錄已載入: {self._snapshot.active_count} 筆有效 / {len(rows)} 筆，耗時 {elapsed_ms:.1f}ms")
+
+    def _incremental_load(self, snapshot: _CatalogSnapshot):
+        result = self.db.execute_query(
+            f"SELECT {CATALOG_COLUMNS} FROM disease_library WHERE updated_at > %s",
+            (snapshot.max_updated_at,),
+            dict_cursor=True
+        ) if snapshot.max_updated_at is not None else self.db.execute_query(
+            f"SELECT {CATALOG_COLUMNS} FROM disease_library",
+            dict_cursor=True
+        )
+        result = result or []
+        rows = dict(snapshot.rows)
+        for row in result:
+            rows[row['id']] = dict(row)
+        self._snapshot = _CatalogSnapshot(rows)
+        with self._metrics_lock:
+            self._counters['incremental_refreshes'] += 1
+            self._counters['rows_refreshed'] += len(result)
+        logger.info(f"🔄 病害知識庫目錄增量更新: {len(result)} 筆")
+
+    # ------------------------------------------------------------------
+    # Redis 失效通知
+    # ------------------------------------------------------------------
+
+    def invalidate(self):
+        """標記目錄需要在下一次查詢時檢查更新（本程序）"""
+        self._invalidated = True
+
+    def publish_invalidation(self) -> bool:
+        """
+        通知所有程序的目錄檢查更新（修改 disease_library 後呼叫）
+
+        Returns:
+            是否成功發佈（Redis 不可用時只標記本程序）
+        """
+        self.invalidate()
+        if redis_manager.client is None:
+            return False
+        try:
+            redis_manager.client.publish(self.channel, str(time.time()))
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️  發佈病害知識庫失效通知失敗: {str(e)}")
+            return False
+
+    def _ensure_listener(self):
+        """在目前程序中啟動訂閱執行緒（gunicorn fork 後每個 worker 各自啟動一次）"""
+        pid = os.getpid()
+        if not self.use_pubsub or self._listener_pid == pid or redis_manager.client is None:
+            return
+        self._listener_pid = pid
+        thread = threading.Thread(target=self._listen, name='disease-catalog-listener', daemon=True)
+        thread.start()
+
+    def _listen(self):
+        """
+        訂閱失效通知（專用連線，不套用 socket_timeout）
+
+        以 get_message(timeout=LISTEN_POLL_SECONDS) 輪詢：閒置時逾時返回 None 屬於正常情況；
+        只有連線實際中斷時才標記需要檢查（中斷期間可能漏掉通知），並以指數退避重新訂閱
+        """
+        backoff = 1.0
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis_manager.pubsub(ignore_subscribe_messages=True)
+                if pubsub is None:
+                    return
+                pubsub.subscribe(self.channel)
+                if backoff > 1.0:
+                    logger.info("✅ 病害知識庫失效通知已重新訂閱")
+                backoff = 1.0
+                while True:
+                    message = pubsub.get_message(timeout=self.LISTEN_POLL_SECONDS)
+                    if message and message.get('type') == 'message':
+                        self._invalidated = True
+                        with self._metrics_lock:
+                            self._counters['invalidations_received'] += 1
+            except Exception as e:
+                logger.warning(f"⚠️  病害知識庫失效通知訂閱中斷，{backoff:.0f}s 後重試: {str(e)}")
+                # 訂閱中斷期間可能漏掉通知：重新訂閱前先標記為需要檢查
+                self._invalidated = True
+                with self._metrics_lock:
+                    self._counters['listener_disconnects'] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    # ------------------------------------------------------------------
+    # 指標
+    # ------------------------------------------------------------------
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取目錄指標
+
+        Returns:
+            載入時間、筆數、距上次成功檢查的秒數（staleness）、命中率與更新次數
+        """
+        snapshot = self._snapshot
+        now = time.time()
+        with self._metrics_lock:
+            counters = dict(self._counters)
+            lookups = counters['hits'] + counters['misses']
+            return {
+                'loaded': snapshot is not None,
+                'entries': snapshot.active_count if snapshot else 0,
+                'rows': snapshot.row_count if snapshot else 0,
+                'max_updated_at': snapshot.max_updated_at.isoformat()
+                if snapshot and hasattr(snapshot.max_updated_at, 'isoformat') else None,
+                'last_load_ms': round(self._last_load_ms, 2),
+                'loaded_seconds_ago': round(now - self._loaded_at, 1) if self._loaded_at else None,
+                'staleness_seconds': round(now - self._last_success, 1) if self._last_success else None,
+                'refresh_interval': self.refresh_interval,
+                'pubsub_listening': self._listener_pid == os.getpid(),
+                'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+                **counters
+            }
+
+
+def _refresh_interval_from_env() -> float:
+    try:
+        return float(os.getenv('DISEASE_CATALOG_REFRESH_SECONDS', '60') or 60)
+    except ValueError:
+        return 60.0
+
+
+# 全局病害知識庫目錄實例
+disease_catalog = DiseaseCatalog(refresh_interval=_refresh_interval_from_env())
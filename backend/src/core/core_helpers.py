@@ -3,8 +3,9 @@
 提供認證相關和 API 日誌記錄的輔助函數
 """
 
-from flask import request, session
-from src.core.core_db_manager import db, APILogger
+from flask import request, session, g
+from src.core.core_db_manager import APILogger
+from src.core.core_user_status_cache import user_status_cache
 from typing import Optional
 import logging
 
@@ -19,16 +20,23 @@ logger = logging.getLogger(__name__)
 # ==================== 認證相關輔助函數 ====================
 
 def get_user_id_from_session():
-    """從 session 獲取使用者 ID"""
+    """
+    從 session 獲取使用者 ID（僅限仍為啟用狀態的使用者）
+    
+    啟用狀態由 user_status_cache 提供（短 TTL，停用後最遲 USER_STATUS_CACHE_TTL 秒生效），
+    同一請求內重複呼叫時直接返回第一次的結果
+    """
     if "user_id" not in session:
         return None
+    if "session_user_id" in g:
+        return g.session_user_id
     try:
-        result = db.execute_query(
-            "SELECT id FROM users WHERE id = %s AND is_active = TRUE",
-            (session["user_id"],),
-            fetch_one=True
-        )
-        return result[0] if result else None
+        user_id = session["user_id"]
+        active = user_status_cache.is_active(user_id)
+        resolved = user_id if active else None
+        if active is not None:
+            g.session_user_id = resolved
+        return resolved
     except Exception as e:
         logger.error(f"❌ 獲取使用者 ID 失敗: {str(e)}")
         return None
@@ -0,0 +1,346 @@
+# 日誌批次寫入（log shipping）：api_logs / activity_logs / error_logs / performance_logs 經環形緩衝區由背景執行緒批次寫入
+
+import os
+import time
+import atexit
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 各日誌表的寫入欄位（created_at 以呼叫當下的 epoch 秒寫入）
+LOG_TABLE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'api_logs': (
+        'user_id', 'endpoint', 'method', 'status_code', 'execution_time_ms',
+        'ip_address', 'user_agent', 'error_message', 'request_body_size', 'response_body_size'
+    ),
+    'activity_logs': (
+        'user_id', 'action_type', 'resource_type', 'resource_id', 'action_details',
+        'ip_address', 'user_agent'
+    ),
+    'error_logs': (
+        'user_id', 'error_type', 'error_message', 'error_code', 'severity',
+        'context', 'error_traceback', 'endpoint'
+    ),
+    'performance_logs': (
+        'operation_name', 'execution_time_ms', 'memory_used_mb', 'cpu_percentage',
+        'status', 'details'
+    ),
+}
+
+# 視為資料庫不可用（整批放棄、不逐筆重試）的錯誤類型
+_UNAVAILABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class LogShipper:
+    """
+    日誌批次寫入器（全局實例：log_shipper）
+
+    請求執行緒只將一列資料放入程序內環形緩衝區（deque，固定上限）即返回；
+    背景執行緒依筆數或時間觸發，以 execute_values 多列 INSERT 將每個日誌表的資料一次寫入。
+    緩衝區已滿時覆蓋最舊的資料並計入 dropped；日誌為輔助資料，資料庫不可用時整批放棄（計入 failed），
+    不溢寫、不阻塞請求。程序結束時（atexit）寫入剩餘資料。
+    """
+
+    def __init__(
+        self,
+        db_manager=None,
+        enabled: bool = True,
+        buffer_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval_ms: int = 1000
+    ):
+        """
+        初始化日誌寫入器
+
+        Args:
+            db_manager: 提供 get_connection() 的資料庫管理器（預設為全局 db，第一次寫入時才取得）
+            enabled: 是否啟用背景批次寫入；False 時在呼叫者執行緒逐筆同步寫入
+            buffer_size: 緩衝區上限（所有日誌表合計筆數），超過時覆蓋最舊的資料
+            batch_size: 緩衝區累積到此筆數時立即喚醒背景執行緒；亦為單一 INSERT 語句的最大列數
+            flush_interval_ms: 最長等待時間，到期即寫入（毫秒）
+        """
+        self._db = db_manager
+        self.enabled = enabled
+        self.buffer_size = max(1, buffer_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(10, flush_interval_ms) / 1000.0
+
+        self._counters = {
+            'flushes': 0,
+            'failed_flushes': 0,
+            'fallback_rows': 0
+        }
+        self._flush_latency = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0, 'last_size': 0}
+        self._reset_state()
+
+        atexit.register(self.shutdown)
+        if hasattr(os, 'register_at_fork'):
+            # gunicorn --preload：子程序不繼承父程序的緩衝資料與背景執行緒
+            os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        """初始化（或在 fork 後的子程序中重設）緩衝區、鎖與背景執行緒狀態"""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 背景執行緒與 flush()/shutdown() 不同時寫入
+        self._buffer: deque = deque(maxlen=self.buffer_size)
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._table_counters = {
+            table: {'buffered': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+            for table in LOG_TABLE_COLUMNS
+        }
+
+    @property
+    def db(self):
+        if self._db is None:
+            from src.core.core_db_manager import db
+            self._db = db
+        return self._db
+
+    # ------------------------------------------------------------------
+    # 請求執行緒 API
+    # ------------------------------------------------------------------
+
+    def ship(self, table: str, values: Tuple[Any, ...]) -> bool:
+        """
+        寫入一列日誌
+
+        Args:
+            table: 日誌表名稱（見 LOG_TABLE_COLUMNS）
+            values: 依 LOG_TABLE_COLUMNS[table] 順序排列的欄位值
+
+        Returns:
+            是否已放入緩衝區（停用時為同步寫入是否成功）
+        """
+        row = values + (time.time(),)
+        if not self.enabled or self._stop_event.is_set():
+            return self._write_sync(table, row)
+
+        if self._worker is None:
+            self._start_worker()
+        with self._lock:
+            if len(self._buffer) == self.buffer_size:
+                # 環形緩衝區已滿：append 會覆蓋最舊的一筆
+                self._table_counters[self._buffer[0][0]]['dropped'] += 1
+            self._buffer.append((table, row))
+            self._table_counters[table]['buffered'] += 1
+            depth = len(self._buffer)
+        if depth >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        立即寫入緩衝區中的所有日誌（在呼叫者執行緒執行）
+
+        Args:
+            timeout: 等待背景執行緒完成目前批次的最長秒數
+
+        Returns:
+            是否已寫入（或放棄）所有資料
+        """
+        if not self._flush_lock.acquire(timeout=timeout):
+            return False
+        try:
+            self._flush_once()
+            return True
+        finally:
+            self._flush_lock.release()
+
+    def shutdown(self, timeout: float = 5.0):
+        """
+        停止寫入器並寫入剩餘資料
+
+        Args:
+            timeout: 等待背景執行緒結束的秒數
+        """
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=timeout)
+        self.flush(timeout=timeout)
+        logger.info("🧹 日誌寫入器已停止")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取寫入器指標
+
+        Returns:
+            緩衝區深度、各日誌表的緩衝/寫入/覆蓋/失敗筆數、寫入延遲
+        """
+        with self._lock:
+            depth = len(self._buffer)
+            tables = {table: dict(counters) for table, counters in self._table_counters.items()}
+            latency = dict(self._flush_latency)
+            counters = dict(self._counters)
+        return {
+            'enabled': self.enabled,
+            'buffer_depth': depth,
+            'buffer_size': self.buffer_size,
+            'batch_size': self.batch_size,
+            'flush_interval_ms': int(self.flush_interval * 1000),
+            'dropped': sum(t['dropped'] for t in tables.values()),
+            'failed': sum(t['failed'] for t in tables.values()),
+            'flush_latency': {
+                'count': latency['count'],
+                'avg_ms': round(latency['total_ms'] / latency['count'], 2) if latency['count'] else 0.0,
+                'max_ms': round(latency['max_ms'], 2),
+                'last_ms': round(latency['last_ms'], 2),
+                'last_size': latency['last_size']
+            },
+            'tables': tables,
+            **counters
+        }
+
+    # ------------------------------------------------------------------
+    # 背景執行緒
+    # ------------------------------------------------------------------
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, name='log-shipper', daemon=True)
+            self._worker.start()
+        logger.info(f"✅ 日誌寫入器已啟動 (buffer={self.buffer_size}, batch={self.batch_size}, "
+                    f"interval={int(self.flush_interval * 1000)}ms)")
+
+    def _run(self):
+        """背景寫入主迴圈"""
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self._flush_lock:
+                    self._flush_once()
+            except Exception as e:
+                logger.error(f"❌ 日誌背景寫入未預期錯誤: {str(e)}", exc_info=True)
+
+    def _flush_once(self):
+        """取出緩衝區的所有資料，依日誌表分組寫入（呼叫者需持有 _flush_lock）"""
+        with self._lock:
+            if not self._buffer:
+                return
+            pending = self._buffer
+            self._buffer = deque(maxlen=self.buffer_size)
+
+        grouped: Dict[str, List[tuple]] = {}
+        for table, row in pending:
+            grouped.setdefault(table, []).append(row)
+
+        start = time.perf_counter()
+        failed = False
+        for table, rows in grouped.items():
+            written, lost = self._write_table(table, rows)
+            failed = failed or lost > 0
+            with self._lock:
+                self._table_counters[table]['written'] += written
+                self._table_counters[table]['failed'] += lost
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._counters['flushes'] += 1
+            if failed:
+                self._counters['failed_flushes'] += 1
+            self._flush_latency['count'] += 1
+            self._flush_latency['total_ms'] += elapsed_ms
+            self._flush_latency['max_ms'] = max(self._flush_latency['max_ms'], elapsed_ms)
+            self._flush_latency['last_ms'] = elapsed_ms
+            self._flush_latency['last_size'] = len(pending)
+
+    def _write_table(self, table: str, rows: List[tuple]) -> Tuple[int, int]:
+        """
+        以單一交易將一個日誌表的資料寫入（每 batch_size 列一個多列 INSERT 語句）
+        單筆資料錯誤（例如違反 CHECK 約束）時逐筆重試，只放棄有問題的資料
+
+        Returns:
+            （寫入筆數, 放棄筆數）
+        """
+        try:
+            self._insert_rows(table, rows)
+            return len(rows), 0
+        except _UNAVAILABLE_ERRORS as e:
+            logger.error(f"❌ 資料庫不可用，放棄 {len(rows)} 筆 {table} 日誌: {str(e)}")
+            return 0, len(rows)
+        except Exception as e:
+            if len(rows) == 1:
+                logger.error(f"❌ 寫入 {table} 日誌失敗: {str(e)}")
+                return 0, 1
+            logger.warning(f"⚠️  批次寫入 {table} 失敗，改為逐筆寫入: {str(e)}")
+
+        with self._lock:
+            self._counters['fallback_rows'] += len(rows)
+        written = 0
+        for row in rows:
+            try:
+                self._insert_rows(table, [row])
+                written += 1
+            except _UNAVAILABLE_ERRORS as e:
+                logger.error(f"❌ 資料庫不可用，放棄 {table} 日誌: {str(e)}")
+                break
+            except Exception as e:
+                logger.error(f"❌ 寫入 {table} 日誌失敗: {str(e)}")
+        return written, len(rows) - written
+
+    def _insert_rows(self, table: str, rows: List[tuple]):
+        columns = LOG_TABLE_COLUMNS[table]
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        f"INSERT INTO {table} ({', '.join(columns)}, created_at) VALUES %s",
+                        rows,
+                        template='(' + ', '.join(['%s'] * len(columns)) + ', to_timestamp(%s))',
+                        page_size=self.batch_size
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _write_sync(self, table: str, row: tuple) -> bool:
+        """停用背景寫入（或已停止）時在呼叫者執行緒寫入單筆資料"""
+        try:
+            self._insert_rows(table, [row])
+            with self._lock:
+                self._table_counters[table]['written'] += 1
+            return True
+        except Exception as e:
+            with self._lock:
+                self._table_counters[table]['failed'] += 1
+            logger.error(f"❌ 寫入 {table} 日誌失敗: {str(e)}")
+            return False
+
+
+def _shipper_from_env() -> LogShipper:
+    def env_int(name: str, default: int) -> int:
+        try:
+            return int(os.getenv(name, str(default)) or default)
+        except ValueError:
+            return default
+
+    return LogShipper(
+        enabled=os.getenv('ENABLE_LOG_SHIPPER', 'true').lower() == 'true',
+        buffer_size=env_int('LOG_SHIPPER_BUFFER_SIZE', 10000),
+        batch_size=env_int('LOG_SHIPPER_BATCH_SIZE', 500),
+        flush_interval_ms=env_int('LOG_SHIPPER_FLUSH_MS', 1000)
+    )
+
+
+# 全局日誌寫入器實例
+log_shipper = _shipper_from_env()
@@ -1,13 +1,34 @@
 # Redis 本地快取管理器
+#
+# 連線由明確的連線池（BlockingConnectionPool）管理，每個操作只有一次往返（不再先送 PING）；
+# 連線失敗由斷路器處理：連續失敗達門檻後直接返回預設值（不等待 socket 逾時），
+# 經過 reset_timeout 秒後放行一個探測請求（half-open），成功即恢復
+#
+# 程序內快取（core_cache_backend.MemoryCacheBackend）有兩個用途：
+#   - Redis 不可用（未連線或斷路器開啟）時作為替代快取，讀寫都改由它處理；Redis 恢復後清空，
+#     避免停機期間寫入、未被其他 worker 失效的項目遮蔽 Redis 中的新值
+#   - Redis 可用時作為近端快取：REDIS_NEAR_CACHE_PREFIXES 中的鍵（結果快取）讀取後在程序內保留
+#     REDIS_NEAR_CACHE_TTL 秒；跨 worker 讀改寫的鍵（登入嘗試次數、上傳工作狀態）不使用近端快取
+#
+# 失效不使用 KEYS（會阻塞 Redis 直到掃描完整個鍵空間）：
+#   - clear_pattern() 以 SCAN 分批掃描、UNLINK 分批刪除（值在背景執行緒釋放）
+#   - 寫入時可指定標籤（tags），鍵同時加入 tag:{標籤} 集合；invalidate_tags() 只走訪該集合，
+#     成本與群組內的鍵數成正比，與整個鍵空間大小無關（寫入時抽查並移除已過期的成員，集合不會無限增長）
 
 import redis
-import json
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+import time
 import logging
 import os
-from typing import Optional, Any, Union
+import uuid
+import threading
+from typing import Optional, Any, Union, Callable, Dict, List
 from functools import wraps
 from datetime import timedelta
 
+from .core_cache_backend import CacheBackend, MemoryCacheBackend, serialize_value, deserialize_value
+
 # 設定日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -15,77 +36,369 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# _execute() 在 Redis 不可用或連線失敗時返回的標記（與 Redis 的 None 結果區分）
+_UNAVAILABLE = object()
+
+# 預設使用近端快取的鍵前綴（結果快取，數秒內的延遲可接受）
+DEFAULT_NEAR_CACHE_PREFIXES = 'detection_result,integrated_detection,user_stats,history_count'
+
+# 標籤集合的鍵前綴
+TAG_KEY_PREFIX = 'tag'
+
+# 將成員鍵加入標籤集合，集合的過期時間延長到不短於本次寫入的鍵（0 表示有不過期的成員，集合也不過期）；
+# 同時隨機抽查 ARGV[2] 個既有成員，移除已過期或已刪除的鍵：每次寫入移除的失效成員多於加入的成員，
+# 持續寫入時集合大小維持在存活鍵數的常數倍內，invalidate_tags() 的成本不會隨歷史寫入量增長
+# KEYS[1]: 標籤集合；ARGV[1]: 過期秒數；ARGV[2]: 抽查數量；ARGV[3..]: 成員鍵
+_TAG_SCRIPT = """
+local existed = redis.call('EXISTS', KEYS[1])
+local ttl = redis.call('TTL', KEYS[1])
+if existed == 1 then
+    local sampled = redis.call('SRANDMEMBER', KEYS[1], tonumber(ARGV[2]))
+    for _, member in ipairs(sampled) do
+        if redis.call('EXISTS', member) == 0 then
+            redis.call('SREM', KEYS[1], member)
+        end
+    end
+end
+redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+local expire = tonumber(ARGV[1])
+if expire == 0 then
+    redis.call('PERSIST', KEYS[1])
+elseif existed == 0 or (ttl >= 0 and ttl < expire) then
+    redis.call('EXPIRE', KEYS[1], expire)
+end
+return 1
+"""
+
+# 每次加入標籤集合的成員數上限（Lua unpack 的參數數量有限制）
+TAG_BATCH_SIZE = 1000
+
+# 每加入一個成員抽查的既有成員數（大於 1 才能讓失效成員的移除速度超過加入速度），以及每次的抽查上限
+TAG_PRUNE_FACTOR = 2
+TAG_PRUNE_MAX_SAMPLE = 2000
+
+
+def _env_number(name: str, default: Union[int, float], cast=int) -> Union[int, float]:
+    """讀取數值環境變數（未設定、空字串或格式錯誤時返回預設值）"""
+    value = os.getenv(name, '')
+    try:
+        return cast(value) if value and value.strip() else default
+    except ValueError:
+        return default
+
+
+class CircuitBreaker:
+    """
+    連線斷路器（執行緒安全）
+
+    closed: 正常放行；連續 failure_threshold 次連線失敗後轉為 open
+    open: 直接拒絕（呼叫者返回預設值），reset_timeout 秒後轉為 half-open
+    half-open: 只放行一個探測請求，成功轉為 closed，失敗回到 open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 5.0):
+        """
+        初始化斷路器
+
+        Args:
+            name: 名稱（日誌用）
+            failure_threshold: 轉為 open 的連續失敗次數
+            reset_timeout: open 狀態持續秒數（之後放行探測請求）
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = max(0.0, reset_timeout)
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._counters = {
+            'opens': 0,
+            'probes': 0,
+            'short_circuited': 0
+        }
+
+    def allow(self) -> bool:
+        """是否放行本次請求（half-open 時只有探測請求返回 True）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_started = now
+                self._counters['probes'] += 1
+                return True
+            if self.state == self.HALF_OPEN and now - self._probe_started >= self.reset_timeout:
+                # 探測請求遲遲沒有結果（例如執行緒被中斷）：再放行一個
+                self._probe_started = now
+                self._counters['probes'] += 1
+                return True
+            self._counters['short_circuited'] += 1
+            return False
+
+    def record_success(self) -> bool:
+        """記錄成功，返回是否由 open / half-open 恢復為 closed"""
+        with self._lock:
+            self._consecutive_failures = 0
+            if self.state == self.CLOSED:
+                return False
+            self.state = self.CLOSED
+        logger.info(f"✅ {self.name} 已恢復連線，斷路器關閉")
+        return True
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._counters['opens'] += 1
+                logger.warning(f"⚠️ {self.name} 連續 {self._consecutive_failures} 次連線失敗，"
+                               f"斷路器開啟，{self.reset_timeout:.0f}s 內直接略過")
+
+    def trip(self):
+        """立即轉為 open（例如啟動時無法連線）"""
+        with self._lock:
+            self._consecutive_failures = max(self._consecutive_failures, self.failure_threshold)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._counters['opens'] += 1
+
+    def is_open(self) -> bool:
+        """目前是否拒絕請求（open 且尚未到探測時間）"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._consecutive_failures,
+                'open_for_seconds': round(time.monotonic() - self._opened_at, 1) if self.state != self.CLOSED else 0.0,
+                **self._counters
+            }
+
 
 class RedisManager:
     """
     Redis 快取管理類
     用於本地端開發的快取服務
+
+    所有操作經由連線池與斷路器執行；Redis 不可用時改由程序內快取處理（Hash 操作除外，返回預設值），
+    呼叫者不需要另外檢查。多個鍵的讀寫請使用 mget() / mset()（單次往返）。
     """
     
-    def __init__(self):
-        """初始化 Redis 連接"""
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        db: Optional[int] = None,
+        password: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        pool_timeout: Optional[float] = None,
+        socket_timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        local_backend: Optional[CacheBackend] = None,
+        near_cache_ttl: Optional[int] = None,
+        near_cache_prefixes: Optional[List[str]] = None,
+        scan_count: Optional[int] = None
+    ):
+        """
+        初始化 Redis 連線池（參數未提供時讀取對應的環境變數）
+        
+        Args:
+            host: 主機（REDIS_HOST）
+            port: 埠號（REDIS_PORT）
+            db: 資料庫編號（REDIS_DB）
+            password: 密碼（REDIS_PASSWORD）
+            max_connections: 連線池最大連線數（REDIS_MAX_CONNECTIONS）
+            pool_timeout: 連線池用盡時等待可用連線的秒數（REDIS_POOL_TIMEOUT）
+            socket_timeout: 單次命令逾時秒數（REDIS_SOCKET_TIMEOUT）
+            connect_timeout: 建立連線逾時秒數（REDIS_CONNECT_TIMEOUT）
+            failure_threshold: 斷路器開啟的連續失敗次數（REDIS_BREAKER_FAILURES）
+            reset_timeout: 斷路器開啟後多久放行探測請求（REDIS_BREAKER_RESET_SECONDS）
+            local_backend: 程序內快取（預設為 MemoryCacheBackend，容量為 REDIS_LOCAL_MAX_ENTRIES / REDIS_LOCAL_MAX_BYTES）
+            near_cache_ttl: 近端快取保留秒數，0 表示停用（REDIS_NEAR_CACHE_TTL）
+            near_cache_prefixes: 使用近端快取的鍵前綴（REDIS_NEAR_CACHE_PREFIXES，逗號分隔）
+            scan_count: SCAN / SSCAN 每次走訪的鍵數提示，也是每次 UNLINK 的批次大小（REDIS_SCAN_COUNT）
+        """
+        self.client = None
+        self.pool = None
+        self.max_connections = max_connections or _env_number('REDIS_MAX_CONNECTIONS', 32)
+        self.breaker = CircuitBreaker(
+            'Redis',
+            failure_threshold=failure_threshold or _env_number('REDIS_BREAKER_FAILURES', 3),
+            reset_timeout=reset_timeout if reset_timeout is not None else _env_number('REDIS_BREAKER_RESET_SECONDS', 5.0, float)
+        )
+        self.local = local_backend or MemoryCacheBackend(
+            max_entries=_env_number('REDIS_LOCAL_MAX_ENTRIES', 10000),
+            max_bytes=_env_number('REDIS_LOCAL_MAX_BYTES', 32 * 1024 * 1024),
+            name='memory'
+        )
+        self.near_cache_ttl = max(0, near_cache_ttl if near_cache_ttl is not None else _env_number('REDIS_NEAR_CACHE_TTL', 5))
+        if near_cache_prefixes is None:
+            near_cache_prefixes = (os.getenv('REDIS_NEAR_CACHE_PREFIXES') or DEFAULT_NEAR_CACHE_PREFIXES).split(',')
+        self.near_cache_prefixes = tuple(f"{prefix.strip().rstrip(':')}:" for prefix in near_cache_prefixes if prefix.strip())
+        self._metrics_lock = threading.Lock()
+        self._counters = {
+            'commands': 0,
+            'round_trips': 0,
+            'connection_failures': 0,
+            'errors': 0,
+            'near_hits': 0,
+            'fallback_reads': 0,
+            'fallback_writes': 0,
+            'scan_calls': 0,
+            'keys_unlinked': 0,
+            'tag_invalidations': 0
+        }
+        self.scan_count = max(10, scan_count or _env_number('REDIS_SCAN_COUNT', 1000))
+        self._use_unlink = True
+        
+        redis_host = host or os.getenv('REDIS_HOST', 'localhost')
+        redis_port = port or _env_number('REDIS_PORT', 6379)
+        redis_db = db if db is not None else _env_number('REDIS_DB', 0)
+        redis_password = password if password is not None else os.getenv('REDIS_PASSWORD', None)
         try:
-            # 獲取 Redis 配置
-            redis_host = os.getenv('REDIS_HOST', 'localhost')
-            redis_port_str = os.getenv('REDIS_PORT', '6379')
-            redis_db_str = os.getenv('REDIS_DB', '0')
-            redis_password = os.getenv('REDIS_PASSWORD', None)
-            
-            # 安全地轉換端口和數據庫編號（處理空字串）
-            try:
-                redis_port = int(redis_port_str) if redis_port_str and redis_port_str.strip() else 6379
-            except ValueError:
-                redis_port = 6379
-                
-            try:
-                redis_db = int(redis_db_str) if redis_db_str and redis_db_str.strip() else 0
-            except ValueError:
-                redis_db = 0
-            
             # 構建連接參數
             connection_params = {
                 'host': redis_host,
                 'port': redis_port,
                 'db': redis_db,
                 'decode_responses': True,
-                'socket_connect_timeout': 5,
-                'socket_timeout': 5
+                'socket_connect_timeout': connect_timeout or _env_number('REDIS_CONNECT_TIMEOUT', 1.0, float),
+                'socket_timeout': socket_timeout or _env_number('REDIS_SOCKET_TIMEOUT', 2.0, float),
+                'socket_keepalive': True,
+                # 閒置超過 30 秒的連線在取用時先檢查（取代每次操作前的 PING）
+                'health_check_interval': 30
             }
             
             # 如果有密碼（非空且非空字串），添加到連接參數
             if redis_password and redis_password.strip():
                 connection_params['password'] = redis_password.strip()
             
-            self.client = redis.Redis(**connection_params)
+            # 連線池用盡時最多等待 pool_timeout 秒，而不是無限制建立新連線
+            self.pool = redis.BlockingConnectionPool(
+                max_connections=self.max_connections,
+                timeout=pool_timeout or _env_number('REDIS_POOL_TIMEOUT', 1.0, float),
+                **connection_params
+            )
+            self.client = redis.Redis(connection_pool=self.pool)
             
             # 測試連接
             self.client.ping()
-            logger.info(f"✅ Redis 連接成功: {redis_host}:{redis_port}")
+            logger.info(f"✅ Redis 連接成功: {redis_host}:{redis_port}（連線池上限 {self.max_connections}）")
         except redis.AuthenticationError as e:
             logger.warning(f"⚠️ Redis 認證失敗: {str(e)}，將使用記憶體快取")
             logger.warning(f"   提示: 請檢查 REDIS_PASSWORD 環境變數是否正確設置")
             self.client = None
-        except redis.ConnectionError as e:
-            logger.warning(f"⚠️ Redis 連接失敗: {str(e)}，將使用記憶體快取")
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            # 保留連線池：斷路器經過 reset_timeout 後探測，Redis 稍後啟動也能自動恢復
+            logger.warning(f"⚠️ Redis 連接失敗: {str(e)}，將使用記憶體快取（每 {self.breaker.reset_timeout:g}s 重試）")
             logger.warning(f"   提示: 請檢查 REDIS_HOST 和 REDIS_PORT 環境變數")
-            self.client = None
+            self.breaker.trip()
         except Exception as e:
             logger.error(f"❌ Redis 初始化錯誤: {str(e)}")
             self.client = None
     
-    def is_available(self) -> bool:
-        """檢查 Redis 是否可用"""
-        if self.client is None:
-            return False
+    def _execute(self, operation: str, fn: Callable[[], Any], default: Any = None, commands: int = 1) -> Any:
+        """
+        經由斷路器執行一次往返
+        
+        Args:
+            operation: 操作名稱（日誌用）
+            fn: 實際呼叫 Redis 的函數
+            default: Redis 不可用或失敗時的返回值
+            commands: 本次往返包含的命令數（管線化時大於 1）
+        
+        Returns:
+            fn 的結果或 default
+        """
+        if self.client is None or not self.breaker.allow():
+            return default
+        with self._metrics_lock:
+            self._counters['commands'] += commands
+            self._counters['round_trips'] += 1
         try:
-            self.client.ping()
-            return True
-        except Exception:
-            return False
+            result = fn()
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self.breaker.record_failure()
+            with self._metrics_lock:
+                self._counters['connection_failures'] += 1
+            logger.debug(f"⚠️ Redis {operation} 連線失敗: {str(e)}")
+            return default
+        except Exception as e:
+            # 伺服器有回應（例如型別錯誤），不影響斷路器
+            self._record_success()
+            with self._metrics_lock:
+                self._counters['errors'] += 1
+            logger.error(f"❌ Redis {operation} 錯誤: {str(e)}")
+            return default
+        self._record_success()
+        return result
+    
+    def _record_success(self):
+        if self.breaker.record_success():
+            # 停機期間寫入程序內快取的項目沒有被其他 worker 失效過，恢復後改讀 Redis
+            cleared = self.local.clear()
+            logger.info(f"🧹 已清空程序內快取（{cleared} 筆），改由 Redis 提供")
+    
+    def _count(self, name: str, amount: int = 1):
+        with self._metrics_lock:
+            self._counters[name] += amount
+    
+    def _is_near(self, key: str) -> bool:
+        """鍵是否使用近端快取"""
+        return self.near_cache_ttl > 0 and key.startswith(self.near_cache_prefixes)
+    
+    def _near_expire(self, expire: Optional[int]) -> int:
+        return min(expire, self.near_cache_ttl) if expire else self.near_cache_ttl
     
+    def is_available(self) -> bool:
+        """檢查 Redis 是否可用（依斷路器狀態判斷，不發送 PING）"""
+        return self.client is not None and not self.breaker.is_open()
+    
+    def ping(self) -> bool:
+        """實際發送 PING（健康檢查用；經由斷路器，open 時直接返回 False）"""
+        return bool(self._execute('PING', lambda: self.client.ping(), False))
+
+    def pubsub(self, **kwargs):
+        """
+        建立使用專用連線的訂閱物件（長時間訂閱用）
+
+        訂閱連線不從連線池取得（不佔用 max_connections 的名額），也不套用 socket_timeout：
+        閒置的訂閱不會因讀取逾時而中斷；連線中斷時直接拋出 ConnectionError（不自動重連），
+        讓呼叫端知道期間可能漏掉訊息
+
+        Args:
+            **kwargs: 傳給 redis.client.PubSub 的參數（例如 ignore_subscribe_messages）
+
+        Returns:
+            PubSub 物件，Redis 未初始化時返回 None
+        """
+        if self.pool is None:
+            return None
+        connection_params = dict(self.pool.connection_kwargs)
+        connection_params.update({
+            'socket_timeout': None,
+            'retry': Retry(NoBackoff(), 0)
+        })
+        pool = redis.ConnectionPool(max_connections=1, **connection_params)
+        return redis.Redis(connection_pool=pool).pubsub(**kwargs)
+
     def get(self, key: str) -> Optional[Any]:
         """
-        獲取快取值
+        獲取快取值（近端快取的鍵先查程序內快取；Redis 不可用時查程序內快取）
         
         Args:
             key: 快取鍵
@@ -93,58 +406,138 @@ class RedisManager:
         Returns:
             快取值或 None
         """
-        if not self.is_available():
-            return None
-        
-        try:
-            value = self.client.get(key)
-            if value is None:
-                return None
-            
-            # 嘗試解析 JSON
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
+        near = self._is_near(key)
+        if near:
+            value = self.local.get(key)
+            if value is not None:
+                self._count('near_hits')
                 return value
-        except Exception as e:
-            logger.error(f"❌ Redis GET 錯誤: {str(e)}")
-            return None
+        raw = self._execute('GET', lambda: self.client.get(key), _UNAVAILABLE)
+        if raw is _UNAVAILABLE:
+            if near:
+                return None
+            self._count('fallback_reads')
+            return self.local.get(key)
+        if near and raw is not None:
+            self.local.set(key, raw, self.near_cache_ttl)
+        return deserialize_value(raw)
+    
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """
+        一次往返獲取多個快取值
+        
+        Args:
+            keys: 快取鍵列表
+        
+        Returns:
+            與 keys 順序相同的值列表（不存在或 Redis 不可用時為 None）
+        """
+        if not keys:
+            return []
+        results: List[Optional[Any]] = [None] * len(keys)
+        near_positions = [i for i, key in enumerate(keys) if self._is_near(key)]
+        if near_positions:
+            for i, value in zip(near_positions, self.local.mget([keys[i] for i in near_positions])):
+                results[i] = value
+            hits = sum(results[i] is not None for i in near_positions)
+            if hits:
+                self._count('near_hits', hits)
+        pending = [i for i in range(len(keys)) if results[i] is None]
+        if not pending:
+            return results
+        
+        pending_keys = [keys[i] for i in pending]
+        values = self._execute('MGET', lambda: self.client.mget(pending_keys), _UNAVAILABLE)
+        if values is _UNAVAILABLE:
+            fallback = [i for i in pending if not self._is_near(keys[i])]
+            if fallback:
+                self._count('fallback_reads', len(fallback))
+                for i, value in zip(fallback, self.local.mget([keys[i] for i in fallback])):
+                    results[i] = value
+            return results
+        near_values = {}
+        for i, raw in zip(pending, values):
+            results[i] = deserialize_value(raw)
+            if raw is not None and self._is_near(keys[i]):
+                near_values[keys[i]] = raw
+        if near_values:
+            self.local.mset(near_values, self.near_cache_ttl)
+        return results
     
-    def set(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
+    def set(self, key: str, value: Any, expire: Optional[int] = None, tags: Optional[List[str]] = None) -> bool:
         """
-        設置快取值
+        設置快取值（Redis 不可用時寫入程序內快取）
         
         Args:
             key: 快取鍵
             value: 快取值
             expire: 過期時間（秒），None 表示不過期
+            tags: 標籤列表（之後可用 invalidate_tags() 一次刪除）
         
         Returns:
             是否成功
         """
-        if not self.is_available():
-            return False
+        if tags:
+            return self.mset({key: value}, expire=expire, tags=tags)
+        value = serialize_value(value)
+        if expire:
+            result = self._execute('SET', lambda: self.client.set(key, value, ex=expire), _UNAVAILABLE)
+        else:
+            result = self._execute('SET', lambda: self.client.set(key, value), _UNAVAILABLE)
+        if result is _UNAVAILABLE:
+            self._count('fallback_writes')
+            return self.local.set(key, value, expire)
+        if self._is_near(key):
+            self.local.set(key, value, self._near_expire(expire))
+        return bool(result)
+    
+    def mset(self, mapping: Dict[str, Any], expire: Optional[int] = None, tags: Optional[List[str]] = None) -> bool:
+        """
+        以管線一次往返設置多個快取值（非交易，各鍵獨立；Redis 不可用時寫入程序內快取）
         
-        try:
-            # 嘗試序列化為 JSON
-            if isinstance(value, (dict, list)):
-                value = json.dumps(value, ensure_ascii=False)
-            elif not isinstance(value, str):
-                value = str(value)
-            
-            if expire:
-                self.client.setex(key, expire, value)
-            else:
-                self.client.set(key, value)
-            
+        Args:
+            mapping: {快取鍵: 值}
+            expire: 過期時間（秒），None 表示不過期
+            tags: 標籤列表（套用到所有鍵，同一次往返中加入標籤集合）
+        
+        Returns:
+            是否全部成功
+        """
+        if not mapping:
             return True
-        except Exception as e:
-            logger.error(f"❌ Redis SET 錯誤: {str(e)}")
-            return False
+        values = {key: serialize_value(value) for key, value in mapping.items()}
+        tags = list(tags or ())
+        keys = list(values)
+        tag_calls = [
+            (self._tag_key(tag), keys[start:start + TAG_BATCH_SIZE])
+            for tag in tags for start in range(0, len(keys), TAG_BATCH_SIZE)
+        ]
+        
+        def run():
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in values.items():
+                if expire:
+                    pipe.set(key, value, ex=expire)
+                else:
+                    pipe.set(key, value)
+            for tag_key, members in tag_calls:
+                # EVAL（而非 EVALSHA + SCRIPT EXISTS）：腳本由 Redis 依 SHA 快取，維持單次往返
+                sample = min(TAG_PRUNE_MAX_SAMPLE, TAG_PRUNE_FACTOR * len(members))
+                pipe.eval(_TAG_SCRIPT, 1, tag_key, expire or 0, sample, *members)
+            return all(pipe.execute())
+        
+        result = self._execute('MSET', run, _UNAVAILABLE, commands=len(values) + len(tag_calls))
+        if result is _UNAVAILABLE:
+            self._count('fallback_writes', len(values))
+            return self.local.mset(values, expire, tags=tags)
+        near_values = {key: value for key, value in values.items() if self._is_near(key)}
+        if near_values:
+            self.local.mset(near_values, self._near_expire(expire), tags=tags)
+        return bool(result)
     
     def delete(self, key: str) -> bool:
         """
-        刪除快取鍵
+        刪除快取鍵（同時刪除程序內快取中的項目）
         
         Args:
             key: 快取鍵
@@ -152,15 +545,25 @@ class RedisManager:
         Returns:
             是否成功
         """
-        if not self.is_available():
-            return False
+        local_deleted = self.local.delete(key)
+        result = self._execute('DELETE', lambda: self.client.delete(key), _UNAVAILABLE)
+        return local_deleted if result is _UNAVAILABLE else True
+    
+    def delete_many(self, keys: List[str]) -> int:
+        """
+        一次往返刪除多個快取鍵（同時刪除程序內快取中的項目）
         
-        try:
-            self.client.delete(key)
-            return True
-        except Exception as e:
-            logger.error(f"❌ Redis DELETE 錯誤: {str(e)}")
-            return False
+        Args:
+            keys: 快取鍵列表
+        
+        Returns:
+            刪除的鍵數量
+        """
+        if not keys:
+            return 0
+        local_deleted = self.local.delete_many(keys)
+        result = self._execute('DELETE', lambda: self.client.delete(*keys), _UNAVAILABLE)
+        return local_deleted if result is _UNAVAILABLE else result
     
     def exists(self, key: str) -> bool:
         """
@@ -172,14 +575,10 @@ class RedisManager:
         Returns:
             是否存在
         """
-        if not self.is_available():
-            return False
-        
-        try:
-            return self.client.exists(key) > 0
-        except Exception as e:
-            logger.error(f"❌ Redis EXISTS 錯誤: {str(e)}")
-            return False
+        result = self._execute('EXISTS', lambda: self.client.exists(key), _UNAVAILABLE)
+        if result is _UNAVAILABLE:
+            return self.local.exists(key)
+        return result > 0
     
     def expire(self, key: str, seconds: int) -> bool:
         """
@@ -192,18 +591,69 @@ class RedisManager:
         Returns:
             是否成功
         """
-        if not self.is_available():
-            return False
+        result = self._execute('EXPIRE', lambda: self.client.expire(key, seconds), _UNAVAILABLE)
+        if result is _UNAVAILABLE:
+            return self.local.expire(key, seconds)
+        return bool(result)
+    
+    def _tag_key(self, tag: str) -> str:
+        return f"{TAG_KEY_PREFIX}:{tag}"
+    
+    def _unlink(self, keys: List[str]) -> int:
+        """以 UNLINK 刪除（值在 Redis 背景執行緒釋放）；伺服器不支援時（Redis < 4.0）改用 DEL"""
+        if self._use_unlink:
+            try:
+                return self.client.unlink(*keys)
+            except redis.ResponseError:
+                self._use_unlink = False
+                logger.info("ℹ️ Redis 不支援 UNLINK，改用 DEL")
+        return self.client.delete(*keys)
+    
+    def _unlink_batch(self, keys: List[str]) -> Optional[int]:
+        """刪除一批鍵（一次往返），Redis 不可用時返回 None"""
+        result = self._execute('UNLINK', lambda: self._unlink(keys), _UNAVAILABLE)
+        if result is _UNAVAILABLE:
+            return None
+        self._count('keys_unlinked', result)
+        return result
+    
+    def _scan_unlink(self, scan: Callable[[int], tuple], operation: str) -> Optional[int]:
+        """
+        以遊標分批走訪並刪除（每次往返只處理 scan_count 個鍵，不會長時間阻塞 Redis）
         
-        try:
-            return self.client.expire(key, seconds)
-        except Exception as e:
-            logger.error(f"❌ Redis EXPIRE 錯誤: {str(e)}")
-            return False
+        Args:
+            scan: scan(cursor) -> (next_cursor, keys)，即 SCAN 或 SSCAN
+            operation: 操作名稱（日誌用）
+        
+        Returns:
+            刪除的鍵數量；第一次往返就失敗時返回 None（中途失敗時返回已刪除的數量）
+        """
+        cursor = 0
+        deleted = 0
+        pending: List[str] = []
+        while True:
+            page = self._execute(operation, lambda: scan(cursor), _UNAVAILABLE)
+            if page is _UNAVAILABLE:
+                return deleted if deleted or pending else None
+            self._count('scan_calls')
+            cursor, keys = page
+            pending.extend(keys)
+            # SCAN 可能重複返回同一個鍵，UNLINK 不存在的鍵沒有影響
+            if len(pending) >= self.scan_count or (cursor == 0 and pending):
+                result = self._unlink_batch(pending)
+                if result is None:
+                    return deleted
+                deleted += result
+                pending = []
+            if cursor == 0:
+                return deleted
     
     def clear_pattern(self, pattern: str) -> int:
         """
-        清除符合模式的所有鍵
+        清除符合模式的所有鍵（同時清除程序內快取中的項目）
+        
+        以 SCAN 分批走訪整個鍵空間：不會阻塞 Redis，但總耗時仍與鍵空間大小成正比；
+        經常需要失效的群組請改用標籤（set(..., tags=[...]) 與 invalidate_tags()）。
         
         Args:
             pattern: 鍵的模式（如 'user:*'）
@@ -211,21 +661,55 @@ class RedisManager:
         Returns:
             清除的鍵數量
         """
-        if not self.is_available():
-            return 0
+        local_cleared = self.local.clear_pattern(pattern)
+        result = self._scan_unlink(
+            lambda cursor: self.client.scan(cursor, match=pattern, count=self.scan_count), 'SCAN'
+        )
+        return local_cleared if result is None else result
+    
+    def invalidate_tags(self, tags: List[str]) -> int:
+        """
+        刪除標籤群組內的所有鍵（同時清除程序內快取中的項目）
+        
+        先將標籤集合 RENAME 為暫存鍵（之後寫入的鍵會加入新的集合，不會被這次失效誤刪），
+        再以 SSCAN 分批走訪並 UNLINK 成員，最後刪除暫存集合；成本與群組內的鍵數成正比。
+        
+        Args:
+            tags: 標籤列表
         
+        Returns:
+            刪除的鍵數量
+        """
+        local_deleted = self.local.invalidate_tags(tags)
+        deleted = 0
+        available = False
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            pending_key = f"{tag_key}:invalidating:{uuid.uuid4().hex}"
+            renamed = self._execute('RENAME', lambda: self._rename_if_exists(tag_key, pending_key), _UNAVAILABLE)
+            if renamed is _UNAVAILABLE:
+                continue
+            available = True
+            self._count('tag_invalidations')
+            if not renamed:
+                continue
+            result = self._scan_unlink(
+                lambda cursor: self.client.sscan(pending_key, cursor, count=self.scan_count), 'SSCAN'
+            )
+            deleted += result or 0
+            self._execute('UNLINK', lambda: self._unlink([pending_key]))
+        return deleted if available else local_deleted
+    
+    def _rename_if_exists(self, source: str, destination: str) -> bool:
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                return self.client.delete(*keys)
-            return 0
-        except Exception as e:
-            logger.error(f"❌ Redis CLEAR PATTERN 錯誤: {str(e)}")
-            return 0
+            return bool(self.client.rename(source, destination))
+        except redis.ResponseError:
+            # 標籤集合不存在（沒有成員或已過期）
+            return False
     
     def increment(self, key: str, amount: int = 1) -> Optional[int]:
         """
-        遞增計數器
+        遞增計數器（Redis 不可用時在程序內計數）
         
         Args:
             key: 快取鍵
@@ -234,14 +718,11 @@ class RedisManager:
         Returns:
             遞增後的值或 None
         """
-        if not self.is_available():
-            return None
-        
-        try:
-            return self.client.incrby(key, amount)
-        except Exception as e:
-            logger.error(f"❌ Redis INCREMENT 錯誤: {str(e)}")
-            return None
+        result = self._execute('INCREMENT', lambda: self.client.incrby(key, amount), _UNAVAILABLE)
+        if result is _UNAVAILABLE:
+            self._count('fallback_writes')
+            return self.local.increment(key, amount)
+        return result
     
     def get_hash(self, key: str, field: str) -> Optional[Any]:
         """
@@ -254,21 +735,7 @@ class RedisManager:
         Returns:
             欄位值或 None
         """
-        if not self.is_available():
-            return None
-        
-        try:
-            value = self.client.hget(key, field)
-            if value is None:
-                return None
-            
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                return value
-        except Exception as e:
-            logger.error(f"❌ Redis HGET 錯誤: {str(e)}")
-            return None
+        return deserialize_value(self._execute('HGET', lambda: self.client.hget(key, field)))
     
     def set_hash(self, key: str, field: str, value: Any) -> bool:
         """
@@ -282,20 +749,8 @@ class RedisManager:
         Returns:
             是否成功
         """
-        if not self.is_available():
-            return False
-        
-        try:
-            if isinstance(value, (dict, list)):
-                value = json.dumps(value, ensure_ascii=False)
-            elif not isinstance(value, str):
-                value = str(value)
-            
-            self.client.hset(key, field, value)
-            return True
-        except Exception as e:
-            logger.error(f"❌ Redis HSET 錯誤: {str(e)}")
-            return False
+        value = serialize_value(value)
+        return self._execute('HSET', lambda: self.client.hset(key, field, value), None) is not None
     
     def get_all_hash(self, key: str) -> Optional[dict]:
         """
@@ -307,32 +762,51 @@ class RedisManager:
         Returns:
             Hash 字典或 None
         """
-        if not self.is_available():
-            return None
+        return self._execute('HGETALL', lambda: self.client.hgetall(key))
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取 Redis 客戶端指標
         
-        try:
-            return self.client.hgetall(key)
-        except Exception as e:
-            logger.error(f"❌ Redis HGETALL 錯誤: {str(e)}")
-            return None
+        Returns:
+            斷路器狀態、命令數與往返次數、連線失敗與錯誤次數、連線池上限、
+            近端快取命中與替代讀寫次數、程序內快取指標（筆數、位元組數、命中率、淘汰次數）
+        """
+        with self._metrics_lock:
+            counters = dict(self._counters)
+        return {
+            'configured': self.client is not None,
+            'max_connections': self.max_connections,
+            'breaker': self.breaker.get_metrics(),
+            'near_cache': {
+                'ttl': self.near_cache_ttl,
+                'prefixes': [prefix.rstrip(':') for prefix in self.near_cache_prefixes]
+            },
+            'local': self.local.get_metrics(),
+            **counters
+        }
 
 
 # 全局 Redis 實例
 redis_manager = RedisManager()
 
 
-def cache_result(key_prefix: str, expire: int = 3600):
+def cache_result(key_prefix: str, expire: int = 3600, tags: Optional[List[str]] = None):
     """
     快取裝飾器
     
     Args:
         key_prefix: 快取鍵前綴
         expire: 過期時間（秒）
+        tags: 標籤範本列表，以被裝飾函數的參數格式化（str.format(*args, **kwargs)），
+              之後可用 redis_manager.invalidate_tags() 一次清除
     
     使用範例:
-        @cache_result('user_profile', expire=1800)
+        @cache_result('user_profile', expire=1800, tags=['user:{0}'])
         def get_user_profile(user_id):
             ...
+        
+        redis_manager.invalidate_tags([f'user:{user_id}'])
     """
     def decorator(func):
         @wraps(func)
@@ -350,10 +824,10 @@ def cache_result(key_prefix: str, expire: int = 3600):
             
             # 執行函數並快取結果
             result = func(*args, **kwargs)
-            redis_manager.set(cache_key, result, expire=expire)
+            key_tags = [tag.format(*args, **kwargs) for tag in tags] if tags else None
+            redis_manager.set(cache_key, result, expire=expire, tags=key_tags)
             logger.debug(f"✅ 結果已快取: {cache_key}")
             
             return result
         return wrapper
     return decorator
-
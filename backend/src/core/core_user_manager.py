@@ -4,10 +4,17 @@
 """
 
 from src.core.core_db_manager import db, ActivityLogger, ErrorLogger, AuditLogger
+from src.core.core_db_statements import statements
+from src.core.core_redis_manager import redis_manager
+from src.core.core_disease_catalog import disease_catalog
+from src.core.core_user_status_cache import user_status_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 import logging
 import re
 import os
+import json
+import base64
+import hashlib
 from datetime import datetime, timedelta
 import secrets
 from typing import Tuple, Optional, Dict, List, Any
@@ -330,6 +337,8 @@ class UserManager:
                     (user_id,)
                 )
             
+            user_status_cache.invalidate(user_id)
+            
             ActivityLogger.log_action(
                 user_id=user_id,
                 action_type='logout'
@@ -508,6 +517,7 @@ class UserManager:
             
             values = tuple(update_fields.values()) + (user_id,)
             db.execute_update(sql, values)
+            user_status_cache.invalidate(user_id)
             
             ActivityLogger.log_action(
                 user_id=user_id,
@@ -608,6 +618,10 @@ class UserManager:
                 "UPDATE users SET is_active = FALSE, updated_at = NOW() WHERE id = %s",
                 (user_id,)
             )
+            # 立即清除快取的啟用狀態（其他 worker 程序最遲 USER_STATUS_CACHE_TTL 秒後生效）
+            user_status_cache.invalidate(user_id)
+            # 清除該使用者的所有結果快取（依 user 標籤，不掃描鍵空間）
+            redis_manager.invalidate_tags([f"user:{user_id}"])
             
             # 記錄審計日誌
             AuditLogger.log_operation(
@@ -637,6 +651,200 @@ class UserManager:
 class DetectionQueries:
     """檢測相關查詢"""
     
+    # 歷史總數快取時間（秒）：總數只用於顯示頁數，允許短時間內略有落差
+    HISTORY_COUNT_TTL = 60
+    
+    # 歷史查詢回傳欄位（包含原始圖片和帶框圖片 URL）
+    HISTORY_COLUMNS = """
+        id, disease_name, severity, confidence, image_path,
+        created_at, status, processing_time_ms, image_compressed,
+        image_source, prediction_log_id, original_image_url, annotated_image_url
+    """
+    
+    @staticmethod
+    def _history_filters(
+        user_id: int,
+        disease_filter: Optional[str] = None,
+        min_confidence: Optional[float] = None
+    ) -> Tuple[List[str], List[Any]]:
+        """構建歷史查詢的 WHERE 條件與參數"""
+        where_conditions = ["user_id = %s"]
+        params: List[Any] = [user_id]
+        
+        if disease_filter:
+            where_conditions.append("disease_name ILIKE %s")
+            params.append(f"%{disease_filter}%")
+        
+        if min_confidence is not None:
+            where_conditions.append("confidence >= %s")
+            params.append(min_confidence)
+        
+        return where_conditions, params
+    
+    @staticmethod
+    def _history_statement(kind: str, sql: str, disease_filter: Optional[str] = None,
+                           min_confidence: Optional[float] = None, after_cursor: bool = False) -> str:
+        """
+        將歷史查詢登錄為預備語句（每種過濾條件組合一個名稱，例如 history_page_disease_after）
+        
+        Returns:
+            語句名稱
+        """
+        name = f"history_{kind}"
+        if disease_filter:
+            name += "_disease"
+        if min_confidence is not None:
+            name += "_confidence"
+        if after_cursor:
+            name += "_after"
+        return statements.register(name, sql)
+    
+    @staticmethod
+    def encode_history_cursor(record: Dict[str, Any]) -> str:
+        """
+        以記錄的 (created_at, id) 產生分頁游標
+        
+        Args:
+            record: 當頁最後一筆記錄
+        
+        Returns:
+            URL 安全的 base64 游標字串
+        """
+        created_at = record.get('created_at')
+        if hasattr(created_at, 'isoformat'):
+            created_at = created_at.isoformat()
+        payload = json.dumps({'t': created_at, 'id': record.get('id')}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_history_cursor(cursor: str) -> Tuple[str, int]:
+        """
+        解析分頁游標
+        
+        Args:
+            cursor: encode_history_cursor() 產生的字串
+        
+        Returns:
+            (created_at ISO 字串, id)
+        
+        Raises:
+            ValueError: 游標格式錯誤
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            created_at = datetime.fromisoformat(payload['t']).isoformat()
+            return created_at, int(payload['id'])
+        except Exception as e:
+            raise ValueError(f"無效的分頁游標: {cursor}") from e
+    
+    @staticmethod
+    def get_user_detections_page(
+        user_id: int,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        disease_filter: Optional[str] = None,
+        min_confidence: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        以游標（keyset）分頁獲取使用者檢測歷史，依 created_at DESC, id DESC 排序
+        
+        以 (created_at, id) 定位下一頁，走 idx_records_user_date 索引範圍掃描，
+        不論翻到第幾頁成本都相同（OFFSET 分頁需掃描並丟棄前面所有記錄）
+        
+        Args:
+            user_id: 使用者 ID
+            limit: 每頁記錄數
+            cursor: 上一頁返回的 next_cursor（None 表示第一頁）
+            disease_filter: 病害名稱過濾
+            min_confidence: 最小置信度過濾
+        
+        Returns:
+            (records, next_cursor) 元組；沒有下一頁時 next_cursor 為 None
+        
+        Raises:
+            ValueError: 游標格式錯誤
+        """
+        where_conditions, params = DetectionQueries._history_filters(user_id, disease_filter, min_confidence)
+        
+        if cursor:
+            cursor_created_at, cursor_id = DetectionQueries.decode_history_cursor(cursor)
+            # created_at <= t 讓索引範圍掃描直接從游標位置開始；同一時間戳再以 id 區分
+            where_conditions.append("created_at <= %s::timestamp AND (created_at < %s::timestamp OR id < %s)")
+            params += [cursor_created_at, cursor_created_at, cursor_id]
+        
+        sql = f"""
+            SELECT {DetectionQueries.HISTORY_COLUMNS}
+            FROM detection_records
+            WHERE {" AND ".join(where_conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """
+        
+        statement = DetectionQueries._history_statement('page', sql, disease_filter, min_confidence, bool(cursor))
+        try:
+            # 多取一筆判斷是否還有下一頁
+            result = db.execute_prepared(statement, tuple(params + [limit + 1]), dict_cursor=True) or []
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"❌ 查詢檢測歷史失敗: {error_msg}", exc_info=True)
+            if "relation" in error_msg.lower() and "does not exist" in error_msg.lower():
+                logger.error("   提示: detection_records 表不存在，請執行: python database/database_manager.py init")
+            return [], None
+        
+        records = result[:limit]
+        next_cursor = DetectionQueries.encode_history_cursor(records[-1]) if len(result) > limit else None
+        logger.debug(f"📊 查詢檢測歷史（游標分頁）: user_id={user_id}, 返回 {len(records)} 筆, has_next={next_cursor is not None}")
+        return records, next_cursor
+    
+    @staticmethod
+    def count_user_detections(
+        user_id: int,
+        disease_filter: Optional[str] = None,
+        min_confidence: Optional[float] = None
+    ) -> Tuple[int, bool]:
+        """
+        獲取使用者檢測記錄總數（Redis 快取 HISTORY_COUNT_TTL 秒）
+        
+        Args:
+            user_id: 使用者 ID
+            disease_filter: 病害名稱過濾
+            min_confidence: 最小置信度過濾
+        
+        Returns:
+            (total_count, from_cache) 元組；from_cache 為 True 時總數可能略有落差
+        """
+        filters = json.dumps([disease_filter, min_confidence])
+        cache_key = f"history_count:{user_id}:{hashlib.sha1(filters.encode('utf-8')).hexdigest()[:12]}"
+        cached = redis_manager.get(cache_key)
+        if isinstance(cached, int):
+            return cached, True
+        
+        where_conditions, params = DetectionQueries._history_filters(user_id, disease_filter, min_confidence)
+        sql = f"""
+            SELECT COUNT(*) as total
+            FROM detection_records
+            WHERE {" AND ".join(where_conditions)}
+        """
+        statement = DetectionQueries._history_statement('count', sql, disease_filter, min_confidence)
+        try:
+            count_result = db.execute_prepared(statement, tuple(params), fetch_one=True)
+            total_count = count_result[0] if count_result else 0
+        except Exception as e:
+            logger.error(f"❌ 查詢檢測歷史總數失敗: {str(e)}")
+            return 0, False
+        
+        redis_manager.set(
+            cache_key, total_count, expire=DetectionQueries.HISTORY_COUNT_TTL,
+            tags=[f"user:{user_id}", f"user_history:{user_id}"]
+        )
+        return total_count, False
+    
+    @staticmethod
+    def invalidate_history_count(user_id: int):
+        """清除使用者的歷史總數與統計快取（刪除記錄後呼叫；依 user_history 標籤失效，不掃描鍵空間）"""
+        redis_manager.invalidate_tags([f"user_history:{user_id}"])
+    
     @staticmethod
     def get_user_detections(
         user_id: int, 
@@ -645,7 +853,8 @@ class DetectionQueries:
         order_by: str = 'created_at',
         order_dir: str = 'DESC',
         disease_filter: Optional[str] = None,
-        min_confidence: Optional[float] = None
+        min_confidence: Optional[float] = None,
+        with_count: bool = True
     ) -> Tuple[List[Dict[str, Any]], int]:
         """
         獲取使用者檢測歷史（支持分頁、排序、過濾）
@@ -658,6 +867,7 @@ class DetectionQueries:
             order_dir: 排序方向（ASC, DESC）
             disease_filter: 病害名稱過濾
             min_confidence: 最小置信度過濾
+            with_count: 是否執行 COUNT 查詢（False 時 total_count 為 -1，可改用 count_user_detections）
         
         Returns:
             (records, total_count) 元組
@@ -670,17 +880,7 @@ class DetectionQueries:
             order_dir = 'DESC'
         
         # 構建 WHERE 條件
-        where_conditions = ["user_id = %s"]
-        params = [user_id]
-        
-        if disease_filter:
-            where_conditions.append("disease_name ILIKE %s")
-            params.append(f"%{disease_filter}%")
-        
-        if min_confidence is not None:
-            where_conditions.append("confidence >= %s")
-            params.append(min_confidence)
-        
+        where_conditions, params = DetectionQueries._history_filters(user_id, disease_filter, min_confidence)
         where_clause = " AND ".join(where_conditions)
         
         # 查詢總數
@@ -690,14 +890,12 @@ class DetectionQueries:
             WHERE {where_clause}
         """
         
-        # 查詢記錄（包含原始圖片和帶框圖片 URL）
+        # 查詢記錄（包含原始圖片和帶框圖片 URL；以 id 作為次要排序，分頁結果穩定）
         sql = f"""
-            SELECT id, disease_name, severity, confidence, image_path,
-                   created_at, status, processing_time_ms, image_compressed,
-                   image_source, prediction_log_id, original_image_url, annotated_image_url
+            SELECT {DetectionQueries.HISTORY_COLUMNS}
             FROM detection_records
             WHERE {where_clause}
-            ORDER BY {order_by} {order_dir}
+            ORDER BY {order_by} {order_dir}, id {order_dir}
             LIMIT %s OFFSET %s
         """
         
@@ -705,8 +903,11 @@ class DetectionQueries:
             # 獲取總數
             logger.debug(f"🔍 執行 COUNT 查詢: {count_sql}")
             logger.debug(f"   參數: {tuple(params)}")
-            count_result = db.execute_query(count_sql, tuple(params), fetch_one=True)
-            total_count = count_result[0] if count_result else 0
+            if with_count:
+                count_result = db.execute_query(count_sql, tuple(params), fetch_one=True)
+                total_count = count_result[0] if count_result else 0
+            else:
+                total_count = -1
             logger.debug(f"✅ COUNT 結果: {total_count}")
             
             # 獲取記錄
@@ -730,7 +931,7 @@ class DetectionQueries:
             else:
                 logger.debug(f"⚠️ 查詢返回空結果")
             
-            logger.info(f"📊 查詢檢測歷史: user_id={user_id}, 返回 {len(result) if result else 0}/{total_count} 筆記錄")
+            logger.debug(f"📊 查詢檢測歷史: user_id={user_id}, 返回 {len(result) if result else 0}/{total_count} 筆記錄")
             return (result if result else [], total_count)
             
         except Exception as e:
@@ -771,6 +972,7 @@ class DetectionQueries:
             rows_affected = db.execute_update(delete_sql, (record_id, user_id))
             
             if rows_affected > 0:
+                DetectionQueries.invalidate_history_count(user_id)
                 logger.info(f"✅ 刪除檢測記錄成功: record_id={record_id}, user_id={user_id}")
                 return True, "記錄已刪除"
             else:
@@ -827,7 +1029,8 @@ class DetectionQueries:
     @staticmethod
     def get_disease_info(disease_name: Optional[str]) -> Optional[Dict[str, Any]]:
         """
-        根據病害名稱查詢病害詳細資訊（不區分大小寫）
+        根據病害名稱查詢病害詳細資訊（不區分大小寫，也接受中文名稱或英文名稱）
+        由程序內病害知識庫目錄提供，不查詢資料庫
         
         Args:
             disease_name: 病害名稱（例如：Potato__Late_blight 或 Potato__late_blight）
@@ -837,31 +1040,23 @@ class DetectionQueries:
         """
         if not disease_name:
             return None
+        result = disease_catalog.lookup(disease_name)
+        if result is None:
+            logger.debug(f"⚠️  未找到病害資訊: {disease_name}")
+        return result
+    
+    @staticmethod
+    def get_disease_info_batch(disease_names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批次獲取多個病害的詳細資訊（由程序內病害知識庫目錄提供）
         
-        # 使用 ILIKE 進行不區分大小寫的匹配
-        sql = """
-            SELECT 
-                id, disease_name, chinese_name, english_name, causes, features,
-                symptoms, pesticides, management_measures, target_crops,
-                severity_levels, prevention_tips, reference_links,
-                created_at, updated_at, is_active
-            FROM disease_library
-            WHERE LOWER(disease_name) = LOWER(%s) AND is_active = TRUE
-            LIMIT 1
+        Args:
+            disease_names: 病害名稱列表（可重複，會自動去重）
+        
+        Returns:
+            {小寫病害名稱: 病害資訊字典}，未找到的病害不在字典中
         """
-        try:
-            result = db.execute_query(sql, (disease_name,), dict_cursor=True, fetch_one=True)
-            if result:
-                logger.debug(f"✅ 查詢到病害資訊: {disease_name} -> {result.get('disease_name')}")
-                return result
-            else:
-                logger.debug(f"⚠️  未找到病害資訊: {disease_name}")
-                return None
-        except Exception as e:
-            error_msg = str(e)
-            logger.warning(f"⚠️  查詢病害資訊失敗: {error_msg}")
-            # 不拋出異常，只記錄警告，返回 None
-            return None
+        return disease_catalog.lookup_many(disease_names)
 
 
 class LogQueries:
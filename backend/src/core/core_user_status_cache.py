@@ -0,0 +1,178 @@
+"""
+使用者狀態快取
+get_user_id_from_session 在每個已登入請求都需要確認使用者仍為啟用狀態，
+此模組以短 TTL 快取 users.is_active 的結果，避免每個請求都查詢資料庫
+
+兩層結構：程序內字典（依筆數淘汰）在前，Redis（可選）在後；兩層都記錄「資料庫確認時間」，
+任何一層的結果最多只會比資料庫落後 ttl 秒，停用帳戶最遲在 ttl 秒後生效。
+UserManager.deactivate_user / update_user_info / logout 會立即清除本程序與 Redis 中的記錄。
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.core.core_db_manager import db
+from src.core.core_db_statements import statements
+from src.core.core_redis_manager import redis_manager
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 每個未命中快取的請求都會執行，登錄為預備語句
+ACTIVE_USER_STATEMENT = statements.register(
+    'users_active_check',
+    "SELECT id FROM users WHERE id = %s AND is_active = TRUE"
+)
+
+
+class UserStatusCache:
+    """使用者啟用狀態快取（全局實例：user_status_cache）"""
+
+    KEY_PREFIX = 'user_status'
+
+    def __init__(
+        self,
+        db_manager=None,
+        ttl: float = 30.0,
+        max_entries: int = 10000,
+        use_redis: bool = True
+    ):
+        """
+        初始化使用者狀態快取
+
+        Args:
+            db_manager: 提供 execute_prepared() 的資料庫管理器（預設為全局 db）
+            ttl: 快取結果最長保留秒數（停用帳戶生效的最長延遲），0 表示不快取
+            max_entries: 程序內最大筆數
+            use_redis: 是否使用 Redis 作為第二層（讓多個 worker 程序共用查詢結果）
+        """
+        self.db = db_manager or db
+        self.ttl = max(0.0, ttl)
+        self.max_entries = max(1, max_entries)
+        self.use_redis = use_redis
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[bool, float]]" = OrderedDict()  # user_id -> (is_active, 確認時間)
+        self._counters = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'db_errors': 0,
+            'invalidations': 0,
+            'evictions': 0
+        }
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    def _store_local(self, user_id: int, active: bool, checked_at: float):
+        """寫入程序內快取並依筆數淘汰（呼叫者需持有鎖）"""
+        self._entries[user_id] = (active, checked_at)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def is_active(self, user_id: int) -> Optional[bool]:
+        """
+        查詢使用者是否存在且為啟用狀態
+
+        Args:
+            user_id: 使用者 ID
+
+        Returns:
+            True / False；資料庫查詢失敗時返回 None（不快取）
+        """
+        now = time.time()
+
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._counters['local_hits'] += 1
+                    return entry[0]
+
+            if self.use_redis:
+                cached = redis_manager.get(self._key(user_id))
+                if isinstance(cached, dict) and now - cached.get('checked_at', 0) < self.ttl:
+                    active = bool(cached.get('active'))
+                    with self._lock:
+                        self._store_local(user_id, active, cached['checked_at'])
+                        self._counters['redis_hits'] += 1
+                    return active
+
+        try:
+            result = self.db.execute_prepared(ACTIVE_USER_STATEMENT, (user_id,), fetch_one=True)
+        except Exception as e:
+            with self._lock:
+                self._counters['db_errors'] += 1
+            logger.error(f"❌ 查詢使用者狀態失敗: {str(e)}")
+            return None
+
+        active = result is not None
+        checked_at = time.time()
+        with self._lock:
+            self._counters['misses'] += 1
+            if self.ttl > 0:
+                self._store_local(user_id, active, checked_at)
+        if self.ttl > 0 and self.use_redis:
+            redis_manager.set(
+                self._key(user_id),
+                {'active': active, 'checked_at': checked_at},
+                expire=max(1, int(self.ttl))
+            )
+        return active
+
+    def invalidate(self, user_id: int):
+        """
+        清除使用者的快取記錄（本程序與 Redis；其他程序的程序內記錄最多再保留 ttl 秒）
+
+        Args:
+            user_id: 使用者 ID
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._counters['invalidations'] += 1
+        if self.use_redis:
+            redis_manager.delete(self._key(user_id))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取快取指標
+
+        Returns:
+            命中/未命中次數、命中率、目前筆數
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            hits = counters['local_hits'] + counters['redis_hits']
+            lookups = hits + counters['misses']
+            return {
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'use_redis': self.use_redis,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                **counters
+            }
+
+
+def _cache_from_env() -> UserStatusCache:
+    try:
+        ttl = float(os.getenv('USER_STATUS_CACHE_TTL', '30') or 30)
+    except ValueError:
+        ttl = 30.0
+    use_redis = os.getenv('USER_STATUS_CACHE_REDIS', 'true').lower() == 'true'
+    return UserStatusCache(ttl=ttl, use_redis=use_redis)
+
+
+# 全局使用者狀態快取實例
+user_status_cache = _cache_from_env()
@@ -0,0 +1,740 @@
+# 預測結果非同步寫入（write-behind）：prediction_log 與 detection_records 批次寫入、離線溢寫檔與重放
+
+import os
+import json
+import glob
+import time
+import atexit
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+from src.core.core_db_statements import statements
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# prediction_log 寫入欄位（created_at 以請求當下的 epoch 秒寫入）
+PREDICTION_LOG_COLUMNS = (
+    'id', 'user_id', 'image_path', 'image_hash', 'image_phash', 'image_size', 'image_source',
+    'image_data', 'image_data_size', 'image_compressed',
+    'cnn_mean_score', 'cnn_best_class', 'cnn_best_score', 'cnn_all_scores',
+    'yolo_result', 'yolo_detected', 'final_status', 'workflow_step',
+    'crop_coordinates', 'original_image_url', 'predict_img_url'
+)
+
+# detection_records 寫入欄位
+DETECTION_RECORD_COLUMNS = (
+    'user_id', 'disease_name', 'severity', 'confidence',
+    'image_path', 'image_hash', 'image_size', 'image_source',
+    'raw_model_output', 'status', 'processing_time_ms',
+    'image_data', 'image_data_size', 'image_compressed',
+    'prediction_log_id', 'original_image_url', 'annotated_image_url'
+)
+
+# 批次寫入以欄位陣列傳入 unnest()，不論批次大小都是同一個語句，可登錄為預備語句（陣列元素型別如下）
+PREDICTION_LOG_TYPES = {
+    'id': 'uuid', 'user_id': 'integer', 'image_path': 'text', 'image_hash': 'text', 'image_phash': 'bigint',
+    'image_size': 'integer', 'image_source': 'text', 'image_data': 'bytea', 'image_data_size': 'integer',
+    'image_compressed': 'boolean', 'cnn_mean_score': 'float8', 'cnn_best_class': 'text', 'cnn_best_score': 'float8',
+    'cnn_all_scores': 'jsonb', 'yolo_result': 'jsonb', 'yolo_detected': 'boolean', 'final_status': 'text',
+    'workflow_step': 'text', 'crop_coordinates': 'jsonb', 'original_image_url': 'text', 'predict_img_url': 'text'
+}
+DETECTION_RECORD_TYPES = {
+    'user_id': 'integer', 'disease_name': 'text', 'severity': 'text', 'confidence': 'numeric',
+    'image_path': 'text', 'image_hash': 'text', 'image_size': 'integer', 'image_source': 'text',
+    'raw_model_output': 'jsonb', 'status': 'text', 'processing_time_ms': 'integer',
+    'image_data': 'bytea', 'image_data_size': 'integer', 'image_compressed': 'boolean',
+    'prediction_log_id': 'uuid', 'original_image_url': 'text', 'annotated_image_url': 'text'
+}
+
+
+def _register_unnest_insert(name: str, table: str, columns: Tuple[str, ...], types: Dict[str, str], conflict: str) -> str:
+    """登錄以 unnest() 批次寫入的 INSERT（最後一個陣列為 created_at 的 epoch 秒）"""
+    column_list = ', '.join(columns)
+    return statements.register(
+        name,
+        f"""
+        INSERT INTO {table} ({column_list}, created_at)
+        SELECT {column_list}, to_timestamp(created_at)
+        FROM unnest({', '.join(['%s'] * (len(columns) + 1))}) AS v({column_list}, created_at)
+        {conflict}
+        """,
+        param_types=[f"{types[column]}[]" for column in columns] + ['float8[]']
+    )
+
+
+# prediction_log：id 為 UUID，重放時已存在的記錄直接略過
+PREDICTION_LOG_INSERT_STATEMENT = _register_unnest_insert(
+    'prediction_log_insert', 'prediction_log', PREDICTION_LOG_COLUMNS, PREDICTION_LOG_TYPES,
+    "ON CONFLICT (id) DO NOTHING"
+)
+DETECTION_RECORD_UPSERT_STATEMENT = _register_unnest_insert(
+    'detection_records_upsert', 'detection_records', DETECTION_RECORD_COLUMNS, DETECTION_RECORD_TYPES,
+    "ON CONFLICT (image_hash) DO UPDATE SET updated_at = NOW()"
+)
+# 未使用外部 URL 的記錄改為以 record_id 提供圖片
+DETECTION_RECORD_IMAGE_PATH_STATEMENT = statements.register(
+    'detection_records_image_path',
+    """
+    UPDATE detection_records
+    SET image_path = '/image/' || id
+    WHERE image_hash = ANY(%s) AND image_path NOT LIKE 'http%%'
+    """,
+    param_types=['text[]']
+)
+
+# 可在寫入後再補上的 URL 欄位（Cloudinary 上傳完成後）
+PREDICTION_LOG_PATCH_COLUMNS = ('image_path', 'original_image_url', 'predict_img_url')
+DETECTION_RECORD_PATCH_COLUMNS = ('original_image_url', 'annotated_image_url')
+
+# 視為資料庫不可用（整批溢寫、稍後重放）的錯誤類型
+_UNAVAILABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, RuntimeError)
+
+
+def _is_external_url(path: Optional[str]) -> bool:
+    return bool(path) and (path.startswith('http://') or path.startswith('https://'))
+
+
+def _spill_owner(path: str) -> Optional[int]:
+    """從溢寫檔名（spill-{pid}.jsonl...）取得寫入該檔的程序 ID"""
+    name = os.path.basename(path)
+    try:
+        return int(name[len('spill-'):].split('.', 1)[0])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    """檢查程序是否仍在執行（用於接手已結束 worker 的重放檔）"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindWriter:
+    """
+    預測結果非同步寫入器
+
+    請求執行緒只將一次預測的所有寫入（prediction_log INSERT、detection_records upsert、
+    之後的 Cloudinary URL 更新）放入記憶體佇列即返回；背景執行緒依筆數或時間觸發，
+    將多個請求合併為單一交易寫入（新增記錄以欄位陣列執行預備語句，URL 更新以 execute_values）。
+    資料庫不可用時整批寫入本地溢寫檔（JSON Lines），恢復後依原順序重放。
+    """
+
+    def __init__(
+        self,
+        db_manager=None,
+        enabled: bool = True,
+        batch_size: int = 64,
+        flush_interval_ms: int = 200,
+        max_pending: int = 2048,
+        enqueue_timeout: float = 1.0,
+        spill_dir: Optional[str] = None,
+        spill_retry_interval: float = 5.0
+    ):
+        """
+        初始化寫入器
+
+        Args:
+            db_manager: 提供 get_connection() 的資料庫管理器（預設為全局 db）
+            enabled: 是否啟用背景寫入；False 時在呼叫者執行緒同步寫入（仍具備溢寫保護）
+            batch_size: 單次交易最多寫入的預測筆數
+            flush_interval_ms: 最長等待時間，到期即寫入（毫秒）
+            max_pending: 佇列上限，超過時呼叫者最多等待 enqueue_timeout 秒，逾時直接溢寫
+            enqueue_timeout: 佇列已滿時的等待秒數
+            spill_dir: 溢寫檔目錄（預設為 data/write_behind）
+            spill_retry_interval: 重放溢寫檔的最短間隔（秒）
+        """
+        if db_manager is None:
+            from src.core.core_db_manager import db as db_manager
+        self.db = db_manager
+        self.enabled = enabled
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0, flush_interval_ms) / 1000.0
+        self.max_pending = max(1, max_pending)
+        self.enqueue_timeout = enqueue_timeout
+        self.spill_retry_interval = spill_retry_interval
+
+        if spill_dir is None:
+            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+            spill_dir = os.path.join(project_root, 'data', 'write_behind')
+        self.spill_dir = spill_dir
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.spill_path = os.path.join(self.spill_dir, f"spill-{os.getpid()}.jsonl")
+
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # 保證寫入（含溢寫與重放）依序執行
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # 尚未寫入的預測
+        self._patches: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # 已寫入預測的 URL 更新
+        self._inflight: set = set()
+        self._flush_requested = False
+        self._stop_event = threading.Event()
+        self._spill_outstanding = 0
+        self._last_replay_attempt = 0.0
+
+        self._metrics_lock = threading.Lock()
+        self._counters = {
+            'submitted': 0,
+            'patches': 0,
+            'flushes': 0,
+            'flushed_predictions': 0,
+            'flushed_patches': 0,
+            'failed_flushes': 0,
+            'spilled_records': 0,
+            'replayed_records': 0,
+            'rejected_records': 0,
+            'blocked_enqueues': 0
+        }
+        self._flush_latency = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0, 'last_size': 0}
+
+        self._worker = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._worker.start()
+        atexit.register(self.shutdown)
+        mode = '背景批次' if enabled else '同步'
+        logger.info(f"✅ 預測寫入器已啟動 ({mode}, batch={self.batch_size}, interval={flush_interval_ms}ms, spill={self.spill_dir})")
+
+    # ------------------------------------------------------------------
+    # 請求執行緒 API
+    # ------------------------------------------------------------------
+
+    def submit_prediction(
+        self,
+        prediction_log: Dict[str, Any],
+        detection_record: Optional[Dict[str, Any]] = None
+    ):
+        """
+        提交一次預測的寫入
+
+        Args:
+            prediction_log: prediction_log 欄位字典（必須包含 id 與 user_id，欄位見 PREDICTION_LOG_COLUMNS）
+            detection_record: detection_records 欄位字典（可選，欄位見 DETECTION_RECORD_COLUMNS）
+        """
+        entry = self._make_entry(prediction_log, detection_record)
+        with self._metrics_lock:
+            self._counters['submitted'] += 1
+
+        if not self.enabled:
+            self._write([entry], [])
+            return
+
+        with self._cond:
+            if len(self._pending) + len(self._patches) >= self.max_pending:
+                with self._metrics_lock:
+                    self._counters['blocked_enqueues'] += 1
+                self._cond.notify_all()
+                deadline = time.time() + self.enqueue_timeout
+                while len(self._pending) + len(self._patches) >= self.max_pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or self._stop_event.is_set():
+                        break
+                    self._cond.wait(remaining)
+            overflow = len(self._pending) + len(self._patches) >= self.max_pending or self._stop_event.is_set()
+            if not overflow:
+                self._pending[entry['prediction_id']] = entry
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify_all()
+
+        if overflow:
+            # 佇列仍滿（資料庫過慢或已停止）：直接溢寫，不無限期阻塞請求、不遺失資料
+            logger.warning(f"⚠️  寫入佇列已滿，直接溢寫: {entry['prediction_id']}")
+            with self._write_lock:
+                self._spill([('insert', entry)])
+
+    def submit_predictions(self, records: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]) -> bool:
+        """
+        在呼叫者執行緒中以單一交易寫入多次預測（批次檢測端點使用），不經過背景佇列
+        返回前所有預測已寫入資料庫或溢寫，之後的 patch_urls() 一定排在 INSERT 之後
+
+        Args:
+            records: (prediction_log, detection_record) 列表，欄位同 submit_prediction()
+
+        Returns:
+            是否以單一交易寫入成功（False 表示已溢寫或改為逐筆寫入）
+        """
+        entries = [self._make_entry(prediction_log, detection_record) for prediction_log, detection_record in records]
+        if not entries:
+            return True
+        with self._metrics_lock:
+            self._counters['submitted'] += len(entries)
+        return self._write(entries, [])
+
+    def patch_urls(
+        self,
+        prediction_id: str,
+        user_id: int,
+        prediction_log: Optional[Dict[str, Any]] = None,
+        detection_record: Optional[Dict[str, Any]] = None
+    ):
+        """
+        更新預測的圖片 URL（Cloudinary 上傳完成後呼叫）
+        若該預測仍在佇列中，直接合併到待寫入的資料列，與 INSERT 在同一交易中完成
+
+        Args:
+            prediction_id: 預測記錄 ID
+            user_id: 使用者 ID
+            prediction_log: prediction_log 的 URL 欄位（見 PREDICTION_LOG_PATCH_COLUMNS）
+            detection_record: detection_records 的 URL 欄位（見 DETECTION_RECORD_PATCH_COLUMNS）
+        """
+        prediction_id = str(prediction_id)
+        log_fields = {k: v for k, v in (prediction_log or {}).items() if k in PREDICTION_LOG_PATCH_COLUMNS}
+        record_fields = {k: v for k, v in (detection_record or {}).items() if k in DETECTION_RECORD_PATCH_COLUMNS}
+        if not log_fields and not record_fields:
+            return
+        with self._metrics_lock:
+            self._counters['patches'] += 1
+
+        patch = {
+            'prediction_id': prediction_id,
+            'user_id': user_id,
+            'prediction_log': log_fields,
+            'detection_record': record_fields
+        }
+        if not self.enabled:
+            self._write([], [patch])
+            return
+
+        with self._cond:
+            pending = self._pending.get(prediction_id)
+            if pending is not None:
+                pending['prediction_log'].update(log_fields)
+                if pending['detection_record'] is not None:
+                    pending['detection_record'].update(record_fields)
+                return
+            existing = self._patches.get(prediction_id)
+            if existing is not None:
+                existing['prediction_log'].update(log_fields)
+                existing['detection_record'].update(record_fields)
+            else:
+                self._patches[prediction_id] = patch
+
+    def ensure_persisted(self, prediction_id: str, timeout: float = 5.0) -> bool:
+        """
+        確保預測已寫入資料庫（例如裁切流程需要更新既有記錄前呼叫）
+
+        Args:
+            prediction_id: 預測記錄 ID
+            timeout: 最長等待秒數
+
+        Returns:
+            是否已離開佇列（寫入資料庫或溢寫）
+        """
+        prediction_id = str(prediction_id)
+        deadline = time.time() + timeout
+        with self._cond:
+            while prediction_id in self._pending or prediction_id in self._inflight or prediction_id in self._patches:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        要求立即寫入所有待寫入資料並等待完成
+
+        Args:
+            timeout: 最長等待秒數
+
+        Returns:
+            佇列是否已清空
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._pending or self._patches or self._inflight:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        停止寫入器：寫入剩餘資料，逾時或資料庫不可用時溢寫到本地檔案
+
+        Args:
+            timeout: 等待背景執行緒結束的秒數
+        """
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._worker.join(timeout=timeout)
+
+        # 背景執行緒未能處理完的資料直接溢寫
+        with self._cond:
+            leftovers = [('insert', entry) for entry in self._pending.values()]
+            leftovers += [('patch', patch) for patch in self._patches.values()]
+            self._pending.clear()
+            self._patches.clear()
+        if leftovers:
+            with self._write_lock:
+                self._spill(leftovers)
+        logger.info("🧹 預測寫入器已停止")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取寫入器指標
+
+        Returns:
+            佇列深度、寫入延遲、溢寫與重放統計
+        """
+        with self._cond:
+            queue_depth = len(self._pending) + len(self._patches)
+            inflight = len(self._inflight)
+        with self._metrics_lock:
+            latency = dict(self._flush_latency)
+            return {
+                'enabled': self.enabled,
+                'queue_depth': queue_depth,
+                'inflight': inflight,
+                'max_pending': self.max_pending,
+                'batch_size': self.batch_size,
+                'flush_interval_ms': int(self.flush_interval * 1000),
+                'flush_latency': {
+                    'count': latency['count'],
+                    'avg_ms': round(latency['total_ms'] / latency['count'], 2) if latency['count'] else 0.0,
+                    'max_ms': round(latency['max_ms'], 2),
+                    'last_ms': round(latency['last_ms'], 2),
+                    'last_size': latency['last_size']
+                },
+                'spill_outstanding': self._spill_outstanding,
+                **self._counters
+            }
+
+    @staticmethod
+    def _make_entry(prediction_log: Dict[str, Any], detection_record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            'prediction_id': str(prediction_log['id']),
+            'user_id': prediction_log['user_id'],
+            'created_at': time.time(),
+            'prediction_log': {column: prediction_log.get(column) for column in PREDICTION_LOG_COLUMNS},
+            'detection_record': (
+                {column: detection_record.get(column) for column in DETECTION_RECORD_COLUMNS}
+                if detection_record else None
+            )
+        }
+
+    # ------------------------------------------------------------------
+    # 背景執行緒
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        """背景寫入主迴圈"""
+        self._claim_orphan_replays()
+        while True:
+            with self._cond:
+                deadline = time.time() + self.flush_interval
+                while (not self._stop_event.is_set()
+                       and not self._flush_requested
+                       and len(self._pending) < self.batch_size):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush_requested = False
+
+                inserts = []
+                while self._pending and len(inserts) < self.batch_size:
+                    _, entry = self._pending.popitem(last=False)
+                    inserts.append(entry)
+                patches = list(self._patches.values())
+                self._patches.clear()
+                self._inflight = {entry['prediction_id'] for entry in inserts} | {p['prediction_id'] for p in patches}
+                stopping = self._stop_event.is_set()
+                has_more = bool(self._pending)
+
+            try:
+                if inserts or patches:
+                    self._write(inserts, patches)
+                elif time.time() - self._last_replay_attempt >= self.spill_retry_interval:
+                    with self._write_lock:
+                        self._replay_spill()
+            except Exception as e:
+                logger.error(f"❌ 背景寫入未預期錯誤: {str(e)}", exc_info=True)
+            finally:
+                with self._cond:
+                    self._inflight = set()
+                    if has_more:
+                        self._flush_requested = True
+                    self._cond.notify_all()
+
+            if stopping and not has_more:
+                break
+
+    def _write(self, inserts: List[Dict[str, Any]], patches: List[Dict[str, Any]]) -> bool:
+        """
+        寫入一批資料：先重放溢寫檔以維持順序，資料庫不可用時整批溢寫
+        單筆資料錯誤（例如違反約束）時逐筆重試，仍失敗的資料寫入 rejected 檔
+
+        Returns:
+            是否以單一交易寫入成功
+        """
+        records = [('insert', entry) for entry in inserts] + [('patch', patch) for patch in patches]
+        with self._write_lock:
+            # 仍有未重放的溢寫資料時，新資料必須排在其後
+            if self._spill_outstanding or self._has_foreign_spill():
+                if not self._replay_spill():
+                    self._spill(records)
+                    return False
+
+            start = time.perf_counter()
+            try:
+                self._execute_batch(inserts, patches)
+            except _UNAVAILABLE_ERRORS as e:
+                logger.error(f"❌ 資料庫不可用，{len(records)} 筆寫入已溢寫: {str(e)}")
+                with self._metrics_lock:
+                    self._counters['failed_flushes'] += 1
+                self._spill(records)
+                return False
+            except psycopg2.Error as e:
+                logger.warning(f"⚠️  批次寫入失敗，改為逐筆寫入: {str(e)}")
+                with self._metrics_lock:
+                    self._counters['failed_flushes'] += 1
+                self._write_individually(records)
+                return False
+
+            self._record_flush(start, len(inserts), len(patches))
+            return True
+
+    def _write_individually(self, records: List[Tuple[str, Dict[str, Any]]]):
+        """逐筆寫入，隔離造成整批失敗的資料"""
+        for index, (kind, item) in enumerate(records):
+            start = time.perf_counter()
+            try:
+                if kind == 'insert':
+                    self._execute_batch([item], [])
+                    self._record_flush(start, 1, 0)
+                else:
+                    self._execute_batch([], [item])
+                    self._record_flush(start, 0, 1)
+            except _UNAVAILABLE_ERRORS as e:
+                logger.error(f"❌ 資料庫不可用，剩餘 {len(records) - index} 筆寫入已溢寫: {str(e)}")
+                self._spill(records[index:])
+                return
+            except psycopg2.Error as e:
+                logger.error(f"❌ 寫入被拒絕 ({kind}, prediction_id={item['prediction_id']}): {str(e)}")
+                self._reject(kind, item, str(e))
+
+    def _record_flush(self, start: float, insert_count: int, patch_count: int):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._metrics_lock:
+            self._counters['flushes'] += 1
+            self._counters['flushed_predictions'] += insert_count
+            self._counters['flushed_patches'] += patch_count
+            self._flush_latency['count'] += 1
+            self._flush_latency['total_ms'] += elapsed_ms
+            self._flush_latency['max_ms'] = max(self._flush_latency['max_ms'], elapsed_ms)
+            self._flush_latency['last_ms'] = elapsed_ms
+            self._flush_latency['last_size'] = insert_count + patch_count
+        logger.debug(f"✅ 批次寫入完成: {insert_count} 筆預測, {patch_count} 筆 URL 更新, 耗時 {elapsed_ms:.1f}ms")
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+
+    def _execute_batch(self, inserts: List[Dict[str, Any]], patches: List[Dict[str, Any]]):
+        """在單一交易中寫入一批預測與 URL 更新"""
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    if inserts:
+                        self._insert_predictions(cursor, inserts)
+                    if patches:
+                        self._apply_patches(cursor, patches)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _insert_predictions(cursor, inserts: List[Dict[str, Any]]):
+        # 以 get() 讀取：新增欄位前寫入的溢寫檔重放時該欄位為 NULL
+        log_rows = [
+            tuple(entry['prediction_log'].get(column) for column in PREDICTION_LOG_COLUMNS) + (entry['created_at'],)
+            for entry in inserts
+        ]
+        statements.execute(cursor, PREDICTION_LOG_INSERT_STATEMENT, [list(column) for column in zip(*log_rows)])
+
+        # detection_records：同一批次內相同 image_hash 只保留第一筆（與逐筆 upsert 的結果一致）
+        records = []
+        seen_hashes = set()
+        internal_path_hashes = []
+        for entry in inserts:
+            record = entry['detection_record']
+            if record is None:
+                continue
+            image_hash = record.get('image_hash')
+            if image_hash:
+                if image_hash in seen_hashes:
+                    continue
+                seen_hashes.add(image_hash)
+                if not _is_external_url(record.get('image_path')):
+                    internal_path_hashes.append(image_hash)
+            records.append(
+                tuple(record.get(column) for column in DETECTION_RECORD_COLUMNS) + (entry['created_at'],)
+            )
+        if not records:
+            return
+
+        statements.execute(cursor, DETECTION_RECORD_UPSERT_STATEMENT, [list(column) for column in zip(*records)])
+
+        if internal_path_hashes:
+            statements.execute(cursor, DETECTION_RECORD_IMAGE_PATH_STATEMENT, (internal_path_hashes,))
+
+    @staticmethod
+    def _apply_patches(cursor, patches: List[Dict[str, Any]]):
+        log_rows = [
+            (patch['prediction_id'],) + tuple(patch['prediction_log'].get(column) for column in PREDICTION_LOG_PATCH_COLUMNS)
+            for patch in patches if patch['prediction_log']
+        ]
+        if log_rows:
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                UPDATE prediction_log AS p SET
+                    image_path = COALESCE(v.image_path, p.image_path),
+                    original_image_url = COALESCE(v.original_image_url, p.original_image_url),
+                    predict_img_url = COALESCE(v.predict_img_url, p.predict_img_url),
+                    updated_at = NOW()
+                FROM (VALUES %s) AS v(id, image_path, original_image_url, predict_img_url)
+                WHERE p.id = v.id
+                """,
+                log_rows,
+                template='(%s::uuid, %s::text, %s::text, %s::text)',
+                page_size=len(log_rows)
+            )
+
+        record_rows = [
+            (patch['prediction_id'], patch['user_id']) + tuple(patch['detection_record'].get(column) for column in DETECTION_RECORD_PATCH_COLUMNS)
+            for patch in patches if patch['detection_record']
+        ]
+        if record_rows:
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                UPDATE detection_records AS d SET
+                    original_image_url = COALESCE(v.original_image_url, d.original_image_url),
+                    annotated_image_url = COALESCE(v.annotated_image_url, d.annotated_image_url)
+                FROM (VALUES %s) AS v(prediction_log_id, user_id, original_image_url, annotated_image_url)
+                WHERE d.prediction_log_id = v.prediction_log_id AND d.user_id = v.user_id
+                """,
+                record_rows,
+                template='(%s::uuid, %s::integer, %s::text, %s::text)',
+                page_size=len(record_rows)
+            )
+
+    # ------------------------------------------------------------------
+    # 溢寫與重放
+    # ------------------------------------------------------------------
+
+    def _spill(self, records: List[Tuple[str, Dict[str, Any]]]):
+        """將資料附加到本程序的溢寫檔（呼叫者需持有 _write_lock）"""
+        if not records:
+            return
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for kind, item in records:
+                f.write(json.dumps({'type': kind, 'entry': item}, ensure_ascii=False, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._spill_outstanding += len(records)
+        with self._metrics_lock:
+            self._counters['spilled_records'] += len(records)
+
+    def _reject(self, kind: str, item: Dict[str, Any], error: str):
+        """記錄無法寫入的資料（不再重試，保留供人工處理）"""
+        rejected_path = os.path.join(self.spill_dir, 'rejected.jsonl')
+        with open(rejected_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'type': kind, 'entry': item, 'error': error}, ensure_ascii=False, default=str) + '\n')
+        with self._metrics_lock:
+            self._counters['rejected_records'] += 1
+
+    def _replayable_spill_files(self) -> List[str]:
+        """本程序或已結束程序留下的溢寫檔（執行中的其他 worker 自行重放，以維持各自的寫入順序）"""
+        paths = []
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, 'spill-*.jsonl'))):
+            owner = _spill_owner(path)
+            if owner == os.getpid() or owner is None or not _pid_alive(owner):
+                paths.append(path)
+        return paths
+
+    def _has_foreign_spill(self) -> bool:
+        """已結束的程序留下、尚未重放的溢寫檔"""
+        return any(path != self.spill_path for path in self._replayable_spill_files())
+
+    def _claim_orphan_replays(self):
+        """將已結束程序未完成的重放檔改回溢寫檔，交由重放流程處理"""
+        for path in glob.glob(os.path.join(self.spill_dir, 'spill-*.jsonl.replay-*')):
+            try:
+                owner = int(path.rsplit('.replay-', 1)[1])
+            except ValueError:
+                continue
+            if owner != os.getpid() and not _pid_alive(owner):
+                os.replace(path, path.rsplit('.replay-', 1)[0] + f".orphan-{owner}.jsonl")
+
+    def _replay_spill(self, force: bool = False) -> bool:
+        """
+        依序重放溢寫檔（呼叫者需持有 _write_lock）
+
+        Args:
+            force: 忽略重放間隔限制（未到重放時間時返回 False，新資料會接在溢寫檔之後）
+
+        Returns:
+            溢寫檔是否已全部重放
+        """
+        now = time.time()
+        if not force and now - self._last_replay_attempt < self.spill_retry_interval:
+            return self._spill_outstanding == 0
+        self._last_replay_attempt = now
+
+        for path in self._replayable_spill_files():
+            # 以 rename 取得檔案所有權，避免多個 worker 重放同一個檔案
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            if path == self.spill_path:
+                self._spill_outstanding = 0
+
+            with open(claimed, 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            records = [(record['type'], record['entry']) for record in records]
+            logger.info(f"🔁 重放溢寫檔: {os.path.basename(path)} ({len(records)} 筆)")
+
+            for start in range(0, len(records), self.batch_size):
+                chunk = records[start:start + self.batch_size]
+                inserts = [item for kind, item in chunk if kind == 'insert']
+                patches = [item for kind, item in chunk if kind == 'patch']
+                try:
+                    self._execute_batch(inserts, patches)
+                except _UNAVAILABLE_ERRORS as e:
+                    logger.warning(f"⚠️  資料庫仍不可用，暫停重放: {str(e)}")
+                    self._spill(records[start:])
+                    os.remove(claimed)
+                    return False
+                except psycopg2.Error:
+                    self._write_individually(chunk)
+                with self._metrics_lock:
+                    self._counters['replayed_records'] += len(chunk)
+
+            os.remove(claimed)
+            logger.info(f"✅ 溢寫檔重放完成: {os.path.basename(path)}")
+        return self._spill_outstanding == 0
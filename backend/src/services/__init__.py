@@ -1,29 +1,47 @@
 """
 業務服務模組
 提供認證、檢測、圖片處理等業務邏輯服務
+
+匯出的名稱在第一次存取時才導入對應的子模組（推論程序只導入推論相關的服務，不導入認證、使用者等需要資料庫的服務）
 """
 
-from .service_auth import AuthService
-from .service_cloudinary import init_cloudinary_storage
-from .service_cnn import CNNClassifierService
-from .service_image import ImageService
-from .service_image_manager import ImageManager, init_image_manager
-from .service_integrated import IntegratedDetectionService
-from .service_integrated_api import IntegratedDetectionAPIService
-from .service_user import UserService
-from .service_yolo import DetectionService
-from .service_yolo_api import DetectionAPIService
-
-__all__ = [
-    'AuthService',
-    'init_cloudinary_storage',
-    'CNNClassifierService',
-    'ImageService',
-    'ImageManager',
-    'init_image_manager',
-    'IntegratedDetectionService',
-    'IntegratedDetectionAPIService',
-    'UserService',
-    'DetectionService',
-    'DetectionAPIService',
-]
+import importlib
+
+# 匯出名稱 -> 所在子模組
+_EXPORTS = {
+    'AuthService': '.service_auth',
+    'MicroBatchScheduler': '.service_batching',
+    'init_cloudinary_storage': '.service_cloudinary',
+    'init_local_cloudinary_storage': '.service_cloudinary',
+    'LocalCloudinaryStorage': '.service_cloudinary',
+    'CNNClassifierService': '.service_cnn',
+    'ImageService': '.service_image',
+    'InferenceCache': '.service_inference_cache',
+    'InferenceClient': '.service_inference_pool',
+    'InferenceServer': '.service_inference_pool',
+    'ImageManager': '.service_image_manager',
+    'init_image_manager': '.service_image_manager',
+    'IntegratedDetectionService': '.service_integrated',
+    'IntegratedDetectionAPIService': '.service_integrated_api',
+    'NearDuplicateIndex': '.service_near_duplicate',
+    'QuantizationGate': '.service_quantization',
+    'UploadQueue': '.service_upload_queue',
+    'UserService': '.service_user',
+    'DetectionService': '.service_yolo',
+    'DetectionAPIService': '.service_yolo_api',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,228 @@
+"""
+動態微批次排程服務
+在時間窗口內收集並發推論請求，合併為單一批次執行後再將結果分送回各呼叫者
+"""
+
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class _BatchItem:
+    """排程佇列中的單一請求"""
+
+    __slots__ = ('payload', 'future', 'enqueued_at')
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+
+
+class MicroBatchScheduler:
+    """
+    動態微批次排程器
+
+    第一個請求到達後最多等待 window_ms 毫秒（或湊滿 max_batch_size 個請求），
+    將收集到的請求交給 batch_fn 一次處理；batch_fn 必須返回與輸入等長、順序一致的結果列表。
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        window_ms: int = 10,
+        max_batch_size: int = 8,
+        name: str = 'inference'
+    ):
+        """
+        初始化微批次排程器
+
+        Args:
+            batch_fn: 批次處理函數，接收 payload 列表並返回對應的結果列表
+            window_ms: 收集批次的時間窗口（毫秒）
+            max_batch_size: 單一批次的最大請求數
+            name: 排程器名稱（用於日誌與工作執行緒名稱）
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size 必須大於 0，當前值: {max_batch_size}")
+
+        self.batch_fn = batch_fn
+        self.window_ms = max(0, window_ms)
+        self.max_batch_size = max_batch_size
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[_BatchItem]]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._batch_size_histogram: Dict[int, int] = {}
+        self._stage_latency: Dict[str, Dict[str, float]] = {}
+        self._total_requests = 0
+        self._total_batches = 0
+        self._failed_batches = 0
+
+        self._worker = threading.Thread(
+            target=self._run,
+            name=f"micro-batch-{name}",
+            daemon=True
+        )
+        self._worker.start()
+        logger.info(f"✅ 微批次排程器已啟動: {name} (window={self.window_ms}ms, max_batch={self.max_batch_size})")
+
+    def submit(self, payload: Any) -> Future:
+        """
+        提交一個請求到排程佇列
+
+        Args:
+            payload: 傳給 batch_fn 的單一請求資料
+
+        Returns:
+            Future 物件，批次完成後可取得此請求的結果
+        """
+        if self._stop_event.is_set():
+            raise RuntimeError(f"微批次排程器已停止: {self.name}")
+
+        item = _BatchItem(payload)
+        self._queue.put(item)
+        return item.future
+
+    def submit_and_wait(self, payload: Any, timeout: Optional[float] = None) -> Any:
+        """
+        提交請求並阻塞等待結果（供同步的 Flask 請求執行緒使用）
+
+        Args:
+            payload: 傳給 batch_fn 的單一請求資料
+            timeout: 最長等待秒數（None 表示不限）
+
+        Returns:
+            此請求的批次處理結果
+        """
+        return self.submit(payload).result(timeout=timeout)
+
+    def record_stage_latency(self, stage: str, elapsed_ms: float):
+        """
+        記錄某個處理階段的耗時（batch_fn 內部可呼叫以回報 SR/CNN/YOLO 等階段）
+
+        Args:
+            stage: 階段名稱
+            elapsed_ms: 耗時（毫秒）
+        """
+        with self._metrics_lock:
+            stats = self._stage_latency.setdefault(
+                stage, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            )
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取排程器指標
+
+        Returns:
+            包含佇列深度、批次大小直方圖與各階段延遲統計的字典
+        """
+        with self._metrics_lock:
+            stage_latency = {
+                stage: {
+                    'count': stats['count'],
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 2) if stats['count'] else 0.0,
+                    'max_ms': round(stats['max_ms'], 2)
+                }
+                for stage, stats in self._stage_latency.items()
+            }
+            return {
+                'name': self.name,
+                'queue_depth': self._queue.qsize(),
+                'window_ms': self.window_ms,
+                'max_batch_size': self.max_batch_size,
+                'total_requests': self._total_requests,
+                'total_batches': self._total_batches,
+                'failed_batches': self._failed_batches,
+                'avg_batch_size': round(self._total_requests / self._total_batches, 2) if self._total_batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_size_histogram.items())),
+                'stage_latency': stage_latency
+            }
+
+    def shutdown(self, timeout: Optional[float] = 5.0):
+        """
+        停止排程器，處理完佇列中剩餘的請求後結束工作執行緒
+
+        Args:
+            timeout: 等待工作執行緒結束的秒數
+        """
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._queue.put(None)  # 喚醒阻塞中的工作執行緒
+        self._worker.join(timeout=timeout)
+        logger.info(f"🧹 微批次排程器已停止: {self.name}")
+
+    def _collect_batch(self) -> List[_BatchItem]:
+        """阻塞等待第一個請求，然後在時間窗口內盡量湊滿批次"""
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.time() + self.window_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        """工作執行緒主迴圈"""
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                if self._stop_event.is_set() and self._queue.empty():
+                    break
+                continue
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: List[_BatchItem]):
+        """執行一個批次並將結果分送回各個 Future"""
+        batch_start = time.time()
+        with self._metrics_lock:
+            size = len(batch)
+            self._batch_size_histogram[size] = self._batch_size_histogram.get(size, 0) + 1
+            self._total_requests += size
+            self._total_batches += 1
+
+        for item in batch:
+            self.record_stage_latency('queue_wait', (batch_start - item.enqueued_at) * 1000)
+
+        try:
+            results = self.batch_fn([item.payload for item in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"批次結果數量不符: 預期 {len(batch)}，實際 {len(results)}")
+            for item, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    item.future.set_exception(result)
+                else:
+                    item.future.set_result(result)
+        except Exception as e:
+            with self._metrics_lock:
+                self._failed_batches += 1
+            logger.error(f"❌ 微批次處理失敗 ({self.name}, size={len(batch)}): {str(e)}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        finally:
+            self.record_stage_latency('batch_total', (time.time() - batch_start) * 1000)
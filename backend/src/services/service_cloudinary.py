@@ -3,6 +3,9 @@ Cloudinary 圖片儲存服務
 提供 Cloudinary 圖片上傳、刪除、轉換等功能
 """    
 
+import os
+import time
+import random
 import logging
 from typing import Optional, Dict, Any, Tuple
 import io
@@ -292,8 +295,134 @@ class CloudinaryStorage:
             raise
 
 
+class LocalCloudinaryStorage:
+    """
+    本地替代儲存（介面與 CloudinaryStorage 相同）
+    將圖片寫入本地資料夾並返回以 base_url 開頭的 URL，可模擬上傳延遲與失敗率，
+    供離線開發、測試背景上傳佇列與效能測試使用
+    """
+    
+    def __init__(
+        self,
+        root_dir: str,
+        base_url: str = '/local-cloudinary',
+        latency_ms: float = 0.0,
+        failure_rate: float = 0.0
+    ):
+        """
+        初始化本地替代儲存
+        
+        Args:
+            root_dir: 圖片儲存根目錄
+            base_url: 返回 URL 的前綴
+            latency_ms: 每次上傳模擬的網路延遲（毫秒）
+            failure_rate: 上傳失敗機率（0~1）
+        """
+        self.root_dir = root_dir
+        self.base_url = base_url.rstrip('/')
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.cloud_name = 'local'
+        os.makedirs(root_dir, exist_ok=True)
+        logger.info(f"✅ 本地 Cloudinary 替代儲存初始化: root_dir={root_dir}, latency_ms={latency_ms}, failure_rate={failure_rate}")
+    
+    def _resolve(self, public_id: str) -> str:
+        """將公開 ID 轉為根目錄下的檔案路徑（拒絕跳出根目錄的路徑）"""
+        root = os.path.abspath(self.root_dir)
+        path = os.path.abspath(os.path.join(root, public_id))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"無效的 public_id: {public_id}")
+        return path
+    
+    def upload_image(
+        self,
+        image_bytes: bytes,
+        public_id: Optional[str] = None,
+        folder: Optional[str] = None,
+        resource_type: str = "image",
+        overwrite: bool = True,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        將圖片寫入本地資料夾
+        
+        Args:
+            image_bytes: 圖片位元組資料
+            public_id: 公開 ID（可選，預設以時間戳命名）
+            folder: 資料夾路徑（可選）
+            resource_type: 資源類型（僅為相容介面）
+            overwrite: 是否覆蓋已存在的圖片
+            **kwargs: 其他上傳選項（忽略）
+        
+        Returns:
+            上傳結果字典，包含 secure_url, public_id 等
+        """
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        if self.failure_rate > 0 and random.random() < self.failure_rate:
+            raise ConnectionError("模擬上傳失敗")
+        
+        if not public_id:
+            public_id = f"{time.time_ns()}.jpg"
+        elif not public_id.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
+            public_id = f"{public_id}.jpg"
+        full_id = f"{folder.strip('/')}/{public_id}" if folder else public_id
+        
+        path = self._resolve(full_id)
+        if overwrite or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{time.time_ns()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(temp_path, path)
+        
+        return {
+            'public_id': os.path.splitext(full_id)[0],
+            'secure_url': f"{self.base_url}/{full_id}",
+            'url': f"{self.base_url}/{full_id}",
+            'bytes': len(image_bytes),
+            'format': os.path.splitext(full_id)[1].lstrip('.') or 'jpg',
+            'resource_type': resource_type
+        }
+    
+    def upload_image_from_path(
+        self,
+        file_path: str,
+        public_id: Optional[str] = None,
+        folder: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """從文件路徑上傳圖片（讀取後交給 upload_image）"""
+        with open(file_path, 'rb') as f:
+            return self.upload_image(f.read(), public_id=public_id, folder=folder, **kwargs)
+    
+    def get_image_url(self, public_id: str, transformation: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """獲取圖片 URL（本地儲存不支援轉換，直接返回原圖 URL）"""
+        if not os.path.splitext(public_id)[1]:
+            public_id = f"{public_id}.jpg"
+        return f"{self.base_url}/{public_id}"
+    
+    def delete_image(self, public_id: str, resource_type: str = "image") -> Dict[str, Any]:
+        """刪除本地圖片"""
+        if not os.path.splitext(public_id)[1]:
+            public_id = f"{public_id}.jpg"
+        path = self._resolve(public_id)
+        if os.path.exists(path):
+            os.remove(path)
+            return {'result': 'ok'}
+        return {'result': 'not found'}
+    
+    def optimize_url(self, public_id: str, **kwargs) -> str:
+        """獲取優化後的圖片 URL（本地儲存直接返回原圖 URL）"""
+        return self.get_image_url(public_id)
+    
+    def get_transformed_url(self, public_id: str, transformation: list = None, **kwargs) -> str:
+        """獲取帶有轉換的圖片 URL（本地儲存直接返回原圖 URL）"""
+        return self.get_image_url(public_id)
+
+
 # 全局實例
-_cloudinary_storage: Optional[CloudinaryStorage] = None
+_cloudinary_storage = None  # CloudinaryStorage 或 LocalCloudinaryStorage
 
 
 def get_cloudinary_storage() -> CloudinaryStorage:
@@ -334,3 +463,26 @@ def init_cloudinary_storage(
         logger.error(f"❌ 初始化 Cloudinary 儲存服務失敗: {str(e)}")
         return None
 
+
+
+def init_local_cloudinary_storage(
+    root_dir: str,
+    base_url: str = '/local-cloudinary',
+    latency_ms: float = 0.0,
+    failure_rate: float = 0.0
+) -> LocalCloudinaryStorage:
+    """
+    初始化全局本地替代儲存（不需要 cloudinary 模組與帳號）
+    
+    Args:
+        root_dir: 圖片儲存根目錄
+        base_url: 返回 URL 的前綴
+        latency_ms: 每次上傳模擬的網路延遲（毫秒）
+        failure_rate: 上傳失敗機率（0~1）
+    
+    Returns:
+        LocalCloudinaryStorage 實例
+    """
+    global _cloudinary_storage
+    _cloudinary_storage = LocalCloudinaryStorage(root_dir, base_url, latency_ms, failure_rate)
+    return _cloudinary_storage
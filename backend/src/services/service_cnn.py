@@ -5,14 +5,18 @@ CNN 分類服務
 
 import os
 import logging
-from typing import Dict, Optional
+import numpy as np
+from typing import Dict, List, Optional
 
 # 導入 CNN 模組
-from modules.cnn_load import load_cnn_model
-from modules.cnn_preprocess import preprocess_image, preprocess_image_from_bytes
+from modules.cnn_load import quantize_cnn_model
+from modules.cnn_backend import EagerBackend, load_cnn_backend
+from modules.model_registry import get_cnn_model
+from modules.cnn_preprocess import preprocess_image, preprocess_image_from_bytes, preprocess_image_from_array, preprocess_images_batch, preprocess_arrays_batch
 from modules.cnn_predict import cnn_predict
-from modules.cnn_postprocess import postprocess_cnn_result
+from modules.cnn_postprocess import postprocess_cnn_result, postprocess_cnn_batch_result
 from modules.cnn_utils import CNN_CLASSES, should_run_yolo, get_final_status
+from src.services.service_inference_cache import file_fingerprint
 
 # 設定日誌
 logging.basicConfig(
@@ -28,22 +32,87 @@ class CNNClassifierService:
     整合 CNN 模組功能，提供統一的服務接口
     """
     
-    def __init__(self, model_path: str, device: Optional[str] = None):
+    def __init__(
+        self,
+        model_path: str,
+        device: Optional[str] = None,
+        backend: str = 'eager',
+        parity_atol: float = 1e-3,
+        num_threads: int = 0,
+        export_dir: Optional[str] = None,
+        quantization: str = 'none',
+        quantization_gate=None
+    ):
         """
         初始化 CNN 分類服務
         
         Args:
             model_path: CNN 模型路徑 (.pth 檔案)
             device: 設備 ('cuda', 'cpu', 或 None 自動選擇)
+            backend: 推論後端 ('eager', 'torchscript', 'onnx')，匯出檔快取在檢查點旁
+            parity_atol: 非 eager 後端與 eager 的 softmax 分數容許誤差，超過時退回 eager
+            num_threads: ONNX Runtime intra-op 執行緒數（0 表示預設）
+            export_dir: 檢查點目錄不可寫入時的匯出目錄
+            quantization: INT8 量化模式 ('none', 'dynamic', 'static')，僅限 CPU；啟用時忽略 backend
+            quantization_gate: QuantizationGate，量化模型準確率下降超過門檻時拒絕啟用
         """
         self.model_path = model_path
         self.device = device or ('cuda' if __import__('torch').cuda.is_available() else 'cpu')
         self.classes = CNN_CLASSES
         self.num_classes = len(self.classes)
+        self.checkpoint_hash = file_fingerprint(model_path)
         
-        # 載入模型
-        self.model = load_cnn_model(model_path, self.num_classes, self.device)
-        logger.info(f"✅ CNN 分類服務初始化完成，類別: {self.classes}")
+        # 載入模型（由模型註冊表共用；eager 模型同時作為一致性檢查的參考）
+        self.model = get_cnn_model(model_path, self.num_classes, self.device)
+        
+        # 建立推論後端（失敗或與 eager 不一致時退回 eager）
+        self.backend, self.backend_info = load_cnn_backend(
+            self.model,
+            model_path,
+            backend=backend,
+            device=self.device,
+            checkpoint_hash=self.checkpoint_hash,
+            num_threads=num_threads,
+            atol=parity_atol,
+            fallback_export_dir=export_dir
+        )
+        
+        # INT8 量化（可選，須通過準確率閘門）
+        self.quantization_info = {'requested': quantization, 'enabled': False}
+        if quantization != 'none':
+            self._apply_quantization(quantization, quantization_gate, backend)
+        logger.info(f"✅ CNN 分類服務初始化完成，類別: {self.classes}，後端: {self.backend.name}"
+                    + ("（INT8）" if self.quantization_info['enabled'] else ""))
+    
+    def _apply_quantization(self, mode: str, gate, requested_backend: str):
+        """以通過準確率閘門的量化模型取代推論後端；未通過或無法驗證時保留 fp32"""
+        from src.services.service_quantization import cnn_classify_fn
+        
+        if self.device != 'cpu':
+            self.quantization_info['reason'] = 'INT8 quantization is CPU-only'
+            logger.warning(f"⚠️  INT8 量化僅支援 CPU（目前設備: {self.device}），使用 fp32")
+            return
+        if gate is None:
+            self.quantization_info['reason'] = 'no accuracy gate configured'
+            logger.warning("⚠️  未設定量化準確率閘門，使用 fp32")
+            return
+        
+        quantized, self.quantization_info = gate.prepare(
+            'cnn',
+            self.model_path,
+            mode,
+            components={'checkpoint': self.checkpoint_hash, 'classes': list(self.classes)},
+            quantize_fn=lambda arrays: quantize_cnn_model(self.model, mode, arrays, gate.engine),
+            reference_fn=cnn_classify_fn(self.model),
+            candidate_fn_factory=cnn_classify_fn
+        )
+        if quantized is None:
+            return
+        if requested_backend != 'eager':
+            logger.warning(f"⚠️  INT8 量化模型以 TorchScript 執行，忽略 CNN_BACKEND={requested_backend}")
+        self.backend = EagerBackend(quantized)
+        self.backend_info = {'requested': requested_backend, 'backend': 'eager', 'export_path': None,
+                             'parity': None, 'quantization': mode}
     
     def predict(self, image_path: str) -> Dict:
         """
@@ -65,7 +134,7 @@ class CNNClassifierService:
             input_tensor = preprocess_image(image_path, device=self.device)
             
             # 2. 執行推論
-            output = cnn_predict(self.model, input_tensor)
+            output = cnn_predict(self.backend, input_tensor)
             
             # 3. 後處理結果
             result = postprocess_cnn_result(output, self.classes)
@@ -91,7 +160,7 @@ class CNNClassifierService:
             input_tensor = preprocess_image_from_bytes(image_bytes, device=self.device)
             
             # 2. 執行推論
-            output = cnn_predict(self.model, input_tensor)
+            output = cnn_predict(self.backend, input_tensor)
             
             # 3. 後處理結果
             result = postprocess_cnn_result(output, self.classes)
@@ -102,6 +171,74 @@ class CNNClassifierService:
             logger.error(f"❌ CNN 預測失敗（從位元組）: {str(e)}")
             raise
     
+    def predict_array(self, image_array: np.ndarray) -> Dict:
+        """
+        從已解碼的 RGB 陣列執行 CNN 分類預測（不觸發解碼）
+        
+        Args:
+            image_array: RGB uint8 陣列 (H, W, 3)
+        
+        Returns:
+            與 predict() 相同的結果字典
+        """
+        try:
+            input_tensor = preprocess_image_from_array(image_array, device=self.device)
+            output = cnn_predict(self.backend, input_tensor)
+            return postprocess_cnn_result(output, self.classes)
+            
+        except Exception as e:
+            logger.error(f"❌ CNN 預測失敗（從陣列）: {str(e)}")
+            raise
+    
+    def predict_batch_arrays(self, image_arrays: List[np.ndarray]) -> List[Dict]:
+        """
+        以單次前向傳播對多個已解碼的 RGB 陣列執行 CNN 分類預測
+        
+        Args:
+            image_arrays: RGB uint8 陣列列表
+        
+        Returns:
+            結果字典列表，順序與輸入一致，每個元素格式同 predict()
+        """
+        try:
+            if not image_arrays:
+                return []
+            
+            input_tensor = preprocess_arrays_batch(image_arrays, device=self.device)
+            output = cnn_predict(self.backend, input_tensor)
+            return postprocess_cnn_batch_result(output, self.classes)
+            
+        except Exception as e:
+            logger.error(f"❌ CNN 批次預測失敗: {str(e)}")
+            raise
+    
+    def predict_batch(self, image_paths: List[str]) -> List[Dict]:
+        """
+        以單次前向傳播對多張圖片執行 CNN 分類預測
+        
+        Args:
+            image_paths: 圖片檔案路徑列表
+        
+        Returns:
+            結果字典列表，順序與輸入一致，每個元素格式同 predict()
+        """
+        try:
+            if not image_paths:
+                return []
+            
+            # 1. 預處理並堆疊為批次張量
+            input_tensor = preprocess_images_batch(image_paths, device=self.device)
+            
+            # 2. 執行推論（單次前向傳播）
+            output = cnn_predict(self.backend, input_tensor)
+            
+            # 3. 逐張後處理結果
+            return postprocess_cnn_batch_result(output, self.classes)
+            
+        except Exception as e:
+            logger.error(f"❌ CNN 批次預測失敗: {str(e)}")
+            raise
+    
     def should_run_yolo(self, best_class: str) -> bool:
         """
         判斷是否應該執行 YOLO 檢測
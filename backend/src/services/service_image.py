@@ -10,6 +10,8 @@ import io
 import logging
 from typing import Tuple, Optional
 
+from modules.image_buffer import ImageBuffer, decode_image_bytes
+
 # 設定日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -108,34 +110,61 @@ class ImageService:
             return False, f"圖片格式錯誤: {str(e)}"
     
     @staticmethod
-    def process_image(image_bytes: bytes, resize: bool = True, 
-                     target_size: Tuple[int, int] = TARGET_SIZE) -> Tuple[bytes, str]:
+    def process_image_buffer(image_bytes: bytes, resize: bool = True,
+                             target_size: Tuple[int, int] = TARGET_SIZE,
+                             filename: str = None) -> ImageBuffer:
         """
-        處理圖片：驗證、resize、計算 hash
+        處理圖片並返回記憶體內緩衝：驗證、resize、計算 hash（整個過程只解碼一次）
         
         Args:
             image_bytes: 原始圖片位元組
             resize: 是否 resize
             target_size: 目標尺寸
+            filename: 檔案名稱（可選，用於副檔名檢查）
         
         Returns:
-            (processed_bytes, image_hash)
+            ImageBuffer（pixels 為處理後像素，encoded 為處理後位元組，image_hash 與 perceptual_hash 已計算）
         """
-        # 1. 驗證圖片
-        is_valid, error_msg = ImageService.validate_image(image_bytes)
-        if not is_valid:
-            raise ValueError(error_msg)
-        
-        # 2. Resize（如果需要）
+        # 1. 驗證大小與副檔名（不需要解碼）
+        if len(image_bytes) > ImageService.MAX_FILE_SIZE:
+            raise ValueError(f"圖片大小超過限制 ({ImageService.MAX_FILE_SIZE / 1024 / 1024}MB)")
+        if filename:
+            ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            if ext not in ImageService.ALLOWED_EXTENSIONS:
+                raise ValueError(f"不支援的檔案格式: {ext}。支援格式: {', '.join(ImageService.ALLOWED_EXTENSIONS)}")
+        
+        # 2. 解碼（唯一一次；完整解碼同時完成格式驗證）
+        image = decode_image_bytes(image_bytes, stage='upload')
+        
+        # 3. Resize（如果需要），並以 JPEG 品質 85 編碼一次
         if resize:
-            processed_bytes = ImageService.resize_image(image_bytes, target_size)
-        else:
-            processed_bytes = image_bytes
+            image = image.resize(target_size)
+            image.encode(format='JPEG', quality=85, stage='upload')
+            logger.debug(f"✅ 圖片已 resize（拉伸）: {image.metadata.get('resized_from')} -> {target_size}")
         
-        # 3. 計算 hash
-        image_hash = ImageService.calculate_hash(processed_bytes)
+        # 4. 計算 hash（與 process_image 相同：對處理後位元組計算），
+        #    以及處理後像素的感知雜湊（重新存檔、不同壓縮品質的同一張圖片 SHA256 不同，感知雜湊只差幾個位元）
+        image.ensure_hash()
+        image.ensure_phash()
         
-        return processed_bytes, image_hash
+        return image
+    
+    @staticmethod
+    def process_image(image_bytes: bytes, resize: bool = True, 
+                     target_size: Tuple[int, int] = TARGET_SIZE) -> Tuple[bytes, str]:
+        """
+        處理圖片：驗證、resize、計算 hash（轉接層：結果同 process_image_buffer）
+        
+        Args:
+            image_bytes: 原始圖片位元組
+            resize: 是否 resize
+            target_size: 目標尺寸
+        
+        Returns:
+            (processed_bytes, image_hash)
+        """
+        image = ImageService.process_image_buffer(image_bytes, resize=resize, target_size=target_size)
+        return image.encoded, image.image_hash
     
     @staticmethod
     def compress_image(image_bytes: bytes, quality: int = 75, max_size: Tuple[int, int] = None) -> bytes:
@@ -13,6 +13,7 @@ from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from src.services.service_image import ImageService
+from modules.image_buffer import ImageBuffer, record_pipeline_event
 
 # 設定日誌
 logging.basicConfig(
@@ -31,7 +32,8 @@ class ImageManager:
         temp_file_ttl_hours: int = 24,
         cloudinary_storage=None,
         use_cloudinary: bool = False,
-        cloudinary_folder: str = 'leaf_disease_ai'
+        cloudinary_folder: str = 'leaf_disease_ai',
+        upload_queue=None
     ):
         """
         初始化圖片管理器
@@ -42,6 +44,7 @@ class ImageManager:
             cloudinary_storage: Cloudinary 儲存服務實例（可選）
             use_cloudinary: 是否使用 Cloudinary 儲存
             cloudinary_folder: Cloudinary 資料夾路徑
+            upload_queue: Cloudinary 背景上傳佇列（可選，None 時同步上傳）
         """
         self.upload_folder = upload_folder
         self.temp_file_ttl_hours = temp_file_ttl_hours
@@ -49,6 +52,7 @@ class ImageManager:
         self.cloudinary_storage = cloudinary_storage
         self.use_cloudinary = use_cloudinary and cloudinary_storage is not None
         self.cloudinary_folder = cloudinary_folder
+        self.upload_queue = upload_queue if self.use_cloudinary else None
         
         # 確保上傳資料夾存在（即使使用 Cloudinary，仍需要暫存文件）
         os.makedirs(upload_folder, exist_ok=True)
@@ -81,53 +85,77 @@ class ImageManager:
             logger.error(f"❌ Base64 解碼失敗: {str(e)}")
             raise ValueError(f"圖片格式錯誤: {str(e)}")
     
-    def process_uploaded_image(self, image_bytes: bytes, resize: bool = True) -> Tuple[bytes, str]:
+    def process_uploaded_image_buffer(self, image_bytes: bytes, resize: bool = True) -> ImageBuffer:
         """
-        處理上傳的圖片（驗證、resize、計算 hash）
+        處理上傳的圖片並返回記憶體內緩衝（驗證、resize、計算 hash，只解碼一次）
         
         Args:
             image_bytes: 原始圖片位元組
             resize: 是否 resize
         
         Returns:
-            (processed_bytes, image_hash)
+            ImageBuffer（encoded 為處理後位元組，image_hash 已計算）
         """
         try:
-            processed_bytes, image_hash = ImageService.process_image(
-                image_bytes, 
-                resize=resize
-            )
-            logger.debug(f"✅ 圖片處理完成: hash={image_hash[:8]}..., size={len(processed_bytes)} bytes")
-            return processed_bytes, image_hash
+            image = ImageService.process_image_buffer(image_bytes, resize=resize)
+            logger.debug(f"✅ 圖片處理完成: hash={image.image_hash[:8]}..., size={len(image.encoded)} bytes")
+            return image
             
         except Exception as e:
             logger.error(f"❌ 圖片處理失敗: {str(e)}")
             raise
     
-    def process_cropped_image(self, cropped_base64: str) -> Tuple[bytes, str]:
+    def process_uploaded_image(self, image_bytes: bytes, resize: bool = True) -> Tuple[bytes, str]:
         """
-        處理裁切後的圖片
+        處理上傳的圖片（驗證、resize、計算 hash）
         
         Args:
-            cropped_base64: 裁切後的 base64 圖片資料
+            image_bytes: 原始圖片位元組
+            resize: 是否 resize
         
         Returns:
             (processed_bytes, image_hash)
         """
+        image = self.process_uploaded_image_buffer(image_bytes, resize=resize)
+        return image.encoded, image.image_hash
+    
+    def process_cropped_image_buffer(self, cropped_base64: str) -> ImageBuffer:
+        """
+        處理裁切後的圖片並返回記憶體內緩衝
+        
+        Args:
+            cropped_base64: 裁切後的 base64 圖片資料
+        
+        Returns:
+            ImageBuffer（encoded 為處理後位元組，image_hash 已計算）
+        """
         try:
             # 解碼 base64
             img_bytes = self.decode_base64_image(cropped_base64)
             
             # 處理圖片（驗證、resize、計算 hash）
-            processed_bytes, image_hash = self.process_uploaded_image(img_bytes, resize=True)
+            image = self.process_uploaded_image_buffer(img_bytes, resize=True)
             
-            logger.info(f"✅ 裁切圖片處理完成: hash={image_hash[:8]}...")
-            return processed_bytes, image_hash
+            logger.info(f"✅ 裁切圖片處理完成: hash={image.image_hash[:8]}...")
+            return image
             
         except Exception as e:
             logger.error(f"❌ 裁切圖片處理失敗: {str(e)}")
             raise
     
+    def process_cropped_image(self, cropped_base64: str) -> Tuple[bytes, str]:
+        """
+        處理裁切後的圖片
+        
+        Args:
+            cropped_base64: 裁切後的 base64 圖片資料
+        
+        Returns:
+            (processed_bytes, image_hash)
+        """
+        image = self.process_cropped_image_buffer(cropped_base64)
+        return image.encoded, image.image_hash
+    
     @contextmanager
     def create_temp_file(self, image_bytes: bytes, suffix: str = '.jpg'):
         """
@@ -151,6 +179,7 @@ class ImageManager:
                 dir=self.upload_folder
             )
             temp_file.write(image_bytes)
+            record_pipeline_event('temp_file', 'io_write')
             temp_file_path = temp_file.name
             temp_file.close()
             temp_file = None
@@ -471,7 +500,8 @@ def init_image_manager(
     temp_file_ttl_hours: int = 24,
     cloudinary_storage=None,
     use_cloudinary: bool = False,
-    cloudinary_folder: str = 'leaf_disease_ai'
+    cloudinary_folder: str = 'leaf_disease_ai',
+    upload_queue=None
 ) -> ImageManager:
     """
     初始化全局圖片管理器
@@ -482,6 +512,7 @@ def init_image_manager(
         cloudinary_storage: Cloudinary 儲存服務實例（可選）
         use_cloudinary: 是否使用 Cloudinary 儲存
         cloudinary_folder: Cloudinary 資料夾路徑
+        upload_queue: Cloudinary 背景上傳佇列（可選）
     
     Returns:
         ImageManager 實例
@@ -492,7 +523,8 @@ def init_image_manager(
         temp_file_ttl_hours,
         cloudinary_storage=cloudinary_storage,
         use_cloudinary=use_cloudinary,
-        cloudinary_folder=cloudinary_folder
+        cloudinary_folder=cloudinary_folder,
+        upload_queue=upload_queue
     )
     return _image_manager
 
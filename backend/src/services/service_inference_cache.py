@@ -0,0 +1,282 @@
+"""
+推論結果快取服務
+以「圖片內容 hash + 模型指紋」為鍵快取純推論輸出（CNN 分數、YOLO 檢測框），與使用者無關
+兩層結構：程序內 LRU（依筆數與位元組數淘汰）在前，Redis 在後
+"""
+
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.core_redis_manager import redis_manager
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 快取的推論欄位（不含耗時等每次請求才有意義的欄位）
+CACHED_FIELDS = ('cnn_result', 'workflow_step', 'final_status', 'yolo_result', 'yolo_detected')
+
+
+def file_fingerprint(path: Optional[str], chunk_size: int = 1024 * 1024) -> str:
+    """
+    計算模型檔案內容的 SHA256（分塊讀取，不一次載入整個檔案）
+
+    Args:
+        path: 模型檔案路徑（None 或不存在時返回 'none'）
+        chunk_size: 每次讀取的位元組數
+
+    Returns:
+        SHA256 十六進位字串
+    """
+    if not path or not os.path.exists(path):
+        return 'none'
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_model_fingerprint(components: Dict[str, Any]) -> str:
+    """
+    將各模型的檔案指紋與影響輸出的設定合併為單一指紋
+
+    Args:
+        components: {'cnn': 檔案 hash, 'yolo': 檔案 hash, 'sr': ..., 其他設定}
+
+    Returns:
+        16 字元的模型指紋
+    """
+    payload = json.dumps(components, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class InferenceCache:
+    """
+    模型版本化、內容定址的推論結果快取
+
+    鍵為 inference:{模型指紋}:{圖片 hash}；模型指紋由已載入的 CNN/YOLO/SR 檢查點內容計算，
+    更換任何檢查點後重新啟動即產生新的鍵空間，舊結果不會再被讀到（Redis 中的舊鍵由 TTL 自然過期，
+    或以 invalidate_model() 依 inference:{模型指紋}:* 前綴立即刪除）。
+    寫入不加標籤：模型指紋已在鍵前綴中，不需要另外維護一個隨每次推論增長的標籤集合。
+    """
+
+    KEY_PREFIX = 'inference'
+
+    def __init__(
+        self,
+        fingerprint: str,
+        max_entries: int = 512,
+        max_bytes: int = 8 * 1024 * 1024,
+        redis_ttl: int = 86400,
+        use_redis: bool = True
+    ):
+        """
+        初始化推論結果快取
+
+        Args:
+            fingerprint: 模型指紋（見 build_model_fingerprint）
+            max_entries: 程序內 LRU 最大筆數
+            max_bytes: 程序內 LRU 最大位元組數（以 JSON 序列化後大小計算）
+            redis_ttl: Redis 層的過期時間（秒）
+            use_redis: 是否使用 Redis 作為第二層
+        """
+        self.fingerprint = fingerprint
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.redis_ttl = redis_ttl
+        self.use_redis = use_redis
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._counters = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'prefetched': 0
+        }
+        logger.info(f"✅ 推論結果快取已啟用 (fingerprint={fingerprint}, max_entries={self.max_entries}, max_bytes={self.max_bytes})")
+
+    def _key(self, image_hash: str) -> str:
+        return f"{self.KEY_PREFIX}:{self.fingerprint}:{image_hash}"
+
+    def _put_local(self, key: str, value: Dict[str, Any], size: int):
+        """寫入程序內 LRU 並依筆數與位元組數淘汰（呼叫者需持有鎖）"""
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters['evictions'] += 1
+
+    def get(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢推論結果（先查程序內 LRU，再查 Redis；Redis 命中時回填 LRU）
+
+        Args:
+            image_hash: 圖片內容 hash
+
+        Returns:
+            推論結果字典（欄位見 CACHED_FIELDS）或 None
+        """
+        if not image_hash:
+            return None
+        key = self._key(image_hash)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['local_hits'] += 1
+                return dict(entry[0])
+
+        if self.use_redis:
+            value = redis_manager.get(key)
+            if isinstance(value, dict):
+                size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+                with self._lock:
+                    self._put_local(key, value, size)
+                    self._counters['redis_hits'] += 1
+                return dict(value)
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def prefetch(self, image_hashes: List[str]) -> int:
+        """
+        以單次 Redis MGET 將程序內 LRU 沒有的推論結果預先載入（批次檢測在逐張 get() 前呼叫）
+
+        Args:
+            image_hashes: 圖片內容 hash 列表
+
+        Returns:
+            從 Redis 載入的筆數
+        """
+        if not self.use_redis:
+            return 0
+        with self._lock:
+            keys = list(dict.fromkeys(
+                self._key(image_hash) for image_hash in image_hashes
+                if image_hash and self._key(image_hash) not in self._entries
+            ))
+        if not keys:
+            return 0
+        loaded = 0
+        for key, value in zip(keys, redis_manager.mget(keys)):
+            if isinstance(value, dict):
+                size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+                with self._lock:
+                    self._put_local(key, value, size)
+                    self._counters['prefetched'] += 1
+                loaded += 1
+        return loaded
+
+    def put(self, image_hash: str, inference: Dict[str, Any]):
+        """
+        寫入推論結果（只保留 CACHED_FIELDS，兩層同時寫入）
+
+        Args:
+            image_hash: 圖片內容 hash
+            inference: _run_inference() 的輸出
+        """
+        self.put_many([(image_hash, inference)])
+
+    def put_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        """
+        寫入多筆推論結果（Redis 以單次管線往返寫入）
+
+        Args:
+            items: [(圖片內容 hash, _run_inference() 的輸出)]
+        """
+        values = {}
+        for image_hash, inference in items:
+            if not image_hash:
+                continue
+            key = self._key(image_hash)
+            value = {field: inference.get(field) for field in CACHED_FIELDS}
+            serialized = json.dumps(value, ensure_ascii=False)
+            with self._lock:
+                self._put_local(key, value, len(serialized.encode('utf-8')))
+                self._counters['stores'] += 1
+            values[key] = value
+
+        if self.use_redis and values:
+            redis_manager.mset(values, expire=self.redis_ttl)
+
+    def invalidate_model(self, fingerprint: Optional[str] = None) -> int:
+        """
+        刪除某個模型版本在 Redis 中的所有推論結果（以 SCAN 走訪 inference:{模型指紋}:* 並分批 UNLINK）
+
+        其他仍使用該指紋的 worker 會失去 Redis 層的結果，適合在所有 worker 都已切換到新模型後執行
+
+        Args:
+            fingerprint: 模型指紋（預設為目前的指紋，此時同時清空程序內 LRU）
+
+        Returns:
+            刪除的鍵數量
+        """
+        fingerprint = fingerprint or self.fingerprint
+        if fingerprint == self.fingerprint:
+            with self._lock:
+                self._entries.clear()
+                self._bytes = 0
+                self._counters['invalidations'] += 1
+        if not self.use_redis:
+            return 0
+        deleted = redis_manager.clear_pattern(f"{self.KEY_PREFIX}:{fingerprint}:*")
+        logger.info(f"🧹 已刪除模型 {fingerprint} 的推論結果快取: {deleted} 筆")
+        return deleted
+
+    def set_fingerprint(self, fingerprint: str):
+        """
+        切換模型指紋（模型熱更新後呼叫），程序內 LRU 立即清空，Redis 舊鍵不再被讀取
+
+        Args:
+            fingerprint: 新的模型指紋
+        """
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            logger.info(f"🔄 模型指紋變更: {self.fingerprint} -> {fingerprint}，推論結果快取已失效")
+            self.fingerprint = fingerprint
+            self._entries.clear()
+            self._bytes = 0
+            self._counters['invalidations'] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取快取指標
+
+        Returns:
+            命中/未命中/淘汰次數、目前筆數與位元組數、命中率
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters['local_hits'] + counters['redis_hits'] + counters['misses']
+            hits = counters['local_hits'] + counters['redis_hits']
+            return {
+                'fingerprint': self.fingerprint,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                **counters
+            }
@@ -0,0 +1,844 @@
+"""
+推論伺服器與客戶端
+推論伺服器模式（INFERENCE_MODE=server）下，模型只載入在獨立的推論程序池中，gunicorn web worker 不載入任何模型：
+
+- web worker 的 InferenceClient 建立一塊共享記憶體（固定數量的圖片槽位），把已解碼的像素複製進槽位後，
+  透過 Unix socket 只傳送槽位編號與陣列形狀；推論程序直接以 NumPy 檢視共享記憶體，不再複製或序列化像素
+- InferenceServer 管理推論程序：每個程序綁定一組 CPU 並設定對應的 torch 執行緒數，一次處理一張圖片；
+  程序崩潰或單次推論超過 task_timeout 時重新啟動，進行中的請求以錯誤返回給呼叫者
+- 推論結果（與程序內模式相同的 inference 字典）經由同一條連線傳回
+"""
+
+import os
+import time
+import atexit
+import socket
+import logging
+import itertools
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener, wait
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """附加到其他程序建立的共享記憶體（不交給本程序的 resource_tracker 管理，避免結束時被誤刪）"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 沒有 track 參數
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+def _percentiles(samples) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0, 'p50_ms': 0.0, 'p99_ms': 0.0}
+    return {
+        'count': len(ordered),
+        'p50_ms': round(ordered[len(ordered) // 2], 2),
+        'p99_ms': round(ordered[max(int(len(ordered) * 0.99) - 1, 0)], 2)
+    }
+
+
+class SharedImageArena:
+    """客戶端的共享記憶體圖片槽位（每個槽位同時只供一個請求使用）"""
+
+    def __init__(self, slots: int, slot_bytes: int):
+        """
+        建立共享記憶體
+
+        Args:
+            slots: 槽位數（同時進行中的請求上限，超過時呼叫者等待）
+            slot_bytes: 每個槽位的位元組數（超過的圖片改以連線直接傳送）
+        """
+        self.slots = max(1, slots)
+        self.slot_bytes = max(1, slot_bytes)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self.name = self.shm.name
+        self._free = deque(range(self.slots))
+        self._cond = threading.Condition()
+        self._owner_pid = os.getpid()
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """取得空閒槽位，逾時返回 None"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not self._free:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._free.popleft()
+
+    def release(self, slot: int):
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify()
+
+    def write(self, slot: int, pixels: np.ndarray) -> Tuple[Tuple[int, ...], str]:
+        """將像素複製到槽位，返回（形狀, dtype）"""
+        view = np.ndarray(pixels.shape, dtype=pixels.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = pixels
+        return tuple(pixels.shape), pixels.dtype.str
+
+    @property
+    def free_slots(self) -> int:
+        with self._cond:
+            return len(self._free)
+
+    def close(self):
+        if os.getpid() != self._owner_pid:
+            return
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+
+
+class InferenceClient:
+    """
+    推論伺服器客戶端（每個 web worker 一個，多個請求執行緒共用一條連線）
+
+    連線在第一次使用時建立；連線中斷時進行中的請求以 ConnectionError 結束，下一個請求自動重新連線
+    """
+
+    # 隨像素一起傳送的圖片中繼資料（推論程序的超解析度策略使用）
+    FORWARDED_METADATA = ('original_size', 'jpeg_quality')
+
+    def __init__(
+        self,
+        address: str,
+        authkey: bytes,
+        slots: int = 8,
+        slot_bytes: int = 16 * 1024 * 1024,
+        request_timeout: float = 120.0,
+        connect_timeout: float = 120.0
+    ):
+        """
+        初始化推論伺服器客戶端
+
+        Args:
+            address: 推論伺服器的 Unix socket 路徑
+            authkey: 連線驗證金鑰（與伺服器相同）
+            slots: 共享記憶體槽位數
+            slot_bytes: 每個槽位的位元組數
+            request_timeout: 單次推論的最長等待秒數
+            connect_timeout: 等待伺服器就緒的最長秒數（伺服器啟動時需要載入模型）
+        """
+        self.address = address
+        self.authkey = authkey
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.server_info: Dict[str, Any] = {}
+        self._reset_state()
+        atexit.register(self.close)
+        if hasattr(os, 'register_at_fork'):
+            # fork 後子程序建立自己的連線與共享記憶體
+            os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._conn = None
+        self._arena: Optional[SharedImageArena] = None
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._latencies = deque(maxlen=1024)
+        self._counters = {
+            'requests': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'shm_transfers': 0,
+            'inline_transfers': 0,
+            'slot_waits': 0,
+            'reconnects': 0
+        }
+
+    def connect(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        連線到推論伺服器（已連線時直接返回）
+
+        Returns:
+            伺服器資訊（模型指紋、CNN 後端、量化狀態、超解析度設定、worker 數）
+        """
+        with self._lock:
+            if self._conn is not None:
+                return self.server_info
+            deadline = time.time() + (self.connect_timeout if timeout is None else timeout)
+            while True:
+                try:
+                    conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+                    break
+                except (OSError, EOFError) as e:
+                    if time.time() >= deadline:
+                        raise ConnectionError(f"無法連線到推論伺服器 {self.address}: {str(e)}")
+                    time.sleep(0.5)
+
+            if self._arena is None:
+                self._arena = SharedImageArena(self.slots, self.slot_bytes)
+            conn.send(('hello', {'pid': os.getpid(), 'arena': self._arena.name, 'slot_bytes': self._arena.slot_bytes}))
+            kind, info = conn.recv()
+            if kind != 'hello':
+                conn.close()
+                raise ConnectionError(f"推論伺服器回應異常: {kind}")
+            if self.server_info:
+                self._counters['reconnects'] += 1
+            self.server_info = info
+            self._conn = conn
+            threading.Thread(target=self._read_results, args=(conn,), name='inference-client', daemon=True).start()
+            logger.info(f"✅ 已連線到推論伺服器: {self.address}（{info.get('workers')} 個推論程序）")
+            return self.server_info
+
+    def _read_results(self, conn):
+        while True:
+            try:
+                _, request_id, ok, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id, None)
+            if future is None or future.done():
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("推論伺服器連線中斷"))
+        logger.warning("⚠️  推論伺服器連線中斷，下一個請求將重新連線")
+
+    def _send(self, message_fn: Callable[[int], Tuple]) -> Future:
+        self.connect()
+        request_id = next(self._ids)
+        future: Future = Future()
+        self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                self._conn.send(message_fn(request_id))
+        except Exception as e:
+            self._pending.pop(request_id, None)
+            future.set_exception(ConnectionError(f"傳送推論請求失敗: {str(e)}"))
+        return future
+
+    def submit(self, pixels: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        提交一張圖片，返回 Future（結果為推論字典）
+
+        Args:
+            pixels: RGB uint8 陣列 (H, W, 3)
+            metadata: 圖片中繼資料（只傳送超解析度策略需要的原始尺寸與 JPEG 品質）
+        """
+        metadata = {key: (metadata or {}).get(key) for key in self.FORWARDED_METADATA}
+        self.connect()
+        pixels = np.ascontiguousarray(pixels)
+        arena = self._arena
+        slot = None
+        if pixels.nbytes <= arena.slot_bytes:
+            slot = arena.acquire(timeout=0)
+            if slot is None:
+                self._counters['slot_waits'] += 1
+                slot = arena.acquire(timeout=self.request_timeout)
+
+        self._counters['requests'] += 1
+        if slot is None:
+            # 圖片大於槽位（或等待槽位逾時）：直接經由連線傳送
+            self._counters['inline_transfers'] += 1
+            future = self._send(lambda request_id: ('infer_inline', request_id, pixels, metadata))
+        else:
+            self._counters['shm_transfers'] += 1
+            shape, dtype = arena.write(slot, pixels)
+            future = self._send(lambda request_id: ('infer', request_id, slot, shape, dtype, metadata))
+            # 推論程序讀完槽位才會返回結果，此時即可重複使用
+            future.add_done_callback(lambda _: arena.release(slot))
+        return future
+
+    def _wait(self, future: Future, start: float, timeout: Optional[float]) -> Dict[str, Any]:
+        try:
+            result = future.result(timeout=self.request_timeout if timeout is None else timeout)
+        except Exception as e:
+            self._counters['failed'] += 1
+            if not future.done():
+                self._counters['timeouts'] += 1
+                future.cancel()
+                raise TimeoutError(f"推論伺服器在 {self.request_timeout}s 內未返回結果") from e
+            raise
+        self._latencies.append((time.perf_counter() - start) * 1000)
+        return result
+
+    def infer(
+        self,
+        pixels: np.ndarray,
+        timeout: Optional[float] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """執行單張圖片推論（阻塞直到返回）"""
+        start = time.perf_counter()
+        return self._wait(self.submit(pixels, metadata), start, timeout)
+
+    def infer_batch(
+        self,
+        pixel_list: List[np.ndarray],
+        timeout: Optional[float] = None,
+        metadata_list: Optional[List[Optional[Dict[str, Any]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """同時提交多張圖片（由多個推論程序並行處理），結果順序與輸入一致"""
+        start = time.perf_counter()
+        metadata_list = metadata_list or [None] * len(pixel_list)
+        futures = [self.submit(pixels, metadata) for pixels, metadata in zip(pixel_list, metadata_list)]
+        return [self._wait(future, start, timeout) for future in futures]
+
+    def get_server_metrics(self, timeout: float = 2.0) -> Dict[str, Any]:
+        """向伺服器查詢推論程序狀態"""
+        try:
+            return self._send(lambda request_id: ('stats', request_id)).result(timeout=timeout)
+        except Exception as e:
+            return {'error': str(e)}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取客戶端指標
+
+        Returns:
+            請求數、共享記憶體 / 直接傳送次數、槽位等待次數、往返延遲，以及伺服器端的推論程序狀態
+        """
+        arena = self._arena
+        return {
+            'mode': 'server',
+            'address': self.address,
+            'connected': self._conn is not None,
+            'slots': self.slots,
+            'free_slots': arena.free_slots if arena else self.slots,
+            'slot_bytes': self.slot_bytes,
+            'pending': len(self._pending),
+            'latency': _percentiles(list(self._latencies)),
+            **self._counters,
+            'server': self.get_server_metrics() if self._conn is not None else None
+        }
+
+    def close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                # 讀取執行緒仍阻塞在 recv 時 close 不會釋放 socket，先 shutdown 讓伺服器立即收到離線通知
+                with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except Exception:
+                pass
+        if self._arena is not None:
+            self._arena.close()
+
+
+def plan_worker_cpus(workers: int, threads_per_worker: int = 0, pin_cpus: bool = True) -> List[Tuple[int, Optional[List[int]]]]:
+    """
+    依本程序可用的 CPU（sched_getaffinity，容器 cpuset 限制後的結果）分配每個推論程序的執行緒數與綁定的 CPU
+
+    Args:
+        workers: 推論程序數
+        threads_per_worker: 每個程序的 torch 執行緒數（0 表示可用 CPU 平均分配）
+        pin_cpus: 是否將每個程序綁定到互不重疊的 CPU
+
+    Returns:
+        [(執行緒數, CPU 列表或 None)]，長度為 workers
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    per_worker = max(1, len(cpus) // max(1, workers))
+    threads = threads_per_worker if threads_per_worker > 0 else per_worker
+    plan = []
+    for index in range(workers):
+        assigned = None
+        if pin_cpus and hasattr(os, 'sched_setaffinity') and len(cpus) >= workers:
+            assigned = cpus[index * per_worker:(index + 1) * per_worker]
+        plan.append((threads, assigned))
+    return plan
+
+
+def build_inference_engine(engine_kwargs: Dict[str, Any]):
+    """
+    推論程序中建立推論引擎（只用於推論的 IntegratedDetectionService：不批次、不快取、不建立持久層）
+
+    推論程序不導入 core_db_manager：不建立資料庫連接池、不執行 DDL，也不啟動會重放
+    data/write_behind 溢寫檔的預測寫入器（溢寫檔只由 web worker 重放）
+    """
+    from src.services.service_integrated import IntegratedDetectionService
+
+    return IntegratedDetectionService(**{
+        **engine_kwargs,
+        'enable_batching': False,
+        'enable_inference_cache': False,
+        'enable_near_duplicate': False,
+        'enable_persistence': False,
+        'inference_client': None
+    })
+
+
+def _inference_worker_main(worker_id, conn, engine_factory, engine_kwargs, threads, cpus):
+    """推論程序進入點"""
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"⚠️  推論程序 {worker_id} 無法綁定 CPU {cpus}: {str(e)}")
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    try:
+        engine = engine_factory(engine_kwargs)
+        info = engine.get_model_info() if hasattr(engine, 'get_model_info') else {}
+    except Exception:
+        conn.send(('failed', traceback.format_exc()))
+        return
+    conn.send(('ready', os.getpid(), info))
+
+    arenas: Dict[str, shared_memory.SharedMemory] = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        if message[0] == 'detach':
+            shm = arenas.pop(message[1], None)
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+            continue
+
+        _, task_key, transfer = message
+        start = time.perf_counter()
+        pixels = None
+        try:
+            if transfer[0] == 'shm':
+                _, name, offset, shape, dtype, metadata = transfer
+                shm = arenas.get(name)
+                if shm is None:
+                    shm = arenas[name] = _attach_shared_memory(name)
+                pixels = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            else:
+                _, pixels, metadata = transfer
+            ok, payload = True, engine.infer_pixels(pixels, metadata)
+        except Exception as e:
+            ok, payload = False, f"{type(e).__name__}: {str(e)}"
+            logger.error(f"❌ 推論程序 {worker_id} 推論失敗: {payload}", exc_info=True)
+        finally:
+            pixels = None
+        conn.send(('done', task_key, ok, payload, (time.perf_counter() - start) * 1000))
+
+    for shm in arenas.values():
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+class _WorkerState:
+    __slots__ = ('worker_id', 'process', 'conn', 'threads', 'cpus', 'ready', 'task', 'task_started',
+                 'processed', 'failed', 'restarts', 'last_start', 'respawn_at')
+
+    def __init__(self, worker_id: int, threads: int, cpus: Optional[List[int]]):
+        self.worker_id = worker_id
+        self.threads = threads
+        self.cpus = cpus
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.task = None  # (client_id, request_id)
+        self.task_started = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.last_start = 0.0
+        self.respawn_at = 0.0
+
+
+class _ClientState:
+    __slots__ = ('conn', 'send_lock', 'arena', 'slot_bytes', 'pid')
+
+    def __init__(self, conn, arena: str, slot_bytes: int, pid: int):
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.arena = arena
+        self.slot_bytes = slot_bytes
+        self.pid = pid
+
+
+class InferenceServer:
+    """
+    推論伺服器：管理推論程序池並接受 web worker 的連線
+
+    請求先進入伺服器端的待處理佇列，再分派給空閒的推論程序（每個程序一次一張），
+    因此伺服器知道每個程序正在處理哪個請求，程序崩潰或逾時時能準確回報錯誤
+    """
+
+    def __init__(
+        self,
+        address: str,
+        authkey: bytes,
+        engine_kwargs: Dict[str, Any],
+        workers: int = 2,
+        threads_per_worker: int = 0,
+        pin_cpus: bool = True,
+        task_timeout: float = 120.0,
+        max_pending: int = 256,
+        ready_timeout: float = 600.0,
+        engine_factory: Callable[[Dict[str, Any]], Any] = build_inference_engine
+    ):
+        """
+        初始化推論伺服器
+
+        Args:
+            address: Unix socket 路徑
+            authkey: 連線驗證金鑰
+            engine_kwargs: 推論引擎參數（IntegratedDetectionService 的模型相關參數）
+            workers: 推論程序數
+            threads_per_worker: 每個程序的 torch 執行緒數（0 表示可用 CPU 平均分配）
+            pin_cpus: 是否將每個程序綁定到互不重疊的 CPU
+            task_timeout: 單張圖片推論的最長秒數，超過時視為卡住並重新啟動該程序
+            max_pending: 待處理佇列上限，超過時直接返回錯誤
+            ready_timeout: 啟動時等待模型載入完成的最長秒數
+            engine_factory: 推論程序中建立推論引擎的函數（必須可被 pickle，即模組層級函數）
+        """
+        self.address = address
+        self.authkey = authkey
+        self.engine_kwargs = engine_kwargs
+        self.engine_factory = engine_factory
+        self.task_timeout = task_timeout
+        self.max_pending = max(1, max_pending)
+        self.ready_timeout = ready_timeout
+        self._ctx = get_context('spawn')
+        self._lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._workers = [
+            _WorkerState(worker_id, threads, cpus)
+            for worker_id, (threads, cpus) in enumerate(plan_worker_cpus(workers, threads_per_worker, pin_cpus))
+        ]
+        self._clients: Dict[int, _ClientState] = {}
+        self._client_ids = itertools.count(1)
+        self._backlog: deque = deque()  # (client_id, request_id, transfer, enqueued_at)
+        self.model_info: Dict[str, Any] = {}
+        self._latencies = deque(maxlen=1024)
+        self._queue_wait = deque(maxlen=1024)
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'restarts': 0, 'crashed_tasks': 0}
+        self._listener = None
+
+    # ------------------------------------------------------------------
+    # 推論程序管理
+    # ------------------------------------------------------------------
+
+    def _spawn(self, worker: _WorkerState):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        # spawn 的子程序在導入 torch 前就讀到執行緒數設定
+        for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ[name] = str(worker.threads)
+        process = self._ctx.Process(
+            target=_inference_worker_main,
+            args=(worker.worker_id, child_conn, self.engine_factory, self.engine_kwargs, worker.threads, worker.cpus),
+            name=f"inference-{worker.worker_id}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.ready = False
+        worker.task = None
+        worker.last_start = time.time()
+        logger.info(f"📦 推論程序 {worker.worker_id} 啟動中 (pid={process.pid}, threads={worker.threads}, cpus={worker.cpus})")
+
+    def start(self):
+        """啟動所有推論程序並等待模型載入完成（至少一個程序就緒才返回）"""
+        for worker in self._workers:
+            self._spawn(worker)
+        threading.Thread(target=self._dispatch_loop, name='inference-dispatch', daemon=True).start()
+        if not self._ready_event.wait(self.ready_timeout):
+            raise RuntimeError(f"推論程序在 {self.ready_timeout}s 內未就緒")
+        atexit.register(self.shutdown)
+
+    def _restart(self, worker: _WorkerState, reason: str):
+        """結束推論程序並排定重新啟動；進行中的請求以錯誤返回（呼叫時須持有 _lock）"""
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        logger.error(f"❌ 推論程序 {worker.worker_id} (pid={worker.process.pid}) {reason} "
+                     f"(exit={worker.process.exitcode})，重新啟動")
+        try:
+            worker.conn.close()
+        except Exception:
+            pass
+        worker.conn = None
+        worker.ready = False
+        if worker.task is not None:
+            client_id, request_id = worker.task
+            worker.task = None
+            self._counters['crashed_tasks'] += 1
+            self._counters['failed'] += 1
+            self._reply(client_id, request_id, False, f"推論程序{reason}")
+        worker.restarts += 1
+        self._counters['restarts'] += 1
+        # 啟動後很快又結束時延後重啟，避免在模型無法載入時不停重啟
+        delay = min(5.0, worker.restarts) if time.time() - worker.last_start < 10 else 0.0
+        worker.respawn_at = time.time() + delay
+
+    def _assign(self):
+        """將待處理請求分派給空閒的推論程序（呼叫時須持有 _lock）"""
+        for worker in self._workers:
+            if not self._backlog:
+                return
+            if not worker.ready or worker.task is not None:
+                continue
+            client_id, request_id, transfer, enqueued_at = self._backlog.popleft()
+            try:
+                worker.conn.send(('task', (client_id, request_id), transfer))
+            except Exception:
+                self._backlog.appendleft((client_id, request_id, transfer, enqueued_at))
+                continue
+            worker.task = (client_id, request_id)
+            worker.task_started = time.time()
+            self._queue_wait.append((worker.task_started - enqueued_at) * 1000)
+
+    def _dispatch_loop(self):
+        """接收推論程序的訊息（就緒、結果），並檢查程序存活與逾時"""
+        while not self._stop_event.is_set():
+            connections = {worker.conn: worker for worker in self._workers if worker.conn is not None}
+            if not connections:
+                time.sleep(0.5)
+            try:
+                readable = wait(list(connections), timeout=0.5) if connections else []
+            except OSError:
+                readable = []
+            for conn in readable:
+                worker = connections[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    with self._lock:
+                        if worker.conn is conn and not self._stop_event.is_set():
+                            self._restart(worker, "已結束")
+                    continue
+                self._handle_worker_message(worker, message)
+
+            now = time.time()
+            with self._lock:
+                if self._stop_event.is_set():
+                    break
+                for worker in self._workers:
+                    if worker.conn is None:
+                        if now >= worker.respawn_at:
+                            self._spawn(worker)
+                    elif not worker.process.is_alive() and worker.conn not in readable:
+                        self._restart(worker, "已結束")
+                    elif worker.task is not None and now - worker.task_started > self.task_timeout:
+                        self._restart(worker, f"超過 {self.task_timeout}s 未完成推論")
+                self._assign()
+
+    def _handle_worker_message(self, worker: _WorkerState, message: Tuple):
+        kind = message[0]
+        if kind == 'ready':
+            _, pid, info = message
+            with self._lock:
+                worker.ready = True
+                if not self.model_info:
+                    self.model_info = info
+                self._assign()
+            logger.info(f"✅ 推論程序 {worker.worker_id} 已就緒 (pid={pid})")
+            self._ready_event.set()
+        elif kind == 'failed':
+            logger.error(f"❌ 推論程序 {worker.worker_id} 初始化失敗:\n{message[1]}")
+        elif kind == 'done':
+            _, (client_id, request_id), ok, payload, elapsed_ms = message
+            with self._lock:
+                worker.task = None
+                worker.processed += 1
+                if not ok:
+                    worker.failed += 1
+                    self._counters['failed'] += 1
+                else:
+                    self._counters['completed'] += 1
+                self._latencies.append(elapsed_ms)
+                self._assign()
+            self._reply(client_id, request_id, ok, payload)
+
+    # ------------------------------------------------------------------
+    # 客戶端連線
+    # ------------------------------------------------------------------
+
+    def _reply(self, client_id: int, request_id: int, ok: bool, payload: Any):
+        client = self._clients.get(client_id)
+        if client is None:
+            return
+        try:
+            with client.send_lock:
+                client.conn.send(('result', request_id, ok, payload))
+        except Exception as e:
+            logger.warning(f"⚠️  回傳推論結果失敗（客戶端 {client.pid} 可能已離線）: {str(e)}")
+
+    def _serve_client(self, conn):
+        client_id = next(self._client_ids)
+        try:
+            kind, hello = conn.recv()
+            if kind != 'hello':
+                conn.close()
+                return
+            client = _ClientState(conn, hello['arena'], hello['slot_bytes'], hello['pid'])
+            self._clients[client_id] = client
+            with client.send_lock:
+                conn.send(('hello', self.get_info()))
+            logger.info(f"🔌 web worker 已連線 (pid={client.pid})")
+
+            while True:
+                message = conn.recv()
+                kind, request_id = message[0], message[1]
+                if kind == 'stats':
+                    self._reply(client_id, request_id, True, self.get_metrics())
+                    continue
+                if kind == 'infer':
+                    _, _, slot, shape, dtype, metadata = message
+                    transfer = ('shm', client.arena, slot * client.slot_bytes, shape, dtype, metadata)
+                else:
+                    transfer = ('inline', message[2], message[3])
+                with self._lock:
+                    if len(self._backlog) >= self.max_pending:
+                        self._counters['rejected'] += 1
+                        rejected = True
+                    else:
+                        self._counters['submitted'] += 1
+                        self._backlog.append((client_id, request_id, transfer, time.time()))
+                        self._assign()
+                        rejected = False
+                if rejected:
+                    self._reply(client_id, request_id, False, f"推論伺服器忙碌（待處理 {self.max_pending} 筆）")
+        except (EOFError, OSError):
+            pass
+        finally:
+            client = self._clients.pop(client_id, None)
+            if client is not None:
+                with self._lock:
+                    self._backlog = deque(item for item in self._backlog if item[0] != client_id)
+                    for worker in self._workers:
+                        try:
+                            worker.conn.send(('detach', client.arena))
+                        except Exception:
+                            pass
+                logger.info(f"🔌 web worker 已離線 (pid={client.pid})")
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def serve_forever(self):
+        """監聽 Unix socket 並為每個 web worker 連線建立處理執行緒"""
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        logger.info(f"✅ 推論伺服器已啟動: {self.address}（{len(self._workers)} 個推論程序）")
+        while not self._stop_event.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logger.warning(f"⚠️  接受連線失敗: {str(e)}")
+                continue
+            threading.Thread(target=self._serve_client, args=(conn,), name='inference-client', daemon=True).start()
+
+    def shutdown(self):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                pass
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+    def get_info(self) -> Dict[str, Any]:
+        """連線時傳給客戶端的伺服器資訊"""
+        return {'pid': os.getpid(), 'workers': len(self._workers), 'model_info': self.model_info}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取伺服器指標
+
+        Returns:
+            各推論程序狀態（存活、就緒、處理中、處理數、重啟次數、CPU 綁定）、待處理佇列深度、推論與排隊延遲
+        """
+        with self._lock:
+            workers = [
+                {
+                    'worker_id': worker.worker_id,
+                    'pid': worker.process.pid if worker.process else None,
+                    'alive': bool(worker.process and worker.process.is_alive()),
+                    'ready': worker.ready,
+                    'busy': worker.task is not None,
+                    'processed': worker.processed,
+                    'failed': worker.failed,
+                    'restarts': worker.restarts,
+                    'threads': worker.threads,
+                    'cpus': worker.cpus
+                }
+                for worker in self._workers
+            ]
+            backlog = len(self._backlog)
+            counters = dict(self._counters)
+            latency = _percentiles(list(self._latencies))
+            queue_wait = _percentiles(list(self._queue_wait))
+        return {
+            'workers': workers,
+            'clients': len(self._clients),
+            'backlog': backlog,
+            'max_pending': self.max_pending,
+            'inference_latency': latency,
+            'queue_wait': queue_wait,
+            **counters
+        }
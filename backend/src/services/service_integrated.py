@@ -3,27 +3,37 @@
 整合 CNN 分類和 YOLO 檢測功能
 """
 
-import os
 import json
 import time
 import uuid
 import logging
 import traceback
-from typing import Dict, Any, Optional, List
+import numpy as np
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
-from src.core.core_db_manager import db, ActivityLogger, ErrorLogger, PerformanceLogger
+# core_db_manager 在寫入資料庫的方法中才導入：推論程序只建立推論引擎（enable_persistence=False），
+# 導入本模組不應建立資料庫連接池
+from src.core.core_write_behind import WriteBehindWriter
 from src.services.service_cnn import CNNClassifierService
 from src.services.service_yolo import DetectionService
 from src.services.service_image import ImageService
+from src.services.service_batching import MicroBatchScheduler
+from src.services.service_inference_cache import InferenceCache, build_model_fingerprint, file_fingerprint
 
 # 導入 YOLO 模組（用於直接使用模組功能）
-from modules.yolo_detect import yolo_detect
+from modules.yolo_detect import yolo_detect_array, yolo_detect_arrays_batch
 from modules.yolo_postprocess import postprocess_yolo_result, draw_boxes_on_image
+from modules.cnn_utils import should_run_yolo, get_final_status
 
 # 導入超解析度模組
 from modules.sr_load import SuperResolutionModelLoader
-from modules.sr_preprocess import preprocess_with_sr
+from modules.model_registry import get_sr_model
+from modules.sr_policy import SRPolicy
+
+# 導入記憶體內圖片緩衝與感知雜湊
+from modules.image_buffer import ImageBuffer, decode_image_bytes, load_image_buffer
+from modules.perceptual_hash import to_signed64
 
 # 設定日誌
 logging.basicConfig(
@@ -40,10 +50,43 @@ class IntegratedDetectionService:
         self, 
         cnn_model_path: str, 
         yolo_model_path: str,
+        cnn_backend: str = 'eager',
+        cnn_parity_atol: float = 1e-3,
+        cnn_num_threads: int = 0,
+        cnn_export_dir: Optional[str] = None,
+        cnn_quantization: str = 'none',
+        sr_quantization: str = 'none',
+        quantization_gate=None,
         sr_model_path: Optional[str] = None,
         sr_model_type: str = 'edsr',
         sr_scale: int = 2,
-        enable_sr: bool = True
+        enable_sr: bool = True,
+        sr_tile_size: int = 0,
+        sr_tile_overlap: int = 16,
+        sr_tile_batch_size: int = 4,
+        sr_policy: str = 'always',
+        sr_policy_min_side: int = 224,
+        sr_policy_blur_threshold: float = 100.0,
+        sr_policy_min_jpeg_quality: int = 50,
+        enable_batching: bool = False,
+        batch_window_ms: int = 10,
+        batch_max_size: int = 8,
+        batch_timeout: Optional[float] = 60.0,
+        enable_inference_cache: bool = True,
+        inference_cache_max_entries: int = 512,
+        inference_cache_max_bytes: int = 8 * 1024 * 1024,
+        inference_cache_ttl: int = 86400,
+        enable_near_duplicate: bool = False,
+        near_duplicate_max_distance: int = 4,
+        near_duplicate_max_entries: int = 500000,
+        near_duplicate_refresh_seconds: float = 30.0,
+        enable_persistence: bool = True,
+        enable_write_behind: bool = True,
+        write_behind_batch_size: int = 64,
+        write_behind_flush_ms: int = 200,
+        write_behind_max_pending: int = 2048,
+        write_behind_spill_dir: Optional[str] = None,
+        inference_client=None
     ):
         """
         初始化整合檢測服務
@@ -51,58 +94,849 @@ class IntegratedDetectionService:
         Args:
             cnn_model_path: CNN 模型路徑
             yolo_model_path: YOLO 模型路徑
+            cnn_backend: CNN 推論後端 ('eager', 'torchscript', 'onnx')
+            cnn_parity_atol: 非 eager 後端與 eager 的 softmax 分數容許誤差
+            cnn_num_threads: ONNX Runtime intra-op 執行緒數（0 表示預設）
+            cnn_export_dir: 檢查點目錄不可寫入時的匯出檔目錄
+            cnn_quantization: CNN INT8 量化模式 ('none', 'dynamic', 'static')
+            sr_quantization: 超解析度模型 INT8 量化模式 ('none', 'dynamic', 'static')
+            quantization_gate: QuantizationGate，量化模型準確率下降超過門檻時拒絕啟用
             sr_model_path: 超解析度模型路徑（可選）
             sr_model_type: 超解析度模型類型 ('edsr', 'rcan' 等)
             sr_scale: 超解析度放大倍數 (2, 4, 8)
             enable_sr: 是否啟用超解析度預處理
+            sr_tile_size: 分塊超解析度的 tile 邊長（0 表示整張處理）
+            sr_tile_overlap: 相鄰 tile 重疊像素數
+            sr_tile_batch_size: 每次前向傳播的 tile 數
+            sr_policy: 超解析度策略（'always' 每張執行、'never' 不執行、'adaptive' 依圖片品質逐張決定）
+            sr_policy_min_side: adaptive 策略下，原始短邊小於此值視為低解析度
+            sr_policy_blur_threshold: adaptive 策略下，Laplacian 變異數小於此值視為模糊
+            sr_policy_min_jpeg_quality: adaptive 策略下，估計 JPEG 品質低於此值視為壓縮失真
+            enable_batching: 是否啟用動態微批次（合併並發請求的 CNN/YOLO 推論）
+            batch_window_ms: 微批次收集時間窗口（毫秒）
+            batch_max_size: 單一批次最大圖片數
+            batch_timeout: 等待批次結果的最長秒數
+            enable_inference_cache: 是否啟用推論結果快取（以圖片 hash + 模型指紋為鍵，與使用者無關）
+            inference_cache_max_entries: 程序內 LRU 最大筆數
+            inference_cache_max_bytes: 程序內 LRU 最大位元組數
+            inference_cache_ttl: Redis 層的過期時間（秒）
+            enable_near_duplicate: 推論結果快取未命中時，是否改用感知雜湊相近的先前圖片的快取結果（需要推論結果快取）
+            near_duplicate_max_distance: 視為近似重複的最大漢明距離（64 位元中）
+            near_duplicate_max_entries: 近似重複索引最多保存的雜湊數
+            near_duplicate_refresh_seconds: 從 prediction_log 增量載入其他 worker 寫入的雜湊的間隔（秒）
+            enable_persistence: 是否建立預測記錄寫入器；False 時只建立推論引擎（推論伺服器的推論程序使用），
+                不連線資料庫，也不能呼叫 predict() 等會寫入資料庫的方法
+            enable_write_behind: 是否以背景批次寫入預測記錄（False 時在請求執行緒同步寫入）
+            write_behind_batch_size: 單次交易最多寫入的預測筆數
+            write_behind_flush_ms: 背景寫入的最長等待時間（毫秒）
+            write_behind_max_pending: 寫入佇列上限
+            write_behind_spill_dir: 資料庫不可用時的溢寫檔目錄
+            inference_client: InferenceClient（推論伺服器模式），提供時本程序不載入模型，推論交由推論伺服器執行
         """
         try:
-            # 初始化 CNN 分類服務
-            self.cnn_service = CNNClassifierService(cnn_model_path)
-            logger.info("✅ CNN 分類服務初始化成功")
+            self.inference_client = inference_client
+            self.model_info = None
+            if inference_client is None:
+                # 初始化 CNN 分類服務
+                self.cnn_service = CNNClassifierService(
+                    cnn_model_path,
+                    backend=cnn_backend,
+                    parity_atol=cnn_parity_atol,
+                    num_threads=cnn_num_threads,
+                    export_dir=cnn_export_dir,
+                    quantization=cnn_quantization,
+                    quantization_gate=quantization_gate
+                )
+                logger.info("✅ CNN 分類服務初始化成功")
             
-            # 初始化 YOLO 檢測服務
-            self.yolo_service = DetectionService(yolo_model_path)
-            logger.info("✅ YOLO 檢測服務初始化成功")
+                # 初始化 YOLO 檢測服務
+                self.yolo_service = DetectionService(yolo_model_path)
+                logger.info("✅ YOLO 檢測服務初始化成功")
             
-            # 初始化超解析度模型（可選）
-            self.enable_sr = enable_sr
-            self.sr_model = None
-            self.sr_scale = sr_scale
-            self.sr_device = 'cuda' if __import__('torch').cuda.is_available() else 'cpu'
+                # 初始化超解析度模型（可選）
+                self.enable_sr = enable_sr
+                self.sr_model = None
+                self.sr_scale = sr_scale
+                self.sr_tile_size = sr_tile_size
+                self.sr_tile_overlap = sr_tile_overlap
+                self.sr_tile_batch_size = sr_tile_batch_size
+                self.sr_device = 'cuda' if __import__('torch').cuda.is_available() else 'cpu'
             
-            if self.enable_sr:
-                try:
-                    self.sr_loader = SuperResolutionModelLoader(
-                        model_path=sr_model_path,
-                        device=self.sr_device
-                    )
-                    self.sr_model = self.sr_loader.load_model(
-                        model_type=sr_model_type,
-                        scale=sr_scale
-                    )
-                    logger.info(f"✅ 超解析度模型初始化成功 (類型: {sr_model_type}, scale: {sr_scale}x)")
-                except Exception as e:
-                    logger.warning(f"⚠️  超解析度模型初始化失敗，將跳過超解析度預處理: {str(e)}")
-                    self.enable_sr = False
-                    self.sr_model = None
+                if self.enable_sr:
+                    try:
+                        # 模型由模型註冊表共用，loader 只保留量化時需要的狀態
+                        self.sr_loader = SuperResolutionModelLoader(
+                            model_path=sr_model_path,
+                            device=self.sr_device
+                        )
+                        self.sr_model = get_sr_model(sr_model_path, sr_model_type, sr_scale, self.sr_device)
+                        self.sr_loader.model = self.sr_model
+                        self.sr_loader.scale_factor = sr_scale
+                        logger.info(f"✅ 超解析度模型初始化成功 (類型: {sr_model_type}, scale: {sr_scale}x)")
+                    except Exception as e:
+                        logger.warning(f"⚠️  超解析度模型初始化失敗，將跳過超解析度預處理: {str(e)}")
+                        self.enable_sr = False
+                        self.sr_model = None
+                else:
+                    logger.info("ℹ️  超解析度預處理已禁用")
+            
+                self.sr_policy = SRPolicy(
+                    mode=sr_policy,
+                    scale=self.sr_scale,
+                    min_side=sr_policy_min_side,
+                    blur_threshold=sr_policy_blur_threshold,
+                    min_jpeg_quality=sr_policy_min_jpeg_quality,
+                    tile_size=sr_tile_size
+                )
+            
+                # 超解析度模型 INT8 量化（可選，須通過準確率閘門）
+                self.sr_quantization_info = {'requested': sr_quantization, 'enabled': False}
+                if self.enable_sr and self.sr_model is not None and sr_quantization != 'none':
+                    self._quantize_sr(sr_quantization, quantization_gate, sr_model_path)
+                
+                self.model_fingerprint = self._compute_model_fingerprint(
+                    cnn_model_path, yolo_model_path, sr_model_path, sr_model_type
+                )
             else:
-                logger.info("ℹ️  超解析度預處理已禁用")
+                # 推論伺服器模式：模型只載入在推論程序中，本程序只保存推論伺服器回報的模型資訊
+                self.model_info = inference_client.connect()['model_info']
+                self.cnn_service = None
+                self.yolo_service = None
+                self.sr_model = None
+                self.sr_device = None
+                self.enable_sr = self.model_info['sr']['enabled']
+                self.sr_scale = self.model_info['sr']['scale']
+                self.sr_tile_size = sr_tile_size
+                self.sr_tile_overlap = sr_tile_overlap
+                self.sr_tile_batch_size = sr_tile_batch_size
+                self.sr_quantization_info = self.model_info['quantization']['sr']
+                # 決策由推論程序執行，本程序只以返回的決策統計指標
+                self.sr_policy = SRPolicy(
+                    mode=sr_policy,
+                    scale=self.sr_scale,
+                    min_side=sr_policy_min_side,
+                    blur_threshold=sr_policy_blur_threshold,
+                    min_jpeg_quality=sr_policy_min_jpeg_quality,
+                    tile_size=sr_tile_size
+                )
+                self.model_fingerprint = self.model_info['fingerprint']
+                logger.info("✅ 已連線到推論伺服器，本程序不載入模型")
+            
+            # 初始化動態微批次排程器（可選）
+            self.batch_scheduler = None
+            self.batch_timeout = batch_timeout
+            if enable_batching:
+                self.batch_scheduler = MicroBatchScheduler(
+                    batch_fn=self._run_inference_batch,
+                    window_ms=batch_window_ms,
+                    max_batch_size=batch_max_size,
+                    name='integrated_detection'
+                )
+            
+            # 初始化預測記錄寫入器（prediction_log / detection_records）
+            self.persistence = None
+            if enable_persistence:
+                self.persistence = WriteBehindWriter(
+                    enabled=enable_write_behind,
+                    batch_size=write_behind_batch_size,
+                    flush_interval_ms=write_behind_flush_ms,
+                    max_pending=write_behind_max_pending,
+                    spill_dir=write_behind_spill_dir
+                )
+            
+            # 初始化推論結果快取（可選）
+            self.inference_cache = None
+            if enable_inference_cache:
+                self.inference_cache = InferenceCache(
+                    fingerprint=self.model_fingerprint,
+                    max_entries=inference_cache_max_entries,
+                    max_bytes=inference_cache_max_bytes,
+                    redis_ttl=inference_cache_ttl
+                )
+            
+            # 初始化近似重複索引（可選）：從資料庫載入推論結果快取 TTL 內的感知雜湊
+            self.near_duplicate_index = None
+            if enable_near_duplicate:
+                if self.inference_cache is None:
+                    logger.warning("⚠️  近似重複索引需要推論結果快取，已停用")
+                else:
+                    from src.services.service_near_duplicate import NearDuplicateIndex
+                    self.near_duplicate_index = NearDuplicateIndex(
+                        max_distance=near_duplicate_max_distance,
+                        max_entries=near_duplicate_max_entries,
+                        load_window_seconds=inference_cache_ttl,
+                        refresh_interval=near_duplicate_refresh_seconds
+                    )
             
         except Exception as e:
             logger.error(f"❌ 整合檢測服務初始化失敗: {str(e)}")
             raise
     
+    def _compute_model_fingerprint(
+        self,
+        cnn_model_path: str,
+        yolo_model_path: str,
+        sr_model_path: Optional[str],
+        sr_model_type: str
+    ) -> str:
+        """
+        根據已載入的檢查點內容與影響推論輸出的設定計算模型指紋
+        任何檢查點或 SR 設定改變都會產生新的指紋，使舊的快取結果失效
+        """
+        components = {
+            'cnn': self.cnn_service.checkpoint_hash,
+            'cnn_backend': self.cnn_service.backend.name,
+            'cnn_quantization': self.cnn_service.quantization_info.get('requested') if self.cnn_service.quantization_info['enabled'] else None,
+            'cnn_classes': list(self.cnn_service.classes),
+            'yolo': file_fingerprint(yolo_model_path),
+            'sr': None
+        }
+        if self.enable_sr and self.sr_model is not None:
+            components['sr'] = {
+                'weights': file_fingerprint(sr_model_path) if sr_model_path else f"default:{sr_model_type}",
+                'scale': self.sr_scale,
+                'tile_size': self.sr_tile_size,
+                'tile_overlap': self.sr_tile_overlap if self.sr_tile_size else None,
+                'quantization': self.sr_quantization_info.get('requested') if self.sr_quantization_info['enabled'] else None,
+                'policy': self.sr_policy.describe()
+            }
+        return build_model_fingerprint(components)
+    
+    def _quantize_sr(self, mode: str, gate, sr_model_path: Optional[str]):
+        """
+        以通過準確率閘門的 INT8 模型取代超解析度模型
+        閘門比較「fp32 SR → fp32 CNN」與「INT8 SR → fp32 CNN」在驗證清單上的分類準確率
+        """
+        from src.services.service_quantization import cnn_classify_fn, sr_then_cnn_classify_fn
+        
+        if self.sr_device != 'cpu' or gate is None or not sr_model_path:
+            reason = ('INT8 quantization is CPU-only' if self.sr_device != 'cpu'
+                      else 'no accuracy gate configured' if gate is None
+                      else 'no SR checkpoint (default architecture has no trained weights)')
+            self.sr_quantization_info['reason'] = reason
+            logger.warning(f"⚠️  超解析度模型不進行 INT8 量化: {reason}")
+            return
+        
+        sr_kwargs = {
+            'scale': self.sr_scale,
+            'tile_size': self.sr_tile_size or None,
+            'tile_overlap': self.sr_tile_overlap,
+            'tile_batch_size': self.sr_tile_batch_size
+        }
+        cnn_classify = cnn_classify_fn(self.cnn_service.model)
+        quantized, self.sr_quantization_info = gate.prepare(
+            'sr',
+            sr_model_path,
+            mode,
+            components={
+                'checkpoint': file_fingerprint(sr_model_path),
+                'cnn': self.cnn_service.checkpoint_hash,
+                'scale': self.sr_scale,
+                'tile_size': self.sr_tile_size
+            },
+            quantize_fn=lambda arrays: self.sr_loader.quantize(mode, arrays, gate.engine),
+            reference_fn=sr_then_cnn_classify_fn(self.sr_model, cnn_classify, **sr_kwargs),
+            candidate_fn_factory=lambda model: sr_then_cnn_classify_fn(model, cnn_classify, **sr_kwargs)
+        )
+        if quantized is not None:
+            self.sr_model = quantized
+    
+    def get_quantization_info(self) -> Dict[str, Any]:
+        """
+        獲取 INT8 量化狀態
+        
+        Returns:
+            {'cnn': ..., 'sr': ...}，各自包含是否啟用、準確率閘門報告或拒絕原因
+        """
+        if self.inference_client is not None:
+            return self.model_info['quantization']
+        return {'cnn': self.cnn_service.quantization_info, 'sr': self.sr_quantization_info}
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        """
+        獲取已載入模型的資訊（推論伺服器在連線時回報給 web worker）
+        
+        Returns:
+            模型指紋、CNN 後端資訊、INT8 量化狀態、超解析度設定
+        """
+        if self.inference_client is not None:
+            return self.model_info
+        return {
+            'fingerprint': self.model_fingerprint,
+            'cnn_backend': self.get_cnn_backend_info(),
+            'quantization': self.get_quantization_info(),
+            'sr': {'enabled': bool(self.enable_sr and self.sr_model is not None), 'scale': self.sr_scale}
+        }
+    
+    def _run_sr(self, image: ImageBuffer) -> Tuple[np.ndarray, int, Optional[Dict[str, Any]]]:
+        """
+        依超解析度策略執行超解析度預處理（可選，記憶體內處理，不寫入臨時檔案）
+        
+        Args:
+            image: 已解碼的圖片緩衝
+        
+        Returns:
+            (供 CNN 使用的 RGB 陣列, 耗時毫秒, 策略決策)；未啟用時返回原始像素、0 與 None，
+            策略跳過或執行失敗時返回原始像素與 0
+        """
+        if not (self.enable_sr and self.sr_model is not None):
+            return image.pixels, 0, None
+        
+        decision = self.sr_policy.decide(image.pixels, image.metadata)
+        if not decision['applied']:
+            logger.info(f"⏭️  階段 0: 跳過超解析度預處理 ({decision['reason']})")
+            return image.pixels, 0, decision
+        
+        try:
+            input_note = f", 輸入 {decision['input_size']}px" if decision['input_size'] else ""
+            logger.info(f"🔍 階段 0: 執行超解析度預處理 (scale={self.sr_scale}x, {decision['reason']}{input_note})...")
+            enhanced_array, sr_time = self.sr_policy.run(
+                image.pixels,
+                decision,
+                model=self.sr_model,
+                device=self.sr_device,
+                tile_overlap=self.sr_tile_overlap,
+                tile_batch_size=self.sr_tile_batch_size
+            )
+            logger.info(f"✅ 超解析度預處理完成，耗時: {sr_time}ms")
+            return enhanced_array, sr_time, decision
+        except Exception as e:
+            logger.warning(f"⚠️  超解析度預處理失敗，使用原始圖片: {str(e)}")
+            image.metadata['sr_failed'] = True  # 降級結果不寫入推論快取
+            self.sr_policy.mark_failed(decision)
+            return image.pixels, 0, decision
+    
+    def _route(self, best_class: str) -> Tuple[str, str, bool]:
+        """
+        根據 CNN 分類結果決定分流
+        
+        Returns:
+            (workflow_step, final_status, 是否執行 YOLO)
+        """
+        final_status = get_final_status(best_class)
+        
+        # 路徑 A: 進入 YOLO 檢測
+        if should_run_yolo(best_class):
+            logger.info(f"🔍 階段 2: 進入 YOLO 檢測流程 ({best_class})...")
+            return 'cnn_yolo', final_status, True
+        
+        # 路徑 B: 需要裁切
+        if best_class == 'whole_plant':
+            logger.info("✂️  需要裁切: whole_plant 類別")
+            final_status = 'need_crop'
+        
+        # 路徑 C: 非植物
+        elif best_class == 'others':
+            logger.info("❌ 非植物影像: others 類別")
+            final_status = 'not_plant'
+        
+        return 'cnn_only', final_status, False
+    
+    @staticmethod
+    def _finalize_yolo_result(processed_result: Dict[str, Any]) -> Tuple[List[Dict], bool]:
+        """將 YOLO 後處理結果轉換為 (yolo_result, yolo_detected)，未檢測到病害時標記為 Healthy"""
+        yolo_detected = processed_result['detected']
+        yolo_result = processed_result['detections']
+        
+        if yolo_detected:
+            logger.info(f"✅ YOLO 檢測完成: 發現 {len(yolo_result)} 個病害")
+        else:
+            logger.info("✅ YOLO 檢測完成: 未發現病害（健康）")
+            yolo_result = [{
+                'class': 'Healthy',
+                'confidence': 1.0,
+                'bbox': []
+            }]
+        return yolo_result, yolo_detected
+    
+    def _run_inference(self, image: ImageBuffer) -> Dict[str, Any]:
+        """
+        對單張圖片執行階段 0-2（超解析度、CNN 分類、YOLO 檢測），全程使用記憶體內像素
+        
+        Args:
+            image: 已解碼的圖片緩衝
+        
+        Returns:
+            推論結果字典（cnn_result, cnn_time, sr_time, sr_decision, workflow_step, final_status,
+            yolo_result, yolo_detected, yolo_time, degraded）
+        """
+        # 推論伺服器模式：像素經共享記憶體交給推論程序，返回相同格式的結果
+        if self.inference_client is not None:
+            inference = self.inference_client.infer(image.pixels, metadata=image.metadata)
+            self.sr_policy.record(inference.get('sr_decision'))
+            return inference
+        
+        # ========== 階段 0: 超解析度預處理（可選，由策略決定）==========
+        cnn_input, sr_time, sr_decision = self._run_sr(image)
+        self.sr_policy.record(sr_decision)
+        
+        # ========== 階段 1: CNN 分類 ==========
+        logger.info("🔍 階段 1: 執行 CNN 分類...")
+        cnn_start = time.time()
+        cnn_result = self.cnn_service.predict_array(cnn_input)
+        cnn_time = int((time.time() - cnn_start) * 1000)
+        
+        best_class = cnn_result['best_class']
+        logger.info(f"✅ CNN 分類完成: {best_class} (分數: {cnn_result['best_score']:.4f}, 耗時: {cnn_time}ms)")
+        
+        # ========== 階段 2: 分流邏輯 ==========
+        workflow_step, final_status, run_yolo = self._route(best_class)
+        yolo_result = None
+        yolo_detected = False
+        yolo_time = None
+        degraded = bool(image.metadata.get('sr_failed'))
+        
+        if run_yolo:
+            yolo_start = time.time()
+            try:
+                # 使用 YOLO 模組進行檢測（原始像素，不經超解析度）
+                yolo_results = yolo_detect_array(self.yolo_service.model, image.pixels)
+                yolo_result, yolo_detected = self._finalize_yolo_result(postprocess_yolo_result(yolo_results))
+            except Exception as e:
+                logger.error(f"❌ YOLO 檢測失敗: {str(e)}", exc_info=True)
+                yolo_result = []
+                yolo_detected = False
+                degraded = True
+                # 繼續流程，不中斷
+            yolo_time = int((time.time() - yolo_start) * 1000)
+            logger.info(f"   YOLO 耗時: {yolo_time}ms")
+        
+        return {
+            'cnn_result': cnn_result,
+            'cnn_time': cnn_time,
+            'sr_time': sr_time,
+            'sr_decision': sr_decision,
+            'workflow_step': workflow_step,
+            'final_status': final_status,
+            'yolo_result': yolo_result,
+            'yolo_detected': yolo_detected,
+            'yolo_time': yolo_time,
+            'degraded': degraded
+        }
+    
+    def _run_inference_batch(self, images: List[ImageBuffer]) -> List[Dict[str, Any]]:
+        """
+        對一批圖片執行階段 0-2：超解析度逐張處理，CNN 與 YOLO 各以單次批次呼叫完成
+        
+        Args:
+            images: 已解碼的圖片緩衝列表
+        
+        Returns:
+            推論結果字典列表，順序與輸入一致，格式同 _run_inference()
+        """
+        scheduler = self.batch_scheduler
+        
+        # 推論伺服器模式：整批同時提交，由多個推論程序並行處理
+        if self.inference_client is not None:
+            inferences = self.inference_client.infer_batch(
+                [image.pixels for image in images],
+                metadata_list=[image.metadata for image in images]
+            )
+            for inference in inferences:
+                self.sr_policy.record(inference.get('sr_decision'))
+            return inferences
+        
+        # ========== 階段 0: 超解析度預處理（輸出尺寸不一，逐張處理，由策略決定）==========
+        sr_outputs = [self._run_sr(image) for image in images]
+        for _, sr_time, sr_decision in sr_outputs:
+            self.sr_policy.record(sr_decision)
+            if scheduler is not None and sr_time > 0:
+                scheduler.record_stage_latency('sr', sr_time)
+        
+        # ========== 階段 1: CNN 批次分類（單次前向傳播）==========
+        logger.info(f"🔍 階段 1: 執行 CNN 批次分類 (batch={len(images)})...")
+        cnn_start = time.time()
+        cnn_results = self.cnn_service.predict_batch_arrays([sr_output[0] for sr_output in sr_outputs])
+        cnn_time = int((time.time() - cnn_start) * 1000)
+        if scheduler is not None:
+            scheduler.record_stage_latency('cnn', cnn_time)
+        
+        inferences = []
+        yolo_indices = []
+        for index, cnn_result in enumerate(cnn_results):
+            workflow_step, final_status, run_yolo = self._route(cnn_result['best_class'])
+            if run_yolo:
+                yolo_indices.append(index)
+            inferences.append({
+                'cnn_result': cnn_result,
+                'cnn_time': cnn_time,
+                'sr_time': sr_outputs[index][1],
+                'sr_decision': sr_outputs[index][2],
+                'workflow_step': workflow_step,
+                'final_status': final_status,
+                'yolo_result': None,
+                'yolo_detected': False,
+                'yolo_time': None,
+                'degraded': bool(images[index].metadata.get('sr_failed'))
+            })
+        
+        # ========== 階段 2: YOLO 批次檢測（僅針對需要的圖片）==========
+        if yolo_indices:
+            yolo_start = time.time()
+            try:
+                batch_results = yolo_detect_arrays_batch(
+                    self.yolo_service.model,
+                    [images[index].pixels for index in yolo_indices]
+                )
+                for index, per_image_results in zip(yolo_indices, batch_results):
+                    yolo_result, yolo_detected = self._finalize_yolo_result(
+                        postprocess_yolo_result(per_image_results)
+                    )
+                    inferences[index]['yolo_result'] = yolo_result
+                    inferences[index]['yolo_detected'] = yolo_detected
+            except Exception as e:
+                logger.error(f"❌ YOLO 批次檢測失敗: {str(e)}", exc_info=True)
+                for index in yolo_indices:
+                    inferences[index]['yolo_result'] = []
+                    inferences[index]['yolo_detected'] = False
+                    inferences[index]['degraded'] = True
+                # 繼續流程，不中斷
+            yolo_time = int((time.time() - yolo_start) * 1000)
+            for index in yolo_indices:
+                inferences[index]['yolo_time'] = yolo_time
+            if scheduler is not None:
+                scheduler.record_stage_latency('yolo', yolo_time)
+            logger.info(f"   YOLO 批次耗時: {yolo_time}ms (batch={len(yolo_indices)})")
+        
+        return inferences
+    
+    def infer_pixels(self, pixels: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        對 RGB 像素陣列執行階段 0-2（推論伺服器的推論程序呼叫，不查快取、不寫入資料庫）
+        
+        Args:
+            pixels: RGB uint8 陣列 (H, W, 3)
+            metadata: 圖片中繼資料（原始尺寸、JPEG 品質，供超解析度策略使用）
+        
+        Returns:
+            推論結果字典，格式同 _run_inference()
+        """
+        return self._run_inference(ImageBuffer(pixels, metadata=dict(metadata or {})))
+    
+    def get_batching_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取微批次排程器指標
+        
+        Returns:
+            指標字典（佇列深度、批次大小直方圖、各階段延遲），未啟用微批次時返回 None
+        """
+        if self.batch_scheduler is None:
+            return None
+        return self.batch_scheduler.get_metrics()
+    
+    def get_inference_cache_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取推論結果快取指標
+        
+        Returns:
+            指標字典（命中/未命中/淘汰次數、模型指紋），未啟用快取時返回 None
+        """
+        if self.inference_cache is None:
+            return None
+        return self.inference_cache.get_metrics()
+    
+    def get_sr_policy_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取超解析度策略指標
+        
+        Returns:
+            指標字典（各原因的決策次數、執行 / 跳過次數、節省的估計耗時），未啟用超解析度時返回 None
+        """
+        if not self.enable_sr:
+            return None
+        return self.sr_policy.get_metrics()
+    
+    def get_near_duplicate_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取近似重複索引指標
+        
+        Returns:
+            指標字典（索引大小、查詢延遲、比中率、載入統計），未啟用時返回 None
+        """
+        if self.near_duplicate_index is None:
+            return None
+        return self.near_duplicate_index.get_metrics()
+    
+    def _lookup_cached_inference(self, image: ImageBuffer, image_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢推論結果快取：先以圖片 hash 查詢，未命中時改用感知雜湊相近的先前圖片的 hash 查詢
+        
+        Args:
+            image: 圖片緩衝（提供感知雜湊）
+            image_hash: 圖片 hash
+        
+        Returns:
+            推論結果字典（已標記 cached，近似重複時附上 near_duplicate），或 None
+        """
+        if self.inference_cache is None:
+            return None
+        inference = self.inference_cache.get(image_hash)
+        near_duplicate = None
+        if inference is not None:
+            # 載入前就在快取中的圖片也加入索引
+            if self.near_duplicate_index is not None:
+                self.near_duplicate_index.add(image.ensure_phash(), image_hash)
+        elif self.near_duplicate_index is not None:
+            for distance, match_hash in self.near_duplicate_index.find(image.ensure_phash()):
+                if match_hash == image_hash:
+                    continue
+                inference = self.inference_cache.get(match_hash)
+                if inference is not None:
+                    near_duplicate = {'distance': distance}
+                    break
+        if inference is None:
+            return None
+        inference.update({'cnn_time': 0, 'sr_time': 0, 'sr_decision': None, 'yolo_time': None, 'cached': True})
+        if near_duplicate is not None:
+            inference['near_duplicate'] = near_duplicate
+        return inference
+    
+    def _store_inference(self, image: ImageBuffer, image_hash: str, inference: Dict[str, Any]):
+        """將新的推論結果寫入快取並加入近似重複索引（降級結果不快取）"""
+        self._store_inferences([(image, image_hash, inference)])
+    
+    def _store_inferences(self, items: List[Tuple[ImageBuffer, str, Dict[str, Any]]]):
+        """批次版 _store_inference()：Redis 以單次管線往返寫入"""
+        if self.inference_cache is None:
+            return
+        items = [item for item in items if not item[2].get('degraded')]
+        self.inference_cache.put_many([(image_hash, inference) for _, image_hash, inference in items])
+        if self.near_duplicate_index is not None:
+            for image, image_hash, _ in items:
+                self.near_duplicate_index.add(image.ensure_phash(), image_hash)
+    
+    def get_cnn_backend_info(self) -> Dict[str, Any]:
+        """
+        獲取 CNN 推論後端資訊
+        
+        Returns:
+            實際使用的後端、匯出檔路徑、一致性檢查結果（退回 eager 時包含原因）
+        """
+        if self.inference_client is not None:
+            return self.model_info['cnn_backend']
+        return self.cnn_service.backend_info
+    
+    def get_inference_server_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取推論伺服器指標
+        
+        Returns:
+            指標字典（共享記憶體 / 直接傳送次數、往返延遲、各推論程序狀態），程序內推論模式時返回 None
+        """
+        if self.inference_client is None:
+            return None
+        return self.inference_client.get_metrics()
+    
+    def get_persistence_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取預測記錄寫入器指標
+        
+        Returns:
+            指標字典（佇列深度、寫入延遲、溢寫與重放統計），未建立寫入器時返回 None
+        """
+        if self.persistence is None:
+            return None
+        return self.persistence.get_metrics()
+    
+    def _build_prediction(
+        self,
+        prediction_id: str,
+        inference: Dict[str, Any],
+        image_buffer: ImageBuffer,
+        image_hash: str,
+        user_id: int,
+        image_source: str,
+        total_time: int,
+        web_image_path: Optional[str] = None,
+        crop_coordinates: Optional[Dict] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        """
+        由階段 0-2 的推論結果建立回應與預測記錄（predict() 與 predict_batch() 共用）
+        
+        Args:
+            prediction_id: 預測記錄 ID
+            inference: 推論結果字典（格式同 _run_inference()）
+            image_buffer: 已解碼的圖片緩衝
+            image_hash: 圖片 hash
+            user_id: 使用者 ID
+            image_source: 圖片來源
+            total_time: 處理耗時（毫秒）
+            web_image_path: Web 訪問路徑
+            crop_coordinates: 裁切座標
+        
+        Returns:
+            (回應字典, prediction_log 欄位, detection_records 欄位)
+        """
+        cnn_result = inference['cnn_result']
+        cnn_time = inference['cnn_time']
+        sr_time = inference['sr_time']
+        workflow_step = inference['workflow_step']
+        final_status = inference['final_status']
+        yolo_result = inference['yolo_result']
+        yolo_detected = inference['yolo_detected']
+        yolo_time = inference['yolo_time']
+        
+        best_class = cnn_result['best_class']
+        mean_score = cnn_result['mean_score']
+        best_score = cnn_result['best_score']
+        all_scores = cnn_result['all_scores']
+        
+        # ========== 階段 3: 預測記錄 ==========
+        # 獲取圖片大小
+        image_size = len(image_buffer.encoded) if image_buffer.encoded else None
+        
+        # 圖片不再儲存在資料庫，只儲存 Cloudinary URL 或資料庫 URL 在 image_path
+        # image_data 相關欄位設為 NULL（保留欄位以維持向後兼容）
+        # 確定圖片路徑：優先使用 web_image_path（可能是 Cloudinary URL），否則使用資料庫 URL
+        if web_image_path and (web_image_path.startswith('http://') or web_image_path.startswith('https://')):
+            # 使用 Cloudinary URL 或其他外部 URL
+            final_image_path = web_image_path
+            original_image_url = web_image_path
+        else:
+            # 使用資料庫 URL（符合資料庫約束要求）
+            final_image_path = f"/image/prediction/{prediction_id}"
+            original_image_url = None
+        
+        # 儲存到 detection_records（無論是否有 YOLO 檢測結果，包括 "others" 類別）
+        # 這樣可以確保所有檢測結果都顯示在歷史記錄中
+        if yolo_detected and yolo_result:
+            # 如果有 YOLO 檢測結果，使用 YOLO 的結果
+            primary_detection = yolo_result[0]
+            disease_name = primary_detection['class']
+            confidence = primary_detection['confidence']
+            raw_output = {'yolo_detections': yolo_result}
+        else:
+            # 否則使用 CNN 分類結果（包括 "others" 類別）
+            disease_name = best_class
+            confidence = best_score
+            raw_output = {
+                'cnn_class': best_class,
+                'cnn_score': best_score,
+                'cnn_all_scores': all_scores,
+                'final_status': final_status
+            }
+        
+        # prediction_log INSERT 與 detection_records upsert 由呼叫者交給寫入器在同一交易中完成；
+        # 帶框圖片與 Cloudinary URL 由 API 層透過 persistence.patch_urls() 補上
+        prediction_log = {
+            'id': prediction_id,
+            'user_id': user_id,
+            'image_path': final_image_path,
+            'image_hash': image_hash,
+            'image_phash': to_signed64(image_buffer.ensure_phash()),  # 感知雜湊（BIGINT，近似重複索引由此載入）
+            'image_size': image_size,
+            'image_source': image_source,
+            'image_data': None,  # 不再使用，圖片儲存在 Cloudinary
+            'image_data_size': None,  # 不再使用
+            'image_compressed': False,  # 不再使用
+            'cnn_mean_score': mean_score,
+            'cnn_best_class': best_class,
+            'cnn_best_score': best_score,
+            'cnn_all_scores': json.dumps(all_scores),
+            'yolo_result': json.dumps(yolo_result) if yolo_result else None,
+            'yolo_detected': yolo_detected,
+            'final_status': final_status,
+            'workflow_step': workflow_step,
+            'crop_coordinates': json.dumps(crop_coordinates) if crop_coordinates else None,
+            'original_image_url': original_image_url,
+            'predict_img_url': None  # 帶框圖片 URL（將在 API 層設置）
+        }
+        detection_record = {
+            'user_id': user_id,
+            'disease_name': disease_name,
+            'severity': 'Unknown',
+            'confidence': confidence,
+            'image_path': final_image_path,
+            'image_hash': image_hash,
+            'image_size': image_size,
+            'image_source': image_source,
+            'raw_model_output': json.dumps(raw_output),
+            'status': 'completed',
+            'processing_time_ms': total_time,
+            'image_data': None,
+            'image_data_size': None,
+            'image_compressed': False,
+            'prediction_log_id': prediction_id,
+            'original_image_url': original_image_url,
+            'annotated_image_url': None  # 將在 API 層更新
+        }
+        
+        # ========== 階段 4: 構建回應 ==========
+        # 外部 URL 直接使用；否則使用 prediction_log 的圖片路由
+        image_url = final_image_path
+        
+        # 確定最終的病害名稱和置信度（用於前端顯示）
+        final_disease = best_class
+        final_confidence = best_score
+        if yolo_detected and yolo_result:
+            final_disease = yolo_result[0]['class']
+            final_confidence = yolo_result[0]['confidence']
+        
+        result = {
+            'status': 'success' if final_status != 'not_plant' else 'error',
+            'workflow': workflow_step,
+            'prediction_id': prediction_id,
+            'cnn_result': {
+                'mean_score': mean_score,
+                'best_class': best_class,
+                'best_score': best_score,
+                'all_scores': all_scores
+            },
+            'disease': final_disease,  # 添加病害名稱（包括 "others"）
+            'confidence': final_confidence,  # 添加置信度
+            'severity': 'Unknown',
+            'final_status': final_status,
+            'image_path': image_url,  # 使用資料庫圖片 URL
+            'image_stored_in_db': False,  # 標記是否從資料庫讀取（已改為 Cloudinary 儲存）
+            'processing_time_ms': total_time,
+            'cnn_time_ms': cnn_time
+        }
+        
+        # 添加超解析度處理時間（如果執行了）
+        if sr_time > 0:
+            result['sr_time_ms'] = sr_time
+            result['sr_enabled'] = True
+            result['sr_scale'] = self.sr_scale
+        
+        # 添加超解析度策略決策（是否執行、原因、輸入尺寸、節省的估計耗時）
+        if inference.get('sr_decision'):
+            result['sr_policy'] = inference['sr_decision']
+        
+        # 標記推論結果來自快取（近似重複時附上與先前圖片的漢明距離）
+        if inference.get('cached'):
+            result['inference_cached'] = True
+        if inference.get('near_duplicate'):
+            result['near_duplicate'] = inference['near_duplicate']
+        
+        # 添加 YOLO 結果（如有）
+        if yolo_result is not None:
+            result['yolo_result'] = {
+                'detected': yolo_detected,
+                'detections': yolo_result
+            }
+            # 總是添加 YOLO 時間（如果執行了 YOLO 檢測）
+            if workflow_step == 'cnn_yolo' and yolo_time is not None:
+                result['yolo_time_ms'] = yolo_time
+        
+        # 添加錯誤訊息（如需要）
+        if final_status == 'not_plant':
+            result['error'] = '非植物影像，請上傳植物葉片圖片'
+        elif final_status == 'need_crop':
+            result['message'] = '請裁切圖片中的葉片區域'
+        
+        return result, prediction_log, detection_record
+    
     def predict(
         self,
-        image_path: str,
+        image_path: Optional[str],
         user_id: int,
         image_source: str = 'upload',
         image_hash: str = None,
         web_image_path: str = None,
         crop_coordinates: Optional[Dict] = None,
         prediction_log_id: Optional[str] = None,
-        image_bytes: Optional[bytes] = None
+        image_bytes: Optional[bytes] = None,
+        image_buffer: Optional[ImageBuffer] = None
     ) -> Dict[str, Any]:
         """
         執行完整的 CNN + YOLO 檢測流程
@@ -115,399 +949,71 @@ class IntegratedDetectionService:
             web_image_path: Web 訪問路徑
             crop_coordinates: 裁切座標（如果是裁切後的圖片）
             prediction_log_id: 預測記錄 ID（如果是裁切後的重新檢測）
+            image_bytes: 圖片位元組（未提供 image_buffer 時解碼使用）
+            image_buffer: 已解碼的圖片緩衝（優先使用，避免重複解碼與檔案讀取）
         
         Returns:
             完整的檢測結果字典
         """
+        from src.core.core_db_manager import ActivityLogger, ErrorLogger, PerformanceLogger
+        
         start_time = time.time()
         prediction_id = str(uuid.uuid4())
         
         try:
-            # ========== 階段 0: 超解析度預處理（可選）==========
-            processed_image_path = image_path
-            sr_time = 0
-            
-            if self.enable_sr and self.sr_model is not None:
-                try:
-                    logger.info(f"🔍 階段 0: 執行超解析度預處理 (scale={self.sr_scale}x)...")
-                    sr_start = time.time()
-                    
-                    # 創建臨時目錄用於存放超解析度處理後的圖片
-                    temp_dir = os.path.join(os.path.dirname(image_path), 'sr_temp')
-                    os.makedirs(temp_dir, exist_ok=True)
-                    
-                    # 執行超解析度處理
-                    processed_image_path = preprocess_with_sr(
-                        image_path=image_path,
-                        model=self.sr_model,
-                        device=self.sr_device,
-                        scale=self.sr_scale,
-                        temp_dir=temp_dir
-                    )
-                    
-                    sr_time = int((time.time() - sr_start) * 1000)
-                    logger.info(f"✅ 超解析度預處理完成，耗時: {sr_time}ms")
-                except Exception as e:
-                    logger.warning(f"⚠️  超解析度預處理失敗，使用原始圖片: {str(e)}")
-                    processed_image_path = image_path
-                    sr_time = 0
-            
-            # ========== 階段 1: CNN 分類 ==========
-            logger.info("🔍 階段 1: 執行 CNN 分類...")
-            cnn_start = time.time()
-            cnn_result = self.cnn_service.predict(processed_image_path)
-            cnn_time = int((time.time() - cnn_start) * 1000)
-            
-            # 清理臨時超解析度圖片（如果創建了）
-            if processed_image_path != image_path and os.path.exists(processed_image_path):
-                try:
-                    os.remove(processed_image_path)
-                    logger.debug(f"🗑️  已清理臨時超解析度圖片: {processed_image_path}")
-                except:
-                    pass
-            
-            best_class = cnn_result['best_class']
-            mean_score = cnn_result['mean_score']
-            best_score = cnn_result['best_score']
-            all_scores = cnn_result['all_scores']
-            
-            logger.info(f"✅ CNN 分類完成: {best_class} (分數: {best_score:.4f}, 耗時: {cnn_time}ms)")
-            
-            # ========== 階段 2: 分流邏輯 ==========
-            workflow_step = 'cnn_only'
-            yolo_result = None
-            yolo_detected = False
-            final_status = self.cnn_service.get_final_status(best_class)
-            
-            # 路徑 A: 進入 YOLO 檢測
-            if self.cnn_service.should_run_yolo(best_class):
-                logger.info(f"🔍 階段 2: 進入 YOLO 檢測流程 ({best_class})...")
-                workflow_step = 'cnn_yolo'
-                
-                yolo_start = time.time()
-                # 使用 YOLO 模組進行檢測
-                try:
-                    # 使用 YOLO 模組進行檢測
-                    yolo_results = yolo_detect(self.yolo_service.model, image_path)
-                    processed_result = postprocess_yolo_result(yolo_results)
-                    
-                    yolo_detected = processed_result['detected']
-                    yolo_result = processed_result['detections']
-                    
-                    if yolo_detected:
-                        logger.info(f"✅ YOLO 檢測完成: 發現 {len(yolo_result)} 個病害")
-                    else:
-                        logger.info("✅ YOLO 檢測完成: 未發現病害（健康）")
-                        yolo_result = [{
-                            'class': 'Healthy',
-                            'confidence': 1.0,
-                            'bbox': []
-                        }]
-                    
-                    yolo_time = int((time.time() - yolo_start) * 1000)
-                    logger.info(f"   YOLO 耗時: {yolo_time}ms")
-                    
-                except Exception as e:
-                    logger.error(f"❌ YOLO 檢測失敗: {str(e)}", exc_info=True)
-                    yolo_result = []
-                    yolo_detected = False
-                    # 繼續流程，不中斷
+            # 取得已解碼的圖片（路徑與位元組為轉接用法）
+            if image_buffer is None:
+                if image_bytes:
+                    image_buffer = decode_image_bytes(image_bytes, stage='integrated')
+                else:
+                    image_buffer = load_image_buffer(image_path, stage='integrated')
+            if image_hash is None:
+                image_hash = image_buffer.ensure_hash()
             
-            # 路徑 B: 需要裁切
-            elif best_class == 'whole_plant':
-                logger.info("✂️  需要裁切: whole_plant 類別")
-                final_status = 'need_crop'
+            # ========== 階段 0-2: 超解析度、CNN 分類、YOLO 檢測 ==========
+            # 先查推論結果快取（同一張圖片不論由哪位使用者上傳都可共用；啟用近似重複索引時也比對相近的圖片）
+            inference = self._lookup_cached_inference(image_buffer, image_hash)
+            if inference is not None:
+                if inference.get('near_duplicate'):
+                    logger.info(f"✅ 近似重複圖片的推論結果快取命中: hash={image_hash[:8]}..., "
+                                f"distance={inference['near_duplicate']['distance']}")
+                else:
+                    logger.info(f"✅ 推論結果快取命中: hash={image_hash[:8]}...")
             
-            # 路徑 C: 非植物
-            elif best_class == 'others':
-                logger.info("❌ 非植物影像: others 類別")
-                final_status = 'not_plant'
+            if inference is None:
+                # 啟用微批次時交由排程器與其他並發請求合併執行
+                if self.batch_scheduler is not None:
+                    inference = self.batch_scheduler.submit_and_wait(image_buffer, timeout=self.batch_timeout)
+                else:
+                    inference = self._run_inference(image_buffer)
+                self._store_inference(image_buffer, image_hash, inference)
             
-            # ========== 階段 3: 儲存到資料庫 ==========
+            # ========== 階段 3: 儲存到資料庫（write-behind，不阻塞回應）==========
             total_time = int((time.time() - start_time) * 1000)
+            result, prediction_log, detection_record = self._build_prediction(
+                prediction_id,
+                inference,
+                image_buffer,
+                image_hash,
+                user_id,
+                image_source,
+                total_time,
+                web_image_path=web_image_path,
+                crop_coordinates=crop_coordinates
+            )
+            workflow_step = inference['workflow_step']
+            final_status = inference['final_status']
+            best_class = inference['cnn_result']['best_class']
+            yolo_detected = inference['yolo_detected']
             
-            # 獲取圖片大小
-            image_size = None
-            if image_bytes:
-                image_size = len(image_bytes)
-            else:
-                try:
-                    if os.path.exists(image_path):
-                        image_size = os.path.getsize(image_path)
-                except:
-                    pass
-            
-            # 圖片不再儲存在資料庫，只儲存 Cloudinary URL 或資料庫 URL 在 image_path
-            # image_data 相關欄位設為 NULL（保留欄位以維持向後兼容）
-            # 確定圖片路徑：優先使用 web_image_path（可能是 Cloudinary URL），否則使用資料庫 URL
-            if web_image_path and (web_image_path.startswith('http://') or web_image_path.startswith('https://')):
-                # 使用 Cloudinary URL 或其他外部 URL
-                final_image_path = web_image_path
-                is_cloudinary = True
-                logger.info(f"✅ 使用外部圖片 URL: {final_image_path}")
-            else:
-                # 使用資料庫 URL（符合資料庫約束要求）
-                final_image_path = f"/image/prediction/{prediction_id}"
-                is_cloudinary = False
-                logger.info(f"✅ 使用資料庫圖片 URL: {final_image_path}")
-            
-            # 注意：帶框圖片的生成和上傳將在 API 層處理
-            # 因為 IntegratedDetectionService 不直接訪問 ImageManager
-            predict_img_url = None  # 將在 API 層設置
-            
-            # 插入 prediction_log
+            # prediction_log INSERT 與 detection_records upsert 交由寫入器在同一交易中完成
             try:
-                db.execute_update(
-                    """
-                    INSERT INTO prediction_log (
-                        id, user_id, image_path, image_hash, image_size, image_source,
-                        image_data, image_data_size, image_compressed,
-                        cnn_mean_score, cnn_best_class, cnn_best_score, cnn_all_scores,
-                        yolo_result, yolo_detected, final_status, workflow_step,
-                        crop_coordinates, predict_img_url, created_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s,
-                        %s, %s, %s,
-                        %s, %s, %s, %s,
-                        %s, %s, %s, %s,
-                        %s, %s, NOW()
-                    )
-                    """,
-                    (
-                        prediction_id, user_id, final_image_path, image_hash, image_size, image_source,
-                        None,  # image_data - 不再使用，圖片儲存在 Cloudinary
-                        None,  # image_data_size - 不再使用
-                        False,  # image_compressed - 不再使用
-                        mean_score, best_class, best_score, json.dumps(all_scores),
-                        json.dumps(yolo_result) if yolo_result else None, yolo_detected, final_status, workflow_step,
-                        json.dumps(crop_coordinates) if crop_coordinates else None,
-                        predict_img_url  # 帶框圖片 URL（將在 API 層設置）
-                    )
-                )
-                storage_type = "Cloudinary" if is_cloudinary else "本地路徑"
-                logger.info(f"✅ 預測記錄已儲存: {prediction_id}, 圖片儲存: {storage_type}")
+                self.persistence.submit_prediction(prediction_log, detection_record)
+                logger.debug(f"💾 預測記錄已排入寫入佇列: {prediction_id}, disease={detection_record['disease_name']}")
             except Exception as e:
-                logger.error(f"❌ 儲存預測記錄失敗: {str(e)}")
+                logger.error(f"❌ 儲存預測記錄失敗: {str(e)}", exc_info=True)
                 # 繼續流程，不中斷
             
-            # 儲存到 detection_records（無論是否有 YOLO 檢測結果，包括 "others" 類別）
-            # 這樣可以確保所有檢測結果都顯示在歷史記錄中
-            record_id = None
-            try:
-                # 確定病害名稱和置信度
-                if yolo_detected and yolo_result:
-                    # 如果有 YOLO 檢測結果，使用 YOLO 的結果
-                    primary_detection = yolo_result[0]
-                    disease_name = primary_detection['class']
-                    confidence = primary_detection['confidence']
-                    raw_output = {'yolo_detections': yolo_result}
-                else:
-                    # 否則使用 CNN 分類結果（包括 "others" 類別）
-                    disease_name = best_class
-                    confidence = best_score
-                    raw_output = {
-                        'cnn_class': best_class,
-                        'cnn_score': best_score,
-                        'cnn_all_scores': all_scores,
-                        'final_status': final_status
-                    }
-                
-                # 確定圖片路徑（優先使用 web_image_path，可能是 Cloudinary URL）
-                if web_image_path and (web_image_path.startswith('http://') or web_image_path.startswith('https://')):
-                    # 使用 Cloudinary URL 或其他外部 URL
-                    db_image_path = web_image_path
-                    logger.info(f"✅ 使用外部圖片 URL: {db_image_path}")
-                else:
-                    # 使用資料庫 URL（向後兼容）
-                    db_image_path = f"/image/prediction/{prediction_id}"
-                
-                logger.info(f"💾 準備儲存檢測記錄: user_id={user_id}, disease={disease_name}, confidence={confidence}, image_path={db_image_path}")
-                
-                # 確定原始圖片 URL（優先使用 Cloudinary URL）
-                original_image_url = None
-                if web_image_path and (web_image_path.startswith('http://') or web_image_path.startswith('https://')):
-                    original_image_url = web_image_path
-                elif final_image_path and (final_image_path.startswith('http://') or final_image_path.startswith('https://')):
-                    original_image_url = final_image_path
-                
-                # 儲存到 detection_records（圖片不再儲存在資料庫，只儲存 URL）
-                # 使用 ON CONFLICT 處理重複圖片 hash 的情況
-                # 如果圖片 hash 已存在，返回現有記錄的 ID；否則創建新記錄
-                try:
-                    record_result = db.execute_returning(
-                        """
-                        INSERT INTO detection_records (
-                            user_id, disease_name, severity, confidence,
-                            image_path, image_hash, image_size, image_source,
-                            raw_model_output, status, processing_time_ms,
-                            image_data, image_data_size, image_compressed,
-                            prediction_log_id, original_image_url, annotated_image_url, created_at
-                        ) VALUES (
-                            %s, %s, %s, %s,
-                            %s, %s, %s, %s,
-                            %s, %s, %s,
-                            %s, %s, %s,
-                            %s, %s, %s, NOW()
-                        )
-                        ON CONFLICT (image_hash) DO UPDATE SET
-                            updated_at = NOW()
-                        RETURNING id
-                        """,
-                        (
-                            user_id, disease_name, 'Unknown', confidence,
-                            db_image_path, image_hash, image_size, image_source,
-                            json.dumps(raw_output), 'completed', total_time,
-                            None,  # image_data - 不再使用，圖片儲存在 Cloudinary
-                            None,  # image_data_size - 不再使用
-                            False,  # image_compressed - 不再使用
-                            prediction_id,
-                            original_image_url,  # 原始圖片 URL
-                            None  # annotated_image_url - 將在 API 層更新
-                        ),
-                        fetch_one=True
-                    )
-                    
-                    if not record_result:
-                        raise ValueError("INSERT 操作未返回 record_id")
-                    
-                    record_id = record_result[0] if record_result else None
-                    
-                    if not record_id:
-                        raise ValueError(f"無法獲取 record_id，record_result: {record_result}")
-                    
-                    logger.info(f"✅ 檢測記錄已插入/更新: record_id={record_id}")
-                except Exception as e:
-                    # 如果 ON CONFLICT 失敗（可能是其他錯誤），嘗試查詢現有記錄
-                    if "duplicate key" in str(e).lower() or "unique constraint" in str(e).lower():
-                        logger.warning(f"⚠️  圖片 hash 已存在，查詢現有記錄: {image_hash[:16]}...")
-                        existing_record = db.execute_query(
-                            """
-                            SELECT id FROM detection_records
-                            WHERE image_hash = %s
-                            LIMIT 1
-                            """,
-                            (image_hash,),
-                            fetch_one=True
-                        )
-                        if existing_record:
-                            record_id = existing_record[0]
-                            logger.info(f"✅ 使用現有記錄: record_id={record_id}")
-                            # 更新現有記錄的時間戳
-                            db.execute_update(
-                                """
-                                UPDATE detection_records
-                                SET updated_at = NOW()
-                                WHERE id = %s
-                                """,
-                                (record_id,)
-                            )
-                        else:
-                            raise ValueError(f"無法找到現有記錄，也無法創建新記錄: {str(e)}")
-                    else:
-                        raise
-                
-                # 如果使用資料庫 URL，更新為正確的 record_id URL
-                if not (web_image_path and (web_image_path.startswith('http://') or web_image_path.startswith('https://'))):
-                    if record_id:
-                        final_db_image_path = f"/image/{record_id}"
-                        db.execute_update(
-                            """
-                            UPDATE detection_records
-                            SET image_path = %s
-                            WHERE id = %s
-                            """,
-                            (final_db_image_path, record_id)
-                        )
-                        db_image_path = final_db_image_path
-                        logger.info(f"✅ 已更新圖片路徑: {final_db_image_path}")
-                    else:
-                        logger.warning(f"⚠️  無法更新圖片路徑，record_id 為 None")
-                
-                storage_type = "Cloudinary" if (db_image_path.startswith('http://') or db_image_path.startswith('https://')) else "本地路徑"
-                logger.info(f"✅ 檢測記錄已儲存: record_id={record_id}, disease={disease_name}, confidence={confidence:.4f}, 圖片儲存: {storage_type}")
-            except Exception as e:
-                error_traceback = traceback.format_exc()
-                logger.error(f"❌ 儲存檢測記錄失敗: {str(e)}")
-                logger.error(f"   錯誤堆疊:\n{error_traceback}")
-                logger.error(f"   參數: user_id={user_id}, disease={disease_name}, prediction_id={prediction_id}")
-                # 不中斷流程，繼續返回結果，但記錄詳細錯誤
-                record_id = None
-            
-            # ========== 階段 4: 構建回應 ==========
-            # 使用圖片 URL（可能是 Cloudinary URL 或資料庫 URL）
-            # 查詢剛創建的 detection_records 記錄以獲取正確的 URL
-            image_url = f"/image/prediction/{prediction_id}"  # 預設使用 prediction_log 的 URL
-            try:
-                record_result = db.execute_query(
-                    """
-                    SELECT id, image_path FROM detection_records 
-                    WHERE prediction_log_id = %s AND user_id = %s
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                    """,
-                    (prediction_id, user_id),
-                    fetch_one=True
-                )
-                if record_result:
-                    record_id = record_result[0]
-                    stored_image_path = record_result[1] if len(record_result) > 1 else None
-                    # 如果儲存的是 Cloudinary URL，直接使用；否則使用資料庫 URL
-                    if stored_image_path and (stored_image_path.startswith('http://') or stored_image_path.startswith('https://')):
-                        image_url = stored_image_path
-                    else:
-                        image_url = f"/image/{record_id}"
-            except Exception as e:
-                logger.debug(f"查詢 detection_records 失敗，使用預設 URL: {str(e)}")
-            
-            # 確定最終的病害名稱和置信度（用於前端顯示）
-            final_disease = best_class
-            final_confidence = best_score
-            if yolo_detected and yolo_result:
-                final_disease = yolo_result[0]['class']
-                final_confidence = yolo_result[0]['confidence']
-            
-            result = {
-                'status': 'success' if final_status != 'not_plant' else 'error',
-                'workflow': workflow_step,
-                'prediction_id': prediction_id,
-                'cnn_result': {
-                    'mean_score': mean_score,
-                    'best_class': best_class,
-                    'best_score': best_score,
-                    'all_scores': all_scores
-                },
-                'disease': final_disease,  # 添加病害名稱（包括 "others"）
-                'confidence': final_confidence,  # 添加置信度
-                'severity': 'Unknown',
-                'final_status': final_status,
-                'image_path': image_url,  # 使用資料庫圖片 URL
-                'image_stored_in_db': False,  # 標記是否從資料庫讀取（已改為 Cloudinary 儲存）
-                'processing_time_ms': total_time,
-                'cnn_time_ms': cnn_time
-            }
-            
-            # 添加超解析度處理時間（如果執行了）
-            if sr_time > 0:
-                result['sr_time_ms'] = sr_time
-                result['sr_enabled'] = True
-                result['sr_scale'] = self.sr_scale
-            
-            # 添加 YOLO 結果（如有）
-            if yolo_result is not None:
-                result['yolo_result'] = {
-                    'detected': yolo_detected,
-                    'detections': yolo_result
-                }
-                # 總是添加 YOLO 時間（如果執行了 YOLO 檢測）
-                if workflow_step == 'cnn_yolo':
-                    result['yolo_time_ms'] = int((time.time() - yolo_start) * 1000)
-            
-            # 添加錯誤訊息（如需要）
-            if final_status == 'not_plant':
-                result['error'] = '非植物影像，請上傳植物葉片圖片'
-            elif final_status == 'need_crop':
-                result['message'] = '請裁切圖片中的葉片區域'
-            
             # 記錄活動
             ActivityLogger.log_action(
                 user_id=user_id,
@@ -553,16 +1059,104 @@ class IntegratedDetectionService:
             logger.error(f"❌ 整合檢測失敗: {str(e)}")
             raise
     
+    def predict_batch(
+        self,
+        images: List[ImageBuffer],
+        user_id: int,
+        image_source: str = 'upload'
+    ) -> List[Tuple[Dict[str, Any], Tuple[Dict[str, Any], Dict[str, Any]]]]:
+        """
+        對一批圖片執行 CNN + YOLO 檢測（批次檢測端點使用）
+        推論結果快取未命中的圖片以單次 _run_inference_batch() 完成（CNN、YOLO 各一次批次呼叫），
+        不經過微批次排程器；預測記錄不立即寫入，由呼叫者累積後以 persist_batch() 在單一交易中寫入
+        
+        Args:
+            images: 已處理（resize、hash）的圖片緩衝列表
+            user_id: 使用者 ID
+            image_source: 圖片來源
+        
+        Returns:
+            (回應字典, (prediction_log, detection_record)) 列表，順序與輸入一致
+        """
+        from src.core.core_db_manager import PerformanceLogger
+        
+        start_time = time.time()
+        image_hashes = [image.ensure_hash() for image in images]
+        
+        # 先查推論結果快取（含近似重複），只對未命中的圖片執行推論；
+        # 程序內 LRU 沒有的結果先以單次 Redis MGET 預先載入，逐張查詢時不再各自往返
+        if self.inference_cache is not None:
+            self.inference_cache.prefetch(image_hashes)
+        inferences: List[Optional[Dict[str, Any]]] = [
+            self._lookup_cached_inference(image, image_hash) for image, image_hash in zip(images, image_hashes)
+        ]
+        
+        misses = [index for index, inference in enumerate(inferences) if inference is None]
+        if misses:
+            for index, inference in zip(misses, self._run_inference_batch([images[index] for index in misses])):
+                inferences[index] = inference
+            self._store_inferences([(images[index], image_hashes[index], inferences[index]) for index in misses])
+        
+        total_time = int((time.time() - start_time) * 1000)
+        outputs = []
+        for image, image_hash, inference in zip(images, image_hashes, inferences):
+            result, prediction_log, detection_record = self._build_prediction(
+                str(uuid.uuid4()),
+                inference,
+                image,
+                image_hash,
+                user_id,
+                image_source,
+                total_time
+            )
+            outputs.append((result, (prediction_log, detection_record)))
+        
+        PerformanceLogger.log_performance(
+            operation_name='integrated_batch_prediction',
+            execution_time_ms=total_time,
+            status='success',
+            details={'batch_size': len(images), 'inferred': len(misses)}
+        )
+        logger.info(f"✅ 批次檢測完成: {len(images)} 張（推論 {len(misses)} 張），耗時: {total_time}ms")
+        return outputs
+    
+    def persist_batch(self, user_id: int, records: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> bool:
+        """
+        以單一交易寫入 predict_batch() 產生的預測記錄，並記錄一筆批次活動
+        
+        Args:
+            user_id: 使用者 ID
+            records: (prediction_log, detection_record) 列表
+        
+        Returns:
+            是否以單一交易寫入成功（False 表示已溢寫，稍後由寫入器重放）
+        """
+        from src.core.core_db_manager import ActivityLogger
+        
+        persisted = self.persistence.submit_predictions(records)
+        ActivityLogger.log_action(
+            user_id=user_id,
+            action_type='batch_prediction',
+            resource_type='image',
+            resource_id=None,
+            action_details={
+                'count': len(records),
+                'persisted': persisted
+            }
+        )
+        return persisted
+    
     def predict_with_crop(
         self,
-        cropped_image_path: str,
+        cropped_image_path: Optional[str],
         user_id: int,
         prediction_log_id: str,
         crop_coordinates: Dict,
         image_source: str = 'crop',
         web_image_path: str = None,
         image_bytes: Optional[bytes] = None,
-        crop_count: int = 1
+        crop_count: int = 1,
+        image_buffer: Optional[ImageBuffer] = None
     ) -> Dict[str, Any]:
         """
         使用裁切後的圖片重新執行檢測，並替換原始圖片資料
@@ -576,19 +1170,29 @@ class IntegratedDetectionService:
             web_image_path: Web 訪問路徑
             image_bytes: 裁切後的圖片位元組
             crop_count: 裁切次數（默認為 1，最多 3 次）
+            image_buffer: 已處理（resize、hash）的圖片緩衝（優先使用，避免重複解碼）
         
         Returns:
             檢測結果字典
         """
+        from src.core.core_db_manager import db
+        
         start_time = time.time()
         
+        # 原始預測可能仍在寫入佇列中，先確保已寫入再更新
+        if not self.persistence.ensure_persisted(prediction_log_id):
+            logger.warning(f"⚠️  原始預測尚未寫入資料庫: {prediction_log_id}")
+        
         # 1. 獲取裁切後的圖片位元組和 hash
-        cropped_image_bytes = image_bytes
-        image_hash = None
         try:
-            if not cropped_image_bytes:
-                cropped_image_bytes = open(cropped_image_path, 'rb').read()
-            processed_bytes, image_hash = ImageService.process_image(cropped_image_bytes, resize=True)
+            if image_buffer is None:
+                cropped_image_bytes = image_bytes
+                if not cropped_image_bytes:
+                    with open(cropped_image_path, 'rb') as f:
+                        cropped_image_bytes = f.read()
+                image_buffer = ImageService.process_image_buffer(cropped_image_bytes, resize=True)
+            processed_bytes = image_buffer.encoded
+            image_hash = image_buffer.ensure_hash()
         except Exception as e:
             logger.error(f"❌ 處理裁切圖片失敗: {str(e)}")
             raise
@@ -611,6 +1215,7 @@ class IntegratedDetectionService:
                 UPDATE prediction_log
                 SET image_path = %s,
                     image_hash = %s,
+                    image_phash = %s,
                     image_size = %s,
                     image_data = %s,
                     image_data_size = %s,
@@ -622,6 +1227,7 @@ class IntegratedDetectionService:
                 (
                     db_image_path,  # 使用 Cloudinary URL 或資料庫 URL
                     image_hash,
+                    to_signed64(image_buffer.ensure_phash()),
                     image_size,
                     None,  # image_data - 不再使用，圖片儲存在 Cloudinary
                     None,  # image_data_size - 不再使用
@@ -637,48 +1243,24 @@ class IntegratedDetectionService:
             raise
         
         # 3. 使用裁切後的圖片執行完整檢測流程
-        # ========== 階段 0: 超解析度預處理（可選）==========
-        processed_cropped_image_path = cropped_image_path
-        sr_time = 0
-        
-        if self.enable_sr and self.sr_model is not None:
-            try:
-                logger.info(f"🔍 階段 0: 執行超解析度預處理（裁切後圖片）(scale={self.sr_scale}x)...")
-                sr_start = time.time()
-                
-                # 創建臨時目錄用於存放超解析度處理後的圖片
-                temp_dir = os.path.join(os.path.dirname(cropped_image_path), 'sr_temp')
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                # 執行超解析度處理
-                processed_cropped_image_path = preprocess_with_sr(
-                    image_path=cropped_image_path,
-                    model=self.sr_model,
-                    device=self.sr_device,
-                    scale=self.sr_scale,
-                    temp_dir=temp_dir
-                )
-                
-                sr_time = int((time.time() - sr_start) * 1000)
-                logger.info(f"✅ 超解析度預處理完成，耗時: {sr_time}ms")
-            except Exception as e:
-                logger.warning(f"⚠️  超解析度預處理失敗，使用原始圖片: {str(e)}")
-                processed_cropped_image_path = cropped_image_path
-                sr_time = 0
-        
-        # ========== 階段 1: CNN 分類 ==========
-        logger.info("🔍 階段 1: 執行 CNN 分類（裁切後圖片）...")
-        cnn_start = time.time()
-        cnn_result = self.cnn_service.predict(processed_cropped_image_path)
-        cnn_time = int((time.time() - cnn_start) * 1000)
-        
-        # 清理臨時超解析度圖片（如果創建了）
-        if processed_cropped_image_path != cropped_image_path and os.path.exists(processed_cropped_image_path):
-            try:
-                os.remove(processed_cropped_image_path)
-                logger.debug(f"🗑️  已清理臨時超解析度圖片: {processed_cropped_image_path}")
-            except:
-                pass
+        remote = None
+        if self.inference_client is not None:
+            # 推論伺服器模式：一次取得階段 0-2 的結果（需要 YOLO 時已一併檢測）
+            remote = self.inference_client.infer(image_buffer.pixels, metadata=image_buffer.metadata)
+            cnn_result = remote['cnn_result']
+            cnn_time = remote['cnn_time']
+            sr_time = remote['sr_time']
+            sr_decision = remote.get('sr_decision')
+        else:
+            # ========== 階段 0: 超解析度預處理（可選，由策略決定）==========
+            cnn_input, sr_time, sr_decision = self._run_sr(image_buffer)
+            
+            # ========== 階段 1: CNN 分類 ==========
+            logger.info("🔍 階段 1: 執行 CNN 分類（裁切後圖片）...")
+            cnn_start = time.time()
+            cnn_result = self.cnn_service.predict_array(cnn_input)
+            cnn_time = int((time.time() - cnn_start) * 1000)
+        self.sr_policy.record(sr_decision)
         
         best_class = cnn_result['best_class']
         mean_score = cnn_result['mean_score']
@@ -693,7 +1275,7 @@ class IntegratedDetectionService:
         yolo_detected = False
         yolo_start = None
         yolo_time = None
-        final_status = self.cnn_service.get_final_status(best_class)
+        final_status = get_final_status(best_class)
         
         # 檢查：如果 crop 後還是 'whole_plant'，處理 crop 次數限制
         if best_class == 'whole_plant':
@@ -758,19 +1340,26 @@ class IntegratedDetectionService:
                 }
         
         # 路徑 A: 進入 YOLO 檢測
-        if self.cnn_service.should_run_yolo(best_class):
+        if should_run_yolo(best_class):
             logger.info(f"🔍 階段 2: 進入 YOLO 檢測流程 ({best_class})...")
             workflow_step = 'cnn_yolo'
             
             yolo_start = time.time()
             try:
-                # 使用 YOLO 模組進行檢測
-                yolo_results = yolo_detect(self.yolo_service.model, cropped_image_path)
-                processed_result = postprocess_yolo_result(yolo_results)
+                if remote is not None:
+                    # 推論程序未檢測到病害時會補上 Healthy 佔位結果，裁切流程使用原始的空檢測列表
+                    processed_result = {
+                        'detected': remote['yolo_detected'],
+                        'detections': remote['yolo_result'] if remote['yolo_detected'] else []
+                    }
+                else:
+                    # 使用 YOLO 模組進行檢測
+                    yolo_results = yolo_detect_array(self.yolo_service.model, image_buffer.pixels)
+                    processed_result = postprocess_yolo_result(yolo_results)
                 
                 yolo_detected = processed_result['detected']
                 yolo_result = processed_result['detections']
-                yolo_time = int((time.time() - yolo_start) * 1000)
+                yolo_time = int((time.time() - yolo_start) * 1000) if remote is None else (remote['yolo_time'] or 0)
                 
                 if yolo_detected:
                     logger.info(f"✅ YOLO 檢測完成: 發現 {len(yolo_result)} 個病害區域")
@@ -986,6 +1575,8 @@ class IntegratedDetectionService:
             result['sr_time_ms'] = sr_time
             result['sr_enabled'] = True
             result['sr_scale'] = self.sr_scale
+        if sr_decision:
+            result['sr_policy'] = sr_decision
         
         # 添加 YOLO 結果（如有）
         if yolo_result is not None:
@@ -3,19 +3,21 @@
 處理 CNN + YOLO 整合檢測的 HTTP 請求
 """
 
-from flask import request, jsonify
+from flask import Response, jsonify, stream_with_context
 from datetime import datetime
 import os
+import json
+import hashlib
+import threading
 import traceback
-import io
-import numpy as np
-from PIL import Image
 from src.core.core_helpers import get_user_id_from_session, log_api_request
 from src.core.core_redis_manager import redis_manager
-from src.core.core_db_manager import db
 from src.core.core_user_manager import DetectionQueries
+from modules.upload_stream import UploadedImage, UploadTooLarge, read_image_upload, read_image_batch_upload
 from src.services.service_integrated import IntegratedDetectionService
 from src.services.service_image_manager import ImageManager
+from modules.yolo_postprocess import draw_boxes_on_array, filter_detections_by_confidence
+from modules.image_buffer import ImageBuffer
 import logging
 
 # 設定日誌
@@ -29,9 +31,252 @@ logger = logging.getLogger(__name__)
 class IntegratedDetectionAPIService:
     """整合檢測 API 服務類"""
     
-    def __init__(self, integrated_service: IntegratedDetectionService, image_manager: ImageManager):
+    def __init__(
+        self,
+        integrated_service: IntegratedDetectionService,
+        image_manager: ImageManager,
+        batch_max_images: int = 32,
+        batch_max_image_bytes: int = 5 * 1024 * 1024,
+        batch_max_bytes: int = 64 * 1024 * 1024,
+        batch_chunk_size: int = 8,
+        batch_max_concurrent: int = 1
+    ):
+        """
+        Args:
+            integrated_service: 整合檢測服務
+            image_manager: 圖片管理器
+            batch_max_images: 批次檢測單次請求最多圖片數
+            batch_max_image_bytes: 批次檢測單張圖片上限（位元組）
+            batch_max_bytes: 批次檢測請求主體（含 zip 解壓後）總大小上限（位元組）
+            batch_chunk_size: 批次檢測每次送入 CNN/YOLO 的圖片數
+            batch_max_concurrent: 本程序同時處理的批次檢測請求數，超過時返回 429
+        """
         self.integrated_service = integrated_service
         self.image_manager = image_manager
+        self.batch_max_images = max(1, batch_max_images)
+        self.batch_max_image_bytes = batch_max_image_bytes
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_chunk_size = max(1, batch_chunk_size)
+        self._batch_slots = threading.BoundedSemaphore(max(1, batch_max_concurrent))
+    
+    # 批次檢測忙碌時建議用戶端重試的秒數（Retry-After）
+    BATCH_RETRY_AFTER_SECONDS = 5
+    
+    # 帶框圖片只繪製置信度不低於此值的檢測框
+    ANNOTATION_MIN_CONFIDENCE = 0.75
+    
+    def _upload_annotated_image(self, image: ImageBuffer, result: dict, prediction_id: str, user_id: int, log_suffix: str = ""):
+        """
+        以整合檢測已產生的 YOLO 檢測框繪製帶框圖片，上傳到 Cloudinary 並更新資料庫 URL
+        不再重新執行 YOLO 推論；URL 透過寫入器更新；啟用背景上傳佇列時不等待上傳完成，
+        result['predict_img_url'] 先指向 /image/prediction/{id}/annotated；失敗時只記錄警告，不中斷流程
+        
+        Args:
+            image: 送入模型的圖片緩衝（檢測框座標以此圖片為準）
+            result: 整合檢測結果（成功時會寫入 predict_img_url）
+            prediction_id: 預測記錄 ID
+            user_id: 使用者 ID
+            log_suffix: 日誌後綴（例如「（裁切後）」）
+        """
+        yolo_result = result.get('yolo_result')
+        if not (prediction_id and yolo_result and yolo_result.get('detected') and yolo_result.get('detections')):
+            return
+        
+        if not self.image_manager.use_cloudinary:
+            logger.info("ℹ️  Cloudinary 未啟用，跳過帶框圖片生成與上傳")
+            return
+        
+        try:
+            detections = filter_detections_by_confidence(
+                yolo_result.get('detections', []),
+                self.ANNOTATION_MIN_CONFIDENCE
+            )
+            annotated_image_bytes = draw_boxes_on_array(image.pixels, detections, line_width=2)
+            logger.info(f"✅ 已由既有檢測結果生成帶檢測框的圖片（{len(detections)} 個框，無文字）{log_suffix}")
+        except Exception as e:
+            logger.warning(f"⚠️  生成帶框圖片失敗: {str(e)}", exc_info=True)
+            # 不中斷流程，繼續返回結果
+            return
+        
+        def apply_url(predict_img_url: str):
+            # 更新 prediction_log 的 predict_img_url 與 detection_records 的 annotated_image_url
+            self.integrated_service.persistence.patch_urls(
+                prediction_id,
+                user_id,
+                prediction_log={'predict_img_url': predict_img_url},
+                detection_record={'annotated_image_url': predict_img_url}
+            )
+            logger.info(f"✅ 已更新帶框圖片 URL{log_suffix}")
+        
+        upload_queue = self.image_manager.upload_queue
+        if upload_queue is not None:
+            # 背景上傳：以內容 hash 命名（相同內容只上傳一次），上傳完成前由圖片路由直接回應位元組
+            content_hash = hashlib.sha256(annotated_image_bytes).hexdigest()
+            status = upload_queue.enqueue(
+                annotated_image_bytes,
+                public_id=f"predictions/{content_hash}",
+                folder="leaf_disease_ai/predictions",
+                ref=(prediction_id, 'annotated'),
+                owner=user_id,
+                on_success=apply_url
+            )
+            result['predict_img_url'] = status['url'] or f"/image/prediction/{prediction_id}/annotated"
+            result.setdefault('image_upload', {})['annotated'] = status['state']
+            return
+        
+        try:
+            # 上傳到 Cloudinary - 存儲到 predictions 資料夾
+            upload_result = self.image_manager.upload_to_cloudinary(
+                annotated_image_bytes,
+                public_id=f"predictions/{prediction_id}",
+                folder="leaf_disease_ai/predictions"
+            )
+            predict_img_url = upload_result.get('secure_url')
+            logger.info(f"✅ 帶框圖片已上傳到 Cloudinary (predictions): {predict_img_url}")
+            apply_url(predict_img_url)
+            
+            # 在返回結果中添加 predict_img_url
+            result['predict_img_url'] = predict_img_url
+        except Exception as e:
+            logger.warning(f"⚠️  上傳帶框圖片到 Cloudinary 失敗: {str(e)}")
+            # 不中斷流程，繼續返回結果
+    
+    def _upload_original_image(self, image_bytes: bytes, result: dict, prediction_id: str, user_id: int, log_suffix: str = ""):
+        """
+        上傳原始圖片到 Cloudinary（origin 資料夾）並更新資料庫 URL
+        啟用背景上傳佇列時只放入佇列並立即返回，result['image_path'] 保持內部 URL
+        （/image/prediction/{id}），上傳完成後才更新資料庫；失敗時只記錄警告，不中斷流程
+        
+        Args:
+            image_bytes: 處理後的圖片位元組
+            result: 整合檢測結果（同步上傳成功時會寫入 image_path）
+            prediction_id: 預測記錄 ID
+            user_id: 使用者 ID
+            log_suffix: 日誌後綴（例如「（裁切後）」）
+        """
+        if not (prediction_id and self.image_manager.use_cloudinary):
+            return
+        
+        def apply_url(cloudinary_original_url: str):
+            # 更新 prediction_log 的 image_path、original_image_url 與 detection_records 的 original_image_url
+            # （預測仍在寫入佇列中時直接合併到同一筆 INSERT）
+            self.integrated_service.persistence.patch_urls(
+                prediction_id,
+                user_id,
+                prediction_log={
+                    'image_path': cloudinary_original_url,
+                    'original_image_url': cloudinary_original_url
+                },
+                detection_record={'original_image_url': cloudinary_original_url}
+            )
+            logger.info(f"✅ 已更新原始圖片 URL{log_suffix}")
+        
+        upload_queue = self.image_manager.upload_queue
+        if upload_queue is not None:
+            content_hash = hashlib.sha256(image_bytes).hexdigest()
+            status = upload_queue.enqueue(
+                image_bytes,
+                public_id=f"origin/{content_hash}",
+                folder="leaf_disease_ai/origin",
+                ref=(prediction_id, 'origin'),
+                owner=user_id,
+                on_success=apply_url
+            )
+            if status['url']:
+                result['image_path'] = status['url']
+            result.setdefault('image_upload', {})['original'] = status['state']
+            return
+        
+        try:
+            upload_result = self.image_manager.upload_to_cloudinary(
+                image_bytes,
+                public_id=f"origin/{prediction_id}",
+                folder="leaf_disease_ai/origin"
+            )
+            cloudinary_original_url = upload_result.get('secure_url')
+            logger.info(f"✅ 原始圖片已上傳到 Cloudinary (origin){log_suffix}: {cloudinary_original_url}")
+            apply_url(cloudinary_original_url)
+            
+            result['image_path'] = cloudinary_original_url
+        except Exception as e:
+            logger.warning(f"⚠️  上傳原始圖片到 Cloudinary 失敗: {str(e)}")
+            # 不中斷流程，繼續執行
+    
+    def _attach_disease_info(self, result: dict, log_suffix: str = ""):
+        """
+        查詢病害詳細資訊並寫入 result['disease_info']（檢測到病害時），有中文名稱時更新 result['disease']
+        
+        Args:
+            result: 整合檢測結果
+            log_suffix: 日誌後綴（例如「（裁切後）」）
+        """
+        # 優先從 yolo_result 中獲取病害名稱，其次從 disease，最後從 cnn_result
+        disease_name = None
+        if result.get('yolo_result') and result.get('yolo_result', {}).get('detections'):
+            # 從 YOLO 檢測結果中獲取第一個檢測到的病害
+            detections = result.get('yolo_result', {}).get('detections', [])
+            if detections and len(detections) > 0:
+                disease_name = detections[0].get('class')
+        
+        if not disease_name:
+            disease_name = result.get('disease')
+        
+        if not disease_name:
+            disease_name = result.get('cnn_result', {}).get('best_class')
+        
+        if disease_name and disease_name not in ['others', 'whole_plant']:
+            logger.debug(f"🔍 查詢病害資訊{log_suffix}: disease_name={disease_name}")
+            disease_info = DetectionQueries.get_disease_info(disease_name)
+            if disease_info:
+                logger.info(f"✅ 找到病害資訊{log_suffix}: {disease_name} -> {disease_info.get('chinese_name', 'N/A')}")
+                
+                # 處理時間字段
+                disease_created_at = disease_info.get('created_at')
+                disease_updated_at = disease_info.get('updated_at')
+                
+                disease_created_at_str = None
+                if disease_created_at:
+                    if hasattr(disease_created_at, 'isoformat'):
+                        disease_created_at_str = disease_created_at.isoformat()
+                    else:
+                        disease_created_at_str = str(disease_created_at)
+                
+                disease_updated_at_str = None
+                if disease_updated_at:
+                    if hasattr(disease_updated_at, 'isoformat'):
+                        disease_updated_at_str = disease_updated_at.isoformat()
+                    else:
+                        disease_updated_at_str = str(disease_updated_at)
+                
+                result['disease_info'] = {
+                    "id": disease_info.get('id'),
+                    "disease_name": disease_info.get('disease_name'),  # 資料庫中的原始名稱
+                    "chinese_name": disease_info.get('chinese_name'),
+                    "english_name": disease_info.get('english_name'),
+                    "causes": disease_info.get('causes'),
+                    "features": disease_info.get('features'),
+                    "symptoms": disease_info.get('symptoms'),
+                    "pesticides": disease_info.get('pesticides'),
+                    "management_measures": disease_info.get('management_measures'),
+                    "target_crops": disease_info.get('target_crops'),
+                    "severity_levels": disease_info.get('severity_levels'),
+                    "prevention_tips": disease_info.get('prevention_tips'),
+                    "reference_links": disease_info.get('reference_links'),
+                    "created_at": disease_created_at_str,
+                    "updated_at": disease_updated_at_str,
+                    "is_active": disease_info.get('is_active')
+                }
+                # 如果有中文名稱，更新顯示名稱
+                if disease_info.get('chinese_name'):
+                    result['disease'] = disease_info.get('chinese_name')
+            else:
+                logger.warning(f"⚠️  未找到病害資訊{log_suffix}: disease_name={disease_name}")
+    
+    def _read_upload(self, image_field: str, missing_error: str = "無圖片資料") -> UploadedImage:
+        """讀取請求中的圖片；JSON 格式以圖片管理器解碼 base64"""
+        upload = read_image_upload(image_field, self.image_manager.decode_base64_image, missing_error=missing_error)
+        logger.debug(f"📥 收到圖片: {upload.size} bytes ({upload.transport}), sha256={upload.sha256[:8]}...")
+        return upload
     
     def predict(self):
         """處理整合檢測請求（CNN + YOLO）"""
@@ -45,31 +290,35 @@ class IntegratedDetectionAPIService:
             return jsonify({"error": "檢測服務未載入"}), 500
         
         try:
-            # 1. 解析圖片資料
-            if not request.json:
-                return jsonify({"error": "請求資料格式錯誤（缺少 JSON 資料）"}), 400
-            
-            img_data = request.json.get("image")
-            image_source = request.json.get("source", "upload")
-            
-            if not img_data:
-                return jsonify({"error": "無圖片資料"}), 400
-            
-            # 2. 解碼並處理圖片（使用圖片管理器）
+            # 1. 讀取圖片（multipart/form-data、application/octet-stream 或 JSON base64）
             try:
-                img_bytes = self.image_manager.decode_base64_image(img_data)
-                processed_bytes, image_hash = self.image_manager.process_uploaded_image(img_bytes, resize=True)
+                upload = self._read_upload("image")
+            except UploadTooLarge as e:
+                return jsonify({"error": str(e)}), 413
             except ValueError as e:
                 return jsonify({"error": str(e)}), 400
-            except Exception as e:
-                logger.error(f"❌ 圖片處理錯誤: {str(e)}")
-                return jsonify({"error": "圖片處理失敗"}), 400
+            image_source = upload.fields.get("source", "upload")
             
-            # 3. 檢查快取
-            cache_key = f"integrated_detection:{image_hash}:{user_id}"
-            cached_result = redis_manager.get(cache_key)
+            # 2. 檢查使用者回應快取（避免同一使用者重複上傳時重複建立記錄；
+            #    與使用者無關的純推論結果快取由 IntegratedDetectionService 處理）
+            #    先以上傳位元組的 hash 查詢，相同檔案重複上傳時不需要解碼圖片
+            upload_cache_key = f"integrated_detection:upload:{upload.sha256}:{user_id}"
+            cached_result = redis_manager.get(upload_cache_key)
+            if not cached_result:
+                # 3. 解碼並處理圖片（使用圖片管理器）
+                try:
+                    image = self.image_manager.process_uploaded_image_buffer(upload.data, resize=True)
+                    processed_bytes, image_hash = image.encoded, image.image_hash
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                except Exception as e:
+                    logger.error(f"❌ 圖片處理錯誤: {str(e)}")
+                    return jsonify({"error": "圖片處理失敗"}), 400
+                
+                cache_key = f"integrated_detection:{image_hash}:{user_id}"
+                cached_result = redis_manager.get(cache_key)
             if cached_result:
-                logger.info(f"✅ 從快取獲取檢測結果: hash={image_hash[:8]}...")
+                logger.info(f"✅ 從快取獲取檢測結果: upload={upload.sha256[:8]}...")
                 execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
                 log_api_request(
                     user_id=user_id, 
@@ -81,222 +330,38 @@ class IntegratedDetectionAPIService:
                 )
                 return jsonify(cached_result)
             
-            # 4. 創建臨時文件並執行檢測（使用上下文管理器自動清理）
+            # 4. 執行檢測（直接使用記憶體內像素，不寫入臨時文件）
             # 注意：儲存到資料庫的是原始 URL，轉換後的 URL 只用於預測驗證
             try:
-                with self.image_manager.create_temp_file(processed_bytes, suffix='.jpg') as temp_file_path:
-                    # 驗證臨時文件是否存在且可讀
-                    if not os.path.exists(temp_file_path):
-                        raise FileNotFoundError(f"臨時文件不存在: {temp_file_path}")
-                    if not os.access(temp_file_path, os.R_OK):
-                        raise PermissionError(f"臨時文件無法讀取: {temp_file_path}")
-                    
-                    # 記錄臨時文件信息（用於調試）
-                    file_size = os.path.getsize(temp_file_path)
-                    logger.debug(f"📁 臨時文件已創建: {temp_file_path}, 大小: {file_size} bytes")
-                    
-                    # 5. 執行整合檢測（先執行預測以獲取 prediction_id）
-                    result = self.integrated_service.predict(
-                        image_path=temp_file_path,
-                        user_id=user_id,
-                        image_source=image_source,
-                        image_hash=image_hash,
-                        web_image_path=None,  # 先不傳 URL，稍後更新
-                        image_bytes=processed_bytes  # 傳遞圖片位元組
-                    )
-                    
-                    # 6. 上傳原始圖片到 Cloudinary（如果啟用）- 存儲到 origin 資料夾
-                    prediction_id = result.get('prediction_id')
-                    cloudinary_original_url = None
-                    if prediction_id and self.image_manager.use_cloudinary:
-                        try:
-                            upload_result = self.image_manager.upload_to_cloudinary(
-                                processed_bytes,
-                                public_id=f"origin/{prediction_id}",
-                                folder="leaf_disease_ai/origin"
-                            )
-                            cloudinary_original_url = upload_result.get('secure_url')
-                            logger.info(f"✅ 原始圖片已上傳到 Cloudinary (origin): {cloudinary_original_url}")
-                            
-                            # 更新資料庫中的 image_path 和 original_image_url
-                            db.execute_update(
-                                """
-                                UPDATE prediction_log
-                                SET image_path = %s, original_image_url = %s
-                                WHERE id = %s
-                                """,
-                                (cloudinary_original_url, cloudinary_original_url, prediction_id)
-                            )
-                            logger.info(f"✅ 已更新資料庫中的原始圖片 URL")
-                            
-                            # 同時更新 detection_records 表中的 original_image_url
-                            db.execute_update(
-                                """
-                                UPDATE detection_records
-                                SET original_image_url = %s
-                                WHERE prediction_log_id = %s AND user_id = %s
-                                """,
-                                (cloudinary_original_url, prediction_id, user_id)
-                            )
-                            logger.info(f"✅ 已更新 detection_records 中的原始圖片 URL")
-                            
-                            result['image_path'] = cloudinary_original_url
-                        except Exception as e:
-                            logger.warning(f"⚠️  上傳原始圖片到 Cloudinary 失敗: {str(e)}")
-                            # 不中斷流程，繼續執行
-                    
-                    # 10. 如果有 YOLO 檢測結果，使用 YOLO predict() 方法生成帶框圖片並上傳到 Cloudinary
-                    yolo_result = result.get('yolo_result')
-                    if prediction_id and yolo_result and yolo_result.get('detected') and yolo_result.get('detections'):
-                        try:
-                            detections = yolo_result.get('detections', [])
-                            if len(detections) > 0:
-                                # 使用 YOLO 模型的 predict() 方法生成帶框圖片（不包含文字）
-                                yolo_model = self.integrated_service.yolo_service.model
-                                predict_results = yolo_model.predict(
-                                    source=temp_file_path,
-                                    save=False,  # 不保存到硬碟，我們要手動處理
-                                    conf=0.75  # 設定最小置信度
-                                )
-                                
-                                # 從結果中獲取帶框的圖片（numpy array）
-                                if predict_results and len(predict_results) > 0:
-                                    annotated_image_array = predict_results[0].plot(
-                                        labels=False,  # 不顯示文字
-                                        boxes=True,  # 顯示框
-                                        line_width=2  # 框線寬度
-                                    )
-                                    
-                                    # 將 numpy array 轉換為 PIL Image，再轉換為 bytes
-                                    annotated_image = Image.fromarray(annotated_image_array)
-                                    img_bytes = io.BytesIO()
-                                    annotated_image.save(img_bytes, format='JPEG', quality=95)
-                                    annotated_image_bytes = img_bytes.getvalue()
-                                    
-                                    logger.info(f"✅ 已使用 YOLO predict() 生成帶檢測框的圖片（無文字）")
-                                    
-                                    # 上傳到 Cloudinary（如果啟用）- 存儲到 predictions 資料夾
-                                    predict_img_url = None
-                                    if self.image_manager.use_cloudinary:
-                                        try:
-                                            upload_result = self.image_manager.upload_to_cloudinary(
-                                                annotated_image_bytes,
-                                                public_id=f"predictions/{prediction_id}",
-                                                folder="leaf_disease_ai/predictions"
-                                            )
-                                            predict_img_url = upload_result.get('secure_url')
-                                            logger.info(f"✅ 帶框圖片已上傳到 Cloudinary (predictions): {predict_img_url}")
-                                            
-                                            # 更新資料庫中的 predict_img_url
-                                            db.execute_update(
-                                                """
-                                                UPDATE prediction_log
-                                                SET predict_img_url = %s
-                                                WHERE id = %s
-                                                """,
-                                                (predict_img_url, prediction_id)
-                                            )
-                                            logger.info(f"✅ 已更新資料庫中的帶框圖片 URL")
-                                            
-                                            # 同時更新 detection_records 表中的 annotated_image_url
-                                            db.execute_update(
-                                                """
-                                                UPDATE detection_records
-                                                SET annotated_image_url = %s
-                                                WHERE prediction_log_id = %s AND user_id = %s
-                                                """,
-                                                (predict_img_url, prediction_id, user_id)
-                                            )
-                                            logger.info(f"✅ 已更新 detection_records 中的帶框圖片 URL")
-                                            
-                                            # 在返回結果中添加 predict_img_url
-                                            result['predict_img_url'] = predict_img_url
-                                            
-                                        except Exception as e:
-                                            logger.warning(f"⚠️  上傳帶框圖片到 Cloudinary 失敗: {str(e)}")
-                                            # 不中斷流程，繼續返回結果
-                                    else:
-                                        logger.info("ℹ️  Cloudinary 未啟用，跳過帶框圖片上傳")
-                                else:
-                                    logger.warning("⚠️  YOLO predict() 未返回結果")
-                        except Exception as e:
-                            logger.warning(f"⚠️  生成帶框圖片失敗: {str(e)}", exc_info=True)
-                            # 不中斷流程，繼續返回結果
-            except FileNotFoundError as e:
-                logger.error(f"❌ 臨時文件錯誤: {str(e)}", exc_info=True)
-                raise
-            except PermissionError as e:
-                logger.error(f"❌ 文件權限錯誤: {str(e)}", exc_info=True)
-                raise
+                # 5. 執行整合檢測（先執行預測以獲取 prediction_id）
+                result = self.integrated_service.predict(
+                    image_path=None,
+                    user_id=user_id,
+                    image_source=image_source,
+                    image_hash=image_hash,
+                    web_image_path=None,  # 先不傳 URL，稍後更新
+                    image_bytes=processed_bytes,  # 傳遞圖片位元組
+                    image_buffer=image  # 已解碼像素，整條管線不再重複解碼
+                )
+                
+                # 6. 上傳原始圖片到 Cloudinary（如果啟用）- 存儲到 origin 資料夾
+                prediction_id = result.get('prediction_id')
+                self._upload_original_image(processed_bytes, result, prediction_id, user_id)
+                
+                # 10. 如果有 YOLO 檢測結果，以既有檢測框繪製帶框圖片並上傳到 Cloudinary
+                self._upload_annotated_image(image, result, prediction_id, user_id)
             except Exception as e:
                 logger.error(f"❌ 檢測執行錯誤: {str(e)}", exc_info=True)
                 raise
             
             # 6. 查詢病害詳細資訊（如果檢測到病害）
-            # 優先從 yolo_result 中獲取病害名稱，其次從 disease，最後從 cnn_result
-            disease_name = None
-            if result.get('yolo_result') and result.get('yolo_result', {}).get('detections'):
-                # 從 YOLO 檢測結果中獲取第一個檢測到的病害
-                detections = result.get('yolo_result', {}).get('detections', [])
-                if detections and len(detections) > 0:
-                    disease_name = detections[0].get('class')
+            self._attach_disease_info(result)
             
-            if not disease_name:
-                disease_name = result.get('disease')
-            
-            if not disease_name:
-                disease_name = result.get('cnn_result', {}).get('best_class')
-            
-            if disease_name and disease_name not in ['others', 'whole_plant']:
-                logger.debug(f"🔍 查詢病害資訊: disease_name={disease_name}")
-                disease_info = DetectionQueries.get_disease_info(disease_name)
-                if disease_info:
-                    logger.info(f"✅ 找到病害資訊: {disease_name} -> {disease_info.get('chinese_name', 'N/A')}")
-                    
-                    # 處理時間字段
-                    disease_created_at = disease_info.get('created_at')
-                    disease_updated_at = disease_info.get('updated_at')
-                    
-                    disease_created_at_str = None
-                    if disease_created_at:
-                        if hasattr(disease_created_at, 'isoformat'):
-                            disease_created_at_str = disease_created_at.isoformat()
-                        else:
-                            disease_created_at_str = str(disease_created_at)
-                    
-                    disease_updated_at_str = None
-                    if disease_updated_at:
-                        if hasattr(disease_updated_at, 'isoformat'):
-                            disease_updated_at_str = disease_updated_at.isoformat()
-                        else:
-                            disease_updated_at_str = str(disease_updated_at)
-                    
-                    result['disease_info'] = {
-                        "id": disease_info.get('id'),
-                        "disease_name": disease_info.get('disease_name'),  # 資料庫中的原始名稱
-                        "chinese_name": disease_info.get('chinese_name'),
-                        "english_name": disease_info.get('english_name'),
-                        "causes": disease_info.get('causes'),
-                        "features": disease_info.get('features'),
-                        "symptoms": disease_info.get('symptoms'),
-                        "pesticides": disease_info.get('pesticides'),
-                        "management_measures": disease_info.get('management_measures'),
-                        "target_crops": disease_info.get('target_crops'),
-                        "severity_levels": disease_info.get('severity_levels'),
-                        "prevention_tips": disease_info.get('prevention_tips'),
-                        "reference_links": disease_info.get('reference_links'),
-                        "created_at": disease_created_at_str,
-                        "updated_at": disease_updated_at_str,
-                        "is_active": disease_info.get('is_active')
-                    }
-                    # 如果有中文名稱，更新顯示名稱
-                    if disease_info.get('chinese_name'):
-                        result['disease'] = disease_info.get('chinese_name')
-                else:
-                    logger.warning(f"⚠️  未找到病害資訊: disease_name={disease_name}")
-            
-            # 7. 快取結果（1 小時）
-            redis_manager.set(cache_key, result, expire=3600)
+            # 7. 快取結果（1 小時；上傳狀態只對本次回應有意義，圖片 URL 由圖片路由解析）
+            cached_value = {key: value for key, value in result.items() if key != 'image_upload'}
+            redis_manager.mset(
+                {cache_key: cached_value, upload_cache_key: cached_value}, expire=3600, tags=[f"user:{user_id}"]
+            )
             
             # 8. 記錄 API 日誌
             execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
@@ -364,22 +429,21 @@ class IntegratedDetectionAPIService:
             return jsonify({"error": "檢測服務未載入"}), 500
         
         try:
-            # 1. 解析請求資料
-            if not request.json:
-                return jsonify({"error": "請求資料格式錯誤（缺少 JSON 資料）"}), 400
-            
-            data = request.json
-            prediction_log_id = data.get("prediction_id")
-            crop_coordinates = data.get("crop_coordinates")
-            cropped_image = data.get("cropped_image")
-            crop_count = data.get("crop_count", 1)  # 默認為第 1 次 crop
+            # 1. 解析請求資料（multipart/form-data、application/octet-stream 或 JSON base64）
+            try:
+                upload = self._read_upload("cropped_image", missing_error="缺少 cropped_image")
+                prediction_log_id = upload.fields.get("prediction_id")
+                crop_coordinates = upload.get_json_field("crop_coordinates")
+            except UploadTooLarge as e:
+                return jsonify({"error": str(e)}), 413
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            crop_count = upload.fields.get("crop_count", 1)  # 默認為第 1 次 crop
             
             if not prediction_log_id:
                 return jsonify({"error": "缺少 prediction_id"}), 400
             if not crop_coordinates:
                 return jsonify({"error": "缺少 crop_coordinates"}), 400
-            if not cropped_image:
-                return jsonify({"error": "缺少 cropped_image"}), 400
             
             # 確保 crop_count 是整數且在合理範圍內
             try:
@@ -395,231 +459,46 @@ class IntegratedDetectionAPIService:
             
             # 2. 處理裁切後的圖片（使用圖片管理器）
             try:
-                processed_bytes, image_hash = self.image_manager.process_cropped_image(cropped_image)
+                image = self.image_manager.process_uploaded_image_buffer(upload.data, resize=True)
+                logger.info(f"✅ 裁切圖片處理完成: hash={image.image_hash[:8]}...")
+                processed_bytes = image.encoded
             except ValueError as e:
                 return jsonify({"error": str(e)}), 400
             except Exception as e:
                 logger.error(f"❌ 裁切圖片處理錯誤: {str(e)}")
                 return jsonify({"error": "裁切圖片處理失敗"}), 400
             
-            # 3. 創建臨時文件並執行檢測（使用上下文管理器自動清理）
+            # 3. 執行檢測（直接使用記憶體內像素，不寫入臨時文件）
             # 注意：儲存到資料庫的是原始 URL，轉換後的 URL 只用於預測驗證
-            # 注意：臨時文件僅用於模型推理，檢測完成後會自動刪除
-            # 圖片只存儲在資料庫中，不存儲在文件系統
             try:
-                with self.image_manager.create_temp_file(processed_bytes, suffix='.jpg') as temp_file_path:
-                    # 驗證臨時文件是否存在且可讀
-                    if not os.path.exists(temp_file_path):
-                        raise FileNotFoundError(f"臨時文件不存在: {temp_file_path}")
-                    if not os.access(temp_file_path, os.R_OK):
-                        raise PermissionError(f"臨時文件無法讀取: {temp_file_path}")
-                    
-                    # 記錄臨時文件信息（用於調試）
-                    file_size = os.path.getsize(temp_file_path)
-                    logger.debug(f"📁 臨時文件已創建: {temp_file_path}, 大小: {file_size} bytes")
-                    
-                    # 4. 執行檢測（先執行預測以獲取 prediction_id）
-                    result = self.integrated_service.predict_with_crop(
-                        cropped_image_path=temp_file_path,
-                        user_id=user_id,
-                        prediction_log_id=prediction_log_id,
-                        crop_coordinates=crop_coordinates,
-                        web_image_path=None,  # 先不傳 URL，稍後更新
-                        image_bytes=processed_bytes,
-                        crop_count=crop_count
-                    )
-                    
-                    # 5. 上傳裁切後的原始圖片到 Cloudinary（如果啟用）- 存儲到 origin 資料夾
-                    prediction_id = result.get('prediction_id')
-                    cloudinary_original_url = None
-                    if prediction_id and self.image_manager.use_cloudinary:
-                        try:
-                            upload_result = self.image_manager.upload_to_cloudinary(
-                                processed_bytes,
-                                public_id=f"origin/{prediction_id}",
-                                folder="leaf_disease_ai/origin"
-                            )
-                            cloudinary_original_url = upload_result.get('secure_url')
-                            logger.info(f"✅ 裁切原始圖片已上傳到 Cloudinary (origin): {cloudinary_original_url}")
-                            
-                            # 更新資料庫中的 image_path 和 original_image_url
-                            db.execute_update(
-                                """
-                                UPDATE prediction_log
-                                SET image_path = %s, original_image_url = %s
-                                WHERE id = %s
-                                """,
-                                (cloudinary_original_url, cloudinary_original_url, prediction_id)
-                            )
-                            logger.info(f"✅ 已更新資料庫中的原始圖片 URL（裁切後）")
-                            
-                            # 同時更新 detection_records 表中的 original_image_url
-                            db.execute_update(
-                                """
-                                UPDATE detection_records
-                                SET original_image_url = %s
-                                WHERE prediction_log_id = %s AND user_id = %s
-                                """,
-                                (cloudinary_original_url, prediction_id, user_id)
-                            )
-                            logger.info(f"✅ 已更新 detection_records 中的原始圖片 URL（裁切後）")
-                            
-                            result['image_path'] = cloudinary_original_url
-                        except Exception as e:
-                            logger.warning(f"⚠️  上傳原始圖片到 Cloudinary 失敗: {str(e)}")
-                            # 不中斷流程，繼續執行
-                    
-                    # 9. 如果有 YOLO 檢測結果，使用 YOLO predict() 方法生成帶框圖片並上傳到 Cloudinary
-                    yolo_result = result.get('yolo_result')
-                    if prediction_id and yolo_result and yolo_result.get('detected') and yolo_result.get('detections'):
-                        try:
-                            detections = yolo_result.get('detections', [])
-                            if len(detections) > 0:
-                                # 使用 YOLO 模型的 predict() 方法生成帶框圖片（不包含文字）
-                                yolo_model = self.integrated_service.yolo_service.model
-                                predict_results = yolo_model.predict(
-                                    source=temp_file_path,
-                                    save=False,  # 不保存到硬碟，我們要手動處理
-                                    conf=0.75  # 設定最小置信度
-                                )
-                                
-                                # 從結果中獲取帶框的圖片（numpy array）
-                                if predict_results and len(predict_results) > 0:
-                                    annotated_image_array = predict_results[0].plot(
-                                        labels=False,  # 不顯示文字
-                                        boxes=True,  # 顯示框
-                                        line_width=2  # 框線寬度
-                                    )
-                                    
-                                    # 將 numpy array 轉換為 PIL Image，再轉換為 bytes
-                                    annotated_image = Image.fromarray(annotated_image_array)
-                                    img_bytes = io.BytesIO()
-                                    annotated_image.save(img_bytes, format='JPEG', quality=95)
-                                    annotated_image_bytes = img_bytes.getvalue()
-                                    
-                                    logger.info(f"✅ 已使用 YOLO predict() 生成帶檢測框的圖片（無文字，裁切後）")
-                                    
-                                    # 上傳到 Cloudinary（如果啟用）- 存儲到 predictions 資料夾
-                                    predict_img_url = None
-                                    if self.image_manager.use_cloudinary:
-                                        try:
-                                            upload_result = self.image_manager.upload_to_cloudinary(
-                                                annotated_image_bytes,
-                                                public_id=f"predictions/{prediction_id}",
-                                                folder="leaf_disease_ai/predictions"
-                                            )
-                                            predict_img_url = upload_result.get('secure_url')
-                                            logger.info(f"✅ 帶框圖片已上傳到 Cloudinary (predictions): {predict_img_url}")
-                                            
-                                            # 更新資料庫中的 predict_img_url
-                                            db.execute_update(
-                                                """
-                                                UPDATE prediction_log
-                                                SET predict_img_url = %s
-                                                WHERE id = %s
-                                                """,
-                                                (predict_img_url, prediction_id)
-                                            )
-                                            logger.info(f"✅ 已更新資料庫中的帶框圖片 URL（裁切後）")
-                                            
-                                            # 同時更新 detection_records 表中的 annotated_image_url
-                                            db.execute_update(
-                                                """
-                                                UPDATE detection_records
-                                                SET annotated_image_url = %s
-                                                WHERE prediction_log_id = %s AND user_id = %s
-                                                """,
-                                                (predict_img_url, prediction_id, user_id)
-                                            )
-                                            logger.info(f"✅ 已更新 detection_records 中的帶框圖片 URL（裁切後）")
-                                            
-                                            # 在返回結果中添加 predict_img_url
-                                            result['predict_img_url'] = predict_img_url
-                                            
-                                        except Exception as e:
-                                            logger.warning(f"⚠️  上傳帶框圖片到 Cloudinary 失敗: {str(e)}")
-                                            # 不中斷流程，繼續返回結果
-                                    else:
-                                        logger.info("ℹ️  Cloudinary 未啟用，跳過帶框圖片上傳")
-                                else:
-                                    logger.warning("⚠️  YOLO predict() 未返回結果")
-                        except Exception as e:
-                            logger.warning(f"⚠️  生成帶框圖片失敗: {str(e)}", exc_info=True)
-                            # 不中斷流程，繼續返回結果
-                    # 確保臨時文件已刪除（上下文管理器會自動處理，這裡是雙重保險）
-                    logger.debug(f"✅ 裁切檢測完成，臨時文件將自動清理: {temp_file_path}")
-            except FileNotFoundError as e:
-                logger.error(f"❌ 臨時文件錯誤: {str(e)}", exc_info=True)
-                raise
-            except PermissionError as e:
-                logger.error(f"❌ 文件權限錯誤: {str(e)}", exc_info=True)
-                raise
+                # 4. 執行檢測（先執行預測以獲取 prediction_id）
+                result = self.integrated_service.predict_with_crop(
+                    cropped_image_path=None,
+                    user_id=user_id,
+                    prediction_log_id=prediction_log_id,
+                    crop_coordinates=crop_coordinates,
+                    web_image_path=None,  # 先不傳 URL，稍後更新
+                    image_bytes=processed_bytes,
+                    crop_count=crop_count,
+                    image_buffer=image  # 已解碼像素，整條管線不再重複解碼
+                )
+                
+                # 5. 上傳裁切後的原始圖片到 Cloudinary（如果啟用）- 存儲到 origin 資料夾
+                prediction_id = result.get('prediction_id')
+                self._upload_original_image(
+                    processed_bytes, result, prediction_id, user_id, log_suffix="（裁切後）"
+                )
+                
+                # 9. 如果有 YOLO 檢測結果，以既有檢測框繪製帶框圖片並上傳到 Cloudinary
+                self._upload_annotated_image(
+                    image, result, prediction_id, user_id, log_suffix="（裁切後）"
+                )
             except Exception as e:
                 logger.error(f"❌ 檢測執行錯誤: {str(e)}", exc_info=True)
                 raise
             
             # 5. 查詢病害詳細資訊（如果檢測到病害）
-            # 優先從 yolo_result 中獲取病害名稱，其次從 disease，最後從 cnn_result
-            disease_name = None
-            if result.get('yolo_result') and result.get('yolo_result', {}).get('detections'):
-                # 從 YOLO 檢測結果中獲取第一個檢測到的病害
-                detections = result.get('yolo_result', {}).get('detections', [])
-                if detections and len(detections) > 0:
-                    disease_name = detections[0].get('class')
-            
-            if not disease_name:
-                disease_name = result.get('disease')
-            
-            if not disease_name:
-                disease_name = result.get('cnn_result', {}).get('best_class')
-            
-            if disease_name and disease_name not in ['others', 'whole_plant']:
-                logger.debug(f"🔍 查詢病害資訊（裁切後）: disease_name={disease_name}")
-                disease_info = DetectionQueries.get_disease_info(disease_name)
-                if disease_info:
-                    logger.info(f"✅ 找到病害資訊（裁切後）: {disease_name} -> {disease_info.get('chinese_name', 'N/A')}")
-                    
-                    # 處理時間字段
-                    disease_created_at = disease_info.get('created_at')
-                    disease_updated_at = disease_info.get('updated_at')
-                    
-                    disease_created_at_str = None
-                    if disease_created_at:
-                        if hasattr(disease_created_at, 'isoformat'):
-                            disease_created_at_str = disease_created_at.isoformat()
-                        else:
-                            disease_created_at_str = str(disease_created_at)
-                    
-                    disease_updated_at_str = None
-                    if disease_updated_at:
-                        if hasattr(disease_updated_at, 'isoformat'):
-                            disease_updated_at_str = disease_updated_at.isoformat()
-                        else:
-                            disease_updated_at_str = str(disease_updated_at)
-                    
-                    result['disease_info'] = {
-                        "id": disease_info.get('id'),
-                        "disease_name": disease_info.get('disease_name'),  # 資料庫中的原始名稱
-                        "chinese_name": disease_info.get('chinese_name'),
-                        "english_name": disease_info.get('english_name'),
-                        "causes": disease_info.get('causes'),
-                        "features": disease_info.get('features'),
-                        "symptoms": disease_info.get('symptoms'),
-                        "pesticides": disease_info.get('pesticides'),
-                        "management_measures": disease_info.get('management_measures'),
-                        "target_crops": disease_info.get('target_crops'),
-                        "severity_levels": disease_info.get('severity_levels'),
-                        "prevention_tips": disease_info.get('prevention_tips'),
-                        "reference_links": disease_info.get('reference_links'),
-                        "created_at": disease_created_at_str,
-                        "updated_at": disease_updated_at_str,
-                        "is_active": disease_info.get('is_active')
-                    }
-                    # 如果有中文名稱，更新顯示名稱
-                    if disease_info.get('chinese_name'):
-                        result['disease'] = disease_info.get('chinese_name')
-                else:
-                    logger.warning(f"⚠️  未找到病害資訊（裁切後）: disease_name={disease_name}")
+            self._attach_disease_info(result, log_suffix="（裁切後）")
             
             # 6. 記錄 API 日誌
             execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
@@ -653,3 +532,174 @@ class IntegratedDetectionAPIService:
                 "message": "裁切檢測過程中發生錯誤，請稍後再試"
             }), 500
 
+    
+    @staticmethod
+    def _ndjson(payload: dict) -> str:
+        return json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+    
+    def predict_batch(self):
+        """
+        處理批次檢測請求（多張圖片或 zip 壓縮檔）
+        每批 batch_chunk_size 張圖片以單次 CNN/YOLO 批次推論完成後，逐張以 NDJSON 串流回應；
+        所有預測記錄在最後以單一交易寫入，最後一行為摘要
+        """
+        start_time = datetime.now()
+        user_id = get_user_id_from_session()
+        
+        if not user_id:
+            return jsonify({"error": "請先登入"}), 401
+        
+        if not self.integrated_service:
+            return jsonify({"error": "檢測服務未載入"}), 500
+        
+        # 背壓：本程序同時處理的批次有上限，已滿時立即返回 429，不讓請求執行緒排隊等待
+        if not self._batch_slots.acquire(blocking=False):
+            logger.warning("⚠️  批次檢測已達並發上限，返回 429")
+            response = jsonify({"error": "批次檢測忙碌中，請稍後再試"})
+            response.headers['Retry-After'] = str(self.BATCH_RETRY_AFTER_SECONDS)
+            return response, 429
+        
+        try:
+            uploads, fields = read_image_batch_upload(
+                "images",
+                "archive",
+                max_images=self.batch_max_images,
+                max_image_bytes=self.batch_max_image_bytes,
+                max_total_bytes=self.batch_max_bytes
+            )
+        except UploadTooLarge as e:
+            self._batch_slots.release()
+            return jsonify({"error": str(e)}), 413
+        except ValueError as e:
+            self._batch_slots.release()
+            return jsonify({"error": str(e)}), 400
+        except Exception:
+            self._batch_slots.release()
+            raise
+        
+        image_source = fields.get("source", "upload")
+        logger.info(f"📦 批次檢測: {len(uploads)} 張圖片 ({uploads[0].transport}), user_id={user_id}")
+        
+        response = Response(
+            stream_with_context(self._stream_batch(uploads, user_id, image_source, start_time)),
+            mimetype="application/x-ndjson"
+        )
+        # 回應結束（完成或用戶端斷線）時釋放並發名額
+        response.call_on_close(self._batch_slots.release)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # 反向代理不緩衝，逐行送出
+        return response
+    
+    def _stream_batch(self, uploads: list, user_id: int, image_source: str, start_time: datetime):
+        """
+        批次檢測的 NDJSON 產生器
+        WSGI 伺服器送出上一批結果後才會處理下一批，用戶端讀取過慢時推論自然暫停（背壓）
+        
+        每行一個 JSON 物件：
+            {"type": "result", "index": 0, "filename": "...", "result": {...}}
+            {"type": "error", "index": 1, "filename": "...", "error": "..."}
+            {"type": "summary", "total": 2, "succeeded": 1, "failed": 1, "persisted": true, "processing_time_ms": 123}
+        """
+        records = []
+        completed = []  # 寫入資料庫後才上傳到 Cloudinary 的 (圖片, 結果)
+        failed = 0
+        persisted = False
+        persist_attempted = False
+        try:
+            for chunk_start in range(0, len(uploads), self.batch_chunk_size):
+                indices = []
+                images = []
+                for index in range(chunk_start, min(chunk_start + self.batch_chunk_size, len(uploads))):
+                    filename = uploads[index].fields.get("filename")
+                    try:
+                        images.append(self.image_manager.process_uploaded_image_buffer(uploads[index].data, resize=True))
+                        indices.append(index)
+                    except Exception as e:
+                        failed += 1
+                        error = str(e) if isinstance(e, ValueError) else "圖片處理失敗"
+                        yield self._ndjson({"type": "error", "index": index, "filename": filename, "error": error})
+                    uploads[index].data = None  # 已解碼，釋放原始位元組
+                if not images:
+                    continue
+                
+                try:
+                    outputs = self.integrated_service.predict_batch(images, user_id, image_source=image_source)
+                except Exception as e:
+                    logger.error(f"❌ 批次檢測執行錯誤: {str(e)}", exc_info=True)
+                    for index in indices:
+                        failed += 1
+                        yield self._ndjson({
+                            "type": "error",
+                            "index": index,
+                            "filename": uploads[index].fields.get("filename"),
+                            "error": "檢測失敗"
+                        })
+                    continue
+                
+                for index, image, (result, record) in zip(indices, images, outputs):
+                    self._attach_disease_info(result)
+                    records.append(record)
+                    if self.image_manager.use_cloudinary:
+                        completed.append((image, result))
+                    yield self._ndjson({
+                        "type": "result",
+                        "index": index,
+                        "filename": uploads[index].fields.get("filename"),
+                        "result": result
+                    })
+            
+            # 所有預測記錄在單一交易中寫入
+            persist_attempted = True
+            persisted = self.integrated_service.persist_batch(user_id, records) if records else True
+            
+            # 圖片上傳排在寫入之後，URL 更新一定套用在已存在的記錄上
+            for image, result in completed:
+                prediction_id = result.get('prediction_id')
+                self._upload_original_image(image.encoded, result, prediction_id, user_id)
+                self._upload_annotated_image(image, result, prediction_id, user_id)
+            
+            execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
+            log_api_request(
+                user_id=user_id,
+                endpoint="/api/predict/batch",
+                method="POST",
+                status_code=200,
+                execution_time_ms=execution_time,
+                error_message=f"{failed} 張圖片失敗" if failed else None
+            )
+            yield self._ndjson({
+                "type": "summary",
+                "total": len(uploads),
+                "succeeded": len(records),
+                "failed": failed,
+                "persisted": persisted,
+                "processing_time_ms": execution_time
+            })
+        except GeneratorExit:
+            # 用戶端中途斷線：已送出的 prediction_id 仍須可查詢，寫入已完成的預測
+            if not persist_attempted and records:
+                logger.warning(f"⚠️  批次檢測用戶端已斷線，寫入已完成的 {len(records)} 筆預測")
+                self.integrated_service.persist_batch(user_id, records)
+            raise
+        except Exception as e:
+            logger.error(f"❌ 批次檢測錯誤: {str(e)}", exc_info=True)
+            if not persist_attempted and records:
+                persisted = self.integrated_service.persist_batch(user_id, records)
+            execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
+            log_api_request(
+                user_id=user_id,
+                endpoint="/api/predict/batch",
+                method="POST",
+                status_code=500,
+                execution_time_ms=execution_time,
+                error_message=str(e)
+            )
+            yield self._ndjson({
+                "type": "summary",
+                "total": len(uploads),
+                "succeeded": len(records),
+                "failed": len(uploads) - len(records),
+                "persisted": persisted,
+                "error": "批次檢測過程中發生錯誤",
+                "processing_time_ms": execution_time
+            })
@@ -0,0 +1,274 @@
+"""
+近似重複圖片索引服務
+prediction_log.image_phash 保存每次預測圖片的 64 位元感知雜湊（pHash）；本服務在程序內以多索引雜湊
+（modules.perceptual_hash.HammingIndex）維護「感知雜湊 -> 圖片 SHA256」的對應，
+推論結果快取以 SHA256 未命中時，找出漢明距離在門檻內的先前圖片，改用其 SHA256 查詢推論結果快取
+
+image_phash 欄位由 init_database.sql（新資料庫）或 database/migrations/ 的遷移（既有資料庫，railway-init.sh 執行）建立，
+本服務不執行 DDL
+
+資料庫即持久層：啟動後由背景執行緒載入 load_window_seconds 內（與推論結果快取 TTL 相同，
+更早的結果已不在快取中）的雜湊，之後每隔 refresh_interval 秒增量載入其他 worker 寫入的記錄
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.core_db_manager import db
+from modules.perceptual_hash import HammingIndex, from_signed64
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class NearDuplicateIndex:
+    """
+    感知雜湊近似重複索引（每個程序一份，gunicorn fork 後各 worker 各自載入）
+
+    find() 只做記憶體查詢，不等待資料庫；載入完成前查詢結果只包含本程序加入的雜湊。
+    """
+
+    # 首次載入失敗後的重試間隔（秒）
+    LOAD_RETRY_SECONDS = 5.0
+    # 增量載入向前重疊的秒數（write-behind 以請求時間寫入 created_at，較晚寫入的記錄可能早於上次的最大值）
+    REFRESH_OVERLAP_SECONDS = 60.0
+    # 伺服器端遊標每次讀取的筆數
+    FETCH_SIZE = 10000
+    # 延遲統計保留的最近查詢數
+    LATENCY_WINDOW = 2048
+
+    def __init__(
+        self,
+        db_manager=None,
+        max_distance: int = 4,
+        max_entries: int = 500000,
+        load_window_seconds: int = 86400,
+        refresh_interval: float = 30.0,
+        load_from_db: bool = True
+    ):
+        """
+        初始化近似重複索引（不會立即連接資料庫，第一次使用時啟動背景載入）
+
+        Args:
+            db_manager: 提供 get_connection() 的資料庫管理器（預設為全局 db）
+            max_distance: 視為近似重複的最大漢明距離（64 位元中）
+            max_entries: 程序內最多保存的雜湊數，超過時淘汰最早的
+            load_window_seconds: 從資料庫載入多久以內的預測記錄（秒）
+            refresh_interval: 增量載入間隔（秒）
+            load_from_db: 是否從資料庫載入（False 時只使用本程序加入的雜湊）
+        """
+        self.db = db_manager or db
+        self.max_distance = max(0, max_distance)
+        self.load_window_seconds = load_window_seconds
+        self.refresh_interval = max(1.0, refresh_interval)
+        self.load_from_db = load_from_db
+        self.index = HammingIndex(max_entries=max_entries)
+
+        self._loader_pid: Optional[int] = None
+        self._loader_lock = threading.Lock()
+        self._watermark = None  # 已載入記錄的最大 created_at
+        self._loaded = False
+        self._metrics_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=self.LATENCY_WINDOW)
+        self._counters = {
+            'lookups': 0,
+            'matches': 0,
+            'candidates_checked': 0,
+            'added': 0,
+            'full_loads': 0,
+            'incremental_refreshes': 0,
+            'rows_loaded': 0,
+            'load_errors': 0
+        }
+        self._last_load_ms = 0.0
+        self._last_refresh: Optional[float] = None
+        logger.info(f"✅ 近似重複索引已啟用 (max_distance={self.max_distance}, max_entries={max_entries})")
+
+    # ------------------------------------------------------------------
+    # 查詢與加入
+    # ------------------------------------------------------------------
+
+    def find(self, perceptual_hash: Optional[int], limit: int = 3) -> List[Tuple[int, str]]:
+        """
+        查詢近似重複的先前圖片
+
+        Args:
+            perceptual_hash: 64 位元感知雜湊
+            limit: 最多返回筆數
+
+        Returns:
+            [(漢明距離, 圖片 SHA256)]，依距離由近到遠
+        """
+        if perceptual_hash is None:
+            return []
+        self._ensure_loader()
+        start = time.perf_counter()
+        matches, checked = self.index.search(perceptual_hash, self.max_distance, limit=limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._metrics_lock:
+            self._counters['lookups'] += 1
+            self._counters['candidates_checked'] += checked
+            if matches:
+                self._counters['matches'] += 1
+            self._latencies.append(elapsed_ms)
+        return [(distance, image_hash) for distance, _, image_hash in matches]
+
+    def add(self, perceptual_hash: Optional[int], image_hash: Optional[str]):
+        """
+        加入圖片（推論結果寫入快取後呼叫）
+
+        Args:
+            perceptual_hash: 64 位元感知雜湊
+            image_hash: 圖片 SHA256（推論結果快取的鍵）
+        """
+        if perceptual_hash is None or not image_hash:
+            return
+        self._ensure_loader()
+        self.index.add(perceptual_hash, image_hash)
+        with self._metrics_lock:
+            self._counters['added'] += 1
+
+    # ------------------------------------------------------------------
+    # 資料庫載入
+    # ------------------------------------------------------------------
+
+    def _ensure_loader(self):
+        """在目前程序中啟動載入執行緒（gunicorn fork 後每個 worker 各自啟動一次）"""
+        pid = os.getpid()
+        if not self.load_from_db or self._loader_pid == pid:
+            return
+        with self._loader_lock:
+            if self._loader_pid == pid:
+                return
+            self._loader_pid = pid
+            # fork 前在主程序載入的內容由子程序繼承，但仍以子程序自己的執行緒繼續增量載入
+            thread = threading.Thread(target=self._load_loop, name='near-duplicate-loader', daemon=True)
+            thread.start()
+
+    def _load_loop(self):
+        while True:
+            if not self._loaded:
+                if self._load(initial=True):
+                    self._loaded = True
+                else:
+                    time.sleep(self.LOAD_RETRY_SECONDS)
+                    continue
+            time.sleep(self.refresh_interval)
+            self._load(initial=False)
+
+    def _load(self, initial: bool) -> bool:
+        """
+        從 prediction_log 載入感知雜湊
+
+        Args:
+            initial: True 時載入整個時間窗口（最新的 max_entries 筆），否則只載入上次之後的記錄
+
+        Returns:
+            是否成功
+        """
+        start = time.perf_counter()
+        if initial:
+            sql = """
+                SELECT image_phash, image_hash, created_at FROM (
+                    SELECT image_phash, image_hash, created_at FROM prediction_log
+                    WHERE image_phash IS NOT NULL AND image_hash IS NOT NULL
+                      AND created_at > NOW() - make_interval(secs => %s)
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                ) recent
+                ORDER BY created_at
+            """
+            params = (self.load_window_seconds, self.index.max_entries or None)
+        else:
+            sql = """
+                SELECT image_phash, image_hash, created_at FROM prediction_log
+                WHERE image_phash IS NOT NULL AND image_hash IS NOT NULL
+                  AND created_at > %s - make_interval(secs => %s)
+                ORDER BY created_at
+            """
+            params = (self._watermark, self.REFRESH_OVERLAP_SECONDS)
+            if self._watermark is None:
+                # 載入時資料庫中還沒有記錄：改為載入整個時間窗口
+                return self._load(initial=True)
+
+        rows = 0
+        try:
+            with self.db.get_connection() as conn:
+                try:
+                    # 伺服器端遊標分批讀取，載入大量記錄時不一次把結果放入記憶體
+                    with conn.cursor(name='near_duplicate_load') as cursor:
+                        cursor.itersize = self.FETCH_SIZE
+                        cursor.execute(sql, params)
+                        for phash_value, image_hash, created_at in cursor:
+                            self.index.add(from_signed64(phash_value), image_hash)
+                            if self._watermark is None or created_at > self._watermark:
+                                self._watermark = created_at
+                            rows += 1
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        except Exception as e:
+            with self._metrics_lock:
+                self._counters['load_errors'] += 1
+            logger.warning(f"⚠️  近似重複索引載入失敗: {str(e)}")
+            return False
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._metrics_lock:
+            self._counters['full_loads' if initial else 'incremental_refreshes'] += 1
+            self._counters['rows_loaded'] += rows
+            self._last_refresh = time.time()
+            if initial:
+                self._last_load_ms = elapsed_ms
+        if initial:
+            logger.info(f"✅ 近似重複索引已載入: {rows} 筆（索引 {len(self.index)} 個雜湊），耗時 {elapsed_ms:.1f}ms")
+        return True
+
+    # ------------------------------------------------------------------
+    # 指標
+    # ------------------------------------------------------------------
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取索引指標
+
+        Returns:
+            索引大小、查詢延遲（最近 LATENCY_WINDOW 次的 p50/p99）、比中率與載入統計
+        """
+        with self._metrics_lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+            last_refresh = self._last_refresh
+            last_load_ms = self._last_load_ms
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4)
+
+        lookups = counters['lookups']
+        return {
+            'entries': len(self.index),
+            'max_entries': self.index.max_entries,
+            'evictions': self.index.evictions,
+            'max_distance': self.max_distance,
+            'loaded': self._loaded,
+            'last_load_ms': round(last_load_ms, 2),
+            'refreshed_seconds_ago': round(time.time() - last_refresh, 1) if last_refresh else None,
+            'lookup_latency_ms': {
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'max': round(latencies[-1], 4) if latencies else 0.0
+            },
+            'match_rate': round(counters['matches'] / lookups, 4) if lookups else 0.0,
+            'avg_candidates': round(counters['candidates_checked'] / lookups, 1) if lookups else 0.0,
+            **counters
+        }
@@ -0,0 +1,249 @@
+"""
+INT8 量化準確率閘門服務
+在啟用量化的 CNN / 超解析度模型前，重播已標註的驗證清單（model/CNN/CNN_v1.1_20251210/val_predictions_rerun.csv），
+比較 fp32 與量化路徑的 top-1 準確率；下降超過門檻時拒絕啟用並繼續使用 fp32 模型
+
+通過的量化模型以 TorchScript 保存在檢查點旁（連同準確率報告），之後啟動直接載入，不需驗證圖片與重新校正；
+未通過的報告同樣保存，之後啟動直接拒絕，不重複評估
+
+重播驗證清單需要數分鐘，只在離線執行（backend/quantize_models.py，evaluate=True）；
+web worker 與推論程序以 evaluate=False 建立閘門，只載入已驗證的量化模型，找不到時使用 fp32
+"""
+
+import os
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from modules.image_buffer import load_image_buffer
+from modules.quantization import (
+    QUANTIZATION_MODES,
+    select_quantization_engine,
+    build_artifact_key,
+    quantized_artifact_paths,
+    load_quantized_model,
+    save_quantized_model,
+    load_gate_report,
+    save_gate_report,
+    load_validation_samples,
+    split_samples,
+    compare_accuracy
+)
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class QuantizationGate:
+    """量化準確率閘門"""
+
+    def __init__(
+        self,
+        val_csv_path: str,
+        image_root: Optional[str],
+        classes: List[str],
+        max_accuracy_drop: float = 0.01,
+        calibration_size: int = 64,
+        max_samples: int = 500,
+        engine: Optional[str] = None,
+        fallback_dir: Optional[str] = None,
+        evaluate: bool = True
+    ):
+        """
+        初始化量化準確率閘門
+
+        Args:
+            val_csv_path: 已標註的驗證清單
+            image_root: 本機驗證集目錄（對應清單中的 val/；未設定時只能使用已保存的量化模型）
+            classes: CNN 類別列表
+            max_accuracy_drop: 允許的最大準確率下降（絕對值，0.01 = 1 個百分點）
+            calibration_size: static 量化的校正圖片數（從驗證清單抽出，不參與評估）
+            max_samples: 評估的最大圖片數（0 表示整份清單）
+            engine: 量化引擎（None 時自動選擇）
+            fallback_dir: 檢查點目錄不可寫入時保存量化模型與報告的目錄
+            evaluate: 找不到已保存的報告時是否量化並重播驗證清單（False 時只載入已驗證的量化模型）
+        """
+        self.val_csv_path = val_csv_path
+        self.image_root = image_root
+        self.classes = classes
+        self.max_accuracy_drop = max_accuracy_drop
+        self.calibration_size = calibration_size
+        self.max_samples = max_samples
+        self.engine = engine
+        self.fallback_dir = fallback_dir
+        self.evaluate = evaluate
+        self._split: Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = None
+
+    def _samples(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """（校正集, 評估集），第一次需要時才讀取清單"""
+        if self._split is None:
+            samples = []
+            if self.val_csv_path and os.path.exists(self.val_csv_path):
+                samples = load_validation_samples(self.val_csv_path, self.image_root, self.classes)
+            self._split = split_samples(samples, self.calibration_size, self.max_samples)
+            if samples:
+                logger.info(f"📋 驗證清單: {len(samples)} 張圖片（校正 {len(self._split[0])}，評估 {len(self._split[1])}）")
+        return self._split
+
+    @staticmethod
+    def _load_arrays(batch: List[Dict[str, Any]]) -> List[np.ndarray]:
+        return [load_image_buffer(sample['path'], stage='quantization').pixels for sample in batch]
+
+    def _artifact_dir(self, model_path: str) -> Optional[str]:
+        directory = os.path.dirname(os.path.abspath(model_path))
+        if os.access(directory, os.W_OK) or not self.fallback_dir:
+            return directory
+        os.makedirs(self.fallback_dir, exist_ok=True)
+        return self.fallback_dir
+
+    def _find_report(self, model_path: str, key: str) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+        """
+        依序在檢查點目錄與 fallback_dir 尋找已保存的報告（離線驗證與執行時的目錄權限可能不同）
+
+        Returns:
+            (量化模型路徑, 報告路徑, 報告或 None)；都找不到時返回本程序的保存位置
+        """
+        directories = [os.path.dirname(os.path.abspath(model_path))]
+        if self.fallback_dir and os.path.abspath(self.fallback_dir) not in directories:
+            directories.append(os.path.abspath(self.fallback_dir))
+        for directory in directories:
+            artifact_path, report_path = quantized_artifact_paths(model_path, key, directory)
+            report = load_gate_report(report_path)
+            if report is not None and 'drop' in report:
+                return artifact_path, report_path, report
+        if not self.evaluate:
+            return quantized_artifact_paths(model_path, key) + (None,)
+        return quantized_artifact_paths(model_path, key, self._artifact_dir(model_path)) + (None,)
+
+    def prepare(
+        self,
+        name: str,
+        model_path: str,
+        mode: str,
+        components: Dict[str, Any],
+        quantize_fn: Callable[[List[np.ndarray]], Tuple[torch.nn.Module, torch.Tensor]],
+        reference_fn: Callable[[List[np.ndarray]], List[int]],
+        candidate_fn_factory: Callable[[torch.nn.Module], Callable[[List[np.ndarray]], List[int]]]
+    ) -> Tuple[Optional[torch.nn.Module], Dict[str, Any]]:
+        """
+        取得通過準確率閘門的量化模型
+
+        Args:
+            name: 模型名稱（日誌與報告用，'cnn' / 'sr'）
+            model_path: fp32 檢查點路徑（量化模型保存在旁邊）
+            mode: 'dynamic' 或 'static'
+            components: 影響量化結果的項目（檢查點 hash 等），決定保存檔名
+            quantize_fn: 校正圖片 -> (量化模型, 範例輸入)
+            reference_fn: fp32 路徑，RGB 陣列列表 -> 預測類別索引
+            candidate_fn_factory: 量化模型 -> 量化路徑的預測函數
+
+        Returns:
+            (量化模型或 None, 資訊字典)；None 表示拒絕啟用（原因見資訊字典）
+        """
+        info: Dict[str, Any] = {'requested': mode, 'enabled': False, 'report': None}
+        if mode not in QUANTIZATION_MODES or mode == 'none':
+            if mode != 'none':
+                info['reason'] = f"unknown mode: {mode}"
+                logger.warning(f"⚠️  未知的 {name} 量化模式 '{mode}'，使用 fp32（可選: {', '.join(QUANTIZATION_MODES)}）")
+            return None, info
+
+        try:
+            engine = select_quantization_engine(self.engine)
+            key = build_artifact_key({
+                **components,
+                'model': name,
+                'mode': mode,
+                'engine': engine,
+                'calibration_size': self.calibration_size if mode == 'static' else 0,
+                'max_samples': self.max_samples
+            })
+            artifact_path, report_path, report = self._find_report(model_path, key)
+            info['engine'] = engine
+            info['artifact_path'] = artifact_path
+
+            # 1. 已有報告：門檻以目前設定重新判斷
+            if report is not None:
+                report['passed'] = report['drop'] <= self.max_accuracy_drop
+                info['report'] = report
+                if report['passed'] and os.path.exists(artifact_path):
+                    info['enabled'] = True
+                    logger.info(f"✅ 使用已驗證的 {name} INT8 模型（{mode}，準確率 {report['reference_accuracy']:.4f} → "
+                                f"{report['candidate_accuracy']:.4f}）: {artifact_path}")
+                    return load_quantized_model(artifact_path), info
+                if not report['passed']:
+                    info['reason'] = 'accuracy gate failed'
+                    logger.warning(f"⚠️  {name} INT8 模型準確率下降 {report['drop']:.4f} > {self.max_accuracy_drop}，使用 fp32")
+                    return None, info
+
+            if not self.evaluate:
+                info['reason'] = 'not validated'
+                logger.warning(f"⚠️  找不到已驗證的 {name} INT8 模型（{mode}），使用 fp32；"
+                               f"請先執行 python backend/quantize_models.py")
+                return None, info
+
+            # 2. 重新量化並重播驗證清單
+            calibration, evaluation = self._samples()
+            if not evaluation:
+                info['reason'] = 'no validation images'
+                logger.warning(f"⚠️  找不到驗證圖片（QUANT_VAL_IMAGE_ROOT={self.image_root}），"
+                               f"無法驗證 {name} INT8 模型準確率，使用 fp32")
+                return None, info
+
+            logger.info(f"📦 {name} INT8 量化（{mode}, engine={engine}），重播 {len(evaluation)} 張驗證圖片...")
+            quantized, example_input = quantize_fn(self._load_arrays(calibration) if mode == 'static' else [])
+            report = compare_accuracy(
+                reference_fn,
+                candidate_fn_factory(quantized),
+                evaluation,
+                self.max_accuracy_drop,
+                load_fn=self._load_arrays
+            )
+            report.update({'model': name, 'mode': mode, 'engine': engine})
+            info['report'] = report
+            save_gate_report(report_path, report)
+
+            if not report['passed']:
+                info['reason'] = 'accuracy gate failed'
+                logger.warning(f"⚠️  {name} INT8 模型準確率 {report['reference_accuracy']:.4f} → {report['candidate_accuracy']:.4f}"
+                               f"（下降 {report['drop']:.4f} > {self.max_accuracy_drop}），拒絕啟用，使用 fp32")
+                return None, info
+
+            save_quantized_model(quantized, example_input, artifact_path)
+            info['enabled'] = True
+            logger.info(f"✅ {name} INT8 模型通過準確率閘門（{report['reference_accuracy']:.4f} → "
+                        f"{report['candidate_accuracy']:.4f}），已保存: {artifact_path}")
+            return quantized, info
+
+        except Exception as e:
+            info['reason'] = str(e)
+            logger.warning(f"⚠️  {name} INT8 量化失敗，使用 fp32: {str(e)}")
+            return None, info
+
+
+def cnn_classify_fn(model) -> Callable[[List[np.ndarray]], List[int]]:
+    """CNN 模型（或推論後端）-> RGB 陣列列表的 top-1 類別索引"""
+    from modules.cnn_preprocess import preprocess_arrays_batch
+
+    def classify(arrays: List[np.ndarray]) -> List[int]:
+        with torch.no_grad():
+            logits = model(preprocess_arrays_batch(arrays, device='cpu'))
+        return logits.argmax(dim=1).tolist()
+
+    return classify
+
+
+def sr_then_cnn_classify_fn(sr_model, cnn_classify: Callable, **sr_kwargs) -> Callable[[List[np.ndarray]], List[int]]:
+    """超解析度模型 + fp32 CNN -> RGB 陣列列表的 top-1 類別索引（衡量 SR 量化對最終分類的影響）"""
+    from modules.sr_preprocess import enhance_image_array_with_sr
+
+    def classify(arrays: List[np.ndarray]) -> List[int]:
+        enhanced = [enhance_image_array_with_sr(array, model=sr_model, device='cpu', **sr_kwargs) for array in arrays]
+        return cnn_classify(enhanced)
+
+    return classify
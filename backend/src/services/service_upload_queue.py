@@ -0,0 +1,465 @@
+"""
+Cloudinary 背景上傳佇列
+請求執行緒只負責把圖片放入佇列並立即返回，由固定數量的工作執行緒上傳到 Cloudinary，
+上傳完成後透過回呼（通常是寫入器的 patch_urls）補上 prediction_log / detection_records 的 URL
+"""
+
+import time
+import atexit
+import base64
+import random
+import hashlib
+import threading
+import queue
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from src.core.core_redis_manager import redis_manager
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 上傳狀態
+STATE_PENDING = 'pending'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+
+class _UploadJob:
+    """單一內容的上傳工作（相同內容的多個請求共用同一個工作）"""
+
+    __slots__ = ('dedup_key', 'image_bytes', 'public_id', 'folder', 'attempts',
+                 'state', 'url', 'error', 'callbacks', 'enqueued_at')
+
+    def __init__(self, dedup_key: str, image_bytes: bytes, public_id: str, folder: str):
+        self.dedup_key = dedup_key
+        self.image_bytes = image_bytes
+        self.public_id = public_id
+        self.folder = folder
+        self.attempts = 0
+        self.state = STATE_PENDING
+        self.url: Optional[str] = None
+        self.error: Optional[str] = None
+        self.callbacks: List[Tuple[Optional[Hashable], Callable[[str], None]]] = []
+        self.enqueued_at = time.perf_counter()
+
+
+class UploadQueue:
+    """
+    有界工作執行緒池的 Cloudinary 上傳佇列
+
+    - 佇列有上限；佇列已滿時在呼叫端執行緒直接上傳一次（背壓，不丟棄）
+    - 失敗時以指數退避 + 抖動重試，超過次數後標記為失敗
+    - 以 folder + 內容 SHA256 去重：已上傳過的內容直接返回既有 URL（程序內 LRU + Redis），
+      上傳中的相同內容只掛上回呼，不重複上傳
+    - 以 ref（例如 (prediction_id, 'origin')）追蹤每個請求的上傳狀態，
+      上傳完成前圖片路由可由 lookup() 取得待上傳的位元組直接回應；
+      ref 狀態同時以短 TTL 寫入 Redis，其他 gunicorn worker 收到圖片請求時也能回應
+    """
+
+    REDIS_KEY_PREFIX = 'cloudinary_upload'
+    REDIS_REF_PREFIX = 'cloudinary_upload_ref'
+
+    def __init__(
+        self,
+        storage,
+        workers: int = 4,
+        max_queue_size: int = 256,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        dedup_ttl: int = 30 * 86400,
+        max_tracked: int = 1024,
+        ref_ttl: int = 600,
+        use_redis: bool = True
+    ):
+        """
+        初始化上傳佇列
+
+        Args:
+            storage: 具有 upload_image(image_bytes, public_id, folder) 的儲存服務
+                     （CloudinaryStorage 或 LocalCloudinaryStorage）
+            workers: 工作執行緒數
+            max_queue_size: 佇列上限
+            max_retries: 失敗後最多重試次數
+            backoff_base: 第一次重試前的等待秒數（之後每次加倍）
+            backoff_max: 重試等待秒數上限
+            dedup_ttl: Redis 去重記錄的過期時間（秒）
+            max_tracked: 程序內保留的已完成 ref / 已上傳內容筆數
+            ref_ttl: Redis 中 ref 狀態的過期時間（秒，需長於寫入器把 URL 寫入資料庫的時間）
+            use_redis: 是否使用 Redis 跨程序去重與共享 ref 狀態
+        """
+        self.storage = storage
+        self.workers = max(1, workers)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.dedup_ttl = dedup_ttl
+        self.max_tracked = max(1, max_tracked)
+        self.ref_ttl = ref_ttl
+        self.use_redis = use_redis
+
+        self._queue: "queue.Queue[Optional[_UploadJob]]" = queue.Queue(maxsize=max(1, max_queue_size))
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _UploadJob] = {}  # dedup_key -> 進行中的工作
+        self._uploaded: "OrderedDict[str, str]" = OrderedDict()  # dedup_key -> URL
+        self._refs: "OrderedDict[Hashable, Tuple[_UploadJob, Any]]" = OrderedDict()  # ref -> (工作, 擁有者)
+        self._retry_timers: set = set()
+        self._latencies = deque(maxlen=256)
+        self._counters = {
+            'enqueued': 0,
+            'uploaded': 0,
+            'deduplicated': 0,
+            'retries': 0,
+            'failed': 0,
+            'inline_uploads': 0,
+            'callback_errors': 0,
+            'superseded': 0
+        }
+        self._closed = False
+
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"upload-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.shutdown)
+        logger.info(f"✅ Cloudinary 背景上傳佇列已啟動 (workers={self.workers}, max_queue_size={self._queue.maxsize}, "
+                    f"max_retries={self.max_retries})")
+
+    @staticmethod
+    def content_key(image_bytes: bytes, folder: str) -> str:
+        """以資料夾 + 內容 SHA256 產生去重鍵"""
+        return f"{folder}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    def enqueue(
+        self,
+        image_bytes: bytes,
+        public_id: str,
+        folder: str,
+        ref: Optional[Hashable] = None,
+        owner: Any = None,
+        on_success: Optional[Callable[[str], None]] = None,
+        dedup_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        放入上傳工作並立即返回
+
+        Args:
+            image_bytes: 圖片位元組
+            public_id: Cloudinary 公開 ID（建議以內容 hash 命名，重複上傳時結果相同）
+            folder: Cloudinary 資料夾
+            ref: 追蹤鍵（例如 (prediction_id, 'origin')），同一 ref 再次放入時舊工作的回呼不再執行
+            owner: ref 的擁有者（例如 user_id），供 lookup() 驗證權限
+            on_success: 上傳成功後以 URL 呼叫的回呼（在工作執行緒中執行）
+            dedup_key: 去重鍵（預設為 content_key(image_bytes, folder)）
+
+        Returns:
+            {'state': 'pending' | 'done', 'url': 已上傳時的 URL}
+        """
+        dedup_key = dedup_key or self.content_key(image_bytes, folder)
+
+        with self._lock:
+            url = self._uploaded.get(dedup_key)
+            if url is not None:
+                self._uploaded.move_to_end(dedup_key)
+            job = self._inflight.get(dedup_key) if url is None else None
+
+        # 程序內未命中時查詢 Redis（其他 worker 程序上傳過的相同內容）
+        if url is None and job is None and self.use_redis:
+            cached = redis_manager.get(f"{self.REDIS_KEY_PREFIX}:{dedup_key}")
+            if isinstance(cached, str) and cached:
+                url = cached
+                with self._lock:
+                    self._remember_uploaded(dedup_key, url)
+
+        if url is not None:
+            done_job = _UploadJob(dedup_key, b'', public_id, folder)
+            done_job.state = STATE_DONE
+            done_job.url = url
+            with self._lock:
+                self._counters['deduplicated'] += 1
+                if ref is not None:
+                    self._track(ref, done_job, owner)
+            if ref is not None:
+                self._publish_ref(ref, owner, STATE_DONE, url=url)
+            self._run_callback(on_success, url)
+            return {'state': STATE_DONE, 'url': url}
+
+        enqueue_new = False
+        with self._lock:
+            job = self._inflight.get(dedup_key)
+            if job is None:
+                job = _UploadJob(dedup_key, image_bytes, public_id, folder)
+                self._inflight[dedup_key] = job
+                self._counters['enqueued'] += 1
+                enqueue_new = True
+            else:
+                self._counters['deduplicated'] += 1
+            if ref is not None:
+                self._track(ref, job, owner)
+            if on_success is not None:
+                job.callbacks.append((ref, on_success))
+
+        if ref is not None:
+            self._publish_ref(ref, owner, STATE_PENDING, image_bytes=image_bytes)
+
+        if enqueue_new:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                # 佇列已滿：由呼叫端執行緒直接上傳一次，失敗時仍交由重試排程處理
+                logger.warning(f"⚠️  上傳佇列已滿（{self._queue.maxsize}），改為同步上傳: {public_id}")
+                with self._lock:
+                    self._counters['inline_uploads'] += 1
+                self._attempt(job)
+
+        with self._lock:
+            return {'state': job.state, 'url': job.url}
+
+    def lookup(self, ref: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        查詢 ref 的上傳狀態
+
+        Args:
+            ref: enqueue() 時傳入的追蹤鍵
+
+        Returns:
+            {'state', 'url', 'image_bytes'（僅上傳中）, 'owner'}，未追蹤時返回 None
+        """
+        with self._lock:
+            entry = self._refs.get(ref)
+            if entry is not None:
+                job, owner = entry
+                return {
+                    'state': job.state,
+                    'url': job.url,
+                    'image_bytes': job.image_bytes if job.state == STATE_PENDING else None,
+                    'owner': owner
+                }
+
+        # 由其他 worker 程序放入的工作
+        if not self.use_redis:
+            return None
+        shared = redis_manager.get(self._ref_key(ref))
+        if not isinstance(shared, dict):
+            return None
+        image = shared.get('image')
+        return {
+            'state': shared.get('state'),
+            'url': shared.get('url'),
+            'image_bytes': base64.b64decode(image) if image else None,
+            'owner': shared.get('owner')
+        }
+
+    def _ref_key(self, ref: Hashable) -> str:
+        parts = ref if isinstance(ref, tuple) else (ref,)
+        return f"{self.REDIS_REF_PREFIX}:" + ':'.join(str(part) for part in parts)
+
+    def _publish_ref(self, ref: Hashable, owner: Any, state: str, url: Optional[str] = None,
+                     image_bytes: Optional[bytes] = None):
+        """將 ref 狀態寫入 Redis（上傳中時附帶圖片位元組），失敗時移除"""
+        if not self.use_redis:
+            return
+        if state == STATE_FAILED:
+            redis_manager.delete(self._ref_key(ref))
+            return
+        value = {'state': state, 'url': url, 'owner': owner}
+        if image_bytes:
+            value['image'] = base64.b64encode(image_bytes).decode('ascii')
+        redis_manager.set(self._ref_key(ref), value, expire=self.ref_ttl)
+
+    def _track(self, ref: Hashable, job: _UploadJob, owner: Any):
+        """記錄 ref 對應的工作，只淘汰已結束的記錄（呼叫者需持有鎖）"""
+        self._refs.pop(ref, None)
+        self._refs[ref] = (job, owner)
+        if len(self._refs) > self.max_tracked:
+            for old_ref in list(self._refs.keys()):
+                if len(self._refs) <= self.max_tracked:
+                    break
+                if self._refs[old_ref][0].state != STATE_PENDING:
+                    del self._refs[old_ref]
+
+    def _remember_uploaded(self, dedup_key: str, url: str):
+        """記錄已上傳內容的 URL（呼叫者需持有鎖）"""
+        self._uploaded[dedup_key] = url
+        self._uploaded.move_to_end(dedup_key)
+        while len(self._uploaded) > self.max_tracked:
+            self._uploaded.popitem(last=False)
+
+    def _worker(self):
+        """工作執行緒：從佇列取出工作並上傳"""
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._attempt(job)
+            finally:
+                self._queue.task_done()
+
+    def _attempt(self, job: _UploadJob):
+        """執行一次上傳；失敗時排程重試或標記為失敗"""
+        job.attempts += 1
+        try:
+            upload_result = self.storage.upload_image(
+                image_bytes=job.image_bytes,
+                public_id=job.public_id,
+                folder=job.folder
+            )
+            url = upload_result.get('secure_url')
+            if not url:
+                raise RuntimeError("上傳結果缺少 secure_url")
+        except Exception as e:
+            job.error = str(e)
+            if job.attempts <= self.max_retries and not self._closed:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (job.attempts - 1)))
+                delay *= 0.5 + random.random()
+                with self._lock:
+                    self._counters['retries'] += 1
+                logger.warning(f"⚠️  上傳失敗（第 {job.attempts} 次），{delay:.2f}s 後重試: {job.public_id}: {str(e)}")
+                self._schedule_retry(job, delay)
+            else:
+                self._fail(job)
+            return
+        self._complete(job, url)
+
+    def _schedule_retry(self, job: _UploadJob, delay: float):
+        """延遲後重新放回佇列（計時器執行緒不佔用工作執行緒）"""
+        def requeue():
+            with self._lock:
+                self._retry_timers.discard(timer)
+            if self._closed:
+                self._fail(job)
+                return
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._attempt(job)
+
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        with self._lock:
+            self._retry_timers.add(timer)
+        timer.start()
+
+    def _complete(self, job: _UploadJob, url: str):
+        """上傳成功：記錄 URL、釋放位元組並執行仍有效的回呼"""
+        with self._lock:
+            job.state = STATE_DONE
+            job.url = url
+            job.image_bytes = b''
+            self._inflight.pop(job.dedup_key, None)
+            self._remember_uploaded(job.dedup_key, url)
+            self._counters['uploaded'] += 1
+            self._latencies.append((time.perf_counter() - job.enqueued_at) * 1000)
+            # 同一 ref 已被新的工作取代（例如裁切後重新上傳）時，舊工作不再更新 URL
+            callbacks = [
+                callback for ref, callback in job.callbacks
+                if ref is None or (ref in self._refs and self._refs[ref][0] is job)
+            ]
+            self._counters['superseded'] += len(job.callbacks) - len(callbacks)
+            job.callbacks = []
+            owned_refs = [(ref, owner) for ref, (tracked, owner) in self._refs.items() if tracked is job]
+
+        if self.use_redis:
+            redis_manager.set(f"{self.REDIS_KEY_PREFIX}:{job.dedup_key}", url, expire=self.dedup_ttl)
+            for ref, owner in owned_refs:
+                self._publish_ref(ref, owner, STATE_DONE, url=url)
+        logger.debug(f"✅ 背景上傳完成: {job.public_id} -> {url}")
+        for callback in callbacks:
+            self._run_callback(callback, url)
+
+    def _fail(self, job: _UploadJob):
+        """重試次數用盡：標記失敗並釋放位元組（資料庫中保留內部 URL）"""
+        with self._lock:
+            job.state = STATE_FAILED
+            job.image_bytes = b''
+            job.callbacks = []
+            self._inflight.pop(job.dedup_key, None)
+            self._counters['failed'] += 1
+            owned_refs = [ref for ref, (tracked, _) in self._refs.items() if tracked is job]
+        for ref in owned_refs:
+            self._publish_ref(ref, None, STATE_FAILED)
+        logger.error(f"❌ 背景上傳失敗（已嘗試 {job.attempts} 次）: {job.public_id}: {job.error}")
+
+    def _run_callback(self, callback: Optional[Callable[[str], None]], url: str):
+        if callback is None:
+            return
+        try:
+            callback(url)
+        except Exception as e:
+            with self._lock:
+                self._counters['callback_errors'] += 1
+            logger.warning(f"⚠️  上傳完成回呼失敗: {str(e)}", exc_info=True)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待所有已放入的工作（含排程中的重試）結束
+
+        Args:
+            timeout: 最長等待秒數（None 表示不限）
+
+        Returns:
+            是否在時間內全部結束
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                if not self._inflight:
+                    return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        停止佇列：等待進行中的上傳結束後停止工作執行緒（未完成的重試標記為失敗）
+
+        Args:
+            timeout: 最長等待秒數
+        """
+        if self._closed:
+            return
+        self.wait_idle(timeout)
+        self._closed = True
+        with self._lock:
+            timers = list(self._retry_timers)
+        for timer in timers:
+            timer.cancel()
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=1.0)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        logger.info("🛑 Cloudinary 背景上傳佇列已停止")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        獲取上傳佇列指標
+
+        Returns:
+            佇列深度、進行中工作數、上傳/去重/重試/失敗次數、上傳延遲（自放入佇列起算）
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_size': self._queue.maxsize,
+                'inflight': len(self._inflight),
+                'pending_retries': len(self._retry_timers),
+                **self._counters,
+                'upload_latency': {
+                    'avg_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                    'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2) if len(latencies) >= 20 else None,
+                    'max_ms': round(latencies[-1], 2) if latencies else 0.0
+                }
+            }
@@ -175,8 +175,8 @@ class UserService:
                 "severity_stats": severity_stats
             }
             
-            # 快取結果 5 分鐘
-            redis_manager.set(cache_key, result, expire=300)
+            # 快取結果 5 分鐘（刪除檢測記錄時依 user_history 標籤失效）
+            redis_manager.set(cache_key, result, expire=300, tags=[f"user:{user_id}", f"user_history:{user_id}"])
             
             execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
             log_api_request(
@@ -10,7 +10,7 @@ import logging
 from typing import Dict, Any, Optional, Tuple
 
 # 導入 YOLO 模組
-from modules.yolo_load import load_yolo_model
+from modules.model_registry import get_yolo_model
 from modules.yolo_detect import yolo_detect
 from modules.yolo_postprocess import postprocess_yolo_result, parse_severity
 from modules.yolo_utils import get_disease_info
@@ -21,7 +21,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from src.core.core_db_manager import db, ActivityLogger, ErrorLogger, PerformanceLogger
+# core_db_manager 在寫入資料庫的方法中才導入：整合檢測的推論引擎（推論程序）只使用 YOLO 模型，不連線資料庫
 from src.services.service_image import ImageService
 
 # 設定日誌
@@ -43,10 +43,10 @@ class DetectionService:
         初始化檢測服務
         
         Args:
-            model_path: YOLO 模型路徑
+            model_path: YOLO 模型路徑（同一程序內的 DetectionService 共用已載入的模型）
         """
         try:
-            self.model = load_yolo_model(model_path)
+            self.model = get_yolo_model(model_path)
             logger.info("✅ YOLO 檢測服務初始化完成")
         except Exception as e:
             logger.error(f"❌ 模型載入失敗: {str(e)}")
@@ -67,6 +67,8 @@ class DetectionService:
         Returns:
             檢測結果字典
         """
+        from src.core.core_db_manager import db, ActivityLogger, ErrorLogger, PerformanceLogger
+        
         # 保存 web_image_path 供後續使用
         self._web_image_path = web_image_path
         start_time = time.time()
@@ -281,6 +283,8 @@ class DetectionService:
         Returns:
             (記錄 ID, True - 圖片已儲存在 Cloudinary)
         """
+        from src.core.core_db_manager import db
+        
         try:
             # 獲取圖片大小（如果 image_bytes 存在）
             image_size = len(image_bytes) if image_bytes else None
@@ -8,10 +8,12 @@ from datetime import datetime
 import base64
 import os
 import uuid
+from typing import Any, Dict, Optional
 from src.core.core_helpers import get_user_id_from_session, log_api_request
 from src.core.core_db_manager import db
 from src.core.core_redis_manager import redis_manager
 from src.core.core_user_manager import DetectionQueries
+from modules.upload_stream import UploadTooLarge, read_image_upload
 from src.services.service_yolo import DetectionService
 from src.services.service_image import ImageService
 import logging
@@ -31,6 +33,17 @@ class DetectionAPIService:
         self.detection_service = detection_service
         self.upload_folder = upload_folder
     
+    @staticmethod
+    def _decode_base64(img_data: str) -> bytes:
+        if "," in img_data:
+            _, encoded = img_data.split(",", 1)
+        else:
+            encoded = img_data
+        try:
+            return base64.b64decode(encoded)
+        except Exception:
+            raise ValueError("圖片格式錯誤")
+    
     def predict(self):
         """處理病害檢測請求"""
         start_time = datetime.now()
@@ -40,18 +53,15 @@ class DetectionAPIService:
         if not self.detection_service:
             return jsonify({"error": "模型未載入"}), 500
         try:
-            img_data = request.json.get("image")
-            image_source = request.json.get("source", "upload")
-            if not img_data:
-                return jsonify({"error": "無圖片資料"}), 400
-            if "," in img_data:
-                _, encoded = img_data.split(",", 1)
-            else:
-                encoded = img_data
+            # multipart/form-data、application/octet-stream 或 JSON base64
             try:
-                img_bytes = base64.b64decode(encoded)
-            except Exception:
-                return jsonify({"error": "圖片格式錯誤"}), 400
+                upload = read_image_upload("image", self._decode_base64)
+            except UploadTooLarge as e:
+                return jsonify({"error": str(e)}), 413
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            img_bytes = upload.data
+            image_source = upload.fields.get("source", "upload")
             processed_bytes, image_hash = ImageService.process_image(img_bytes, resize=True)
             
             # 檢查快取中是否有相同 hash 的結果
@@ -104,7 +114,7 @@ class DetectionAPIService:
                         pass
             
             # 快取結果 1 小時
-            redis_manager.set(cache_key, result, expire=3600)
+            redis_manager.set(cache_key, result, expire=3600, tags=[f"user:{user_id}"])
             
             execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
             log_api_request(
@@ -195,8 +205,44 @@ class DetectionAPIService:
             )
             return jsonify({"error": "系統錯誤"}), 500
     
+    @staticmethod
+    def _isoformat(value) -> Optional[str]:
+        """將時間欄位序列化為字串"""
+        if not value:
+            return None
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    
+    @classmethod
+    def _format_disease_info(cls, disease_info: Dict[str, Any]) -> Dict[str, Any]:
+        """將 disease_library 記錄轉為 API 回傳格式（返回所有欄位）"""
+        return {
+            "id": disease_info.get('id'),
+            "disease_name": disease_info.get('disease_name'),  # 資料庫中的原始名稱
+            "chinese_name": disease_info.get('chinese_name'),
+            "english_name": disease_info.get('english_name'),
+            "causes": disease_info.get('causes'),
+            "features": disease_info.get('features'),
+            "symptoms": disease_info.get('symptoms'),
+            "pesticides": disease_info.get('pesticides'),
+            "management_measures": disease_info.get('management_measures'),
+            "target_crops": disease_info.get('target_crops'),
+            "severity_levels": disease_info.get('severity_levels'),
+            "prevention_tips": disease_info.get('prevention_tips'),
+            "reference_links": disease_info.get('reference_links'),
+            "created_at": cls._isoformat(disease_info.get('created_at')),
+            "updated_at": cls._isoformat(disease_info.get('updated_at')),
+            "is_active": disease_info.get('is_active')
+        }
+    
     def get_history(self):
-        """獲取檢測歷史記錄（支持分頁、排序、過濾）"""
+        """
+        獲取檢測歷史記錄（支持分頁、排序、過濾）
+        
+        依 created_at 由新到舊排序時使用游標（keyset）分頁：回應中的 pagination.next_cursor
+        作為下一次請求的 cursor 參數，翻到任何深度的成本都相同；其他排序或未帶 cursor 的
+        page > 1 請求沿用 OFFSET 分頁。總數由 Redis 快取（最多落後 HISTORY_COUNT_TTL 秒），
+        每頁的病害資訊以單一查詢批次取得。
+        """
         start_time = datetime.now()
         user_id = get_user_id_from_session()
         if not user_id:
@@ -204,59 +250,69 @@ class DetectionAPIService:
         
         try:
             # 獲取查詢參數
-            page = request.args.get('page', 1, type=int)
+            page = max(request.args.get('page', 1, type=int), 1)
             per_page = request.args.get('per_page', 20, type=int)
             order_by = request.args.get('order_by', 'created_at', type=str)
             order_dir = request.args.get('order_dir', 'DESC', type=str)
             disease_filter = request.args.get('disease', None, type=str)
             min_confidence = request.args.get('min_confidence', None, type=float)
+            cursor = request.args.get('cursor', None, type=str)
             
-            # 限制每頁最大記錄數
-            per_page = min(per_page, 100)
+            # 限制每頁記錄數
+            per_page = min(max(per_page, 1), 100)
             offset = (page - 1) * per_page
             
             # 查詢記錄
-            records, total_count = DetectionQueries.get_user_detections(
-                user_id=user_id,
-                limit=per_page,
-                offset=offset,
-                order_by=order_by,
-                order_dir=order_dir,
-                disease_filter=disease_filter,
-                min_confidence=min_confidence
+            next_cursor = None
+            use_keyset = order_by == 'created_at' and order_dir.upper() == 'DESC' and (cursor or page == 1)
+            if use_keyset:
+                try:
+                    records, next_cursor = DetectionQueries.get_user_detections_page(
+                        user_id=user_id,
+                        limit=per_page,
+                        cursor=cursor,
+                        disease_filter=disease_filter,
+                        min_confidence=min_confidence
+                    )
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+            else:
+                records, _ = DetectionQueries.get_user_detections(
+                    user_id=user_id,
+                    limit=per_page,
+                    offset=offset,
+                    order_by=order_by,
+                    order_dir=order_dir,
+                    disease_filter=disease_filter,
+                    min_confidence=min_confidence,
+                    with_count=False
+                )
+            total_count, total_cached = DetectionQueries.count_user_detections(
+                user_id, disease_filter, min_confidence
             )
             
-            logger.info(f"📊 查詢到 {len(records)}/{total_count} 筆檢測記錄 (user_id={user_id}, page={page}, per_page={per_page})")
-            if records:
-                logger.debug(f"📋 原始記錄樣本: {records[0]}")
-                logger.debug(f"📋 記錄字段: {list[str](records[0].keys()) if records else []}")
-            else:
-                logger.warning(f"⚠️ 沒有查詢到任何記錄 (user_id={user_id})")
+            # 每頁只查詢一次病害資訊（所有不同的病害名稱一次取回）
+            disease_infos = DetectionQueries.get_disease_info_batch([
+                record.get('disease_name') for record in records
+                if record.get('disease_name') not in (None, 'others', 'whole_plant')
+            ])
+            formatted_disease_infos = {
+                name: self._format_disease_info(info) for name, info in disease_infos.items()
+            }
             
             formatted_records = []
             for record in records:
-                created_at = record.get('created_at')
                 image_path = record.get('image_path')
                 record_id = record.get('id')
                 disease_name = record.get('disease_name')
                 
                 # 處理圖片路徑：資料庫存儲的是 Cloudinary URL（https://res.cloudinary.com 開頭）
+                # 其他路徑格式不支援（圖片應存儲在 Cloudinary）
                 image_url = None
-                
-                if image_path:
-                    # 檢查是否為 URL（http:// 或 https://）
-                    if image_path.startswith('http://') or image_path.startswith('https://'):
-                        # Cloudinary URL，直接使用
-                        image_url = image_path
-                        logger.debug(f"✅ 使用 Cloudinary URL: {image_url}")
-                    else:
-                        # 其他路徑格式不支援（圖片應存儲在 Cloudinary）
-                        image_url = None
-                        logger.warning(f"⚠️  記錄 {record_id} 的圖片路徑格式不支援（應為 Cloudinary URL）: {image_path}")
-                else:
-                    # 沒有圖片路徑
-                    image_url = None
-                    logger.warning(f"⚠️  記錄 {record_id} 沒有圖片路徑")
+                if image_path and (image_path.startswith('http://') or image_path.startswith('https://')):
+                    image_url = image_path
+                elif image_path:
+                    logger.debug(f"⚠️  記錄 {record_id} 的圖片路徑格式不支援（應為 Cloudinary URL）: {image_path}")
                 
                 # 處理病害名稱顯示
                 display_disease = disease_name
@@ -265,30 +321,13 @@ class DetectionAPIService:
                 elif disease_name == 'whole_plant':
                     display_disease = '整株植物'
                 
-                # 查詢病害詳細資訊
-                disease_info = None
-                if disease_name and disease_name not in ['others', 'whole_plant']:
-                    logger.debug(f"🔍 查詢病害資訊: disease_name={disease_name}")
-                    disease_info = DetectionQueries.get_disease_info(disease_name)
-                    if disease_info:
-                        logger.info(f"✅ 找到病害資訊: {disease_name} -> {disease_info.get('chinese_name', 'N/A')}")
-                        # 如果找到中文名稱，使用中文名稱作為顯示名稱
-                        if disease_info.get('chinese_name'):
-                            display_disease = disease_info.get('chinese_name')
-                    else:
-                        logger.warning(f"⚠️  未找到病害資訊: disease_name={disease_name}")
+                disease_info = formatted_disease_infos.get(disease_name.lower()) if disease_name else None
+                if disease_info and disease_info.get('chinese_name'):
+                    # 如果找到中文名稱，使用中文名稱作為顯示名稱
+                    display_disease = disease_info.get('chinese_name')
                 
                 # 處理時間字段：確保正確序列化
-                timestamp_str = None
-                created_at_str = None
-                if created_at:
-                    if hasattr(created_at, 'isoformat'):
-                        timestamp_str = created_at.isoformat()
-                        created_at_str = created_at.isoformat()
-                    else:
-                        # 如果是字符串，直接使用
-                        timestamp_str = str(created_at)
-                        created_at_str = str(created_at)
+                created_at_str = self._isoformat(record.get('created_at'))
                 
                 formatted_record = {
                     "id": record_id,
@@ -303,51 +342,13 @@ class DetectionAPIService:
                     "image_source": record.get('image_source', 'upload'),
                     "status": record.get('status', 'completed'),
                     "processing_time_ms": record.get('processing_time_ms'),
-                    "timestamp": timestamp_str,
+                    "timestamp": created_at_str,
                     "created_at": created_at_str
                 }
                 
                 # 如果有病害資訊，加入到記錄中（返回所有欄位）
                 if disease_info:
-                    # 處理時間字段
-                    disease_created_at = disease_info.get('created_at')
-                    disease_updated_at = disease_info.get('updated_at')
-                    
-                    disease_created_at_str = None
-                    if disease_created_at:
-                        if hasattr(disease_created_at, 'isoformat'):
-                            disease_created_at_str = disease_created_at.isoformat()
-                        else:
-                            disease_created_at_str = str(disease_created_at)
-                    
-                    disease_updated_at_str = None
-                    if disease_updated_at:
-                        if hasattr(disease_updated_at, 'isoformat'):
-                            disease_updated_at_str = disease_updated_at.isoformat()
-                        else:
-                            disease_updated_at_str = str(disease_updated_at)
-                    
-                    formatted_record["disease_info"] = {
-                        "id": disease_info.get('id'),
-                        "disease_name": disease_info.get('disease_name'),  # 資料庫中的原始名稱
-                        "chinese_name": disease_info.get('chinese_name'),
-                        "english_name": disease_info.get('english_name'),
-                        "causes": disease_info.get('causes'),
-                        "features": disease_info.get('features'),
-                        "symptoms": disease_info.get('symptoms'),
-                        "pesticides": disease_info.get('pesticides'),
-                        "management_measures": disease_info.get('management_measures'),
-                        "target_crops": disease_info.get('target_crops'),
-                        "severity_levels": disease_info.get('severity_levels'),
-                        "prevention_tips": disease_info.get('prevention_tips'),
-                        "reference_links": disease_info.get('reference_links'),
-                        "created_at": disease_created_at_str,
-                        "updated_at": disease_updated_at_str,
-                        "is_active": disease_info.get('is_active')
-                    }
-                    logger.info(f"✅ 已添加病害資訊到記錄 {record_id}: {disease_info.get('chinese_name', 'N/A')}")
-                else:
-                    logger.warning(f"⚠️  記錄 {record_id} 沒有病害資訊 (disease_name={disease_name})")
+                    formatted_record["disease_info"] = disease_info
                 
                 formatted_records.append(formatted_record)
             
@@ -360,14 +361,16 @@ class DetectionAPIService:
                     "page": page,
                     "per_page": per_page,
                     "total": total_count,
+                    "total_cached": total_cached,
                     "total_pages": total_pages,
-                    "has_next": page < total_pages,
-                    "has_prev": page > 1
+                    "has_next": next_cursor is not None if use_keyset else page < total_pages,
+                    "has_prev": page > 1 or bool(cursor),
+                    "next_cursor": next_cursor
                 }
             }
             
-            logger.info(f"✅ 返回 {len(formatted_records)} 筆格式化記錄，總計 {total_count} 筆")
-            logger.debug(f"📤 響應數據樣本: {response_data['records'][0] if formatted_records else '無記錄'}")
+            logger.debug(f"✅ 返回 {len(formatted_records)} 筆歷史記錄（user_id={user_id}, 總計 {total_count} 筆, "
+                         f"{len(disease_infos)} 種病害資訊, {'游標' if use_keyset else 'OFFSET'}分頁）")
             
             execution_time = int((datetime.now() - start_time).total_seconds() * 1000)
             log_api_request(
@@ -31,6 +31,7 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', '')
     DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
     TESTING = False
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # 內部監控讀取 /api/metrics 的權杖（Authorization: Bearer），未設定時只允許具有 system_maintenance 權限的登入使用者
     
     @classmethod
     def validate_secret_key(cls):
@@ -47,6 +48,13 @@ class Config:
     DB_NAME = os.getenv('DB_NAME')
     DB_USER = os.getenv('DB_USER')
     DB_PASSWORD = os.getenv('DB_PASSWORD')
+    DB_POOL_MIN = get_env_int('DB_POOL_MIN', 2)  # 連接池啟動時建立的連線數（每個程序）
+    DB_POOL_MAX = get_env_int('DB_POOL_MAX', 10)  # 連接池最大連線數（每個程序）
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '') or 5.0)  # 連接池用盡時等待可用連線的秒數
+    DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '') or 1800.0)  # 連線最長使用秒數，超過後重建（0 表示不限制）
+    DB_POOL_VALIDATE_IDLE_SECONDS = float(os.getenv('DB_POOL_VALIDATE_IDLE_SECONDS', '') or 30.0)  # 閒置超過此秒數的連線取出時先以 SELECT 1 檢查
+    DB_STATEMENT_TIMEOUT_MS = get_env_int('DB_STATEMENT_TIMEOUT_MS', 30000)  # 預設語句逾時毫秒數（0 表示不限制）
+    DB_CONNECT_TIMEOUT = get_env_int('DB_CONNECT_TIMEOUT', 5)  # 建立連線逾時秒數
     
     # 驗證必要的應用設定
     @classmethod
@@ -83,6 +91,17 @@ class Config:
     REDIS_PORT = get_env_int('REDIS_PORT', 6379)
     REDIS_DB = get_env_int('REDIS_DB', 0)
     REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
+    REDIS_MAX_CONNECTIONS = get_env_int('REDIS_MAX_CONNECTIONS', 32)  # 連線池最大連線數（每個程序）
+    REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', '') or 1.0)  # 連線池用盡時等待可用連線的秒數
+    REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '') or 2.0)  # 單次命令逾時秒數
+    REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', '') or 1.0)  # 建立連線逾時秒數
+    REDIS_BREAKER_FAILURES = get_env_int('REDIS_BREAKER_FAILURES', 3)  # 斷路器開啟的連續連線失敗次數
+    REDIS_BREAKER_RESET_SECONDS = float(os.getenv('REDIS_BREAKER_RESET_SECONDS', '') or 5.0)  # 斷路器開啟後放行探測請求的秒數
+    REDIS_LOCAL_MAX_ENTRIES = get_env_int('REDIS_LOCAL_MAX_ENTRIES', 10000)  # 程序內快取最大筆數（Redis 不可用時的替代快取與近端快取）
+    REDIS_LOCAL_MAX_BYTES = get_env_int('REDIS_LOCAL_MAX_BYTES', 32 * 1024 * 1024)  # 程序內快取最大位元組數
+    REDIS_NEAR_CACHE_TTL = get_env_int('REDIS_NEAR_CACHE_TTL', 5)  # 近端快取保留秒數（0 表示停用）
+    REDIS_SCAN_COUNT = get_env_int('REDIS_SCAN_COUNT', 1000)  # 失效時 SCAN / SSCAN 每次走訪與 UNLINK 每批的鍵數
+    REDIS_NEAR_CACHE_PREFIXES = os.getenv('REDIS_NEAR_CACHE_PREFIXES', 'detection_result,integrated_detection,user_stats,history_count')  # 使用近端快取的鍵前綴
     CACHE_DEFAULT_TIMEOUT = get_env_int('CACHE_DEFAULT_TIMEOUT', 3600)  # 預設快取時間 1 小時
     
     # 會話（可從 .env 檔案設定）
@@ -103,12 +122,21 @@ class Config:
     CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET', '')
     CLOUDINARY_SECURE = os.getenv('CLOUDINARY_SECURE', 'true').lower() == 'true'
     CLOUDINARY_FOLDER = os.getenv('CLOUDINARY_FOLDER', 'leaf_disease_ai')  # Cloudinary 資料夾路徑
+    CLOUDINARY_LOCAL_STANDIN = os.getenv('CLOUDINARY_LOCAL_STANDIN', 'false').lower() == 'true'  # 以本地資料夾替代 Cloudinary（離線開發/測試）
+    CLOUDINARY_LOCAL_DIR_RELATIVE = os.getenv('CLOUDINARY_LOCAL_DIR_RELATIVE', 'data/local_cloudinary')  # 本地替代儲存資料夾
+    
+    # Cloudinary 背景上傳佇列（可從 .env 檔案設定）
+    ENABLE_UPLOAD_QUEUE = os.getenv('ENABLE_UPLOAD_QUEUE', 'true').lower() == 'true'  # 請求不等待上傳完成
+    UPLOAD_QUEUE_WORKERS = get_env_int('UPLOAD_QUEUE_WORKERS', 4)  # 上傳工作執行緒數
+    UPLOAD_QUEUE_MAX_SIZE = get_env_int('UPLOAD_QUEUE_MAX_SIZE', 256)  # 佇列上限（已滿時改為同步上傳）
+    UPLOAD_MAX_RETRIES = get_env_int('UPLOAD_MAX_RETRIES', 3)  # 上傳失敗重試次數
+    UPLOAD_RETRY_BACKOFF_MS = get_env_int('UPLOAD_RETRY_BACKOFF_MS', 500)  # 第一次重試前的等待時間（之後指數加倍）
     
     @classmethod
     def validate_cloudinary_config(cls):
         """驗證 Cloudinary 配置是否完整（如果啟用）"""
-        if not cls.USE_CLOUDINARY:
-            return True  # 如果未啟用，不需要驗證
+        if not cls.USE_CLOUDINARY or cls.CLOUDINARY_LOCAL_STANDIN:
+            return True  # 如果未啟用或使用本地替代儲存，不需要驗證
         
         missing = []
         if not cls.CLOUDINARY_CLOUD_NAME:
@@ -126,14 +154,71 @@ class Config:
     
     # AI 模型配置（可從 .env 檔案設定）
     # 注意：預設路徑必須與 Dockerfile 中複製的模型路徑一致
+    MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', 'true').lower() == 'true'  # 是否由 gunicorn 主程序在 fork 前預載入模型
     CNN_MODEL_PATH_RELATIVE = os.getenv('CNN_MODEL_PATH_RELATIVE', 'model/CNN/CNN_v1.1_20251210/best_mobilenetv3_large.pth')  # CNN 模型路徑
     YOLO_MODEL_PATH_RELATIVE = os.getenv('YOLO_MODEL_PATH_RELATIVE', 'model/yolov11/YOLOv11_v1_20251212/weights/best.pt')  # YOLO 模型路徑
+    CNN_BACKEND = os.getenv('CNN_BACKEND', 'eager').lower()  # CNN 推論後端 ('eager', 'torchscript', 'onnx')
+    CNN_PARITY_ATOL = float(os.getenv('CNN_PARITY_ATOL', '') or 1e-3)  # 非 eager 後端與 eager 的 softmax 分數容許誤差
+    CNN_NUM_THREADS = get_env_int('CNN_NUM_THREADS', 0)  # ONNX Runtime intra-op 執行緒數（0 表示預設）
+    CNN_EXPORT_DIR_RELATIVE = os.getenv('CNN_EXPORT_DIR_RELATIVE', 'data/model_cache')  # 檢查點目錄不可寫入時的匯出檔目錄
     
     # 超解析度模型配置（可選，可從 .env 檔案設定）
     ENABLE_SR = os.getenv('ENABLE_SR', 'true').lower() == 'true'  # 是否啟用超解析度預處理
     SR_MODEL_PATH_RELATIVE = os.getenv('SR_MODEL_PATH_RELATIVE', None)  # 超解析度模型路徑（可選，如果為 None 則使用預設架構）
     SR_MODEL_TYPE = os.getenv('SR_MODEL_TYPE', 'edsr')  # 超解析度模型類型 ('edsr', 'rcan' 等)
     SR_SCALE = get_env_int('SR_SCALE', 2)  # 超解析度放大倍數 (2, 4, 8)
+    SR_TILE_SIZE = get_env_int('SR_TILE_SIZE', 0)  # 分塊超解析度的 tile 邊長（0 表示整張處理）
+    SR_TILE_OVERLAP = get_env_int('SR_TILE_OVERLAP', 16)  # 相鄰 tile 重疊像素數
+    SR_TILE_BATCH_SIZE = get_env_int('SR_TILE_BATCH_SIZE', 4)  # 每次前向傳播的 tile 數
+    SR_POLICY = os.getenv('SR_POLICY', 'always').lower()  # 超解析度策略 ('always', 'never', 'adaptive')
+    SR_POLICY_MIN_SIDE = get_env_int('SR_POLICY_MIN_SIDE', 224)  # adaptive：原始短邊小於此值視為低解析度
+    SR_POLICY_BLUR_THRESHOLD = float(os.getenv('SR_POLICY_BLUR_THRESHOLD', '') or 100.0)  # adaptive：Laplacian 變異數小於此值視為模糊
+    SR_POLICY_MIN_JPEG_QUALITY = get_env_int('SR_POLICY_MIN_JPEG_QUALITY', 50)  # adaptive：估計 JPEG 品質低於此值視為壓縮失真
+    
+    # INT8 量化配置（可選，僅限 CPU；量化模型須通過驗證清單的準確率閘門才會啟用）
+    CNN_QUANTIZATION = os.getenv('CNN_QUANTIZATION', 'none').lower()  # CNN 量化模式 ('none', 'dynamic', 'static')
+    SR_QUANTIZATION = os.getenv('SR_QUANTIZATION', 'none').lower()  # 超解析度模型量化模式 ('none', 'dynamic', 'static')
+    QUANT_MAX_ACCURACY_DROP = float(os.getenv('QUANT_MAX_ACCURACY_DROP', '') or 0.01)  # 允許的最大準確率下降（0.01 = 1 個百分點）
+    QUANT_VAL_CSV_RELATIVE = os.getenv('QUANT_VAL_CSV_RELATIVE', 'model/CNN/CNN_v1.1_20251210/val_predictions_rerun.csv')  # 已標註的驗證清單
+    QUANT_VAL_IMAGE_ROOT = os.getenv('QUANT_VAL_IMAGE_ROOT', '')  # 本機驗證集目錄（對應清單中的 val/）
+    QUANT_CALIBRATION_SIZE = get_env_int('QUANT_CALIBRATION_SIZE', 64)  # static 量化的校正圖片數
+    QUANT_GATE_MAX_SAMPLES = get_env_int('QUANT_GATE_MAX_SAMPLES', 500)  # 準確率閘門評估的最大圖片數（0 表示整份清單）
+    QUANT_ENGINE = os.getenv('QUANT_ENGINE', '') or None  # 量化引擎（'x86'、'fbgemm'、'qnnpack'，預設自動選擇）
+    
+    # 動態微批次推論配置（可從 .env 檔案設定）
+    ENABLE_MICRO_BATCHING = os.getenv('ENABLE_MICRO_BATCHING', 'false').lower() == 'true'  # 是否合併並發請求為批次推論
+    BATCH_WINDOW_MS = get_env_int('BATCH_WINDOW_MS', 10)  # 收集批次的時間窗口（毫秒）
+    BATCH_MAX_SIZE = get_env_int('BATCH_MAX_SIZE', 8)  # 單一批次最大圖片數
+    BATCH_PREDICT_MAX_IMAGES = get_env_int('BATCH_PREDICT_MAX_IMAGES', 32)  # /api/predict/batch 單次請求最多圖片數
+    BATCH_PREDICT_MAX_IMAGE_BYTES = get_env_int('BATCH_PREDICT_MAX_IMAGE_BYTES', 5 * 1024 * 1024)  # 批次檢測單張圖片上限
+    BATCH_PREDICT_MAX_BYTES = get_env_int('BATCH_PREDICT_MAX_BYTES', 64 * 1024 * 1024)  # 批次檢測請求（含 zip 解壓後）總大小上限
+    BATCH_PREDICT_CHUNK_SIZE = get_env_int('BATCH_PREDICT_CHUNK_SIZE', 8)  # 批次檢測每次送入 CNN/YOLO 的圖片數
+    BATCH_PREDICT_MAX_CONCURRENT = get_env_int('BATCH_PREDICT_MAX_CONCURRENT', 1)  # 每個 worker 同時處理的批次檢測數（超過返回 429）
+    ENABLE_INFERENCE_CACHE = os.getenv('ENABLE_INFERENCE_CACHE', 'true').lower() == 'true'  # 是否快取推論結果（圖片 hash + 模型指紋）
+    INFERENCE_CACHE_MAX_ENTRIES = get_env_int('INFERENCE_CACHE_MAX_ENTRIES', 512)  # 程序內 LRU 最大筆數
+    INFERENCE_CACHE_MAX_BYTES = get_env_int('INFERENCE_CACHE_MAX_BYTES', 8 * 1024 * 1024)  # 程序內 LRU 最大位元組數
+    INFERENCE_CACHE_TTL = get_env_int('INFERENCE_CACHE_TTL', 86400)  # Redis 層過期時間（秒）
+    ENABLE_NEAR_DUPLICATE = os.getenv('ENABLE_NEAR_DUPLICATE', 'false').lower() == 'true'  # 快取未命中時是否改用感知雜湊相近圖片的快取結果
+    NEAR_DUPLICATE_MAX_DISTANCE = get_env_int('NEAR_DUPLICATE_MAX_DISTANCE', 4)  # 視為近似重複的最大漢明距離（64 位元中）
+    NEAR_DUPLICATE_MAX_ENTRIES = get_env_int('NEAR_DUPLICATE_MAX_ENTRIES', 500000)  # 程序內索引最多保存的雜湊數
+    NEAR_DUPLICATE_REFRESH_SECONDS = get_env_int('NEAR_DUPLICATE_REFRESH_SECONDS', 30)  # 從 prediction_log 增量載入的間隔（秒）
+    ENABLE_WRITE_BEHIND = os.getenv('ENABLE_WRITE_BEHIND', 'true').lower() == 'true'  # 預測記錄是否以背景批次寫入
+    WRITE_BEHIND_BATCH_SIZE = get_env_int('WRITE_BEHIND_BATCH_SIZE', 64)  # 單次交易最多寫入的預測筆數
+    WRITE_BEHIND_FLUSH_MS = get_env_int('WRITE_BEHIND_FLUSH_MS', 200)  # 背景寫入最長等待時間（毫秒）
+    WRITE_BEHIND_MAX_PENDING = get_env_int('WRITE_BEHIND_MAX_PENDING', 2048)  # 寫入佇列上限
+    WRITE_BEHIND_SPILL_DIR_RELATIVE = os.getenv('WRITE_BEHIND_SPILL_DIR_RELATIVE', 'data/write_behind')  # 資料庫不可用時的溢寫檔目錄
+    
+    # 推論伺服器配置（INFERENCE_MODE=server 時 web worker 不載入模型，推論交由獨立的推論程序池執行）
+    INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'in_process').lower()  # 推論模式 ('in_process', 'server')
+    INFERENCE_SERVER_SOCKET_RELATIVE = os.getenv('INFERENCE_SERVER_SOCKET_RELATIVE', 'data/inference.sock')  # 推論伺服器 Unix socket 路徑
+    INFERENCE_WORKERS = get_env_int('INFERENCE_WORKERS', 2)  # 推論程序數
+    INFERENCE_THREADS_PER_WORKER = get_env_int('INFERENCE_THREADS_PER_WORKER', 0)  # 每個推論程序的 torch 執行緒數（0 表示可用 CPU 平均分配）
+    INFERENCE_PIN_CPUS = os.getenv('INFERENCE_PIN_CPUS', 'true').lower() == 'true'  # 是否將每個推論程序綁定到互不重疊的 CPU
+    INFERENCE_SHM_SLOTS = get_env_int('INFERENCE_SHM_SLOTS', 8)  # 每個 web worker 的共享記憶體圖片槽位數
+    INFERENCE_SHM_SLOT_MB = get_env_int('INFERENCE_SHM_SLOT_MB', 16)  # 每個槽位大小（MB），較大的圖片直接經由 socket 傳送
+    INFERENCE_TASK_TIMEOUT = get_env_int('INFERENCE_TASK_TIMEOUT', 120)  # 單張圖片推論的最長秒數，超過時重新啟動該推論程序
+    INFERENCE_MAX_PENDING = get_env_int('INFERENCE_MAX_PENDING', 256)  # 推論伺服器待處理佇列上限
+    INFERENCE_CONNECT_TIMEOUT = get_env_int('INFERENCE_CONNECT_TIMEOUT', 300)  # web worker 等待推論伺服器就緒的最長秒數
     
     # 向後兼容
     MODEL_PATH_RELATIVE = os.getenv('MODEL_PATH_RELATIVE', os.getenv('YOLO_MODEL_PATH_RELATIVE', 'model/yolov11/YOLOv11_v1_20251212/weights/best.pt'))  # 相對於專案根目錄的模型路徑
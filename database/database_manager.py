@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 資料庫管理腳本
-支援初始化（init）和重置（reset）兩種模式
+支援初始化（init）、重置（reset）與遷移（migrate）三種模式
 """
 
 import os
@@ -27,6 +27,8 @@ DB_PASSWORD = os.getenv('DB_PASSWORD')
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 # SQL 檔案與腳本在同一資料夾中（已整合為單一檔案）
 INIT_SQL_PATH = os.path.join(os.path.dirname(__file__), 'init_database.sql')
+# 既有資料庫的遷移（新資料庫的 init_database.sql 已包含所有遷移的內容）
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
 
 
 def validate_config():
@@ -376,6 +378,21 @@ def init_database():
     print("=" * 60)
 
 
+def migrate_database():
+    """對既有資料庫執行遷移（migrations/*.sql，依檔名順序；每個遷移都可重複執行）"""
+    migrations = sorted(
+        name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql')
+    ) if os.path.isdir(MIGRATIONS_DIR) else []
+    if not migrations:
+        print("ℹ️  沒有需要執行的遷移")
+        return
+    for name in migrations:
+        if not execute_sql_file(os.path.join(MIGRATIONS_DIR, name), f"遷移 {name}"):
+            print(f"\n❌ 遷移失敗: {name}")
+            sys.exit(1)
+    print(f"✅ 已執行 {len(migrations)} 個遷移")
+
+
 def reset_database():
     """重置資料庫（刪除並重新創建）"""
     print("\n" + "=" * 60)
@@ -446,11 +463,14 @@ def main():
             init_database()
         elif mode == 'reset':
             reset_database()
+        elif mode == 'migrate':
+            migrate_database()
         else:
             print("❌ 錯誤：未知的模式")
-            print("用法: python database_manager.py [init|reset]")
-            print("  init  - 初始化資料庫（如果不存在則創建）")
-            print("  reset - 重置資料庫（刪除並重新創建）")
+            print("用法: python database_manager.py [init|reset|migrate]")
+            print("  init    - 初始化資料庫（如果不存在則創建）")
+            print("  reset   - 重置資料庫（刪除並重新創建）")
+            print("  migrate - 對既有資料庫執行 migrations/ 中的遷移")
             sys.exit(1)
     else:
         # 預設為初始化模式
@@ -178,6 +178,7 @@ CREATE TABLE prediction_log (
     -- 圖片資訊
     image_path TEXT NOT NULL,
     image_hash VARCHAR(64),
+    image_phash BIGINT,
     image_size INTEGER,
     image_source VARCHAR(20) DEFAULT 'upload',
     image_data BYTEA,
@@ -227,6 +228,7 @@ COMMENT ON COLUMN prediction_log.final_status IS '最終狀態：yolo_detected,
 COMMENT ON COLUMN prediction_log.workflow_step IS '工作流程步驟：cnn_only, cnn_yolo, crop_required';
 COMMENT ON COLUMN prediction_log.original_image_url IS '原始圖片 URL（Cloudinary 或其他外部存儲）';
 COMMENT ON COLUMN prediction_log.predict_img_url IS '帶檢測框的預測結果圖片 URL（Cloudinary）';
+COMMENT ON COLUMN prediction_log.image_phash IS '處理後圖片的 64 位元感知雜湊（pHash，以有號 BIGINT 儲存），用於近似重複圖片比對';
 
 -- ============================================
 -- 8. 建立檢測記錄表
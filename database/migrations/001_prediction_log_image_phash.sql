@@ -0,0 +1,9 @@
+-- ============================================
+-- 遷移 001：prediction_log.image_phash
+-- 既有資料庫（init_database.sql 只在首次部署執行）補上感知雜湊欄位；可重複執行
+-- 預測記錄寫入與近似重複索引都使用此欄位
+-- ============================================
+
+ALTER TABLE prediction_log ADD COLUMN IF NOT EXISTS image_phash BIGINT;
+
+COMMENT ON COLUMN prediction_log.image_phash IS '處理後圖片的 64 位元感知雜湊（pHash，以有號 BIGINT 儲存），用於近似重複圖片比對';
@@ -62,6 +62,12 @@ interface PredictionResult {
     max_crop_count?: number;
 }
 
+// 將 data URL 轉為 Blob（multipart 上傳使用）
+async function dataUrlToBlob(dataUrl: string): Promise<Blob> {
+    const res = await fetch(dataUrl);
+    return res.blob();
+}
+
 function PredictPage() {
     const [mode, setMode] = useState<Mode>("idle");
     const [image, setImage] = useState<string | null>(null);
@@ -108,15 +114,14 @@ function PredictPage() {
     // 處理預測
     const handlePredict = async (imageData: string) => {
         try {
-            // 移除 data URL 前綴（如果有的話）
-            const base64Data = imageData.includes(",") ? imageData.split(",")[1] : imageData;
+            // 以 multipart/form-data 傳送圖片位元組（比 JSON 內的 base64 小約 1/3）
+            const formData = new FormData();
+            formData.append("image", await dataUrlToBlob(imageData), "image.jpg");
+            formData.append("source", "upload");
 
             const res = await apiFetch("/api/predict", {
                 method: "POST",
-                body: JSON.stringify({
-                    image: base64Data,
-                    source: "upload",
-                }),
+                body: formData,
             });
 
             let data = await res.json();
@@ -165,16 +170,15 @@ function PredictPage() {
         setMode("processing");
 
         try {
-            const base64Data = croppedImage.includes(",") ? croppedImage.split(",")[1] : croppedImage;
+            const formData = new FormData();
+            formData.append("cropped_image", await dataUrlToBlob(croppedImage), "cropped.jpg");
+            formData.append("prediction_id", result.prediction_id);
+            formData.append("crop_coordinates", JSON.stringify(coordinates));
+            formData.append("crop_count", String(cropCount)); // 傳遞當前 crop 次數
 
             const res = await apiFetch("/api/predict-crop", {
                 method: "POST",
-                body: JSON.stringify({
-                    prediction_id: result.prediction_id,
-                    crop_coordinates: coordinates,
-                    cropped_image: base64Data,
-                    crop_count: cropCount, // 傳遞當前 crop 次數
-                }),
+                body: formData,
             });
 
             let data = await res.json();
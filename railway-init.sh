@@ -27,6 +27,15 @@ TABLE_EXISTS=$(psql $DATABASE_URL -tAc "SELECT EXISTS (SELECT FROM information_s
 
 if [ "$TABLE_EXISTS" = "t" ]; then
     echo "✅ 資料庫已初始化，跳過初始化步驟"
+    # 既有資料庫執行遷移（database/migrations/*.sql，依檔名順序；每個遷移都可重複執行）
+    # 新資料庫的 init_database.sql 已包含所有遷移的內容
+    for migration in database/migrations/*.sql; do
+        [ -e "$migration" ] || continue
+        echo "📦 執行資料庫遷移: $migration"
+        if ! psql $DATABASE_URL -v ON_ERROR_STOP=1 -q -f "$migration"; then
+            echo "⚠️  資料庫遷移失敗: $migration，但繼續啟動應用程式"
+        fi
+    done
     exit 0
 fi
 
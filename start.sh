@@ -16,11 +16,21 @@ echo "🔍 執行資料庫初始化..."
 chmod +x ./railway-init.sh
 ./railway-init.sh
 
-# 2. 啟動 Gunicorn 服務器
+# 2. INT8 量化準確率閘門（CNN_QUANTIZATION / SR_QUANTIZATION 不為 none 時）
+# 在啟動 worker 前執行一次並保存結果，worker 只載入已驗證的量化模型；失敗時 worker 使用 fp32
+if [ "${CNN_QUANTIZATION:-none}" != "none" ] || [ "${SR_QUANTIZATION:-none}" != "none" ]; then
+    echo "📦 執行 INT8 量化準確率閘門..."
+    (cd /app/backend && python quantize_models.py) || echo "⚠️  量化準確率閘門未完成，將使用 fp32 模型"
+fi
+
+# 3. 啟動 Gunicorn 服務器
+# INFERENCE_MODE=server 時推論伺服器由 gunicorn.conf.py 的 hook 啟動與停止（意外結束時自動重新啟動）
 echo "📦 啟動 Gunicorn 服務器..."
 # 使用 exec 讓 Gunicorn 接收系統信號 (PID 1)
 # 從 backend 目錄執行，這樣可以正確導入 src 模組
+# gunicorn.conf.py 在 fork worker 前預載入模型（MODEL_PRELOAD），所有 worker 共用同一份權重
 exec gunicorn app:app \
+    --config /app/backend/gunicorn.conf.py \
     --bind 0.0.0.0:${PORT:-5000} \
     --workers 2 \
     --threads 2 \
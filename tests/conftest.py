@@ -0,0 +1,48 @@
+"""
+測試共用設定
+將專案根目錄與 backend 目錄加入 Python 路徑（與 backend/benchmarks 的腳本相同），並提供測試資料庫的連線參數
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from dotenv import load_dotenv
+
+# 添加專案根目錄與 backend 目錄到 Python 路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'backend'))
+
+# 測試環境配置（見 tests/README.md），不讀取開發用的 .env
+load_dotenv(project_root / '.env.test')
+
+
+@pytest.fixture(scope='session')
+def postgres_connect_kwargs():
+    """
+    測試資料庫的 psycopg2.connect() 參數（DATABASE_URL 或 DB_HOST / DB_PORT / DB_NAME / DB_USER / DB_PASSWORD）
+    未設定或無法連線時略過需要 PostgreSQL 的測試
+    """
+    psycopg2 = pytest.importorskip('psycopg2')
+
+    if os.getenv('DATABASE_URL'):
+        kwargs = {'dsn': os.getenv('DATABASE_URL')}
+    else:
+        names = ('DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 'DB_PASSWORD')
+        if not all(os.getenv(name) for name in names):
+            pytest.skip('未設定測試資料庫（DATABASE_URL 或 DB_HOST 等環境變數）')
+        kwargs = {
+            'host': os.getenv('DB_HOST'),
+            'port': int(os.getenv('DB_PORT')),
+            'database': os.getenv('DB_NAME'),
+            'user': os.getenv('DB_USER'),
+            'password': os.getenv('DB_PASSWORD')
+        }
+
+    try:
+        psycopg2.connect(connect_timeout=5, **kwargs).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"無法連線到測試資料庫: {str(e).splitlines()[0]}")
+    return kwargs
@@ -0,0 +1,3 @@
+"""
+單元測試
+"""
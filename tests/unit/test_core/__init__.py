@@ -0,0 +1,3 @@
+"""
+核心模組（backend/src/core）測試
+"""
@@ -0,0 +1,148 @@
+"""
+核心模組測試的固定裝置
+stub_database：記錄寫入語句的模擬資料庫（與 DatabaseManager 相同的 get_connection() 介面，可模擬中斷）
+pg_database：以測試資料庫建立的 get_connection() 介面（未設定測試資料庫時略過）
+"""
+
+import uuid
+import threading
+from contextlib import contextmanager
+
+import pytest
+import psycopg2
+
+
+class StubCursor:
+    """
+    模擬遊標：記錄預備語句的 EXECUTE 與 execute_values 的 UPDATE（PREPARE 不記錄）
+
+    EXECUTE 記錄為 (語句名稱, 參數)；execute_values 先以 mogrify() 逐列組成 VALUES，
+    記錄為 ('UPDATE <資料表>', 各列參數)
+    """
+
+    rowcount = 0
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = []
+
+    def mogrify(self, template, args):
+        self._rows.append(tuple(args))
+        return repr(tuple(args)).encode('utf-8')
+
+    def execute(self, sql, params=None):
+        text = (sql.decode('utf-8') if isinstance(sql, bytes) else sql).strip()
+        if text.startswith('PREPARE '):
+            self.connection.prepares.append(text.split()[1])
+        elif text.startswith('EXECUTE '):
+            self.connection.staged.append((text.split()[1], params))
+        elif text.startswith('UPDATE '):
+            self.connection.staged.append((' '.join(text.split()[:2]), self._rows))
+        else:
+            raise AssertionError(f"未預期的語句: {text[:60]}")
+        self._rows = []
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StubConnection:
+    """模擬連接：提交時才將語句記錄為一個交易"""
+
+    encoding = 'UTF8'
+
+    def __init__(self, database):
+        self.database = database
+        self.staged = []
+        self.prepares = []
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        with self.database.lock:
+            self.database.transactions.append(self.staged)
+        self.staged = []
+
+    def rollback(self):
+        self.staged = []
+
+
+class StubDatabase:
+    """提供與 DatabaseManager 相同 get_connection() 介面的模擬資料庫；down 為 True 時連線失敗"""
+
+    def __init__(self):
+        self.transactions = []
+        self.down = False
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def get_connection(self):
+        if self.down:
+            raise psycopg2.OperationalError("模擬資料庫中斷")
+        yield StubConnection(self)
+
+    def statements(self, name: str) -> list:
+        """已提交的交易中，指定語句的參數（依提交順序）"""
+        with self.lock:
+            return [params for transaction in self.transactions for statement, params in transaction if statement == name]
+
+    def inserted_prediction_ids(self) -> list:
+        """已提交的 prediction_log INSERT 中的 ID（依寫入順序）"""
+        return [str(prediction_id) for params in self.statements('prediction_log_insert') for prediction_id in params[0]]
+
+
+class PostgresDatabase:
+    """每次 get_connection() 建立一條新的測試資料庫連線（與 DatabaseManager 相同的介面）"""
+
+    def __init__(self, connect_kwargs: dict):
+        self.connect_kwargs = connect_kwargs
+
+    @contextmanager
+    def get_connection(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def query(self, sql: str, params=None) -> list:
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+
+@pytest.fixture
+def stub_database():
+    return StubDatabase()
+
+
+@pytest.fixture
+def pg_database(postgres_connect_kwargs):
+    return PostgresDatabase(postgres_connect_kwargs)
+
+
+@pytest.fixture
+def pg_user_id(pg_database):
+    """測試專用使用者（結束時刪除，其預測記錄與檢測記錄一併刪除）"""
+    suffix = uuid.uuid4().hex[:12]
+    with pg_database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (email, password_hash, username) VALUES (%s, 'x', %s) RETURNING id",
+                (f"pytest_{suffix}@example.com", f"pytest_{suffix}")
+            )
+            user_id = cursor.fetchone()[0]
+        conn.commit()
+    yield user_id
+    with pg_database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        conn.commit()
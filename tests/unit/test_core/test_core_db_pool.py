@@ -0,0 +1,204 @@
+"""
+PostgreSQL 連接池（core_db_pool.ConnectionPool）測試
+以測試資料庫驗證連線上限、等待者先進先出、取用逾時、max_lifetime 回收與被終止連線的替換（未設定測試資料庫時略過）
+"""
+
+import time
+import uuid
+import threading
+
+import pytest
+import psycopg2
+
+from src.core.core_db_pool import ConnectionPool, PoolTimeout
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def application_name():
+    """本測試建立的連線的 application_name（以 pg_stat_activity 計算伺服器端連線數）"""
+    return f"pytest_pool_{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def admin(postgres_connect_kwargs):
+    """連接池之外的管理連線（autocommit：每次查詢 pg_stat_activity 都是新的快照）"""
+    conn = psycopg2.connect(**postgres_connect_kwargs)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_pool(postgres_connect_kwargs, application_name):
+    """建立連接池（連線帶有 application_name），測試結束時關閉"""
+    pools = []
+
+    def factory(**kwargs):
+        options = {'minconn': 0, 'maxconn': 2, 'acquire_timeout': 5.0, 'statement_timeout_ms': 10000}
+        options.update(kwargs)
+        connection_pool = ConnectionPool(**options, **postgres_connect_kwargs, application_name=application_name)
+        pools.append(connection_pool)
+        return connection_pool
+
+    yield factory
+    for connection_pool in pools:
+        connection_pool.closeall()
+
+
+def server_connections(admin, application_name: str) -> int:
+    with admin.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE application_name = %s", (application_name,))
+        return cursor.fetchone()[0]
+
+
+def backend_alive(admin, pid: int) -> bool:
+    with admin.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_stat_activity WHERE pid = %s", (pid,))
+        return cursor.fetchone() is not None
+
+
+def test_server_connections_never_exceed_maxconn(make_pool, admin, application_name):
+    connection_pool = make_pool(maxconn=3)
+    errors = []
+    peak = 0
+    done = threading.Event()
+
+    def monitor():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, server_connections(admin, application_name))
+            time.sleep(0.005)
+
+    def worker():
+        try:
+            for _ in range(5):
+                conn = connection_pool.getconn()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT pg_sleep(0.02)")
+                finally:
+                    connection_pool.putconn(conn)
+        except Exception as e:
+            errors.append(e)
+
+    sampler = threading.Thread(target=monitor)
+    sampler.start()
+    # 執行緒數為連線上限的 4 倍
+    workers = [threading.Thread(target=worker) for _ in range(12)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    done.set()
+    sampler.join()
+
+    assert errors == []
+    assert 1 <= peak <= 3
+    metrics = connection_pool.get_metrics()
+    assert metrics['created'] <= 3
+    assert metrics['acquires'] == 60
+    assert metrics['waits'] > 0
+    assert metrics['in_use'] == 0
+
+
+def test_waiters_are_served_in_arrival_order(make_pool):
+    connection_pool = make_pool(maxconn=1)
+    held = connection_pool.getconn()
+    order = []
+
+    def waiter(index):
+        conn = connection_pool.getconn()
+        order.append(index)
+        connection_pool.putconn(conn)
+
+    threads = []
+    for index in range(5):
+        thread = threading.Thread(target=waiter, args=(index,))
+        thread.start()
+        threads.append(thread)
+        # 前一個等待者確定進入佇列後才啟動下一個
+        assert wait_until(lambda: connection_pool.get_metrics()['waiting'] == index + 1)
+
+    connection_pool.putconn(held)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == [0, 1, 2, 3, 4]
+    assert connection_pool.get_metrics()['created'] == 1
+
+
+def test_acquire_raises_pool_timeout(make_pool):
+    connection_pool = make_pool(maxconn=1, acquire_timeout=0.3)
+    held = connection_pool.getconn()
+
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        connection_pool.getconn()
+    assert 0.3 <= time.monotonic() - start < 2.0
+
+    # 指定的 timeout 優先於 acquire_timeout
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        connection_pool.getconn(timeout=0.1)
+    assert time.monotonic() - start < 0.3
+
+    metrics = connection_pool.get_metrics()
+    assert metrics['timeouts'] == 2
+    assert metrics['waiting'] == 0
+
+    # 逾時的等待者已離開佇列：歸還後立即可取用
+    connection_pool.putconn(held)
+    connection_pool.putconn(connection_pool.getconn(timeout=0.1))
+
+
+def test_max_lifetime_recycles_connections(make_pool, admin):
+    connection_pool = make_pool(minconn=1, maxconn=1, max_lifetime=0.3)
+    conn = connection_pool.getconn()
+    first_pid = conn.get_backend_pid()
+    connection_pool.putconn(conn)
+
+    time.sleep(0.4)
+    conn = connection_pool.getconn()
+    second_pid = conn.get_backend_pid()
+    connection_pool.putconn(conn)
+
+    assert second_pid != first_pid
+    assert wait_until(lambda: not backend_alive(admin, first_pid))
+    assert connection_pool.get_metrics()['recycled_lifetime'] >= 1
+
+
+def test_terminated_connections_are_replaced(make_pool, admin):
+    connection_pool = make_pool(minconn=2, maxconn=2, validate_idle_seconds=0)
+    conns = [connection_pool.getconn() for _ in range(2)]
+    pids = {conn.get_backend_pid() for conn in conns}
+    for conn in conns:
+        connection_pool.putconn(conn)
+
+    # 閒置連線在伺服器端被終止（例如資料庫重啟或 idle 逾時）
+    with admin.cursor() as cursor:
+        for pid in pids:
+            cursor.execute("SELECT pg_terminate_backend(%s)", (pid,))
+    assert wait_until(lambda: not any(backend_alive(admin, pid) for pid in pids))
+
+    # 取出時檢查失敗的連線被替換，呼叫者不會收到例外
+    conns = [connection_pool.getconn() for _ in range(2)]
+    for conn in conns:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.fetchone() == (1,)
+    assert {conn.get_backend_pid() for conn in conns}.isdisjoint(pids)
+    for conn in conns:
+        connection_pool.putconn(conn)
+
+    metrics = connection_pool.get_metrics()
+    assert metrics['validation_failures'] == 2
+    assert metrics['size'] == 2
@@ -0,0 +1,281 @@
+"""
+預測結果背景寫入（core_write_behind.WriteBehindWriter）測試
+以模擬資料庫驗證批次寫入、URL 更新合併、溢寫與依序重放、接手已結束程序的重放檔、重放缺少新欄位的溢寫檔；
+ON CONFLICT 的實際行為以測試資料庫驗證（未設定時略過）
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import subprocess
+
+import pytest
+
+from src.core.core_db_statements import statements
+from src.core.core_write_behind import (
+    WriteBehindWriter,
+    PREDICTION_LOG_COLUMNS,
+    DETECTION_RECORD_COLUMNS,
+    PREDICTION_LOG_INSERT_STATEMENT,
+    DETECTION_RECORD_UPSERT_STATEMENT,
+    DETECTION_RECORD_IMAGE_PATH_STATEMENT
+)
+
+
+def make_prediction(user_id: int = 1, image_hash: str = None) -> tuple:
+    """建立一筆與整合檢測相同格式的 prediction_log / detection_records 資料"""
+    prediction_id = str(uuid.uuid4())
+    image_hash = image_hash or uuid.uuid4().hex + uuid.uuid4().hex
+    prediction_log = {
+        'id': prediction_id,
+        'user_id': user_id,
+        'image_path': f"/image/prediction/{prediction_id}",
+        'image_hash': image_hash,
+        'image_size': 120000,
+        'image_source': 'upload',
+        'image_compressed': False,
+        'cnn_best_class': 'tomato',
+        'cnn_best_score': 0.97,
+        'cnn_all_scores': json.dumps({'tomato': 0.97}),
+        'yolo_result': json.dumps([{'class': 'Tomato_early_blight', 'confidence': 0.9}]),
+        'yolo_detected': True,
+        'final_status': 'yolo_detected',
+        'workflow_step': 'cnn_yolo'
+    }
+    detection_record = {
+        'user_id': user_id,
+        'disease_name': 'Tomato_early_blight',
+        'severity': 'Unknown',
+        'confidence': 0.9,
+        'image_path': prediction_log['image_path'],
+        'image_hash': image_hash,
+        'image_size': 120000,
+        'image_source': 'upload',
+        'raw_model_output': json.dumps({'test': True}),
+        'status': 'completed',
+        'processing_time_ms': 100,
+        'image_compressed': False,
+        'prediction_log_id': prediction_id
+    }
+    return prediction_log, detection_record
+
+
+def column(params, columns: tuple, name: str) -> list:
+    """從 unnest 批次寫入的參數（每個欄位一個陣列）取出指定欄位"""
+    return list(params[columns.index(name)])
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def make_writer(tmp_path):
+    """建立寫入器（溢寫檔寫入暫存目錄），測試結束時停止"""
+    writers = []
+
+    def factory(database, **kwargs):
+        options = {
+            'enabled': True,
+            'batch_size': 64,
+            'flush_interval_ms': 60000,
+            'spill_dir': str(tmp_path),
+            'spill_retry_interval': 0.0
+        }
+        options.update(kwargs)
+        writer = WriteBehindWriter(db_manager=database, **options)
+        writers.append(writer)
+        return writer
+
+    yield factory
+    for writer in writers:
+        writer.shutdown()
+
+
+def test_batches_predictions_into_one_transaction(stub_database, make_writer):
+    writer = make_writer(stub_database, batch_size=3)
+    shared_hash = uuid.uuid4().hex * 2
+    predictions = [make_prediction(), make_prediction(image_hash=shared_hash), make_prediction(image_hash=shared_hash)]
+    for prediction_log, detection_record in predictions:
+        writer.submit_prediction(prediction_log, detection_record)
+    assert writer.flush(timeout=5)
+
+    assert len(stub_database.transactions) == 1
+    assert [name for name, _ in stub_database.transactions[0]] == [
+        PREDICTION_LOG_INSERT_STATEMENT, DETECTION_RECORD_UPSERT_STATEMENT, DETECTION_RECORD_IMAGE_PATH_STATEMENT
+    ]
+    assert stub_database.inserted_prediction_ids() == [log['id'] for log, _ in predictions]
+
+    # 同一批次內相同 image_hash 的檢測記錄只寫入第一筆
+    upsert = stub_database.statements(DETECTION_RECORD_UPSERT_STATEMENT)[0]
+    assert column(upsert, DETECTION_RECORD_COLUMNS, 'image_hash') == [predictions[0][1]['image_hash'], shared_hash]
+    assert column(upsert, DETECTION_RECORD_COLUMNS, 'prediction_log_id') == [predictions[0][0]['id'], predictions[1][0]['id']]
+    # 未使用外部 URL 的記錄改寫 image_path
+    assert list(stub_database.statements(DETECTION_RECORD_IMAGE_PATH_STATEMENT)[0][0]) == [predictions[0][1]['image_hash'], shared_hash]
+
+    metrics = writer.get_metrics()
+    assert metrics['flushes'] == 1
+    assert metrics['flushed_predictions'] == 3
+
+
+def test_insert_statements_are_idempotent():
+    # 重放已寫入的預測不會重複寫入；重複的圖片只更新既有的檢測記錄
+    assert 'ON CONFLICT (id) DO NOTHING' in statements._statements[PREDICTION_LOG_INSERT_STATEMENT].sql
+    assert 'ON CONFLICT (image_hash) DO UPDATE' in statements._statements[DETECTION_RECORD_UPSERT_STATEMENT].sql
+
+
+def test_patch_merges_into_pending_insert(stub_database, make_writer):
+    writer = make_writer(stub_database)
+    prediction_log, detection_record = make_prediction()
+    writer.submit_prediction(prediction_log, detection_record)
+    url = f"https://res.cloudinary.com/demo/{prediction_log['id']}.jpg"
+    writer.patch_urls(prediction_log['id'], prediction_log['user_id'],
+                      prediction_log={'image_path': url, 'original_image_url': url},
+                      detection_record={'original_image_url': url})
+    assert writer.flush(timeout=5)
+
+    # URL 直接寫入 INSERT 的資料列，不另外執行 UPDATE
+    assert len(stub_database.transactions) == 1
+    assert not stub_database.statements('UPDATE prediction_log')
+    insert = stub_database.statements(PREDICTION_LOG_INSERT_STATEMENT)[0]
+    assert column(insert, PREDICTION_LOG_COLUMNS, 'image_path') == [url]
+    assert column(insert, PREDICTION_LOG_COLUMNS, 'original_image_url') == [url]
+    upsert = stub_database.statements(DETECTION_RECORD_UPSERT_STATEMENT)[0]
+    assert column(upsert, DETECTION_RECORD_COLUMNS, 'original_image_url') == [url]
+    assert writer.get_metrics()['flushed_patches'] == 0
+
+
+def test_patch_after_insert_is_batched_update(stub_database, make_writer):
+    writer = make_writer(stub_database)
+    prediction_log, detection_record = make_prediction()
+    writer.submit_prediction(prediction_log, detection_record)
+    assert writer.flush(timeout=5)
+
+    url = f"https://res.cloudinary.com/demo/{prediction_log['id']}_annotated.jpg"
+    writer.patch_urls(prediction_log['id'], prediction_log['user_id'], prediction_log={'predict_img_url': url})
+    writer.patch_urls(prediction_log['id'], prediction_log['user_id'], detection_record={'annotated_image_url': url})
+    assert writer.flush(timeout=5)
+
+    # 同一預測的兩次更新合併為一筆，在同一交易中更新兩個資料表
+    assert len(stub_database.transactions) == 2
+    assert stub_database.statements('UPDATE prediction_log') == [[(prediction_log['id'], None, None, url)]]
+    assert stub_database.statements('UPDATE detection_records') == [
+        [(prediction_log['id'], prediction_log['user_id'], None, url)]
+    ]
+
+
+def test_spills_when_database_down_and_replays_in_order(stub_database, make_writer, tmp_path):
+    writer = make_writer(stub_database)
+    stub_database.down = True
+    first = [make_prediction() for _ in range(3)]
+    for prediction_log, detection_record in first[:2]:
+        writer.submit_prediction(prediction_log, detection_record)
+    assert writer.flush(timeout=5)
+    # 溢寫檔尚未重放時，新資料接在其後
+    writer.submit_prediction(*first[2])
+    assert writer.flush(timeout=5)
+
+    spill_path = tmp_path / f"spill-{os.getpid()}.jsonl"
+    spilled = [json.loads(line) for line in spill_path.read_text(encoding='utf-8').splitlines()]
+    assert [record['entry']['prediction_id'] for record in spilled] == [log['id'] for log, _ in first]
+    assert writer.get_metrics()['spill_outstanding'] == 3
+    assert stub_database.transactions == []
+
+    # 資料庫恢復後，新資料寫入前先依原順序重放溢寫檔
+    stub_database.down = False
+    later_log, later_record = make_prediction()
+    writer.submit_prediction(later_log, later_record)
+    assert writer.flush(timeout=5)
+
+    assert stub_database.inserted_prediction_ids() == [log['id'] for log, _ in first] + [later_log['id']]
+    assert list(tmp_path.glob('spill-*')) == []
+    metrics = writer.get_metrics()
+    assert metrics['replayed_records'] == 3
+    assert metrics['spill_outstanding'] == 0
+
+
+def test_claims_orphan_replay_file_by_rename(stub_database, make_writer, tmp_path):
+    # 已結束的程序（重放到一半時結束）與仍在執行的程序各留下一個重放檔
+    finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    dead_pid = int(finished.stdout)
+    running = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        orphan = [make_prediction() for _ in range(2)]
+        dead_file = tmp_path / f"spill-{dead_pid}.jsonl.replay-{dead_pid}"
+        live_file = tmp_path / f"spill-{running.pid}.jsonl.replay-{running.pid}"
+        for path, predictions in ((dead_file, orphan), (live_file, [make_prediction()])):
+            lines = [
+                json.dumps({'type': 'insert', 'entry': WriteBehindWriter._make_entry(log, record)})
+                for log, record in predictions
+            ]
+            path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+        make_writer(stub_database, flush_interval_ms=20)
+
+        assert wait_until(lambda: not any(tmp_path.glob(f"spill-{dead_pid}.*")))
+        assert stub_database.inserted_prediction_ids() == [log['id'] for log, _ in orphan]
+        # 仍在執行的程序的重放檔不被接手
+        assert live_file.exists()
+    finally:
+        running.kill()
+        running.wait()
+
+
+def test_replays_spill_file_missing_new_columns(stub_database, make_writer, tmp_path):
+    # 新增欄位前寫入的溢寫檔（記錄中沒有該欄位）重放時該欄位為 NULL
+    finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    dead_pid = int(finished.stdout)
+    prediction_log, detection_record = make_prediction()
+    entry = WriteBehindWriter._make_entry(prediction_log, detection_record)
+    del entry['prediction_log']['predict_img_url']
+    del entry['detection_record']['annotated_image_url']
+    spill_file = tmp_path / f"spill-{dead_pid}.jsonl"
+    spill_file.write_text(json.dumps({'type': 'insert', 'entry': entry}) + '\n', encoding='utf-8')
+
+    writer = make_writer(stub_database)
+    later_log, later_record = make_prediction()
+    writer.submit_prediction(later_log, later_record)
+    assert writer.flush(timeout=5)
+
+    assert stub_database.inserted_prediction_ids() == [prediction_log['id'], later_log['id']]
+    upsert = stub_database.statements(DETECTION_RECORD_UPSERT_STATEMENT)[0]
+    assert column(upsert, DETECTION_RECORD_COLUMNS, 'prediction_log_id') == [prediction_log['id']]
+    assert column(upsert, DETECTION_RECORD_COLUMNS, 'annotated_image_url') == [None]
+    assert list(tmp_path.glob('spill-*')) == []
+    metrics = writer.get_metrics()
+    assert metrics['replayed_records'] == 1
+    assert metrics['rejected_records'] == 0
+
+
+def test_on_conflict_against_postgres(pg_database, pg_user_id, make_writer):
+    writer = make_writer(pg_database, enabled=False)
+    prediction_log, detection_record = make_prediction(pg_user_id)
+    writer.submit_prediction(prediction_log, detection_record)
+    # 重放同一筆預測（例如溢寫後重放已寫入的資料）不會報錯，也不會重複寫入
+    writer.submit_prediction(prediction_log, detection_record)
+    # 相同圖片的另一筆預測：新增預測記錄，檢測記錄維持一筆
+    duplicate_log, duplicate_record = make_prediction(pg_user_id, image_hash=prediction_log['image_hash'])
+    writer.submit_prediction(duplicate_log, duplicate_record)
+
+    assert pg_database.query(
+        "SELECT id::text FROM prediction_log WHERE user_id = %s ORDER BY created_at", (pg_user_id,)
+    ) == [(prediction_log['id'],), (duplicate_log['id'],)]
+    records = pg_database.query(
+        "SELECT id, image_path, prediction_log_id::text FROM detection_records WHERE image_hash = %s",
+        (prediction_log['image_hash'],)
+    )
+    assert len(records) == 1
+    record_id, image_path, prediction_log_id = records[0]
+    assert prediction_log_id == prediction_log['id']
+    assert image_path == f"/image/{record_id}"
+
+    metrics = writer.get_metrics()
+    assert metrics['rejected_records'] == 0
+    assert metrics['spilled_records'] == 0
@@ -0,0 +1,3 @@
+"""
+AI 模組（backend/modules）測試
+"""
@@ -0,0 +1,101 @@
+"""
+CNN 推論後端（modules.cnn_backend）一致性測試
+將固定的檢查點匯出為 TorchScript / ONNX，以固定種子的圖片比較與 eager 模型的 top-1 類別與 softmax 分數，
+誤差上限為 CNN_PARITY_ATOL；未安裝 torch / timm 時略過，未安裝 onnxruntime 時略過 ONNX
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+timm = pytest.importorskip('timm')
+import torch.nn.functional as F
+
+from config.base import Config
+from modules.cnn_backend import ONNXRUNTIME_AVAILABLE, check_cnn_parity, load_cnn_backend
+from modules.cnn_load import load_cnn_model
+from modules.cnn_preprocess import preprocess_arrays_batch
+
+NUM_CLASSES = 5
+SAMPLES = 16
+
+
+@pytest.fixture(scope='module')
+def checkpoint(tmp_path_factory):
+    """
+    測試用檢查點（複製到暫存目錄，匯出檔不寫入專案目錄）
+    CNN_MODEL_PATH_RELATIVE 指向的檢查點存在時使用它，否則以固定種子初始化 mobilenetv3_large_100
+    """
+    directory = tmp_path_factory.mktemp('cnn_checkpoint')
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    trained = os.path.join(project_root, Config.CNN_MODEL_PATH_RELATIVE)
+    path = str(directory / 'cnn_parity.pth')
+    if os.path.isfile(trained):
+        shutil.copyfile(trained, path)
+    else:
+        torch.manual_seed(0)
+        model = timm.create_model('mobilenetv3_large_100', pretrained=False, num_classes=NUM_CLASSES)
+        torch.save({'model_state_dict': model.state_dict()}, path)
+    return path
+
+
+@pytest.fixture(scope='module')
+def eager_model(checkpoint):
+    return load_cnn_model(checkpoint, num_classes=NUM_CLASSES, device='cpu')
+
+
+@pytest.fixture(scope='module')
+def images():
+    """固定種子的 RGB 圖片（不同尺寸，經過與推論相同的預處理）"""
+    rng = np.random.default_rng(0)
+    arrays = [
+        rng.integers(0, 256, size=(int(rng.integers(160, 480)), int(rng.integers(160, 480)), 3), dtype=np.uint8)
+        for _ in range(SAMPLES)
+    ]
+    return preprocess_arrays_batch(arrays, device='cpu')
+
+
+@pytest.mark.parametrize('backend', [
+    'torchscript',
+    pytest.param('onnx', marks=pytest.mark.skipif(not ONNXRUNTIME_AVAILABLE, reason='onnxruntime 未安裝'))
+])
+def test_exported_backend_matches_eager(backend, checkpoint, eager_model, images):
+    atol = Config.CNN_PARITY_ATOL
+    candidate, info = load_cnn_backend(eager_model, checkpoint, backend=backend, device='cpu', verify=False)
+
+    # 匯出與載入成功（沒有退回 eager），匯出檔放在檢查點旁
+    assert info['backend'] == backend, info.get('error')
+    assert os.path.dirname(info['export_path']) == os.path.dirname(checkpoint)
+
+    with torch.no_grad():
+        expected = F.softmax(eager_model(images).float(), dim=1)
+        actual = F.softmax(candidate(images).float(), dim=1)
+
+    assert actual.shape == expected.shape == (SAMPLES, NUM_CLASSES)
+    assert float((actual - expected).abs().max()) <= atol
+    # 前兩名差距在誤差內的樣本不比對 top-1（與 check_cnn_parity 相同）
+    top2 = expected.topk(2, dim=1).values
+    decisive = (top2[:, 0] - top2[:, 1]) >= atol
+    assert torch.equal(actual.argmax(dim=1)[decisive], expected.argmax(dim=1)[decisive])
+
+    parity = check_cnn_parity(eager_model, candidate, inputs=images, atol=atol)
+    assert parity['passed'], parity
+
+
+def test_cached_export_is_reused(checkpoint, eager_model):
+    _, first = load_cnn_backend(eager_model, checkpoint, backend='torchscript', device='cpu', verify=False)
+    modified = os.path.getmtime(first['export_path'])
+
+    _, second = load_cnn_backend(
+        eager_model, checkpoint, backend='torchscript', device='cpu', verify=True, atol=Config.CNN_PARITY_ATOL
+    )
+
+    # 同一檢查點不重新匯出；載入時的一致性檢查通過
+    assert second['export_path'] == first['export_path']
+    assert os.path.getmtime(second['export_path']) == modified
+    assert second['backend'] == 'torchscript'
+    assert second['parity']['passed']